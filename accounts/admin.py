@@ -1,9 +1,45 @@
 from django.contrib import admin
 
 from accounts.models import UserAccount, Customer, Courier
+from deliveet.utils.bulk_jobs import BulkJobAdminMixin, ImportForm, bulk_action
+
+
+class UserAccountImportForm(ImportForm):
+    """
+    This validates one row of a user import
+    """
+
+    class Meta:
+        model = UserAccount
+        fields = [
+            'email', 'first_name', 'last_name', 'phone_number', 'account_type',
+            'is_customer', 'is_courier', 'is_active',
+        ]
+
 
 # Register your models here.
-admin.site.register(UserAccount)
+@admin.register(UserAccount)
+class UserAccountAdmin(BulkJobAdminMixin, admin.ModelAdmin):
+    list_display = ['email', 'first_name', 'last_name', 'account_type', 'is_active', 'date_joined']
+    list_filter = ['account_type', 'is_active']
+    search_fields = ['email', 'first_name', 'last_name']
+    import_form = UserAccountImportForm
+    import_key = 'email'
+    bulk_actions = ['activate_users', 'deactivate_users']
+
+    def prepare_import(self, records):
+        # Imported users choose a password through password reset.
+        for user in records:
+            user.set_unusable_password()
+
+    @bulk_action('Activate selected users')
+    def activate_users(self, queryset):
+        return queryset.filter(is_active=False).update(is_active=True)
+
+    @bulk_action('Deactivate selected users')
+    def deactivate_users(self, queryset):
+        return queryset.filter(is_active=True).update(is_active=False)
+
 
 admin.site.register(Customer)
 
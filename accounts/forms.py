@@ -2,12 +2,14 @@
 This module provides forms for creating and updating accounts.
 """
 from django import forms
-from django.contrib.auth.forms import UserCreationForm, AuthenticationForm, SetPasswordForm
+from django.contrib.auth.forms import UserCreationForm, AuthenticationForm, PasswordResetForm, SetPasswordForm
 from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.template.loader import render_to_string
 
 from accounts.models import UserAccount, Customer, Courier
 from app.forms import BaseForm
+from deliveet.utils.email_outbox import queue_email
 from finance.models import Wallet
 
 
@@ -117,6 +119,20 @@ class ChangePasswordForm(SetPasswordForm):
         return self.user
 
 
+class ResetPasswordForm(PasswordResetForm):
+    """
+    This form sends the password reset link through the email outbox, so
+    the request does not wait on the mail server.
+    """
+
+    def send_mail(self, subject_template_name, email_template_name, context, from_email, to_email,
+                  html_email_template_name=None):
+        subject = ''.join(render_to_string(subject_template_name, context).splitlines())
+        body = render_to_string(email_template_name, context)
+        html_body = render_to_string(html_email_template_name, context) if html_email_template_name else ''
+        queue_email(subject, body, [to_email], html_body=html_body, from_email=from_email)
+
+
 class UserAccountUpdateForm(forms.ModelForm):
     """
     This form is used to update a user.
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_useraccount_rating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='courier',
+            name='is_verified',
+            field=models.BooleanField(default=False),
+        ),
+    ]
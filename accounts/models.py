@@ -6,6 +6,8 @@ import uuid
 from django.contrib.auth.base_user import AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
 from django.db import models
+from django.db.models import Case, F, FloatField, When
+from django.db.models.functions import Cast
 from django.urls import reverse
 from phonenumber_field.modelfields import PhoneNumberField
 
@@ -79,6 +81,21 @@ class UserAccount(AbstractBaseUser, PermissionsMixin):
     last_login = models.DateTimeField(
         auto_now=True
     )
+    # The totals of the user's ratings, kept up to date by api.ratings.
+    rating_sum = models.PositiveIntegerField(
+        default=0
+    )
+    rating_count = models.PositiveIntegerField(
+        default=0
+    )
+    rating = models.GeneratedField(
+        expression=Case(
+            When(rating_count__gt=0, then=Cast('rating_sum', FloatField()) / F('rating_count')),
+            default=None,
+        ),
+        output_field=FloatField(null=True),
+        db_persist=True,
+    )
     objects = UserAccountManager()
 
     USERNAME_FIELD = 'email'
@@ -86,6 +103,9 @@ class UserAccount(AbstractBaseUser, PermissionsMixin):
 
     class Meta:
         verbose_name_plural = 'User Accounts'
+        indexes = [
+            models.Index(fields=['-rating'], name='accounts_user_rating_idx'),
+        ]
 
     def __str__(self) -> str:
         """
@@ -153,6 +173,10 @@ class Courier(ProfileBaseModel):
     courier_longitude = models.FloatField(
         default=0.0
     )
+    # Cleared by api.documents when a verification document expires.
+    is_verified = models.BooleanField(
+        default=False
+    )
     fcm_token = models.TextField(
         blank=True,
         null=True
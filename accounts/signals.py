@@ -1,14 +1,12 @@
 """
 This module conyains signals for the account app.
 """
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 
 from django.dispatch import receiver
-from django.core.mail import send_mail
-from django.conf import settings
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
 
+from deliveet.utils.channels_auth import forget_user
+from deliveet.utils.email_outbox import queue_template_email
 from .models import UserAccount
 
 
@@ -16,19 +14,23 @@ from .models import UserAccount
 def send_welcome_email(sender, instance, created, **kwargs):
     """
     The function to send a welcome email when an account is created.
+    The email goes through the outbox, so signing up does not wait on the
+    mail server.
     """
     if created and instance.email:
-        subject = 'Welcome to DELIVEET'
-        html_message = render_to_string('accounts/welcome_email.html', {'user': instance})
-        plain_message = strip_tags(html_message)
-        from_email = settings.DEFAULT_FROM_EMAIL
-        recipient_list = [instance.email]
-
-        send_mail(
-            subject,
-            plain_message,
-            html_message=html_message,
-            from_email=from_email,
-            recipient_list=recipient_list,
-            fail_silently=False
+        queue_template_email(
+            'Welcome to DELIVEET',
+            'accounts/welcome_email.html',
+            {'user': instance},
+            [instance.email],
         )
+
+
+@receiver(post_save, sender=UserAccount)
+@receiver(post_delete, sender=UserAccount)
+def forget_websocket_user(sender, instance, **kwargs):
+    """
+    The function to drop the cached copy WebSocket connections
+    authenticate against, so changes such as deactivation apply at once.
+    """
+    forget_user(instance.pk)
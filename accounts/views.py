@@ -1,11 +1,9 @@
 """
 This contains views for the accounts app.
 """
-import firebase_admin
 from django.contrib import messages
 from django.contrib.auth import login, authenticate, get_user_model, update_session_auth_hash
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.forms import PasswordResetForm
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import PasswordResetDoneView, PasswordResetView, \
     PasswordResetCompleteView, PasswordResetConfirmView
@@ -15,20 +13,13 @@ from django.shortcuts import redirect, render
 from django.urls import reverse_lazy, reverse
 from django.utils.decorators import method_decorator
 from django.views.generic import CreateView, View, DetailView, FormView
-from firebase_admin import auth, credentials
 
-from accounts.forms import SignUpForm, SignInForm, ChangePasswordForm, UserAccountUpdateForm
+from accounts.forms import SignUpForm, SignInForm, ChangePasswordForm, ResetPasswordForm, UserAccountUpdateForm
 from accounts.models import UserAccount
-from deliveet.settings import FIREBASE_SECRETS
+from deliveet.utils.firebase import verify_id_token
 
 UserModel = get_user_model()
 
-try:
-    cred = credentials.Certificate(FIREBASE_SECRETS)
-    firebase_admin.initialize_app(cred)
-except ValueError as e:
-    raise ValueError("Failed to initialize Firebase credentials: {}".format(e))
-
 
 class SignUpView(CreateView):
     """
@@ -157,7 +148,7 @@ class UserAccountUpdateView(FormView):
                     messages.success(request, 'Your profile has been updated')
                     return redirect(reverse('couriers:courier_dashboard'))
         elif request.POST.get('action') == 'update_user_phone':
-            firebase_user = auth.verify_id_token(request.POST.get('id_token'))
+            firebase_user = verify_id_token(request.POST.get('id_token'))
 
             request.user.phone_number = firebase_user['phone_number']
             if request.user.phone_number:
@@ -179,7 +170,7 @@ class ResetPasswordView(SuccessMessageMixin, PasswordResetView):
     It inherits PasswordResetView
     """
     template_name = 'accounts/password/password_reset.html'
-    form_class = PasswordResetForm
+    form_class = ResetPasswordForm
     email_template_name = 'registration/password_reset_email.html'
     subject_template_name = 'registration/password_reset_subject.txt'
     success_url = reverse_lazy('accounts:reset_password_done')
@@ -0,0 +1,102 @@
+"""
+This module expires courier documents once their expiry date has passed.
+
+expire_documents() runs daily from Celery beat. Each run is one
+transaction of set-based statements, whatever the number of documents:
+
+- one UPDATE marks every unexpired document with an expiry date before
+  today as expired, found through the partial index on expiry_date of the
+  unexpired documents, and stamps them with the run's updated_at
+- one UPDATE clears is_verified of the couriers who lost a verified
+  license, insurance, vehicle registration or ID card this run and have
+  no current verified document of the same type
+- the run's documents, found through the partial index on updated_at of
+  the expired documents, are read back NOTIFICATION_BATCH_SIZE at a time
+  and their owners notified with one INSERT per batch; the pushes are
+  queued once the transaction commits
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from accounts.models import Courier
+from api import notifications
+from api.models import Document, Notification
+
+# The documents a courier needs to stay verified
+VERIFICATION_DOCUMENT_TYPES = ['license', 'insurance', 'vehicle_registration', 'id_card']
+
+
+def unverify_couriers(expired):
+    """
+    This clears is_verified of the couriers whose verification documents
+    are among expired and have not been replaced, and returns how many
+    """
+    current = Document.objects.filter(
+        user=OuterRef('user'),
+        document_type=OuterRef('document_type'),
+        is_verified=True,
+        is_expired=False,
+    )
+    lapsed = expired.filter(
+        user=OuterRef('pk'),
+        is_verified=True,
+        document_type__in=VERIFICATION_DOCUMENT_TYPES,
+    ).exclude(Exists(current))
+    return Courier.objects.filter(
+        Exists(lapsed),
+        is_verified=True,
+        pk__in=expired.values('user'),
+    ).update(is_verified=False)
+
+
+def _expiry_notification(document_id, user_id, document_type, labels):
+    return Notification(
+        user_id=user_id,
+        notification_type='message',
+        title=f'Your {labels.get(document_type, document_type)} has expired',
+        message=(
+            'Upload a current one to stay verified.'
+            if document_type in VERIFICATION_DOCUMENT_TYPES else 'Upload a current one if you still need it.'
+        ),
+        data={'document_id': str(document_id), 'document_type': document_type},
+    )
+
+
+def notify_owners(expired):
+    """
+    This notifies the owners of expired, NOTIFICATION_BATCH_SIZE
+    documents at a time
+    """
+    labels = {key: str(label) for key, label in Document.DOCUMENT_TYPE_CHOICES}
+    size = settings.NOTIFICATION_BATCH_SIZE
+    batch = []
+    for row in expired.order_by().values_list('pk', 'user_id', 'document_type').iterator(chunk_size=size):
+        batch.append(_expiry_notification(*row, labels))
+        if len(batch) == size:
+            notifications.send_notifications(batch)
+            batch = []
+    if batch:
+        notifications.send_notifications(batch)
+
+
+def expire_documents(today=None):
+    """
+    This marks the documents that expired before today as expired,
+    unverifies their couriers and notifies their owners. It returns the
+    number of documents expired and couriers unverified.
+    """
+    now = timezone.now()
+    today = today or timezone.localdate(now)
+    with transaction.atomic():
+        expired = Document.objects.filter(is_expired=False, expiry_date__lt=today).update(
+            is_expired=True,
+            updated_at=now,
+        )
+        if not expired:
+            return 0, 0
+        swept = Document.objects.filter(is_expired=True, updated_at=now)
+        unverified = unverify_couriers(swept)
+        notify_owners(swept)
+    return expired, unverified
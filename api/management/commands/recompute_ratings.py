@@ -0,0 +1,22 @@
+"""
+Rebuilds the users' rating totals from their ratings.
+"""
+from django.core.management.base import BaseCommand
+
+from accounts.models import UserAccount
+from api.ratings import recompute
+
+
+class Command(BaseCommand):
+    help = "Rebuild every user's rating sum and count from the Rating rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Users updated per UPDATE')
+
+    def handle(self, *args, **options):
+        ids = list(UserAccount.objects.order_by('pk').values_list('pk', flat=True))
+        updated = 0
+        for start in range(0, len(ids), options['batch_size']):
+            updated += recompute(UserAccount.objects.filter(pk__in=ids[start:start + options['batch_size']]))
+        self.stdout.write(self.style.SUCCESS(f'Recomputed the ratings of {updated} users'))
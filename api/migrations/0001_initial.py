@@ -0,0 +1,144 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:59
+
+import django.core.validators
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('payments', '0001_initial'),
+        ('shipments', '0009_delivery_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Promotion',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('code', models.CharField(max_length=20, unique=True)),
+                ('name', models.CharField(max_length=100)),
+                ('description', models.TextField(blank=True)),
+                ('promotion_type', models.CharField(choices=[('percentage', 'Percentage Discount'), ('fixed', 'Fixed Amount'), ('free_delivery', 'Free Delivery')], max_length=20)),
+                ('discount_value', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('max_discount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('min_order_amount', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('usage_limit', models.IntegerField(blank=True, null=True)),
+                ('used_count', models.IntegerField(default=0)),
+                ('is_active', models.BooleanField(default=True)),
+                ('start_date', models.DateTimeField()),
+                ('end_date', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-start_date'],
+                'indexes': [models.Index(fields=['code'], name='api_promoti_code_bf47fd_idx'), models.Index(fields=['is_active', '-end_date'], name='api_promoti_is_acti_da6890_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Document',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('document_type', models.CharField(choices=[('license', 'Driver License'), ('insurance', 'Insurance'), ('vehicle_registration', 'Vehicle Registration'), ('proof_of_delivery', 'Proof of Delivery'), ('id_card', 'ID Card'), ('other', 'Other')], max_length=30)),
+                ('file', models.FileField(upload_to='documents/%Y/%m/%d/')),
+                ('original_filename', models.CharField(max_length=255)),
+                ('file_size', models.IntegerField()),
+                ('is_verified', models.BooleanField(default=False)),
+                ('verification_date', models.DateTimeField(blank=True, null=True)),
+                ('expiry_date', models.DateField(blank=True, null=True)),
+                ('is_expired', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='documents', to=settings.AUTH_USER_MODEL)),
+                ('verified_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='verified_documents', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'document_type'], name='api_documen_user_id_719810_idx'), models.Index(fields=['is_verified'], name='api_documen_is_veri_a3595d_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('notification_type', models.CharField(choices=[('delivery_created', 'Delivery Created'), ('delivery_assigned', 'Delivery Assigned'), ('delivery_updated', 'Delivery Updated'), ('delivery_completed', 'Delivery Completed'), ('courier_arrived', 'Courier Arrived'), ('payment_received', 'Payment Received'), ('rating_received', 'Rating Received'), ('message', 'Message')], max_length=50)),
+                ('title', models.CharField(max_length=200)),
+                ('message', models.TextField()),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('is_read', models.BooleanField(default=False)),
+                ('read_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['-created_at'], name='api_notific_created_ae9e55_idx'), models.Index(fields=['user', 'is_read', '-created_at'], name='api_notific_user_id_4b7939_idx'), models.Index(fields=['notification_type'], name='api_notific_notific_574e18_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Rating',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('rating', models.IntegerField(choices=[(1, '1'), (2, '2'), (3, '3'), (4, '4'), (5, '5')], validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)])),
+                ('review', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('delivery', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rating', to='shipments.delivery')),
+                ('rated_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ratings_received', to=settings.AUTH_USER_MODEL)),
+                ('rater', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ratings_given', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['rated_user', '-created_at'], name='api_rating_rated_u_ec80a6_idx'), models.Index(fields=['rating'], name='api_rating_rating_7cf488_idx'), models.Index(fields=['created_at'], name='api_rating_created_ab00b7_idx')],
+                'unique_together': {('rater', 'delivery')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Support',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('subject', models.CharField(max_length=200)),
+                ('description', models.TextField()),
+                ('status', models.CharField(choices=[('open', 'Open'), ('in_progress', 'In Progress'), ('resolved', 'Resolved'), ('closed', 'Closed')], default='open', max_length=20)),
+                ('priority', models.CharField(choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High'), ('urgent', 'Urgent')], default='medium', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('assigned_to', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='assigned_tickets', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='support_tickets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['-created_at'], name='api_support_created_b356ae_idx'), models.Index(fields=['status', 'priority'], name='api_support_status_8b13a3_idx'), models.Index(fields=['user', 'status'], name='api_support_user_id_529325_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Transaction',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('transaction_type', models.CharField(choices=[('payment', 'Payment'), ('refund', 'Refund'), ('earning', 'Earning'), ('commission', 'Commission'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)])),
+                ('currency', models.CharField(default='NGN', max_length=3)),
+                ('description', models.TextField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='pending', max_length=20)),
+                ('metadata', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('delivery_ref', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='shipments.delivery')),
+                ('payment_ref', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='payments.payment')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', '-created_at'], name='api_transac_user_id_893f16_idx'), models.Index(fields=['transaction_type', '-created_at'], name='api_transac_transac_9374c6_idx'), models.Index(fields=['status'], name='api_transac_status_0f4e6a_idx'), models.Index(fields=['-created_at'], name='api_transac_created_632a57_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+        ('shipments', '0009_delivery_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rating',
+            name='delivery',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rating', to='shipments.delivery'),
+        ),
+    ]
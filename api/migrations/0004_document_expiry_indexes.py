@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_notification_user_created_at_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(condition=models.Q(('is_expired', False)), fields=['expiry_date'], name='api_document_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(condition=models.Q(('is_expired', True)), fields=['updated_at'], name='api_document_expired_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# The rating totals added in accounts 0004 start at zero; fill them in
+# from the ratings that already exist, as api.ratings.recompute() does.
+
+from django.db import migrations
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def recompute_rating_totals(apps, schema_editor):
+    Rating = apps.get_model('api', 'Rating')
+    UserAccount = apps.get_model('accounts', 'UserAccount')
+    ratings = Rating.objects.filter(rated_user=OuterRef('pk')).order_by().values('rated_user')
+    UserAccount.objects.update(
+        rating_sum=Coalesce(Subquery(ratings.annotate(total=Sum('rating')).values('total'),
+                                     output_field=IntegerField()), Value(0)),
+        rating_count=Coalesce(Subquery(ratings.annotate(count=Count('pk')).values('count'),
+                                       output_field=IntegerField()), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_useraccount_rating'),
+        ('api', '0004_document_expiry_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(recompute_rating_totals, migrations.RunPython.noop),
+    ]
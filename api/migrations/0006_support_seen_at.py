@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_recompute_rating_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='support',
+            name='seen_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def queue_unrolled_ratings(apps, schema_editor):
+    # Ratings given after the old created_at watermark are not in the
+    # rollups yet; queue them as changes.
+    Rating = apps.get_model('api', 'Rating')
+    RatingChange = apps.get_model('api', 'RatingChange')
+    RollupWatermark = apps.get_model('shipments', 'RollupWatermark')
+    ratings = Rating.objects.order_by()
+    watermark = RollupWatermark.objects.filter(source='ratings').first()
+    if watermark and watermark.processed_until:
+        ratings = ratings.filter(created_at__gt=watermark.processed_until)
+    RatingChange.objects.bulk_create(
+        (
+            RatingChange(rated_user_id=user_id, rated_at=created_at, rating_delta=rating, count_delta=1)
+            for user_id, created_at, rating in ratings.values_list('rated_user_id', 'created_at', 'rating').iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_support_seen_at'),
+        ('shipments', '0012_deliveryevent_rolled_up'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rated_at', models.DateTimeField()),
+                ('rating_delta', models.IntegerField()),
+                ('count_delta', models.SmallIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('rated_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(queue_unrolled_ratings, migrations.RunPython.noop),
+    ]
@@ -2,7 +2,7 @@
 Database Models Optimization & Additional Features
 Enhanced models with indexing, validation, and business logic
 """
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db.models import Q
@@ -40,6 +40,7 @@ class Notification(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['-created_at']),
+            models.Index(fields=['user', '-created_at']),
             models.Index(fields=['user', 'is_read', '-created_at']),
             models.Index(fields=['notification_type']),
         ]
@@ -49,11 +50,9 @@ class Notification(models.Model):
     
     def mark_as_read(self):
         """Mark notification as read"""
-        from django.utils import timezone
-        if not self.is_read:
-            self.is_read = True
-            self.read_at = timezone.now()
-            self.save(update_fields=['is_read', 'read_at'])
+        from api.notifications import mark_read
+        if not self.is_read and mark_read(self.user_id, [self.pk]):
+            self.refresh_from_db(fields=['is_read', 'read_at', 'updated_at'])
 
 
 class Rating(models.Model):
@@ -64,7 +63,7 @@ class Rating(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     rater = models.ForeignKey('accounts.UserAccount', on_delete=models.CASCADE, related_name='ratings_given')
     rated_user = models.ForeignKey('accounts.UserAccount', on_delete=models.CASCADE, related_name='ratings_received')
-    delivery = models.OneToOneField('shipments.Delivery', on_delete=models.CASCADE, related_name='rating', null=True, blank=True)
+    delivery = models.OneToOneField('shipments.Delivery', on_delete=models.SET_NULL, related_name='rating', null=True, blank=True)
     
     rating = models.IntegerField(choices=RATING_CHOICES, validators=[MinValueValidator(1), MaxValueValidator(5)])
     review = models.TextField(blank=True)
@@ -78,11 +77,36 @@ class Rating(models.Model):
         indexes = [
             models.Index(fields=['rated_user', '-created_at']),
             models.Index(fields=['rating']),
+            models.Index(fields=['created_at']),
         ]
     
     def __str__(self):
         return f"{self.rater.email} rated {self.rated_user.email} - {self.rating}⭐"
 
+    def save(self, *args, **kwargs):
+        # The signals of api.ratings lock the row and update the totals in
+        # the same transaction as the save.
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            return super().delete(*args, **kwargs)
+
+
+class RatingChange(models.Model):
+    """Changes to ratings waiting to be added to the delivery rollups"""
+    
+    rated_user = models.ForeignKey('accounts.UserAccount', on_delete=models.CASCADE, related_name='+')
+    # When the rating was first given; edits count towards that period
+    rated_at = models.DateTimeField()
+    rating_delta = models.IntegerField()
+    count_delta = models.SmallIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.rating_delta:+} for {self.rated_user_id}"
+
 
 class Transaction(models.Model):
     """Transaction tracking for audit and accounting"""
@@ -126,7 +150,7 @@ class Transaction(models.Model):
             models.Index(fields=['user', '-created_at']),
             models.Index(fields=['transaction_type', '-created_at']),
             models.Index(fields=['status']),
-            models.Index(fields='-created_at'),
+            models.Index(fields=['-created_at']),
         ]
     
     def __str__(self):
@@ -219,6 +243,8 @@ class Support(models.Model):
     
     assigned_to = models.ForeignKey('accounts.UserAccount', on_delete=models.SET_NULL, 
                                    null=True, blank=True, related_name='assigned_tickets')
+    # Set once the ticket is pushed to a connection of its agent, see api.support
+    seen_at = models.DateTimeField(null=True, blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -272,6 +298,9 @@ class Document(models.Model):
         indexes = [
             models.Index(fields=['user', 'document_type']),
             models.Index(fields=['is_verified']),
+            # The expiry sweep, see api/documents.py
+            models.Index(fields=['expiry_date'], condition=models.Q(is_expired=False), name='api_document_expiry_idx'),
+            models.Index(fields=['updated_at'], condition=models.Q(is_expired=True), name='api_document_expired_idx'),
         ]
     
     def __str__(self):
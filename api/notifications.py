@@ -0,0 +1,189 @@
+"""
+This module creates users' notifications and pushes them.
+
+send_notifications() inserts notifications with bulk_create,
+NOTIFICATION_BATCH_SIZE rows per INSERT, and once the transaction commits
+queues one push_notifications task per batch. The task sends each
+notification to its user's notifications_<user id> channel group, all of
+the batch's group sends at once, and to the couriers' devices with one
+FCM multicast per distinct title and message.
+
+Each user's unread count is cached for NOTIFICATION_UNREAD_CACHE_SECONDS.
+New and read notifications change the cached count with atomic INCR and
+DECR rather than a recount; a user without a cached count is counted with
+one query the next time the count is asked for.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from functools import partial
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import Courier
+from api.models import Notification
+from deliveet.utils.firebase import firebase_messaging
+
+logger = logging.getLogger(__name__)
+
+# The most tokens one FCM multicast message takes
+FCM_MULTICAST_LIMIT = 500
+
+
+def _unread_key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def _change_unread(user_id, delta):
+    """
+    This adds delta to the user's cached unread count, if there is one
+    """
+    key = _unread_key(user_id)
+    try:
+        if cache.incr(key, delta) < 0:
+            cache.delete(key)
+    except ValueError:
+        # Not cached; the next read counts.
+        pass
+
+
+def unread_count(user_id):
+    """
+    This returns the number of the user's unread notifications
+    """
+    key = _unread_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(user_id=user_id, is_read=False).count()
+        # add() keeps a count another request changed in the meantime.
+        cache.add(key, count, timeout=settings.NOTIFICATION_UNREAD_CACHE_SECONDS)
+    return count
+
+
+def send_notifications(notifications):
+    """
+    This saves unsaved Notification instances, for any number of users,
+    and pushes them once the transaction commits
+    """
+    notifications = Notification.objects.bulk_create(notifications, batch_size=settings.NOTIFICATION_BATCH_SIZE)
+    for start in range(0, len(notifications), settings.NOTIFICATION_BATCH_SIZE):
+        transaction.on_commit(partial(_committed, notifications[start:start + settings.NOTIFICATION_BATCH_SIZE]))
+    return notifications
+
+
+def notify_users(users, notification_type, title, message, data=None):
+    """
+    This sends the same notification to each of users, given as users or
+    their ids
+    """
+    return send_notifications([
+        Notification(
+            user_id=getattr(user, 'pk', user),
+            notification_type=notification_type,
+            title=title,
+            message=message,
+            data=data or {},
+        )
+        for user in users
+    ])
+
+
+def _committed(notifications):
+    from api.tasks import push_notifications
+
+    unread = defaultdict(int)
+    for notification in notifications:
+        unread[notification.user_id] += 1
+    for user_id, count in unread.items():
+        _change_unread(user_id, count)
+    push_notifications.delay([str(notification.pk) for notification in notifications])
+
+
+def mark_read(user_id, ids=None):
+    """
+    This marks the user's unread notifications, or those of them in ids,
+    as read with one UPDATE and returns how many it marked
+    """
+    notifications = Notification.objects.filter(user_id=user_id, is_read=False)
+    if ids is not None:
+        notifications = notifications.filter(pk__in=ids)
+    now = timezone.now()
+    marked = notifications.update(is_read=True, read_at=now, updated_at=now)
+    if marked:
+        transaction.on_commit(partial(_change_unread, user_id, -marked))
+    return marked
+
+
+def _channel_message(notification):
+    return {
+        'type': 'send_notification',
+        'id': str(notification.pk),
+        'notification_type': notification.notification_type,
+        'title': notification.title,
+        'message': notification.message,
+        'data': notification.data,
+        'created_at': notification.created_at.isoformat(),
+    }
+
+
+async def _send_to_channels(notifications):
+    layer = get_channel_layer()
+    await asyncio.gather(*(
+        layer.group_send(f'notifications_{notification.user_id}', _channel_message(notification))
+        for notification in notifications
+    ))
+
+
+def _send_to_devices(notifications):
+    """
+    This sends one FCM multicast per distinct title and message to the
+    devices of the notified couriers
+    """
+    tokens = dict(
+        Courier.objects.filter(user_id__in={notification.user_id for notification in notifications})
+        .exclude(fcm_token__isnull=True).exclude(fcm_token='')
+        .values_list('user_id', 'fcm_token')
+    )
+    recipients = defaultdict(list)
+    for notification in notifications:
+        if notification.user_id in tokens:
+            recipients[(notification.title, notification.message)].append(tokens[notification.user_id])
+    if not recipients:
+        return
+
+    try:
+        messaging = firebase_messaging()
+    except ImproperlyConfigured as error:
+        logger.warning('Not pushing %s notifications to devices: %s', len(notifications), error)
+        return
+
+    for (title, body), device_tokens in recipients.items():
+        for start in range(0, len(device_tokens), FCM_MULTICAST_LIMIT):
+            message = messaging.MulticastMessage(
+                notification=messaging.Notification(title=title, body=body),
+                tokens=device_tokens[start:start + FCM_MULTICAST_LIMIT],
+            )
+            try:
+                messaging.send_multicast(message)
+            except Exception as error:
+                logger.warning('Pushing %s notifications to devices failed: %s', len(device_tokens), error)
+
+
+def push(ids):
+    """
+    This pushes the notifications still unread to their users' open
+    connections and devices
+    """
+    notifications = list(Notification.objects.filter(pk__in=ids, is_read=False))
+    if not notifications:
+        return 0
+
+    async_to_sync(_send_to_channels)(notifications)
+    _send_to_devices(notifications)
+    return len(notifications)
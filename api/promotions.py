@@ -0,0 +1,115 @@
+"""
+This module checks and redeems promotion codes.
+
+Codes are looked up in the default cache, Redis in production, for
+PROMOTION_CACHE_SECONDS, so checking a code at checkout does not read the
+database; unknown codes are cached too. Saving or deleting a Promotion
+drops its cached copy.
+
+The cached copy may be behind the database, so it is only used to price
+an order. redeem() takes a use with one conditional UPDATE,
+used_count = used_count + 1 WHERE used_count < usage_limit and the
+promotion is active and current, so concurrent checkouts cannot take more
+uses than usage_limit and nothing waits on a row lock to check.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q
+from django.utils import timezone
+
+from api.models import Promotion
+
+# The fields kept in the cache; used_count changes on every redemption.
+CACHED_FIELDS = [
+    'id', 'code', 'name', 'promotion_type', 'discount_value', 'max_discount',
+    'min_order_amount', 'usage_limit', 'is_active', 'start_date', 'end_date',
+]
+
+
+class PromotionError(Exception):
+    """
+    This is raised when a promotion code cannot be used
+    """
+
+
+def _cache_key(code):
+    return f'promotions:code:{code.strip()}'
+
+
+def forget(code):
+    """
+    This drops the cached copy of the promotion with the code
+    """
+    cache.delete(_cache_key(code))
+
+
+def get_promotion(code):
+    """
+    This returns the promotion with the code, read from the cache when it
+    can be, or None when there is no such promotion. Its used_count is not
+    kept up to date.
+    """
+    key = _cache_key(code)
+    fields = cache.get(key)
+    if fields is None:
+        promotion = Promotion.objects.filter(code=code.strip()).values(*CACHED_FIELDS, 'used_count').first()
+        fields = promotion or {}
+        if promotion and promotion['usage_limit'] is not None:
+            # Known to be used up until it is saved again.
+            fields['exhausted'] = promotion['used_count'] >= promotion['usage_limit']
+        fields.pop('used_count', None)
+        cache.set(key, fields, timeout=settings.PROMOTION_CACHE_SECONDS)
+    if not fields:
+        return None
+    fields = dict(fields)
+    exhausted = fields.pop('exhausted', False)
+    # is_valid() only compares used_count with usage_limit.
+    promotion = Promotion(**fields, used_count=fields['usage_limit'] if exhausted else 0)
+    promotion._state.adding = False
+    return promotion
+
+
+def discount_for(promotion, amount):
+    """
+    This returns the discount the promotion gives on amount, to the kobo
+    and never more than amount
+    """
+    if promotion.promotion_type == 'free_delivery':
+        discount = amount
+    else:
+        discount = Decimal(promotion.apply_discount(amount))
+    return min(discount, amount).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def check(code, amount):
+    """
+    This returns the promotion with the code if it can be used on an order
+    of amount, and raises PromotionError otherwise
+    """
+    promotion = get_promotion(code)
+    if promotion is None or not promotion.is_valid():
+        raise PromotionError('This promotion code is not valid.')
+    if amount < promotion.min_order_amount:
+        raise PromotionError(f'This promotion code needs an order of at least {promotion.min_order_amount}.')
+    return promotion
+
+
+def redeem(promotion):
+    """
+    This takes one use of the promotion with a conditional UPDATE, and
+    raises PromotionError when it is used up, inactive or out of date
+    """
+    now = timezone.now()
+    redeemed = Promotion.objects.filter(
+        Q(usage_limit__isnull=True) | Q(used_count__lt=F('usage_limit')),
+        pk=promotion.pk,
+        is_active=True,
+        start_date__lte=now,
+        end_date__gte=now,
+    ).update(used_count=F('used_count') + 1, updated_at=now)
+    if not redeemed:
+        forget(promotion.code)
+        raise PromotionError('This promotion code is no longer available.')
+    return promotion
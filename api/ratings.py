@@ -0,0 +1,102 @@
+"""
+This module keeps each user's rating totals up to date.
+
+UserAccount.rating_sum and rating_count hold the sum and number of the
+ratings a user has received, and UserAccount.rating, their average, is a
+column the database computes from them, so couriers can be ordered and
+filtered by rating in SQL without averaging Rating rows.
+
+Saving or deleting a Rating changes the totals with one UPDATE that adds
+the difference, rating_sum = rating_sum + delta, so concurrent ratings of
+the same user do not overwrite each other. The difference is taken from
+the rating's row, locked in the transaction Rating.save() and delete()
+open, so concurrent edits of one rating are applied one after another. Bulk changes such as
+QuerySet.update() send no signals; recompute() rebuilds the totals from
+the Rating rows after them.
+
+Each difference is also queued as a RatingChange, dated when the rating
+was first given, for shipments.rollups to add to the delivery rollups.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from accounts.models import UserAccount
+from api.models import Rating, RatingChange
+
+
+def change_totals(user_id, rating_delta, count_delta):
+    """
+    This adds rating_delta and count_delta to the user's rating totals
+    """
+    if rating_delta or count_delta:
+        UserAccount.objects.filter(pk=user_id).update(
+            rating_sum=F('rating_sum') + rating_delta,
+            rating_count=F('rating_count') + count_delta,
+        )
+
+
+def _change(user_id, rated_at, rating_delta, count_delta):
+    change_totals(user_id, rating_delta, count_delta)
+    if rating_delta or count_delta:
+        RatingChange.objects.create(
+            rated_user_id=user_id,
+            rated_at=rated_at,
+            rating_delta=rating_delta,
+            count_delta=count_delta,
+        )
+
+
+def remember_previous(rating):
+    """
+    This locks a Rating's row and records the rated user and rating it has
+    before it is saved or deleted, so that the totals change by the
+    difference even when the same rating is edited concurrently. Call it
+    in the transaction that saves or deletes the rating.
+    """
+    rating._previous = None
+    if not rating._state.adding:
+        rating._previous = (
+            Rating.objects.select_for_update().filter(pk=rating.pk)
+            .values_list('rated_user_id', 'rating').first()
+        )
+
+
+def rating_saved(rating):
+    """
+    This adds a saved Rating to its user's totals, less what it counted
+    before the save
+    """
+    previous = getattr(rating, '_previous', None)
+    if previous is None:
+        _change(rating.rated_user_id, rating.created_at, rating.rating, 1)
+    elif previous[0] == rating.rated_user_id:
+        _change(rating.rated_user_id, rating.created_at, rating.rating - previous[1], 0)
+    else:
+        _change(previous[0], rating.created_at, -previous[1], -1)
+        _change(rating.rated_user_id, rating.created_at, rating.rating, 1)
+    rating._previous = (rating.rated_user_id, rating.rating)
+
+
+def rating_deleted(rating):
+    """
+    This takes a deleted Rating off its user's totals, as it was in the
+    database when it was deleted
+    """
+    user_id, value = getattr(rating, '_previous', None) or (rating.rated_user_id, rating.rating)
+    _change(user_id, rating.created_at, -value, -1)
+
+
+def recompute(users=None):
+    """
+    This rebuilds the rating totals of users, or of every user, from their
+    ratings with one UPDATE and returns the number of users updated
+    """
+    ratings = Rating.objects.filter(rated_user=OuterRef('pk')).order_by().values('rated_user')
+    total = ratings.annotate(total=Sum('rating')).values('total')
+    count = ratings.annotate(count=Count('pk')).values('count')
+    if users is None:
+        users = UserAccount.objects.all()
+    return users.update(
+        rating_sum=Coalesce(Subquery(total, output_field=IntegerField()), Value(0)),
+        rating_count=Coalesce(Subquery(count, output_field=IntegerField()), Value(0)),
+    )
@@ -41,10 +41,12 @@ class UserAccountSerializer(serializers.ModelSerializer):
 class CourierSerializer(serializers.ModelSerializer):
     """Serializer for Courier model"""
     user = UserAccountSerializer(read_only=True)
+    rating = serializers.FloatField(source='user.rating', read_only=True)
+    rating_count = serializers.IntegerField(source='user.rating_count', read_only=True)
     
     class Meta:
         model = Courier
-        fields = ['id', 'user', 'rating', 'total_deliveries', 'vehicle_type',
+        fields = ['id', 'user', 'rating', 'rating_count', 'total_deliveries', 'vehicle_type',
                   'license_number', 'insurance_number', 'is_verified', 'is_available']
         read_only_fields = ['id', 'total_deliveries']
 
@@ -0,0 +1,77 @@
+"""
+This module contains signals for the api app.
+"""
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from api import promotions, ratings, support
+from api.models import Promotion, Rating, Support
+
+
+@receiver(pre_save, sender=Rating)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    """
+    The function to record what a rating counted before it is changed.
+    """
+    if not raw:
+        ratings.remember_previous(instance)
+
+
+@receiver(post_save, sender=Rating)
+def add_rating_to_totals(sender, instance, raw=False, **kwargs):
+    """
+    The function to add a new or changed rating to its user's totals.
+    """
+    if not raw:
+        ratings.rating_saved(instance)
+
+
+@receiver(pre_delete, sender=Rating)
+def remember_deleted_rating(sender, instance, **kwargs):
+    """
+    The function to record what a rating counts before it is deleted.
+    """
+    ratings.remember_previous(instance)
+
+
+@receiver(post_delete, sender=Rating)
+def remove_rating_from_totals(sender, instance, **kwargs):
+    """
+    The function to take a deleted rating off its user's totals.
+    """
+    ratings.rating_deleted(instance)
+
+
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+def forget_cached_promotion(sender, instance, **kwargs):
+    """
+    The function to drop the cached copy of a changed promotion.
+    """
+    promotions.forget(instance.code)
+
+
+@receiver(pre_save, sender=Support)
+def remember_previous_ticket(sender, instance, raw=False, **kwargs):
+    """
+    The function to record a ticket's status and agent before it changes.
+    """
+    if not raw:
+        support.remember_previous(instance)
+
+
+@receiver(post_save, sender=Support)
+def route_ticket(sender, instance, raw=False, **kwargs):
+    """
+    The function to queue new and reopened tickets and keep agents' loads.
+    """
+    if not raw:
+        support.ticket_saved(instance)
+
+
+@receiver(post_delete, sender=Support)
+def release_ticket(sender, instance, **kwargs):
+    """
+    The function to take a deleted ticket off its agent's load.
+    """
+    support.ticket_deleted(instance)
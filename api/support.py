@@ -0,0 +1,450 @@
+"""
+This module routes open support tickets to the least loaded agents.
+
+Open, unassigned tickets wait in a priority queue, urgent before high
+before medium before low and oldest first within a priority. Staff users
+connected to the support WebSocket are the agents on duty; each has a
+load, the number of tickets in progress assigned to them. assign_tickets()
+repeatedly gives the first ticket in the queue to the agent on duty with
+the smallest load below SUPPORT_AGENT_CAPACITY, takes the ticket with a
+conditional UPDATE (WHERE status = 'open' AND assigned_to IS NULL) so a
+ticket changed in the meantime is skipped, and pushes it to the agent's
+support_agent_<user id> channel group.
+
+The queue and the loads are sorted sets in the default cache's Redis, and
+a ticket and its agent are picked with one Lua script, so several web and
+worker processes can assign at once without giving an agent more than
+their capacity. When the cache is not Redis, as in development and tests,
+they are kept in process memory instead.
+
+An agent is on duty while they have a live connection. Each connection
+is recorded with an expiry SUPPORT_CONNECTION_TTL_SECONDS ahead, which the
+consumer pushes back with a heartbeat, so a connection whose process died
+without closing it lapses on its own.
+
+The database stays the record of which tickets are open and who works on
+them. requeue() runs every SUPPORT_REQUEUE_SECONDS: it takes agents whose
+connections have all lapsed off duty and reopens the tickets they were
+never shown, adds the open, unassigned tickets back to the queue, reading
+them one priority at a time through the (status, priority) index, and
+recounts the loads of the agents on duty. That restores the queue after
+Redis restarts and repairs anything a failed Redis call missed; a ticket
+queued twice is only assigned once, because the UPDATE that assigns it is
+conditional.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from api.models import Support
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = 'support:queue'
+LOAD_KEY = 'support:load'
+CONNECTIONS_KEY = 'support:connections:{}'
+
+# Lower ranks are assigned first
+PRIORITY_RANK = {'urgent': 0, 'high': 1, 'medium': 2, 'low': 3}
+
+# KEYS: queue, loads; ARGV[1]: the capacity. Returns {ticket, agent} and
+# counts the ticket against the agent, or nil when there is no ticket or
+# no agent with room for one.
+ASSIGN_SCRIPT = """
+local agent = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', '(' .. ARGV[1], 'LIMIT', 0, 1)[1]
+if not agent then
+    return nil
+end
+local ticket = redis.call('ZPOPMIN', KEYS[1])[1]
+if not ticket then
+    return nil
+end
+redis.call('ZINCRBY', KEYS[2], 1, agent)
+return {ticket, agent}
+"""
+
+# KEYS: the agent's connections, loads; ARGV: the agent, the connection,
+# its expiry, the agent's load and the TTL. Records or refreshes the
+# connection and puts the agent on duty if they are not.
+CONNECT_SCRIPT = """
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+redis.call('ZADD', KEYS[2], 'NX', ARGV[4], ARGV[1])
+"""
+
+# KEYS: the agent's connections, loads; ARGV: the agent, the connection
+# (empty to only drop lapsed ones) and the time. Takes the agent off duty
+# when no live connection is left and returns 1 if they were on duty.
+DISCONNECT_SCRIPT = """
+if ARGV[2] ~= '' then
+    redis.call('ZREM', KEYS[1], ARGV[2])
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[3])
+if redis.call('ZCARD', KEYS[1]) > 0 then
+    return 0
+end
+return redis.call('ZREM', KEYS[2], ARGV[1])
+"""
+
+
+def ticket_score(priority, created_at):
+    """
+    This returns the queue position of a ticket: its priority's rank, then
+    its creation time in milliseconds
+    """
+    return PRIORITY_RANK.get(priority, PRIORITY_RANK['medium']) * 10 ** 13 + int(created_at.timestamp() * 1000)
+
+
+class LocalQueue:
+    """
+    This is the in-process queue used without Redis. Each process has its
+    own queue and agents, so it is only fit for a single process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def add(self, scores):
+        with self._lock:
+            self._tickets.update(scores)
+
+    def assign(self, capacity):
+        with self._lock:
+            agents = [(load, agent) for agent, load in self._loads.items() if load < capacity]
+            if not agents or not self._tickets:
+                return None
+            agent = min(agents)[1]
+            ticket = min(self._tickets, key=lambda ticket: (self._tickets[ticket], ticket))
+            del self._tickets[ticket]
+            self._loads[agent] += 1
+            return ticket, agent
+
+    def change_load(self, agent, delta):
+        with self._lock:
+            if agent in self._loads:
+                self._loads[agent] += delta
+
+    def agents(self):
+        with self._lock:
+            return list(self._loads)
+
+    def set_loads(self, loads):
+        with self._lock:
+            for agent in self._loads:
+                self._loads[agent] = loads.get(agent, 0)
+
+    def connect(self, agent, connection, load, expires, ttl):
+        with self._lock:
+            self._connections.setdefault(agent, {})[connection] = expires
+            self._loads.setdefault(agent, load)
+
+    def disconnect(self, agent, connection, now):
+        with self._lock:
+            connections = self._connections.get(agent, {})
+            connections.pop(connection, None)
+            for lapsed in [key for key, expires in connections.items() if expires <= now]:
+                del connections[lapsed]
+            if connections:
+                return False
+            self._connections.pop(agent, None)
+            return self._loads.pop(agent, None) is not None
+
+    def clear(self):
+        self._tickets = {}
+        self._loads = {}
+        self._connections = {}
+
+
+class RedisQueue:
+    """
+    This is the queue kept in Redis, shared by every process
+    """
+
+    def __init__(self, redis):
+        self.redis = redis
+        self._assign = redis.register_script(ASSIGN_SCRIPT)
+        self._connect = redis.register_script(CONNECT_SCRIPT)
+        self._disconnect = redis.register_script(DISCONNECT_SCRIPT)
+
+    def add(self, scores):
+        if scores:
+            self.redis.zadd(QUEUE_KEY, scores)
+
+    def assign(self, capacity):
+        picked = self._assign(keys=[QUEUE_KEY, LOAD_KEY], args=[capacity])
+        if not picked:
+            return None
+        ticket, agent = picked
+        return ticket.decode(), agent.decode()
+
+    def change_load(self, agent, delta):
+        # XX: agents off duty have no load to change.
+        self.redis.zadd(LOAD_KEY, {agent: delta}, xx=True, incr=True)
+
+    def agents(self):
+        return [agent.decode() for agent in self.redis.zrange(LOAD_KEY, 0, -1)]
+
+    def set_loads(self, loads):
+        agents = self.agents()
+        if agents:
+            self.redis.zadd(LOAD_KEY, {agent: loads.get(agent, 0) for agent in agents}, xx=True)
+
+    def connect(self, agent, connection, load, expires, ttl):
+        self._connect(keys=[CONNECTIONS_KEY.format(agent), LOAD_KEY], args=[agent, connection, expires, load, ttl])
+
+    def disconnect(self, agent, connection, now):
+        return bool(self._disconnect(keys=[CONNECTIONS_KEY.format(agent), LOAD_KEY], args=[agent, connection, now]))
+
+
+local_queue = LocalQueue()
+_redis_queue = None
+
+
+def get_queue():
+    """
+    This returns the queue in the default cache's Redis, or the in-process
+    queue when the cache is not Redis
+    """
+    global _redis_queue
+    if _redis_queue is None:
+        from django_redis import get_redis_connection
+
+        try:
+            _redis_queue = RedisQueue(get_redis_connection('default'))
+        except NotImplementedError:
+            _redis_queue = False
+    return _redis_queue or local_queue
+
+
+def _agent_load(agent_id):
+    return Support.objects.filter(status='in_progress', assigned_to_id=agent_id).count()
+
+
+def queue_tickets(tickets):
+    """
+    This adds open, unassigned tickets to the queue
+    """
+    get_queue().add({
+        str(ticket.pk): ticket_score(ticket.priority, ticket.created_at)
+        for ticket in tickets
+        if ticket.status == 'open' and ticket.assigned_to_id is None
+    })
+
+
+def change_load(agent_id, delta):
+    """
+    This changes the load of an agent on duty by delta
+    """
+    get_queue().change_load(str(agent_id), delta)
+
+
+def assign_tickets():
+    """
+    This gives queued tickets to the least loaded agents on duty until the
+    queue is empty or every agent is at capacity, pushes them to the
+    agents and returns how many were assigned
+    """
+    queue = get_queue()
+    assigned = []
+    while True:
+        picked = queue.assign(settings.SUPPORT_AGENT_CAPACITY)
+        if picked is None:
+            break
+        ticket_id, agent_id = picked
+        updated = Support.objects.filter(pk=ticket_id, status='open', assigned_to__isnull=True).update(
+            status='in_progress',
+            assigned_to_id=agent_id,
+            seen_at=None,
+        )
+        if updated:
+            assigned.append(ticket_id)
+        else:
+            # Closed or assigned by hand since it was queued
+            queue.change_load(agent_id, -1)
+    if assigned:
+        push(assigned)
+    return len(assigned)
+
+
+def _connect(agent_id, connection):
+    ttl = settings.SUPPORT_CONNECTION_TTL_SECONDS
+    get_queue().connect(str(agent_id), connection, _agent_load(agent_id), time.time() + ttl, ttl)
+
+
+def agent_connected(agent_id, connection):
+    """
+    This puts an agent on duty for one more connection and gives them
+    tickets if they have room
+    """
+    _connect(agent_id, connection)
+    return assign_tickets()
+
+
+def agent_heartbeat(agent_id, connection):
+    """
+    This keeps a live connection of an agent from lapsing
+    """
+    _connect(agent_id, connection)
+
+
+def agent_disconnected(agent_id, connection):
+    """
+    This takes an agent off duty once their last connection closes
+    """
+    get_queue().disconnect(str(agent_id), connection, time.time())
+
+
+def ticket_seen(ticket_id, agent_id):
+    """
+    This records that a ticket was pushed to a connection of its agent
+    """
+    Support.objects.filter(pk=ticket_id, assigned_to_id=agent_id, seen_at__isnull=True).update(
+        seen_at=timezone.now()
+    )
+
+
+def release_lapsed_agents():
+    """
+    This takes agents whose connections have all lapsed off duty and
+    reopens the tickets in progress they were never shown. It returns
+    the number of tickets reopened.
+    """
+    queue = get_queue()
+    now = time.time()
+    lapsed = [agent for agent in queue.agents() if queue.disconnect(agent, '', now)]
+    if not lapsed:
+        return 0
+    logger.info('Support agents %s lost their connections', ', '.join(lapsed))
+    # requeue() queues the reopened tickets with the other open ones.
+    return Support.objects.filter(status='in_progress', assigned_to__in=lapsed, seen_at__isnull=True).update(
+        status='open',
+        assigned_to=None,
+    )
+
+
+def requeue(batch_size=1000):
+    """
+    This takes lapsed agents off duty, adds every open, unassigned ticket
+    back to the queue, recounts the loads of the agents on duty and
+    assigns what it can. It returns the number of tickets queued.
+    """
+    release_lapsed_agents()
+    queued = 0
+    for priority in PRIORITY_RANK:
+        # Equal status and priority: a range of the (status, priority) index
+        tickets = Support.objects.filter(status='open', priority=priority, assigned_to__isnull=True).order_by()
+        batch = []
+        for ticket in tickets.only('pk', 'status', 'priority', 'assigned_to', 'created_at').iterator(chunk_size=batch_size):
+            batch.append(ticket)
+            if len(batch) == batch_size:
+                queue_tickets(batch)
+                queued += len(batch)
+                batch = []
+        queue_tickets(batch)
+        queued += len(batch)
+
+    queue = get_queue()
+    agents = queue.agents()
+    if agents:
+        loads = (
+            Support.objects.filter(status='in_progress', assigned_to__in=agents)
+            .order_by().values('assigned_to').annotate(load=Count('pk'))
+        )
+        queue.set_loads({str(row['assigned_to']): row['load'] for row in loads})
+    assign_tickets()
+    return queued
+
+
+def remember_previous(ticket):
+    """
+    This records the status and agent a ticket had before it is saved
+    """
+    ticket._previous = None
+    if not ticket._state.adding:
+        ticket._previous = Support.objects.filter(pk=ticket.pk).values_list('status', 'assigned_to_id').first()
+
+
+def _counted(status, agent_id):
+    return agent_id if status == 'in_progress' else None
+
+
+def _apply_change(ticket, previous):
+    before = _counted(*previous) if previous else None
+    after = _counted(ticket.status, ticket.assigned_to_id)
+    if before != after:
+        if before is not None:
+            change_load(before, -1)
+        if after is not None:
+            change_load(after, 1)
+    queue_tickets([ticket])
+    assign_tickets()
+
+
+def ticket_saved(ticket):
+    """
+    This changes the agents' loads for a saved ticket, queues it if it is
+    open and unassigned and assigns tickets, once the transaction commits
+    """
+    previous = getattr(ticket, '_previous', None)
+    ticket._previous = (ticket.status, ticket.assigned_to_id)
+
+    def committed():
+        try:
+            _apply_change(ticket, previous)
+        except Exception as error:
+            # requeue() picks the ticket up and recounts the loads.
+            logger.warning('Routing support ticket %s failed: %s', ticket.pk, error)
+
+    transaction.on_commit(committed)
+
+
+def ticket_deleted(ticket):
+    """
+    This takes a deleted ticket off its agent's load
+    """
+    agent_id = _counted(ticket.status, ticket.assigned_to_id)
+    if agent_id is not None:
+        transaction.on_commit(lambda: change_load(agent_id, -1))
+
+
+def _channel_message(ticket):
+    return {
+        'type': 'ticket_assigned',
+        'ticket': {
+            'id': str(ticket.pk),
+            'subject': ticket.subject,
+            'description': ticket.description,
+            'priority': ticket.priority,
+            'status': ticket.status,
+            'user_id': str(ticket.user_id),
+            'created_at': ticket.created_at.isoformat(),
+        },
+    }
+
+
+async def _send_to_agents(tickets):
+    layer = get_channel_layer()
+    await asyncio.gather(*(
+        layer.group_send(f'support_agent_{ticket.assigned_to_id}', _channel_message(ticket))
+        for ticket in tickets
+    ))
+
+
+def push(ids):
+    """
+    This pushes newly assigned tickets to their agents' connections
+    """
+    tickets = {str(ticket.pk): ticket for ticket in Support.objects.filter(pk__in=ids)}
+    try:
+        async_to_sync(_send_to_agents)([tickets[pk] for pk in ids if pk in tickets])
+    except Exception as error:
+        logger.warning('Pushing %s assigned support tickets failed: %s', len(ids), error)
@@ -0,0 +1,33 @@
+"""
+This module contains the Celery tasks of the api app.
+"""
+from celery import shared_task
+
+from api import documents, notifications, support
+
+
+@shared_task(ignore_result=True)
+def push_notifications(ids):
+    """
+    This pushes a batch of new notifications to their users' connections
+    and devices
+    """
+    return notifications.push(ids)
+
+
+@shared_task(ignore_result=True)
+def expire_documents():
+    """
+    This marks documents past their expiry date as expired and
+    unverifies their couriers
+    """
+    return documents.expire_documents()
+
+
+@shared_task(ignore_result=True)
+def requeue_support_tickets():
+    """
+    This puts open, unassigned support tickets back in the queue and
+    assigns them to the agents on duty
+    """
+    return support.requeue()
@@ -6,7 +6,8 @@ from rest_framework.routers import DefaultRouter
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 from .views import (
     AuthenticationViewSet, UserAccountViewSet, CourierViewSet,
-    CustomerViewSet, ShipmentViewSet, DeliveryViewSet, WalletViewSet
+    CustomerViewSet, ShipmentViewSet, DeliveryViewSet, WalletViewSet,
+    NotificationViewSet
 )
 
 router = DefaultRouter()
@@ -17,6 +18,7 @@ router.register(r'customers', CustomerViewSet, basename='customer')
 router.register(r'shipments', ShipmentViewSet, basename='shipment')
 router.register(r'deliveries', DeliveryViewSet, basename='delivery')
 router.register(r'wallets', WalletViewSet, basename='wallet')
+router.register(r'notifications', NotificationViewSet, basename='notification')
 
 app_name = 'api'
 
@@ -1,12 +1,16 @@
 """
 API Views for Deliveet
 """
-from rest_framework import viewsets, status, filters
+from rest_framework import mixins, viewsets, status, filters
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError as DRFValidationError
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
+from django.core.exceptions import ValidationError
+from django.db.models import F
 from django_filters.rest_framework import DjangoFilterBackend
 
 from accounts.models import UserAccount
@@ -14,12 +18,16 @@ from courier.models import Courier
 from customers.models import Customer
 from shipments.models import Shipment, Delivery
 from finance.models import Wallet
+from shipments import transitions
+from api import notifications
+from api.models import Notification
 
 from .serializers import (
     UserAccountSerializer, CourierSerializer, CustomerSerializer,
     ShipmentSerializer, DeliverySerializer, WalletSerializer,
     LoginSerializer, RegistrationSerializer
 )
+from .serializers_extended import NotificationSerializer
 from .permissions import (
     IsCourier, IsCustomer, IsOwner, IsVerifiedCourier,
     IsShipmentOwner, IsDeliveryAssigned
@@ -31,6 +39,7 @@ class AuthenticationViewSet(viewsets.ViewSet):
     API endpoint for authentication (login, register, logout)
     """
     permission_classes = [AllowAny]
+    throttle_scope = 'auth'
 
     @action(detail=False, methods=['post'])
     def register(self, request):
@@ -123,11 +132,19 @@ class CourierViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Couriers can only view/edit their own profile"""
         if self.request.user.is_staff:
-            return Courier.objects.all()
-        try:
-            return Courier.objects.filter(user=self.request.user)
-        except:
-            return Courier.objects.none()
+            couriers = Courier.objects.all()
+        else:
+            couriers = Courier.objects.filter(user=self.request.user)
+        # The user's rating is a stored column, so ?ordering=rating and
+        # ?min_rating= are plain SQL on the joined user row.
+        couriers = couriers.select_related('user').annotate(rating=F('user__rating'))
+        min_rating = self.request.query_params.get('min_rating')
+        if min_rating:
+            try:
+                couriers = couriers.filter(rating__gte=float(min_rating))
+            except ValueError:
+                raise DRFValidationError({'min_rating': 'A number is required'})
+        return couriers
 
     @action(detail=False, methods=['get'])
     def nearby(self, request):
@@ -274,8 +291,12 @@ class DeliveryViewSet(viewsets.ModelViewSet):
             return Response({'detail': 'Invalid status'},
                           status=status.HTTP_400_BAD_REQUEST)
 
-        delivery.status = new_status
-        delivery.save()
+        courier = Courier.objects.filter(user=request.user).first()
+        try:
+            transitions.transition_to(delivery, new_status, courier=courier)
+        except transitions.TransitionError as error:
+            return Response({'detail': str(error)},
+                          status=status.HTTP_409_CONFLICT)
         serializer = self.get_serializer(delivery)
         return Response(serializer.data)
 
@@ -289,9 +310,11 @@ class DeliveryViewSet(viewsets.ModelViewSet):
             return Response({'detail': 'Photo required'},
                           status=status.HTTP_400_BAD_REQUEST)
 
-        delivery.delivery_photo = photo
-        delivery.status = 'delivered'
-        delivery.save()
+        try:
+            transitions.deliver(delivery, photo)
+        except transitions.TransitionError as error:
+            return Response({'detail': str(error)},
+                          status=status.HTTP_409_CONFLICT)
         serializer = self.get_serializer(delivery)
         return Response(serializer.data)
 
@@ -317,3 +340,46 @@ class WalletViewSet(viewsets.ReadOnlyModelViewSet):
         except Wallet.DoesNotExist:
             return Response({'detail': 'Wallet not found'},
                           status=status.HTTP_404_NOT_FOUND)
+
+
+class NotificationPagination(CursorPagination):
+    """
+    Newest first, without the COUNT query of page numbers
+    """
+    ordering = '-created_at'
+    page_size = 20
+
+
+class NotificationViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    API endpoint for the user's notifications
+    """
+    serializer_class = NotificationSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = NotificationPagination
+
+    def get_queryset(self):
+        """Users can only see their own notifications, ?unread=true for the unread ones"""
+        queryset = Notification.objects.filter(user=self.request.user)
+        if self.request.query_params.get('unread') in ('1', 'true'):
+            queryset = queryset.filter(is_read=False)
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        """Get the number of unread notifications"""
+        return Response({'unread': notifications.unread_count(request.user.pk)})
+
+    @action(detail=False, methods=['post'])
+    def mark_read(self, request):
+        """Mark the given notifications, or all of them, as read"""
+        ids = request.data.get('ids')
+        if ids is not None and not isinstance(ids, list):
+            return Response({'detail': 'ids must be a list'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        try:
+            marked = notifications.mark_read(request.user.pk, ids)
+        except ValidationError:
+            return Response({'detail': 'ids must be notification ids'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        return Response({'marked': marked})
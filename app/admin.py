@@ -1,3 +1,61 @@
 from django.contrib import admin
+from django.db import transaction
+from django.utils import timezone
+
+from app.models import BulkJob, OutgoingEmail
+from deliveet.utils import email_outbox
+from deliveet.utils.bulk_jobs import enqueue
+
 
 # Register your models here.
+@admin.register(BulkJob)
+class BulkJobAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'status', 'progress_display', 'succeeded', 'failed', 'created_by', 'created_at']
+    list_filter = ['kind', 'status', 'model']
+    readonly_fields = [
+        'kind', 'model', 'action', 'source', 'status', 'total', 'processed', 'succeeded', 'failed',
+        'checkpoint', 'errors', 'created_by', 'created_at', 'heartbeat_at', 'finished_at',
+    ]
+    exclude = ['query']
+    actions = ['resume_jobs']
+
+    @admin.display(description='Progress')
+    def progress_display(self, job):
+        return f'{job.processed}/{job.total if job.total is not None else "?"} ({job.progress}%)'
+
+    @admin.action(description='Resume selected failed jobs from their checkpoint', permissions=['change'])
+    def resume_jobs(self, request, queryset):
+        for job in queryset.filter(status=BulkJob.StatusChoices.FAILED):
+            job.status = BulkJob.StatusChoices.PENDING
+            job.finished_at = None
+            job.save(update_fields=['status', 'finished_at'])
+            enqueue(job)
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'recipients', 'status', 'attempts', 'created_at', 'sent_at']
+    list_filter = ['status']
+    search_fields = ['subject', 'to']
+    readonly_fields = [
+        'subject', 'body', 'html_body', 'from_email', 'to', 'status', 'attempts', 'last_error',
+        'send_after', 'created_at', 'sent_at',
+    ]
+    actions = ['retry_emails']
+
+    @admin.display(description='To')
+    def recipients(self, email):
+        return ', '.join(email.to)
+
+    @admin.action(description='Send selected failed emails again', permissions=['change'])
+    def retry_emails(self, request, queryset):
+        queryset.filter(status=OutgoingEmail.StatusChoices.FAILED).update(
+            status=OutgoingEmail.StatusChoices.PENDING, attempts=0, send_after=timezone.now(),
+        )
+        transaction.on_commit(email_outbox.dispatch)
+
+    def has_add_permission(self, request):
+        return False
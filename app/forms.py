@@ -33,24 +33,23 @@ class BaseForm(forms.Form):
             # Add CSS classes to form fields
             field.widget.attrs[
                 'class'] = 'bg-gray-50 border border-gray-300 text-gray-900 text-sm rounded-lg focus:ring-primary-600 \
-                focus:border-primary-600 block w-full p-2.5 dark:bg-gray-700 dark:border-gray-600 \
-                dark:placeholder-gray-400 dark:text-white dark:focus:ring-blue-500 dark:focus:border-blue-500'
+                focus:border-primary-600 block w-full p-2.5'
 
             # Add CSS classes to form labels
             field.label_attrs = {
-                'class': 'block mb-2 text-sm font-medium text-gray-900 dark:text-white'
+                'class': 'block mb-2 text-sm font-medium text-gray-900'
             }
 
             # Add CSS classes to form placeholders
             field.widget.attrs['placeholder'] = 'form-placeholder'
-            field.widget.attrs['placeholder_class'] = 'placeholder-gray-500 dark:placeholder-gray-400'
+            field.widget.attrs['placeholder_class'] = 'placeholder-gray-500'
 
             # Add CSS classes to form help text
             field.help_text_attrs = {
-                'class': 'mt-2 text-sm text-red-600 dark:text-red-500'
+                'class': 'mt-2 text-sm text-red-600'
             }
 
             # Add CSS classes to form errors
             field.error_attributes = {
-                'class': 'text-red-700 dark:text-red-500'
+                'class': 'text-red-700'
             }
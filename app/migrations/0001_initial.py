@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:36
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('import', 'Import'), ('action', 'Bulk action')], max_length=20)),
+                ('model', models.CharField(help_text='The app label and model name, for example shipments.delivery', max_length=100)),
+                ('action', models.CharField(blank=True, default='', max_length=100)),
+                ('source', models.FileField(blank=True, help_text='The CSV file of an import', null=True, upload_to='bulk_jobs/')),
+                ('query', models.BinaryField(blank=True, help_text='The pickled query selecting the rows of a bulk action', null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('total', models.PositiveIntegerField(blank=True, null=True)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('succeeded', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('checkpoint', models.CharField(blank=True, default='', help_text='The last row number imported or the last primary key processed', max_length=100)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bulk_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'heartbeat_at'], name='app_bulkjob_status_3da262_idx')],
+            },
+        ),
+    ]
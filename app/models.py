@@ -2,7 +2,9 @@
 This contains miscellaneous and core models for the deliveet app
 """
 import uuid
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from phonenumber_field.modelfields import PhoneNumberField
 
 from deliveet.utils.validators import phone_number_validator
@@ -62,3 +64,185 @@ class ProfileBaseModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class BulkJob(models.Model):
+    """
+    This tracks an admin import or bulk action running in the background.
+    The checkpoint records how far the job got, so a job interrupted by a
+    worker restart carries on from there.
+    """
+
+    class KindChoices(models.TextChoices):
+        """
+        This defines what a job does
+        """
+        IMPORT = 'import', 'Import'
+        ACTION = 'action', 'Bulk action'
+
+    class StatusChoices(models.TextChoices):
+        """
+        This defines the different statuses of a job
+        """
+        PENDING = 'pending', 'Pending'
+        RUNNING = 'running', 'Running'
+        COMPLETED = 'completed', 'Completed'
+        FAILED = 'failed', 'Failed'
+
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    kind = models.CharField(
+        max_length=20,
+        choices=KindChoices.choices
+    )
+    model = models.CharField(
+        max_length=100,
+        help_text='The app label and model name, for example shipments.delivery'
+    )
+    action = models.CharField(
+        max_length=100,
+        default='',
+        blank=True
+    )
+    source = models.FileField(
+        upload_to='bulk_jobs/',
+        null=True,
+        blank=True,
+        help_text='The CSV file of an import'
+    )
+    query = models.BinaryField(
+        null=True,
+        blank=True,
+        help_text='The pickled query selecting the rows of a bulk action'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=StatusChoices.choices,
+        default=StatusChoices.PENDING
+    )
+    total = models.PositiveIntegerField(
+        null=True,
+        blank=True
+    )
+    processed = models.PositiveIntegerField(
+        default=0
+    )
+    succeeded = models.PositiveIntegerField(
+        default=0
+    )
+    failed = models.PositiveIntegerField(
+        default=0
+    )
+    checkpoint = models.CharField(
+        max_length=100,
+        default='',
+        blank=True,
+        help_text='The last row number imported or the last primary key processed'
+    )
+    errors = models.JSONField(
+        default=list,
+        blank=True
+    )
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='bulk_jobs'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True
+    )
+    heartbeat_at = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'heartbeat_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.get_kind_display()} of {self.model} {self.action}'.strip()
+
+    @property
+    def progress(self):
+        """
+        This returns the share of rows processed, from 0 to 100
+        """
+        if not self.total:
+            return 100 if self.status == self.StatusChoices.COMPLETED else 0
+        return min(100, round(self.processed * 100 / self.total))
+
+
+class OutgoingEmail(models.Model):
+    """
+    This is an email waiting in the outbox for a Celery worker to send it.
+    A claimed email stays SENDING until its send_after lease runs out, so
+    the email of a worker that stopped mid-batch is picked up again.
+    """
+
+    class StatusChoices(models.TextChoices):
+        """
+        This defines the different statuses of an email
+        """
+        PENDING = 'pending', 'Pending'
+        SENDING = 'sending', 'Sending'
+        SENT = 'sent', 'Sent'
+        FAILED = 'failed', 'Failed'
+
+    subject = models.CharField(
+        max_length=255
+    )
+    body = models.TextField()
+    html_body = models.TextField(
+        default='',
+        blank=True
+    )
+    from_email = models.CharField(
+        max_length=254
+    )
+    to = models.JSONField(
+        default=list
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=StatusChoices.choices,
+        default=StatusChoices.PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0
+    )
+    last_error = models.TextField(
+        default='',
+        blank=True
+    )
+    send_after = models.DateTimeField(
+        default=timezone.now,
+        help_text='When the email is next due, or when the claim of the worker sending it runs out'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True
+    )
+    sent_at = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'send_after']),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} to {", ".join(self.to)}'
@@ -0,0 +1,43 @@
+"""
+This module contains the Celery tasks of the app app.
+"""
+from celery import shared_task
+from django.conf import settings
+
+from deliveet.utils import bulk_jobs, email_outbox
+
+
+@shared_task(ignore_result=True, acks_late=True)
+def run_bulk_job(job_id):
+    """
+    This runs an admin import or bulk action, or resumes it from its
+    checkpoint
+    """
+    bulk_jobs.run_job(job_id)
+
+
+@shared_task(ignore_result=True)
+def resume_bulk_jobs():
+    """
+    This queues again the jobs no worker picked up or whose worker stopped
+    """
+    for job_id in bulk_jobs.stalled_jobs().values_list('pk', flat=True):
+        run_bulk_job.delay(str(job_id))
+
+
+@shared_task(ignore_result=True)
+def send_queued_emails():
+    """
+    This sends a batch of the outbox, and queues itself again while more
+    emails are due
+    """
+    if email_outbox.send_batch() >= settings.EMAIL_OUTBOX_BATCH_SIZE:
+        send_queued_emails.delay()
+
+
+@shared_task(ignore_result=True)
+def purge_sent_emails():
+    """
+    This deletes old sent and failed emails from the outbox
+    """
+    return email_outbox.purge_sent()
@@ -0,0 +1,43 @@
+"""
+Benchmarks for Deliveet.
+
+Each module is a script run from the project root, for example::
+
+    python -m benchmarks.media_serving
+
+They use the project settings, so the usual environment variables
+(DATABASE_URL, REDIS_URL, ...) must be set as for manage.py.
+"""
+import os
+import time
+
+
+def setup_django():
+    """
+    This configures Django for a standalone benchmark script
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'deliveet.settings')
+    import django
+    django.setup()
+
+
+def timed(func, *args, repeat=1, **kwargs):
+    """
+    This runs func repeat times and returns the total seconds and last result
+    """
+    result = None
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def report(title, rows):
+    """
+    This prints a simple aligned table of (label, value) rows
+    """
+    print(f'\n{title}')
+    print('-' * len(title))
+    width = max(len(label) for label, _ in rows)
+    for label, value in rows:
+        print(f'{label.ljust(width)}  {value}')
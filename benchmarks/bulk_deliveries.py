@@ -0,0 +1,86 @@
+"""
+Measures creating a merchant's orders one at a time against the bulk API.
+
+One at a time follows the wizard: create the delivery, look up its
+distance, save the price and submit it. The bulk path validates every
+row, looks the distances up concurrently and inserts the batch at once.
+The distance API is simulated with a fixed latency, and everything runs
+in a transaction that is rolled back.
+
+    python -m benchmarks.bulk_deliveries --orders 500 --latency-ms 80
+"""
+import argparse
+import time
+from unittest import mock
+
+from benchmarks import report, setup_django, timed
+
+
+def order(number):
+    return {
+        'item_name': f'Order {number}',
+        'pickup_address': '1 Marina, Lagos',
+        'sender_name': 'Benchmark Shop',
+        'sender_phone': '08012345678',
+        'delivery_address': f'{number} Allen Avenue, Ikeja',
+        'recipient_name': 'Ada',
+        'recipient_phone': '08087654321',
+    }
+
+
+def one_at_a_time(customer, orders):
+    from shipments import pricing, transitions
+    from shipments.models import Delivery
+
+    for row in orders:
+        delivery = Delivery.objects.create(customer=customer, status=Delivery.StatusChoices.CREATING, **row)
+        delivery.distance, delivery.duration = pricing.lookup_distance(row['pickup_address'], row['delivery_address'])
+        delivery.price = pricing.price_for_distance(delivery.distance)
+        delivery.save()
+        transitions.submit(delivery)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--orders', type=int, default=500)
+    parser.add_argument('--latency-ms', type=float, default=80.0)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import transaction
+    from accounts.models import Customer, UserAccount
+    from shipments import bulk
+
+    def lookup_distance(origin, destination, session=None):
+        time.sleep(args.latency_ms / 1000)
+        return 5.0, 20
+
+    orders = [order(number) for number in range(args.orders)]
+    results = {}
+    with mock.patch('shipments.pricing.lookup_distance', side_effect=lookup_distance), \
+            mock.patch('shipments.bulk.notify_couriers'):
+        for label, create in (('one at a time', one_at_a_time), ('bulk', None)):
+            with transaction.atomic():
+                user = UserAccount.objects.create_user(
+                    email=f'bulk-benchmark-{time.time_ns()}@example.com',
+                    password='BenchmarkPass123!',
+                    is_customer=True,
+                )
+                customer = Customer.objects.create(user=user)
+                if create is None:
+                    seconds, _ = timed(bulk.create_deliveries, user, orders)
+                else:
+                    seconds, _ = timed(create, customer, orders)
+                transaction.set_rollback(True)
+            results[label] = seconds
+
+    rows = [
+        (label, f'{args.orders / seconds:8.1f} orders/s  ({seconds:.2f}s total)')
+        for label, seconds in results.items()
+    ]
+    rows.append(('speed-up', f'{results["one at a time"] / results["bulk"]:.1f}x'))
+    report(f'Creating {args.orders} orders, {args.latency_ms:.0f}ms distance lookups', rows)
+
+
+if __name__ == '__main__':
+    main()
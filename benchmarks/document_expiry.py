@@ -0,0 +1,106 @@
+"""
+Measures the daily document expiry sweep of api/documents.py on a large
+document table.
+
+Inserts the documents, a share of them past their expiry date, for a
+number of couriers in a transaction that is rolled back. It then runs the
+sweep, which makes one UPDATE for the documents and one for the couriers
+and inserts the notifications in batches. For comparison, a smaller
+number of documents is expired the naive way, loading each expired
+document and its courier and saving them one at a time.
+
+    python -m benchmarks.document_expiry --documents 1000000 --expired 20000
+"""
+import argparse
+import time
+from datetime import timedelta
+
+from benchmarks import report, setup_django
+
+
+def naive(today, limit):
+    from accounts.models import Courier
+    from api.models import Document
+
+    expired = 0
+    for document in Document.objects.filter(expiry_date__lt=today)[:limit]:
+        if document.is_expired:
+            continue
+        document.is_expired = True
+        document.save()
+        courier = Courier.objects.filter(user_id=document.user_id).first()
+        if courier is not None and courier.is_verified:
+            courier.is_verified = False
+            courier.save()
+        expired += 1
+    return expired
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--documents', type=int, default=1_000_000)
+    parser.add_argument('--expired', type=int, default=20_000)
+    parser.add_argument('--couriers', type=int, default=10_000)
+    parser.add_argument('--naive-documents', type=int, default=2_000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import transaction
+    from django.utils import timezone
+
+    from accounts.models import Courier, UserAccount
+    from api.documents import VERIFICATION_DOCUMENT_TYPES, expire_documents
+    from api.models import Document
+
+    today = timezone.localdate()
+    run = time.time_ns()
+    rows = []
+    with transaction.atomic():
+        start = time.perf_counter()
+        users = UserAccount.objects.bulk_create([
+            UserAccount(email=f'expiry-benchmark-{run}-{number}@example.com', is_courier=True)
+            for number in range(args.couriers)
+        ], batch_size=5_000)
+        Courier.objects.bulk_create([Courier(user=user, is_verified=True) for user in users], batch_size=5_000)
+        # Every document_count / expired-th document expired yesterday.
+        step = max(args.documents // max(args.expired, 1), 1)
+        for offset in range(0, args.documents, 10_000):
+            Document.objects.bulk_create([
+                Document(
+                    user=users[number % args.couriers],
+                    document_type=VERIFICATION_DOCUMENT_TYPES[number % len(VERIFICATION_DOCUMENT_TYPES)],
+                    file='documents/benchmark.pdf',
+                    original_filename='benchmark.pdf',
+                    file_size=1024,
+                    is_verified=True,
+                    expiry_date=today - timedelta(days=1) if number % step == 0 else today + timedelta(days=365),
+                )
+                for number in range(offset, min(offset + 10_000, args.documents))
+            ])
+        rows.append(('insert', f'{args.documents:,} documents in {time.perf_counter() - start:.1f}s'))
+
+        if args.naive_documents:
+            with transaction.atomic():
+                start = time.perf_counter()
+                expired = naive(today, args.naive_documents)
+                seconds = time.perf_counter() - start
+                transaction.set_rollback(True)
+            rows.append((
+                f'naive, {expired:,} documents',
+                f'{seconds:8.2f}s  ({expired / seconds:10,.0f} documents/s)',
+            ))
+
+        start = time.perf_counter()
+        expired, unverified = expire_documents(today)
+        seconds = time.perf_counter() - start
+        rows.append((
+            f'sweep, {expired:,} documents',
+            f'{seconds:8.2f}s  ({expired / seconds:10,.0f} documents/s), {unverified:,} couriers unverified',
+        ))
+        transaction.set_rollback(True)
+
+    report(f'Document expiry sweep over {args.documents:,} documents', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Measures the time and memory of a streaming CSV export of wallet
+transactions.
+
+Inserts the rows in a transaction that is rolled back, streams them the
+way the admin export does and, for a smaller count, exports them the
+naive way by loading the queryset and writing the whole file in memory.
+Memory is the peak traced by tracemalloc while the export runs.
+
+    python -m benchmarks.exports --rows 1000000 --naive-rows 100000
+"""
+import argparse
+import csv
+import io
+import time
+import tracemalloc
+from decimal import Decimal
+
+from benchmarks import report, setup_django
+
+FIELDS = ['id', 'transaction_reference', 'wallet__user__email', 'transaction_type', 'amount',
+          'transaction_verified', 'created_at']
+
+
+def measured(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = func(*args)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak, size
+
+
+def streamed(queryset):
+    from deliveet.utils.exports import stream_rows
+
+    size = 0
+    # The WSGI server sends each chunk to the client and drops it.
+    for chunk in stream_rows(queryset, FIELDS):
+        size += len(chunk)
+    return size
+
+
+def naive(queryset):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(FIELDS)
+    for row in list(queryset.select_related('wallet__user')):
+        writer.writerow([
+            row.id, row.transaction_reference, row.wallet.user.email,
+            row.transaction_type, row.amount, row.transaction_verified,
+            row.created_at.isoformat(),
+        ])
+    return len(output.getvalue())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--naive-rows', type=int, default=100_000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import transaction
+    from accounts.models import UserAccount
+    from finance.models import Wallet, WalletTransaction
+
+    rows = []
+    with transaction.atomic():
+        user = UserAccount.objects.create_user(
+            email=f'export-benchmark-{time.time_ns()}@example.com',
+            password='BenchmarkPass123!',
+        )
+        wallet = Wallet.objects.create(user=user)
+        start = time.perf_counter()
+        for offset in range(0, args.rows, 10_000):
+            WalletTransaction.objects.bulk_create([
+                WalletTransaction(
+                    wallet=wallet,
+                    amount=Decimal('1500.00'),
+                    transaction_reference=f'bench-{number}',
+                    transaction_verified=True,
+                )
+                for number in range(offset, min(offset + 10_000, args.rows))
+            ])
+        rows.append(('insert', f'{args.rows:,} rows in {time.perf_counter() - start:.1f}s'))
+
+        queryset = WalletTransaction.objects.filter(wallet=wallet).order_by('-created_at')
+        for label, export, count in (
+            ('streaming', streamed, args.rows),
+            ('naive', naive, args.naive_rows),
+        ):
+            if not count:
+                continue
+            seconds, peak, size = measured(export, queryset[:count] if count < args.rows else queryset)
+            rows.append((
+                f'{label}, {count:,} rows',
+                f'{count / seconds:10,.0f} rows/s  {size / 2 ** 20:8.1f}MB written  '
+                f'{peak / 2 ** 20:8.1f}MB peak memory',
+            ))
+        transaction.set_rollback(True)
+
+    report('Wallet transaction export', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Measures courier matching in the FastAPI service on a synthetic city.
+
+Ranks couriers for every delivery one at a time (a plain Python loop over
+all couriers, then the vectorized grid index), and assigns the whole batch
+(greedy best-first, then the min-cost assignment).
+
+    python -m benchmarks.matching --deliveries 1000 --couriers 5000
+"""
+import argparse
+import math
+import random
+import time
+
+import numpy as np
+
+from benchmarks import report, timed
+from fastapi_service import matching
+
+# Roughly the Lagos mainland and island.
+CITY_BOUNDS = (6.40, 6.70, 3.25, 3.55)
+
+
+def build_index(couriers, seed):
+    rng = random.Random(seed)
+    index = matching.CourierIndex()
+    now = time.time()
+    south, north, west, east = CITY_BOUNDS
+    for number in range(couriers):
+        courier_id = f'courier-{number}'
+        index.update_location(courier_id, rng.uniform(south, north), rng.uniform(west, east))
+        index.update_stats(
+            courier_id,
+            active_deliveries=rng.choice((0, 0, 0, 1, 1, 2)),
+            average_rating=round(rng.uniform(3.0, 5.0), 1),
+            idle_since=now - rng.uniform(0, 3600),
+        )
+    return index
+
+
+def build_pickups(deliveries, seed):
+    rng = random.Random(seed + 1)
+    south, north, west, east = CITY_BOUNDS
+    return [(rng.uniform(south, north), rng.uniform(west, east)) for _ in range(deliveries)]
+
+
+def python_rank(index, latitude, longitude, now, weights=matching.MatchWeights()):
+    """
+    The straightforward version: score every courier in a Python loop
+    """
+    best = None
+    for row, courier_id in enumerate(index.ids):
+        if not index.available[row]:
+            continue
+        lat1, lat2 = math.radians(latitude), math.radians(index.latitude[row])
+        dlat = lat2 - lat1
+        dlon = math.radians(index.longitude[row] - longitude)
+        a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+        distance = 2 * matching.EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+        if distance > matching.MATCH_RADIUS_KM:
+            continue
+        idle_minutes = (now - index.idle_since[row]) / 60.0
+        recently_busy = max(weights.idle_cap_minutes - idle_minutes, 0) / weights.idle_cap_minutes
+        cost = (
+            weights.distance * distance
+            + weights.workload * index.active_deliveries[row]
+            + weights.rating * (5.0 - index.rating[row])
+            + weights.recent_activity * recently_busy
+        )
+        if best is None or cost < best[1]:
+            best = (courier_id, cost)
+    return best
+
+
+def greedy_assign(index, pickups, now):
+    """
+    Each delivery in turn takes its best courier that is still free
+    """
+    taken = set()
+    total = 0.0
+    assigned = 0
+    for latitude, longitude in pickups:
+        rows, distances = index.candidates(latitude, longitude)
+        costs = matching.courier_costs(index, rows, distances, now)
+        for i in np.argsort(costs):
+            if rows[i] not in taken:
+                taken.add(rows[i])
+                total += costs[i]
+                assigned += 1
+                break
+    return assigned, total
+
+
+def assignment_cost(index, pickups, assignments, now):
+    total = 0.0
+    for (latitude, longitude), match in zip(pickups, assignments):
+        if match:
+            row = np.array([index.rows[match[0]]])
+            total += matching.courier_costs(index, row, np.array([match[1]]), now)[0]
+    return sum(1 for match in assignments if match), total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--deliveries', type=int, default=1000)
+    parser.add_argument('--couriers', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    index = build_index(args.couriers, args.seed)
+    pickups = build_pickups(args.deliveries, args.seed)
+    now = time.time()
+
+    python_seconds, _ = timed(lambda: [python_rank(index, lat, lon, now) for lat, lon in pickups])
+    vector_seconds, _ = timed(lambda: [matching.rank_couriers(index, lat, lon, now=now) for lat, lon in pickups])
+    greedy_seconds, (greedy_assigned, greedy_total) = timed(greedy_assign, index, pickups, now)
+    batch_seconds, assignments = timed(matching.assign_batch, index, pickups, now=now)
+    batch_assigned, batch_total = assignment_cost(index, pickups, assignments, now)
+
+    report(f'Ranking couriers for {args.deliveries} deliveries, {args.couriers} couriers', [
+        ('python loop', f'{python_seconds:.3f}s ({python_seconds / args.deliveries * 1000:.2f}ms per delivery)'),
+        ('vectorized + grid', f'{vector_seconds:.3f}s ({vector_seconds / args.deliveries * 1000:.2f}ms per delivery)'),
+    ])
+    report('Batch assignment (assigned, total cost)', [
+        ('greedy', f'{greedy_seconds:.3f}s  {greedy_assigned} assigned, cost {greedy_total:.1f}'),
+        ('min-cost assignment', f'{batch_seconds:.3f}s  {batch_assigned} assigned, cost {batch_total:.1f}'),
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Measures the worker time spent serving a media file in each MEDIA_SERVE_MODE.
+
+In 'django' mode the worker reads and sends every byte of the file; with
+X-Accel-Redirect or X-Sendfile it only resolves the file and writes headers.
+
+    python -m benchmarks.media_serving --requests 500 --size-kb 2048
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+from benchmarks import report, setup_django, timed
+
+
+def serve_all(view, request_factory, path, requests):
+    for _ in range(requests):
+        response = view(request_factory.get(f'/media/{path}'), path)
+        # The WSGI server iterates the body inside the worker.
+        for _chunk in response:
+            pass
+        response.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--size-kb', type=int, default=2048)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import RequestFactory, override_settings
+    from deliveet.utils.media import serve_media
+
+    media_root = tempfile.mkdtemp()
+    path = 'proofs/benchmark/delivery_photo.jpg'
+    os.makedirs(os.path.join(media_root, 'proofs/benchmark'))
+    with open(os.path.join(media_root, path), 'wb') as photo:
+        photo.write(os.urandom(args.size_kb * 1024))
+
+    request_factory = RequestFactory()
+    results = {}
+    try:
+        for mode in ('django', 'x-accel', 'x-sendfile'):
+            with override_settings(MEDIA_ROOT=media_root, MEDIA_SERVE_MODE=mode, USE_S3=False):
+                seconds, _ = timed(serve_all, serve_media, request_factory, path, args.requests)
+            results[mode] = seconds
+    finally:
+        shutil.rmtree(media_root)
+
+    rows = [
+        (mode, f'{seconds * 1000 / args.requests:8.3f} ms/request  ({seconds:.2f}s total)')
+        for mode, seconds in results.items()
+    ]
+    saved = results['django'] - results['x-accel']
+    rows.append(('worker time saved', f'{saved:.2f}s over {args.requests} requests '
+                                      f'({saved / results["django"]:.0%})'))
+    report(f'Media serving, {args.requests} requests of {args.size_kb}KB', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Measures the cost of one rate limit check: DRF's UserRateThrottle against
+the GCRA limiter of deliveet/utils/rate_limit.py.
+
+DRF's throttle reads the client's list of request timestamps from the
+cache, trims it and writes it back, so a check gets slower as the list
+grows towards the rate's limit. The GCRA limiter keeps one number per
+client and checks it with one Lua script in Redis, or in process memory
+without Redis. Both use the default cache's Redis when there is one.
+
+    python -m benchmarks.rate_limit --checks 1000 --rate 1000/hour
+"""
+import argparse
+import uuid
+
+from benchmarks import report, setup_django, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--checks', type=int, default=1000)
+    parser.add_argument('--rate', default='1000/hour')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import AnonymousUser
+    from django.core.cache import cache, caches
+    from rest_framework import throttling
+    from rest_framework.test import APIRequestFactory
+
+    from deliveet.utils import rate_limit
+
+    class DRFThrottle(throttling.UserRateThrottle):
+        rate = args.rate
+
+    request = APIRequestFactory().get('/api/v1/deliveries/')
+    request.user = AnonymousUser()
+    cache.delete(DRFThrottle().get_cache_key(request, None))
+    rate_limit.local_limiter.clear()
+    client = uuid.uuid4().hex
+
+    def drf():
+        return DRFThrottle().allow_request(request, None)
+
+    def gcra():
+        return rate_limit.limit('benchmark', client, args.rate).allowed
+
+    def local():
+        count, period = rate_limit.parse_rate(args.rate)
+        return rate_limit.local_limiter.hit('benchmark:local', round(period * 1e6 / count), period * 1000000) == 0
+
+    backend = 'Redis' if rate_limit._redis_script() else 'process memory'
+    rows = []
+    for label, check in [
+        (f'DRF UserRateThrottle ({type(caches["default"]).__name__})', drf),
+        (f'GCRA limit() ({backend})', gcra),
+        ('GCRA in process memory', local),
+    ]:
+        seconds, allowed = timed(check, repeat=args.checks)
+        rows.append((label, f'{seconds / args.checks * 1e6:8.1f}us per check, last allowed: {allowed}'))
+
+    report(f'{args.checks} checks of one client at {args.rate}', rows)
+
+
+if __name__ == '__main__':
+    main()
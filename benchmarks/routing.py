@@ -0,0 +1,97 @@
+"""
+Measures the route optimizer on synthetic Lagos-sized instances.
+
+Each instance is a courier somewhere in the city with deliveries whose
+pickups and drop-offs are spread over it. For every size the script
+reports the nearest-neighbour distance, the improved distance and the
+solve time, averaged over several seeds. 10 stop instances are also
+solved exactly, to show the gap to the optimum.
+
+    python -m benchmarks.routing --sizes 10 25 50 100 200 --seeds 5
+"""
+import argparse
+import random
+import statistics
+
+from benchmarks import report
+from benchmarks.matching import CITY_BOUNDS
+from fastapi_service import routing
+
+
+def build_instance(stop_count, seed):
+    """
+    This returns a courier start and stops for stop_count / 2 deliveries
+    """
+    rng = random.Random(seed)
+    south, north, west, east = CITY_BOUNDS
+
+    def point():
+        return rng.uniform(south, north), rng.uniform(west, east)
+
+    deliveries = [
+        {'delivery_id': f'delivery-{number}', 'pickup': point(), 'drop': point()}
+        for number in range(stop_count // 2)
+    ]
+    return point(), routing.build_stops(deliveries)
+
+
+def exact_distance(matrix, stops):
+    """
+    This finds the optimal route by depth-first search with pruning
+    """
+    matrix = matrix.tolist()
+    pickup_of, _ = routing._precedence(stops)
+    best = [float('inf')]
+
+    def search(current, visited, remaining, distance):
+        if distance >= best[0]:
+            return
+        if not remaining:
+            best[0] = distance
+            return
+        for node in sorted(remaining, key=matrix[current].__getitem__):
+            if pickup_of[node] in visited:
+                visited.add(node)
+                remaining.remove(node)
+                search(node, visited, remaining, distance + matrix[current][node])
+                remaining.add(node)
+                visited.remove(node)
+
+    search(0, {0}, set(range(1, len(matrix))), 0.0)
+    return best[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 25, 50, 100, 200])
+    parser.add_argument('--seeds', type=int, default=5)
+    parser.add_argument('--time-budget', type=float, default=routing.DEFAULT_TIME_BUDGET)
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        initial, improved, seconds, gaps = [], [], [], []
+        for seed in range(args.seeds):
+            start, stops = build_instance(size, seed)
+            route = routing.solve(start, stops, time_budget=args.time_budget)
+            initial.append(route.initial_distance_km)
+            improved.append(route.distance_km)
+            seconds.append(route.solve_seconds)
+            if size <= 10:
+                optimum = exact_distance(routing.distance_matrix(start, stops), stops)
+                gaps.append((route.distance_km - optimum) / optimum * 100)
+
+        saving = (1 - statistics.mean(improved) / statistics.mean(initial)) * 100
+        line = (
+            f'nearest neighbour {statistics.mean(initial):7.1f} km, improved {statistics.mean(improved):7.1f} km '
+            f'(-{saving:4.1f}%), {statistics.mean(seconds) * 1000:7.1f} ms avg, {max(seconds) * 1000:7.1f} ms max'
+        )
+        if gaps:
+            line += f', {statistics.mean(gaps):.2f}% above optimal'
+        rows.append((f'{size} stops', line))
+
+    report(f'Route optimization, {args.seeds} instances per size, time budget {args.time_budget}s', rows)
+
+
+if __name__ == '__main__':
+    main()
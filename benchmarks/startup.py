@@ -0,0 +1,81 @@
+"""
+Measures how long a process takes to start: django.setup() and loading
+every URLconf, which imports all the views, as a web worker does before
+its first request.
+
+Each run is a fresh interpreter started with -X importtime, so nothing is
+cached between runs. The report gives the median of the runs and the
+packages whose own import time is largest.
+
+    python -m benchmarks.startup --runs 5 --top 12
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import Counter
+
+from benchmarks import report
+
+CHILD = '''
+import json, os, time
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'deliveet.settings')
+start = time.perf_counter()
+import django
+django.setup()
+ready = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps({'setup': ready - start, 'urls': time.perf_counter() - ready}))
+'''
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def run_once():
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD],
+        capture_output=True, text=True, env=os.environ.copy(), check=False,
+    )
+    if result.returncode != 0:
+        sys.exit(result.stderr.strip().splitlines()[-1])
+
+    packages = Counter()
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            packages[match.group(4).split('.')[0]] += int(match.group(1))
+    return json.loads(result.stdout.strip().splitlines()[-1]), packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=12)
+    args = parser.parse_args()
+
+    timings = []
+    packages = Counter()
+    for _ in range(args.runs):
+        timing, imported = run_once()
+        timings.append(timing)
+        packages.update(imported)
+
+    setup = statistics.median(timing['setup'] for timing in timings)
+    urls = statistics.median(timing['urls'] for timing in timings)
+    report(f'Process start-up, median of {args.runs} runs', [
+        ('django.setup()', f'{setup * 1000:7.0f}ms'),
+        ('URLconf and views', f'{urls * 1000:7.0f}ms'),
+        ('total', f'{(setup + urls) * 1000:7.0f}ms'),
+    ])
+    report('Heaviest imports, own time per run', [
+        (package, f'{microseconds / args.runs / 1000:7.1f}ms')
+        for package, microseconds in packages.most_common(args.top)
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Measures rendering the dashboards with dark: classes stripped per render
+against stripping them when the templates load.
+
+Per render is how the bases used to work: render the page, then rewrite
+every class attribute of the output with a regular expression. At load
+time the project's template loaders strip the classes from the source
+once and the cached loader keeps the result, so a render is only a render.
+
+    python -m benchmarks.template_rendering --renders 2000
+"""
+import argparse
+import re
+
+from benchmarks import report, setup_django, timed
+
+TEMPLATES = ['courier/courier_dashboard.html', 'customers/customers_dashboard.html']
+CLASS_ATTRIBUTE = re.compile(r'class="([^"]*)"')
+
+
+def strip_per_render(output):
+    return CLASS_ATTRIBUTE.sub(
+        lambda match: 'class="{}"'.format(' '.join(
+            name for name in match.group(1).split() if not name.startswith('dark:')
+        )),
+        output,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--renders', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.contrib.messages.storage.fallback import FallbackStorage
+    from django.template import RequestContext, engines
+    from django.template.backends.django import DjangoTemplates
+    from django.test import RequestFactory
+    from accounts.models import UserAccount
+
+    # Django's own loaders, which read the templates as they are on disk.
+    plain = DjangoTemplates({
+        'NAME': 'plain',
+        'DIRS': settings.TEMPLATES[0]['DIRS'],
+        'APP_DIRS': True,
+        'OPTIONS': {'context_processors': settings.TEMPLATES[0]['OPTIONS']['context_processors']},
+    }).engine
+    stripping = engines['django'].engine
+
+    request = RequestFactory().get('/dashboard/')
+    request.user = UserAccount(email='benchmark@example.com', first_name='Ada', last_name='Obi')
+    request.session = {}
+    request._messages = FallbackStorage(request)
+    context = {'deliveries_in_progress': 3, 'deliveries_completed': 120, 'deliveries_canceled': 4}
+
+    def render(engine, name, process=None):
+        output = engine.get_template(name).render(RequestContext(request, context))
+        return process(output) if process else output
+
+    rows = []
+    for name in TEMPLATES:
+        per_render = render(plain, name, strip_per_render)
+        at_load = render(stripping, name)
+        assert 'dark:' not in at_load.split('<body', 1)[-1], f'{name} still has dark: classes'
+
+        before, _ = timed(render, plain, name, strip_per_render, repeat=args.renders)
+        after, _ = timed(render, stripping, name, repeat=args.renders)
+        rows += [
+            (f'{name}, per render', f'{before / args.renders * 1e6:8.0f}us  ({len(per_render):,} bytes)'),
+            (f'{name}, at load', f'{after / args.renders * 1e6:8.0f}us  ({len(at_load):,} bytes)'),
+            (f'{name}, speed-up', f'{before / after:.2f}x'),
+        ]
+
+    report(f'Rendering the dashboards {args.renders} times each', rows)
+
+
+if __name__ == '__main__':
+    main()
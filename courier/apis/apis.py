@@ -1,15 +1,18 @@
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
 
-from shipments.models import Delivery
+from deliveet.utils.replicas import read_from_replica
+from shipments import bundling, transitions, uploads
+from shipments.models import Delivery, DeliveryBundle, ProofUpload
 
 
 @csrf_exempt
 @login_required
+@read_from_replica
 def delivery_tasks_api(request):
     delivery_tasks = list(Delivery.objects.filter(status=Delivery.StatusChoices.PROCESSING).values())
 
@@ -31,49 +34,156 @@ def delivery_task_status_api(request, id):
         ]
     ).last()
 
-    if delivery_task.status == Delivery.StatusChoices.PICKUP_IN_PROGRESS:
-        delivery_task.pickup_photo = request.FILES['pickup_photo']
-        delivery_task.pickedup_at = timezone.now()
-        delivery_task.status = Delivery.StatusChoices.DELIVERY_IN_PROGRESS
-        delivery_task.save()
-
-        print(delivery_task.pickup_photo.url)
-
-        try:
-            layer = get_channel_layer()
-            async_to_sync(layer.group_send)("delivery_task_" + str(delivery_task.id), {
-                'type': 'delivery_task_update',
-                'delivery_task': {
-                    'status': delivery_task.get_status_display(),
-                    'pickup_photo': delivery_task.pickup_photo.url,
-                }
-            })
-        except:
-            pass
-
-    elif delivery_task.status == Delivery.StatusChoices.DELIVERY_IN_PROGRESS:
-        delivery_task.delivery_photo = request.FILES['delivery_photo']
-        delivery_task.delivered_at = timezone.now()
-        delivery_task.status = Delivery.StatusChoices.COMPLETED
-        delivery_task.save()
-
-        try:
-            layer = get_channel_layer()
-            async_to_sync(layer.group_send)("delivery_task_" + str(delivery_task.id), {
-                'type': 'delivery_task_update',
-                'delivery_task': {
-                    'status': delivery_task.get_status_display(),
-                    'delivery_photo': delivery_task.delivery_photo.url,
-                }
-            })
-        except:
-            pass
+    if not delivery_task:
+        return JsonResponse({"success": False, "message": "Delivery task not found."}, status=404)
+
+    try:
+        if delivery_task.status == Delivery.StatusChoices.PICKUP_IN_PROGRESS:
+            transitions.pick_up(delivery_task, request.FILES['pickup_photo'])
+        else:
+            transitions.deliver(delivery_task, request.FILES['delivery_photo'])
+    except transitions.TransitionError as error:
+        return JsonResponse({"success": False, "message": str(error)}, status=409)
 
     return JsonResponse({
         "success": True
     })
 
 
+def _upload_response(upload):
+    return {
+        "success": True,
+        "upload_id": str(upload.id),
+        "kind": upload.kind,
+        "offset": upload.received_bytes,
+        "total_size": upload.total_size,
+        "chunk_size": settings.PROOF_UPLOAD_CHUNK_SIZE,
+        "completed": upload.status == ProofUpload.StatusChoices.COMPLETED,
+    }
+
+
+def _upload_error_response(error):
+    response = {
+        "success": False,
+        "message": str(error),
+    }
+    if error.offset is not None:
+        response["offset"] = error.offset
+    return JsonResponse(response, status=error.status_code)
+
+
+@csrf_exempt
+@login_required
+@require_http_methods(["POST"])
+def delivery_task_upload_start_api(request, id):
+    """
+    Opens a resumable upload for the photo the ongoing delivery task is waiting for.
+    The photo size is sent in the X-Upload-Length header.
+    """
+    delivery_task = Delivery.objects.filter(
+        id=id,
+        courier=request.user.courier_account,
+        status__in=uploads.PROOF_STEPS.keys()
+    ).last()
+
+    if not delivery_task:
+        return JsonResponse({"success": False, "message": "Delivery task not found."}, status=404)
+
+    try:
+        total_size = int(request.headers.get('X-Upload-Length', 0))
+        upload = uploads.start_upload(delivery_task, request.user.courier_account, total_size)
+    except ValueError:
+        return JsonResponse({"success": False, "message": "Invalid X-Upload-Length header."}, status=400)
+    except uploads.UploadError as error:
+        return _upload_error_response(error)
+
+    return JsonResponse(_upload_response(upload), status=201)
+
+
+@csrf_exempt
+@login_required
+@require_http_methods(["GET", "PUT", "DELETE"])
+def delivery_task_upload_api(request, id, upload_id):
+    """
+    GET returns the offset to resume from, PUT streams the next chunk
+    described by its Content-Range header and DELETE cancels the upload.
+    """
+    upload = ProofUpload.objects.filter(
+        id=upload_id,
+        delivery_id=id,
+        courier=request.user.courier_account,
+    ).first()
+
+    if not upload:
+        return JsonResponse({"success": False, "message": "Upload not found."}, status=404)
+
+    if request.method == 'GET':
+        return JsonResponse(_upload_response(upload))
+
+    if request.method == 'DELETE':
+        if upload.status == ProofUpload.StatusChoices.UPLOADING:
+            uploads.abort_upload(upload)
+        return JsonResponse(_upload_response(upload))
+
+    try:
+        upload = uploads.write_chunk(
+            upload.id,
+            request.user.courier_account,
+            request,
+            request.headers.get('Content-Range'),
+        )
+    except uploads.UploadError as error:
+        return _upload_error_response(error)
+
+    return JsonResponse(_upload_response(upload))
+
+
+@csrf_exempt
+@login_required
+@require_http_methods(["GET"])
+def delivery_bundles_api(request):
+    """
+    Lists the bundles currently offered to the courier.
+    """
+    bundles = DeliveryBundle.objects.filter(
+        courier=request.user.courier_account,
+        status=DeliveryBundle.StatusChoices.OFFERED,
+        expires_at__gt=timezone.now(),
+    ).prefetch_related('deliveries')
+
+    return JsonResponse({
+        "success": True,
+        "bundles": [
+            {
+                "id": bundle.id,
+                "expires_at": bundle.expires_at,
+                "delivery_tasks": list(bundle.deliveries.values(
+                    'id', 'item_name', 'pickup_address', 'delivery_address', 'price'
+                )),
+            }
+            for bundle in bundles
+        ]
+    })
+
+
+@csrf_exempt
+@login_required
+@require_http_methods(["POST"])
+def delivery_bundle_accept_api(request, id):
+    """
+    Accepts a bundle and assigns its delivery tasks to the courier.
+    """
+    try:
+        delivery_tasks = bundling.accept_bundle(id, request.user.courier_account)
+    except transitions.TransitionError as error:
+        return JsonResponse({"success": False, "message": str(error)}, status=409)
+
+    return JsonResponse({
+        "success": True,
+        "delivery_tasks": [delivery_task.id for delivery_task in delivery_tasks]
+    })
+
+
 @csrf_exempt
 @login_required
 def fcm_token_update_api(request):
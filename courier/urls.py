@@ -4,7 +4,8 @@ This contains url routes for the courier app.
 from django.urls import path
 from . import views
 from profiles.views import courier_profile_view
-from .apis.apis import delivery_tasks_api, delivery_task_status_api, fcm_token_update_api
+from .apis.apis import delivery_tasks_api, delivery_task_status_api, fcm_token_update_api, \
+    delivery_task_upload_start_api, delivery_task_upload_api, delivery_bundles_api, delivery_bundle_accept_api
 
 app_name = 'couriers'
 urlpatterns = [
@@ -14,6 +15,16 @@ urlpatterns = [
 
     path('apis/deliveries/ongoing/<uuid:id>/status', delivery_task_status_api, name='courier_delivery_tasks_status'),
 
+    path('apis/deliveries/ongoing/<uuid:id>/uploads', delivery_task_upload_start_api,
+         name='courier_delivery_task_upload_start'),
+
+    path('apis/deliveries/ongoing/<uuid:id>/uploads/<uuid:upload_id>', delivery_task_upload_api,
+         name='courier_delivery_task_upload'),
+
+    path('apis/bundles', delivery_bundles_api, name='courier_delivery_bundles'),
+
+    path('apis/bundles/<uuid:id>/accept', delivery_bundle_accept_api, name='courier_delivery_bundle_accept'),
+
     path('apis/deliveries/tasks/fcm', delivery_tasks_api, name='courier_delivery_tasks_fcm'),
 
     path('me/', courier_profile_view, name='courier_profile'),
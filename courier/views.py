@@ -3,18 +3,21 @@ This contains views for courier app.
 """
 from decimal import Decimal
 
-from asgiref.sync import async_to_sync
 from django.conf import settings
+from django.db.models import Count, Sum
 from django.shortcuts import render, redirect
 from django.urls import reverse
 from django.utils.decorators import method_decorator
 from django.views.generic import TemplateView
 
 from deliveet.utils.decorators import courier_required
+from deliveet.utils.replicas import read_from_replica
+from shipments import transitions
+from shipments.archive import delivery_history
 from shipments.models import Delivery
 
 
-@method_decorator([courier_required], name='dispatch')
+@method_decorator([courier_required, read_from_replica], name='dispatch')
 class CourierDashboardView(TemplateView):
     """
     This view handles the courier's dashboard
@@ -24,10 +27,10 @@ class CourierDashboardView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        delivery_tasks = Delivery.objects.filter(
+        completed = delivery_history(
             courier=self.request.user.courier_account,
             status=Delivery.StatusChoices.COMPLETED
-        )
+        ).aggregate(count=Count('id'), price=Sum('price'), distance=Sum('distance'))
         deliveries_in_progress = Delivery.objects.filter(
             courier=self.request.user.courier_account,
             status__in=[
@@ -37,24 +40,17 @@ class CourierDashboardView(TemplateView):
             ]
         ).count()
 
-        deliveries_canceled = Delivery.objects.filter(
+        deliveries_canceled = delivery_history(
             courier=self.request.user.courier_account,
-            status__in=[
-                Delivery.StatusChoices.CANCELED,
-            ]
+            status=Delivery.StatusChoices.CANCELED,
         ).count()
 
-        deliveries_completed = Delivery.objects.filter(
-            courier=self.request.user.courier_account,
-            status__in=[
-                Delivery.StatusChoices.COMPLETED,
-            ]
-        ).count()
+        deliveries_completed = completed['count'] or 0
 
-        total_price = sum(delivery_task.price for delivery_task in delivery_tasks)
+        total_price = completed['price'] or Decimal('0')
         context['total_earnings'] = (total_price * Decimal('0.9')).quantize(Decimal('0.01'))
-        context['total_delivery_tasks'] = len(delivery_tasks)
-        context['total_km'] = sum(delivery_task.distance for delivery_task in delivery_tasks)
+        context['total_delivery_tasks'] = deliveries_completed
+        context['total_km'] = completed['distance'] or 0
         context['deliveries_in_progress'] = deliveries_in_progress
         context['deliveries_canceled'] = deliveries_canceled
         context['deliveries_completed'] = deliveries_completed
@@ -90,20 +86,11 @@ def courier_available_delivery_task(request, id):
         return redirect(reverse('couriers:available_delivery_tasks'))
 
     if request.method == 'POST':
-        delivery_task.courier = request.user.courier_account
-        delivery_task.status = Delivery.StatusChoices.PICKUP_IN_PROGRESS
-        delivery_task.save()
-
         try:
-            layer = get_channel_layer()
-            async_to_sync(layer.group_send)("delivery_task_" + str(delivery_task.id), {
-                'type': 'delivery_task_update',
-                'delivery_task': {
-                    'status': delivery_task.get_status_display(),
-                }
-            })
-        except:
-            pass
+            transitions.accept(delivery_task, request.user.courier_account)
+        except transitions.TransitionError:
+            # Another courier accepted the task first.
+            return redirect(reverse('couriers:available_delivery_tasks'))
 
         return redirect(reverse('couriers:delivery_task'))
 
@@ -168,15 +155,16 @@ def courier_delivery_task_completed(request):
 
 
 @courier_required
+@read_from_replica
 def courier_past_delivery_tasks(request):
     """
     Renders the past delivery_tasks page.
     """
     template_name = 'courier/past_delivery_tasks.html'
-    delivery_tasks = Delivery.objects.filter(
+    delivery_tasks = delivery_history(
         courier=request.user.courier_account,
         status=Delivery.StatusChoices.COMPLETED
-    )
+    ).select_related('customer__user')
 
     return render(request, template_name, {
         "delivery_tasks": delivery_tasks
@@ -9,10 +9,13 @@ from django.utils.decorators import method_decorator
 from django.views.generic import ListView, DetailView
 
 from deliveet.utils.decorators import customer_required
+from deliveet.utils.replicas import read_from_replica
+from shipments import transitions
+from shipments.archive import TERMINAL_STATUSES, delivery_history
 from shipments.models import Delivery
 
 
-@method_decorator([customer_required], name='dispatch')
+@method_decorator([customer_required, read_from_replica], name='dispatch')
 class CustomerDashboardView(ListView):
     """
     This is the customers dashboard view
@@ -35,9 +38,9 @@ class CustomerDashboardView(ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        total_deliveries = Delivery.objects.filter(customer=self.request.user.customer_account).count()
+        total_deliveries = delivery_history(customer=self.request.user.customer_account).count()
 
-        deliveries_completed = Delivery.objects.filter(
+        deliveries_completed = delivery_history(
             customer=self.request.user.customer_account,
             status=Delivery.StatusChoices.COMPLETED
         ).count()
@@ -51,7 +54,7 @@ class CustomerDashboardView(ListView):
             ]
         ).count()
 
-        deliveries_canceled = Delivery.objects.filter(
+        deliveries_canceled = delivery_history(
             customer=self.request.user.customer_account,
             status__in=[
                 Delivery.StatusChoices.CANCELED,
@@ -66,7 +69,7 @@ class CustomerDashboardView(ListView):
         return context
 
 
-@method_decorator([customer_required], name='dispatch')
+@method_decorator([customer_required, read_from_replica], name='dispatch')
 class CustomerDeliveryTasksView(ListView):
     """
     This view displays the customers delivery orders.
@@ -85,18 +88,15 @@ class CustomerDeliveryTasksView(ListView):
         )
 
 
-@method_decorator([customer_required], name='dispatch')
+@method_decorator([customer_required, read_from_replica], name='dispatch')
 class CustomerCompletedDeliveryTask(ListView):
     template_name = 'customers/customer_completed_delivery_task.html'
     context_object_name = 'delivery_task'
 
     def get_queryset(self):
-        return Delivery.objects.filter(
+        return delivery_history(
             customer=self.request.user.customer_account,
-            status__in=[
-                Delivery.StatusChoices.COMPLETED,
-                Delivery.StatusChoices.CANCELED
-            ]
+            status__in=TERMINAL_STATUSES,
         )
 
 
@@ -117,8 +117,8 @@ class CustomerDeliveryTaskDetailView(DetailView):
 
     def post(self, request, *args, **kwargs):
         delivery_task = self.get_object()
-        if delivery_task.status == Delivery.StatusChoices.PROCESSING:
-            delivery_task.status = Delivery.StatusChoices.CANCELED
-            delivery_task.save()
-            return redirect(reverse('customer:archived_jobs'))
-        return self.get(request, *args, **kwargs)
+        try:
+            transitions.cancel(delivery_task)
+        except transitions.TransitionError:
+            return self.get(request, *args, **kwargs)
+        return redirect(reverse('customer:archived_jobs'))
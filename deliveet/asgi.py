@@ -5,7 +5,6 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 """
 
 import os
-from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 
 from django.core.asgi import get_asgi_application
@@ -15,10 +14,11 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'deliveet.settings')
 django_application = get_asgi_application()
 
 from . import urls  # noqa isort:skip
+from .utils.channels_auth import JWTAuthMiddlewareStack  # noqa isort:skip
 
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
-    'websocket': AuthMiddlewareStack(
+    'websocket': JWTAuthMiddlewareStack(
         URLRouter(
             urls.websocket_urlpatterns
         )
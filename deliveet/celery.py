@@ -0,0 +1,61 @@
+"""
+This module defines the Celery app for deliveet.
+
+Start a worker with `celery -A deliveet worker` and the scheduler with
+`celery -A deliveet beat`. Tasks live in each app's tasks.py.
+"""
+import os
+
+from celery import Celery
+from celery.signals import task_postrun, task_prerun, worker_process_init
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'deliveet.settings')
+
+app = Celery('deliveet')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
+
+
+@worker_process_init.connect
+def reset_database_pools(**kwargs):
+    """
+    This gives each forked worker process its own database pool and hooks
+    the metrics in before it connects
+    """
+    from deliveet.utils.db_pool import forget_inherited_pools
+    from deliveet.utils.metrics import install
+
+    forget_inherited_pools()
+    install()
+
+
+@task_postrun.connect
+def report_database_pools(**kwargs):
+    """
+    This logs the worker's pool usage now and then
+    """
+    from django.conf import settings
+
+    from deliveet.utils.db_pool import log_pool_stats
+
+    log_pool_stats(settings.DATABASE_POOL_STATS_INTERVAL)
+
+
+@task_prerun.connect
+def start_task_metrics(task_id=None, **kwargs):
+    """
+    This starts measuring the task's time, queries and cache use
+    """
+    from deliveet.utils.metrics import start_task
+
+    start_task(task_id)
+
+
+@task_postrun.connect
+def record_task_metrics(task_id=None, task=None, state=None, **kwargs):
+    """
+    This records the task's measurements under its name
+    """
+    from deliveet.utils.metrics import finish_task
+
+    finish_task(task_id, task.name, state)
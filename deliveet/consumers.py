@@ -3,19 +3,27 @@ WebSocket Consumers for Real-time Features
 - Delivery tracking
 - Live notifications
 - Location updates
+- Support ticket assignment
 """
+import asyncio
 import json
 import logging
 from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer, WebsocketConsumer
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from urllib.parse import parse_qs
-import jwt
+
+from api import support
+from deliveet.utils.channels_auth import scope_user
+from deliveet.utils.metrics import InstrumentedConsumerMixin
+from deliveet.utils.rate_limit import rate_limit
 
 logger = logging.getLogger(__name__)
 
 
-class DeliveryTaskConsumer(WebsocketConsumer):
+class DeliveryTaskConsumer(InstrumentedConsumerMixin, WebsocketConsumer):
     """Consumer for delivery task updates"""
     
     def connect(self):
@@ -27,7 +35,7 @@ class DeliveryTaskConsumer(WebsocketConsumer):
             self.delivery_task_group_name,
             self.channel_name
         )
-        self.accept()
+        self.accept(self.scope.get('auth_subprotocol'))
 
     def disconnect(self, close_code):
         # Leave room group
@@ -36,6 +44,7 @@ class DeliveryTaskConsumer(WebsocketConsumer):
             self.channel_name
         )
 
+    @rate_limit('delivery_location')
     def receive(self, text_data):
         try:
             text_data_json = json.loads(text_data)
@@ -65,17 +74,17 @@ class DeliveryTaskConsumer(WebsocketConsumer):
         }))
 
 
-class DeliveryTrackerConsumer(AsyncWebsocketConsumer):
+class DeliveryTrackerConsumer(InstrumentedConsumerMixin, AsyncWebsocketConsumer):
     """Async Consumer for real-time shipment tracking"""
     
     async def connect(self):
         self.shipment_id = self.scope['url_route']['kwargs']['shipment_id']
-        self.user_token = self.scope['url_route']['kwargs']['user_token']
+        self.user_token = self.scope['url_route']['kwargs'].get('user_token')
         self.room_name = f'shipment_tracker_{self.shipment_id}'
         self.room_group_name = f'tracker_{self.shipment_id}'
 
-        # Validate token
-        if not await self.validate_token(self.user_token):
+        self.user = await scope_user(self.scope, self.user_token)
+        if not self.user.is_authenticated:
             await self.close()
             return
 
@@ -84,7 +93,7 @@ class DeliveryTrackerConsumer(AsyncWebsocketConsumer):
             self.room_group_name,
             self.channel_name
         )
-        await self.accept()
+        await self.accept(self.scope.get('auth_subprotocol'))
         
         logger.info(f"User connected to shipment tracker {self.shipment_id}")
 
@@ -95,6 +104,7 @@ class DeliveryTrackerConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
+    @rate_limit('tracker')
     async def receive(self, text_data):
         try:
             data = json.loads(text_data)
@@ -131,26 +141,18 @@ class DeliveryTrackerConsumer(AsyncWebsocketConsumer):
             'status': event.get('status')
         }))
 
-    async def validate_token(self, token):
-        """Validate JWT token"""
-        try:
-            from django.conf import settings
-            jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-            return True
-        except:
-            return False
-
 
-class NotificationConsumer(AsyncWebsocketConsumer):
+class NotificationConsumer(InstrumentedConsumerMixin, AsyncWebsocketConsumer):
     """Async Consumer for real-time notifications"""
     
     async def connect(self):
         self.user_id = self.scope['url_route']['kwargs']['user_id']
-        self.user_token = self.scope['url_route']['kwargs']['user_token']
+        self.user_token = self.scope['url_route']['kwargs'].get('user_token')
         self.room_group_name = f'notifications_{self.user_id}'
 
-        # Validate token
-        if not await self.validate_token(self.user_token):
+        # Only the user the notifications are for may listen to them
+        self.user = await scope_user(self.scope, self.user_token)
+        if not self.user.is_authenticated or str(self.user.pk) != self.user_id:
             await self.close()
             return
 
@@ -158,7 +160,7 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             self.room_group_name,
             self.channel_name
         )
-        await self.accept()
+        await self.accept(self.scope.get('auth_subprotocol'))
         
         logger.info(f"User {self.user_id} connected to notifications")
 
@@ -168,6 +170,7 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
+    @rate_limit('notifications')
     async def receive(self, text_data):
         try:
             data = json.loads(text_data)
@@ -179,17 +182,58 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         """Send notification to connected client"""
         await self.send(text_data=json.dumps({
             'type': 'notification',
+            'id': event.get('id'),
+            'notification_type': event.get('notification_type'),
             'title': event.get('title'),
             'message': event.get('message'),
-            'data': event.get('data')
+            'data': event.get('data'),
+            'created_at': event.get('created_at'),
         }))
 
-    async def validate_token(self, token):
-        """Validate JWT token"""
-        try:
-            from django.conf import settings
-            jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-            return True
-        except:
-            return False
+
+class SupportAgentConsumer(InstrumentedConsumerMixin, AsyncWebsocketConsumer):
+    """Async Consumer that puts staff on duty and pushes them their tickets"""
+
+    async def connect(self):
+        self.user = await scope_user(self.scope)
+        if not self.user.is_authenticated or not self.user.is_staff:
+            await self.close()
+            return
+
+        self.room_group_name = f'support_agent_{self.user.pk}'
+        await self.channel_layer.group_add(
+            self.room_group_name,
+            self.channel_name
+        )
+        await self.accept(self.scope.get('auth_subprotocol'))
+        await database_sync_to_async(support.agent_connected)(self.user.pk, self.channel_name)
+        self.heartbeat = asyncio.ensure_future(self.send_heartbeats())
+
+        logger.info(f"Support agent {self.user.pk} connected")
+
+    async def disconnect(self, close_code):
+        if not getattr(self, 'room_group_name', None):
+            return
+        self.heartbeat.cancel()
+        await database_sync_to_async(support.agent_disconnected)(self.user.pk, self.channel_name)
+        await self.channel_layer.group_discard(
+            self.room_group_name,
+            self.channel_name
+        )
+
+    async def send_heartbeats(self):
+        """Keep this connection from lapsing while it is open"""
+        while True:
+            await asyncio.sleep(settings.SUPPORT_CONNECTION_TTL_SECONDS / 3)
+            try:
+                await database_sync_to_async(support.agent_heartbeat)(self.user.pk, self.channel_name)
+            except Exception as error:
+                logger.warning(f"Support agent {self.user.pk} heartbeat failed: {error}")
+
+    async def ticket_assigned(self, event):
+        """Send a newly assigned ticket to the agent"""
+        await self.send(text_data=json.dumps({
+            'type': 'ticket_assigned',
+            'ticket': event.get('ticket'),
         }))
+        await database_sync_to_async(support.ticket_seen)(event['ticket']['id'], self.user.pk)
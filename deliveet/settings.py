@@ -3,17 +3,15 @@ Django settings for deliveet project - Production Grade Delivery App
 Upgraded to Django 5.2 with DRF, FastAPI, and production features
 """
 import base64
-import json
 import os
 from pathlib import Path
-from urllib.parse import urlparse
 
 import dj_database_url
-import requests
+from celery.schedules import crontab
 from decouple import config
 from django.contrib import messages
+from django.core.exceptions import ImproperlyConfigured
 from django.core.management.utils import get_random_secret_key
-from django.template.context_processors import media
 from environ import Env
 
 # Path
@@ -91,11 +89,13 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'deliveet.utils.metrics.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'deliveet.utils.replicas.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django_browser_reload.middleware.BrowserReloadMiddleware',
@@ -110,8 +110,15 @@ TEMPLATES = [
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates']
         ,
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Templates are loaded without Tailwind's dark: classes and
+            # cached, see deliveet/utils/remove_dark_classes.py
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'deliveet.utils.remove_dark_classes.FilesystemLoader',
+                    'deliveet.utils.remove_dark_classes.AppDirectoriesLoader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -119,7 +126,6 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 'django.template.context_processors.media',
                 'deliveet.utils.firebase_context_processor.firebase_config',
-                'deliveet.utils.remove_dark_classes.dark_mode_processor',
             ],
         },
     },
@@ -149,6 +155,15 @@ else:
         }
     }
 
+# Read replica for views decorated with read_from_replica, see deliveet/utils/replicas.py
+REPLICA_DATABASE_ALIAS = 'replica'
+REPLICA_DATABASE_URL = env('REPLICA_DATABASE_URL', default='')
+if REPLICA_DATABASE_URL:
+    DATABASES[REPLICA_DATABASE_ALIAS] = dj_database_url.parse(REPLICA_DATABASE_URL)
+    DATABASES[REPLICA_DATABASE_ALIAS]['TEST'] = {'MIRROR': 'default'}
+REPLICA_STICKY_SECONDS = env.int('REPLICA_STICKY_SECONDS', default=10)
+DATABASE_ROUTERS = ['deliveet.utils.replicas.ReplicaRouter']
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -255,13 +270,17 @@ REST_FRAMEWORK = {
         'rest_framework.filters.OrderingFilter',
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Redis GCRA throttles, see deliveet/utils/rate_limit.py
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
+        'deliveet.utils.rate_limit.AnonRateThrottle',
+        'deliveet.utils.rate_limit.UserRateThrottle',
+        'deliveet.utils.rate_limit.ScopedRateThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/hour',
         'user': '1000/hour',
+        # Views with a throttle_scope
+        'auth': '20/minute',
     },
     'EXCEPTION_HANDLER': 'drf_standardized_errors.exception_handler.exception_handler',
 }
@@ -315,12 +334,52 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Users of WebSocket access tokens are cached this long, see
+# deliveet/utils/channels_auth.py
+WEBSOCKET_AUTH_CACHE_SECONDS = env.int('WEBSOCKET_AUTH_CACHE_SECONDS', default=60)
+
+# Notifications are inserted and pushed NOTIFICATION_BATCH_SIZE at a time,
+# see api/notifications.py
+NOTIFICATION_BATCH_SIZE = env.int('NOTIFICATION_BATCH_SIZE', default=500)
+NOTIFICATION_UNREAD_CACHE_SECONDS = env.int('NOTIFICATION_UNREAD_CACHE_SECONDS', default=3600)
+
+# Promotion codes are cached this long, see api/promotions.py
+PROMOTION_CACHE_SECONDS = env.int('PROMOTION_CACHE_SECONDS', default=300)
+
+# Messages each user may send per consumer, see deliveet/utils/rate_limit.py.
+# Without Redis, or while it is unreachable, each process limits on its
+# own and retries Redis after RATE_LIMIT_REDIS_RETRY_SECONDS.
+WEBSOCKET_RATE_LIMITS = {
+    'delivery_location': env('WEBSOCKET_RATE_DELIVERY_LOCATION', default='2/second'),
+    'tracker': env('WEBSOCKET_RATE_TRACKER', default='5/second'),
+    'notifications': env('WEBSOCKET_RATE_NOTIFICATIONS', default='10/second'),
+}
+RATE_LIMIT_REDIS_RETRY_SECONDS = env.int('RATE_LIMIT_REDIS_RETRY_SECONDS', default=5)
+
+# Delivery events outbox, published by `manage.py relay_delivery_events`
+FASTAPI_SERVICE_URL = env('FASTAPI_SERVICE_URL', default='')
+DELIVERY_EVENTS_BATCH_SIZE = env.int('DELIVERY_EVENTS_BATCH_SIZE', default=200)
+DELIVERY_EVENTS_RELAY_INTERVAL = env.float('DELIVERY_EVENTS_RELAY_INTERVAL', default=0.5)
+DELIVERY_EVENTS_SINK_TIMEOUT = env.float('DELIVERY_EVENTS_SINK_TIMEOUT', default=5.0)
+DELIVERY_EVENTS_RETENTION_DAYS = env.int('DELIVERY_EVENTS_RETENTION_DAYS', default=7)
+# A failed event is retried after DELIVERY_EVENTS_RETRY_SECONDS, doubling
+# each attempt, and given up on after DELIVERY_EVENTS_MAX_ATTEMPTS
+DELIVERY_EVENTS_RETRY_SECONDS = env.int('DELIVERY_EVENTS_RETRY_SECONDS', default=5)
+DELIVERY_EVENTS_MAX_ATTEMPTS = env.int('DELIVERY_EVENTS_MAX_ATTEMPTS', default=10)
+
+# Courier ratings and active deliveries pushed to the FastAPI matching
+# service, see shipments/courier_stats.py
+COURIER_STATS_INTERVAL = env.int('COURIER_STATS_INTERVAL', default=300)
+COURIER_STATS_BATCH_SIZE = env.int('COURIER_STATS_BATCH_SIZE', default=1000)
+COURIER_STATS_SINK_TIMEOUT = env.float('COURIER_STATS_SINK_TIMEOUT', default=10.0)
+
 # ==========================================
 # CACHE CONFIGURATION
 # ==========================================
 CACHES = {
     'default': {
-        'BACKEND': 'django_redis.cache.RedisCache',
+        # django_redis's RedisCache with hits and misses counted, see deliveet/utils/metrics.py
+        'BACKEND': 'deliveet.utils.metrics.InstrumentedRedisCache',
         'LOCATION': env('REDIS_URL', default='redis://localhost:6379/1'),
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
@@ -339,6 +398,81 @@ CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
+CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+
+# Delivery analytics rollups, see shipments/rollups.py
+DELIVERY_ROLLUP_INTERVAL = env.int('DELIVERY_ROLLUP_INTERVAL', default=300)
+DELIVERY_ROLLUP_SYNC_DAYS = env.int('DELIVERY_ROLLUP_SYNC_DAYS', default=31)
+DELIVERY_ROLLUP_SINK_TIMEOUT = env.float('DELIVERY_ROLLUP_SINK_TIMEOUT', default=10.0)
+
+# Archival of old delivered and canceled deliveries, see shipments/archive.py
+DELIVERY_ARCHIVE_AFTER_DAYS = env.int('DELIVERY_ARCHIVE_AFTER_DAYS', default=90)
+DELIVERY_ARCHIVE_BATCH_SIZE = env.int('DELIVERY_ARCHIVE_BATCH_SIZE', default=500)
+DELIVERY_ARCHIVE_HOUR = env.int('DELIVERY_ARCHIVE_HOUR', default=3)
+
+# Admin imports and bulk actions, BULK_JOB_CHUNK_SIZE rows per transaction,
+# see deliveet/utils/bulk_jobs.py. Jobs without a heartbeat for
+# BULK_JOB_STALL_SECONDS are resumed from their checkpoint.
+BULK_JOB_CHUNK_SIZE = env.int('BULK_JOB_CHUNK_SIZE', default=1000)
+BULK_JOB_STALL_SECONDS = env.int('BULK_JOB_STALL_SECONDS', default=300)
+BULK_JOB_MAX_ERRORS = env.int('BULK_JOB_MAX_ERRORS', default=500)
+
+# Email outbox, see deliveet/utils/email_outbox.py. Each worker sends at
+# most EMAIL_OUTBOX_RATE_LIMIT emails a second; a failed email is retried
+# after EMAIL_OUTBOX_RETRY_SECONDS, doubling each attempt.
+EMAIL_OUTBOX_BATCH_SIZE = env.int('EMAIL_OUTBOX_BATCH_SIZE', default=100)
+EMAIL_OUTBOX_RATE_LIMIT = env.float('EMAIL_OUTBOX_RATE_LIMIT', default=10.0)
+EMAIL_OUTBOX_MAX_ATTEMPTS = env.int('EMAIL_OUTBOX_MAX_ATTEMPTS', default=6)
+EMAIL_OUTBOX_RETRY_SECONDS = env.int('EMAIL_OUTBOX_RETRY_SECONDS', default=60)
+EMAIL_OUTBOX_STALL_SECONDS = env.int('EMAIL_OUTBOX_STALL_SECONDS', default=300)
+EMAIL_OUTBOX_KEEP_DAYS = env.int('EMAIL_OUTBOX_KEEP_DAYS', default=7)
+
+# Support tickets go to agents with fewer than SUPPORT_AGENT_CAPACITY tickets
+# in progress; the queue is rebuilt from the database every
+# SUPPORT_REQUEUE_SECONDS, see api/support.py. An agent connection without
+# a heartbeat for SUPPORT_CONNECTION_TTL_SECONDS has lapsed.
+SUPPORT_AGENT_CAPACITY = env.int('SUPPORT_AGENT_CAPACITY', default=5)
+SUPPORT_REQUEUE_SECONDS = env.int('SUPPORT_REQUEUE_SECONDS', default=60)
+SUPPORT_CONNECTION_TTL_SECONDS = env.int('SUPPORT_CONNECTION_TTL_SECONDS', default=90)
+
+# Documents past their expiry date are expired daily at this hour, see
+# api/documents.py
+DOCUMENT_EXPIRY_HOUR = env.int('DOCUMENT_EXPIRY_HOUR', default=0)
+
+CELERY_BEAT_SCHEDULE = {
+    'update-delivery-rollups': {
+        'task': 'shipments.tasks.update_delivery_rollups',
+        'schedule': DELIVERY_ROLLUP_INTERVAL,
+    },
+    'resume-bulk-jobs': {
+        'task': 'app.tasks.resume_bulk_jobs',
+        'schedule': BULK_JOB_STALL_SECONDS,
+    },
+    'send-queued-emails': {
+        'task': 'app.tasks.send_queued_emails',
+        'schedule': 60,
+    },
+    'purge-sent-emails': {
+        'task': 'app.tasks.purge_sent_emails',
+        'schedule': crontab(hour=DELIVERY_ARCHIVE_HOUR, minute=30),
+    },
+    'archive-deliveries': {
+        'task': 'shipments.tasks.archive_deliveries',
+        'schedule': crontab(hour=DELIVERY_ARCHIVE_HOUR, minute=0),
+    },
+    'expire-documents': {
+        'task': 'api.tasks.expire_documents',
+        'schedule': crontab(hour=DOCUMENT_EXPIRY_HOUR, minute=5),
+    },
+    'push-courier-stats': {
+        'task': 'shipments.tasks.push_courier_stats',
+        'schedule': COURIER_STATS_INTERVAL,
+    },
+    'requeue-support-tickets': {
+        'task': 'api.tasks.requeue_support_tickets',
+        'schedule': SUPPORT_REQUEUE_SECONDS,
+    },
+}
 
 # ==========================================
 # AWS S3 STORAGE (Optional)
@@ -353,11 +487,81 @@ if USE_S3:
     AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com'
     AWS_LOCATION = 'static'
     
+    AWS_S3_SIGNATURE_VERSION = 's3v4'
+    AWS_QUERYSTRING_EXPIRE = env.int('AWS_QUERYSTRING_EXPIRE', default=3600)
+
     STATIC_URL = f'https://{AWS_S3_CUSTOM_DOMAIN}/{AWS_LOCATION}/'
-    STATICFILES_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
-    
-    DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
-    MEDIA_URL = f'https://{AWS_S3_CUSTOM_DOMAIN}/media/'
+
+    # Django only reads storages from STORAGES since 5.1. Media is private:
+    # without a custom domain its URLs are signed and expire after
+    # AWS_QUERYSTRING_EXPIRE seconds. MEDIA_URL keeps pointing at
+    # serve_media, which redirects to them.
+    STORAGES = {
+        'default': {
+            'BACKEND': 'storages.backends.s3boto3.S3Boto3Storage',
+            'OPTIONS': {
+                'location': 'media',
+                'custom_domain': None,
+                'querystring_auth': True,
+                'querystring_expire': AWS_QUERYSTRING_EXPIRE,
+            },
+        },
+        'staticfiles': {
+            'BACKEND': 'storages.backends.s3boto3.S3Boto3Storage',
+        },
+    }
+
+# ==========================================
+# MEDIA SERVING
+# ==========================================
+# 'django' streams files from the worker (development only), 'x-accel' hands
+# them to nginx and 'x-sendfile' to Apache/lighttpd. With USE_S3 the media
+# view redirects to signed S3 URLs instead.
+MEDIA_SERVE_MODE = env('MEDIA_SERVE_MODE', default='django')
+MEDIA_ACCEL_REDIRECT_PREFIX = env('MEDIA_ACCEL_REDIRECT_PREFIX', default='/protected-media/')
+MEDIA_CACHE_MAX_AGE = env.int('MEDIA_CACHE_MAX_AGE', default=86400)
+MEDIA_IMMUTABLE_PREFIXES = env.list('MEDIA_IMMUTABLE_PREFIXES', default=['proofs/'])
+MEDIA_SIGNED_URL_CACHE_SECONDS = env.int('MEDIA_SIGNED_URL_CACHE_SECONDS', default=300)
+
+# ==========================================
+# PROOF OF DELIVERY UPLOADS
+# ==========================================
+# Chunks are written straight to storage; S3 multipart parts must be at least 5MB.
+PROOF_UPLOAD_MAX_SIZE = env.int('PROOF_UPLOAD_MAX_SIZE', default=10 * 1024 * 1024)
+PROOF_UPLOAD_CHUNK_SIZE = env.int('PROOF_UPLOAD_CHUNK_SIZE', default=5 * 1024 * 1024)
+
+if USE_S3 and PROOF_UPLOAD_CHUNK_SIZE < 5 * 1024 * 1024:
+    raise ImproperlyConfigured('PROOF_UPLOAD_CHUNK_SIZE must be at least 5MB when USE_S3 is on.')
+
+# ==========================================
+# DELIVERY BUNDLING
+# ==========================================
+# Open deliveries whose pickups share a grid cell and whose trips share a
+# compass sector are offered together to one courier by
+# `manage.py build_delivery_bundles`.
+BUNDLE_CELL_SIZE_DEGREES = env.float('BUNDLE_CELL_SIZE_DEGREES', default=0.01)
+BUNDLE_HEADING_SECTORS = env.int('BUNDLE_HEADING_SECTORS', default=8)
+BUNDLE_MAX_SIZE = env.int('BUNDLE_MAX_SIZE', default=4)
+BUNDLE_OFFER_SECONDS = env.int('BUNDLE_OFFER_SECONDS', default=90)
+BUNDLE_OFFER_RADIUS_KM = env.float('BUNDLE_OFFER_RADIUS_KM', default=5.0)
+BUNDLE_INTERVAL = env.float('BUNDLE_INTERVAL', default=30.0)
+
+# ==========================================
+# BULK DELIVERY CREATION
+# ==========================================
+# Merchants create many deliveries in one request, see shipments/bulk.py.
+# Distance lookups for a batch run on at most BULK_DELIVERY_LOOKUP_WORKERS
+# threads.
+BULK_DELIVERY_MAX_ROWS = env.int('BULK_DELIVERY_MAX_ROWS', default=500)
+BULK_DELIVERY_LOOKUP_WORKERS = env.int('BULK_DELIVERY_LOOKUP_WORKERS', default=8)
+DISTANCE_LOOKUP_TIMEOUT = env.float('DISTANCE_LOOKUP_TIMEOUT', default=10.0)
+
+# ==========================================
+# EXPORTS
+# ==========================================
+# Admin exports stream rows from a server-side cursor, EXPORT_CHUNK_SIZE
+# rows per fetch and per chunk written, see deliveet/utils/exports.py.
+EXPORT_CHUNK_SIZE = env.int('EXPORT_CHUNK_SIZE', default=2000)
 
 # ==========================================
 # FIREBASE CONFIGURATION
@@ -408,6 +612,8 @@ SESSION_COOKIE_AGE = 86400 * 7  # 7 days
 # HTTPS & Security Headers
 if not DEBUG:
     SECURE_SSL_REDIRECT = env.bool('SECURE_SSL_REDIRECT', default=True)
+    # Health probes come from inside the network over plain HTTP.
+    SECURE_REDIRECT_EXEMPT = [r'^health/$']
     SECURE_HSTS_SECONDS = 31536000  # 1 year
     SECURE_HSTS_INCLUDE_SUBDOMAINS = True
     SECURE_HSTS_PRELOAD = True
@@ -469,6 +675,13 @@ LOGGING = {
     },
 }
 
+# Per-endpoint latency, query and cache metrics, served at /metrics/ to
+# Prometheus with the METRICS_TOKEN bearer token, see deliveet/utils/metrics.py
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+METRICS_FLUSH_SECONDS = env.int('METRICS_FLUSH_SECONDS', default=10)
+METRICS_DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+METRICS_QUERY_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500]
+
 # Sentry Configuration (optional)
 SENTRY_DSN = env('SENTRY_DSN', default='')
 if SENTRY_DSN:
@@ -500,8 +713,38 @@ ADMIN_INTERFACE_THEME = 'modern'
 # ==========================================
 # DATABASE CONNECTION POOL (Production)
 # ==========================================
-if not DEBUG:
-    DATABASES['default']['CONN_MAX_AGE'] = 600
-    DATABASES['default']['OPTIONS'] = {
-        'connect_timeout': 10,
-    }
+# With DATABASE_POOL on, PostgreSQL connections come from a psycopg pool
+# shared by the threads of a process instead of one persistent connection
+# per thread. DATABASE_PROCESS_TYPE picks the pool size: web (daphne,
+# serving HTTP and WebSockets), channels (runworker) or celery (Celery
+# workers and the other background commands).
+DATABASE_POOL = env.bool('DATABASE_POOL', default=not DEBUG)
+DATABASE_PROCESS_TYPE = env('DATABASE_PROCESS_TYPE', default='web')
+DATABASE_POOL_SIZES = {
+    'web': (env.int('DATABASE_POOL_MIN_SIZE_WEB', default=2), env.int('DATABASE_POOL_MAX_SIZE_WEB', default=16)),
+    'channels': (env.int('DATABASE_POOL_MIN_SIZE_CHANNELS', default=1), env.int('DATABASE_POOL_MAX_SIZE_CHANNELS', default=8)),
+    'celery': (env.int('DATABASE_POOL_MIN_SIZE_CELERY', default=1), env.int('DATABASE_POOL_MAX_SIZE_CELERY', default=2)),
+}
+DATABASE_POOL_TIMEOUT = env.float('DATABASE_POOL_TIMEOUT', default=10.0)
+DATABASE_POOL_MAX_IDLE = env.float('DATABASE_POOL_MAX_IDLE', default=300.0)
+DATABASE_POOL_MAX_LIFETIME = env.float('DATABASE_POOL_MAX_LIFETIME', default=1800.0)
+DATABASE_POOL_STATS_INTERVAL = env.int('DATABASE_POOL_STATS_INTERVAL', default=300)
+
+for database in DATABASES.values():
+    if database['ENGINE'] != 'django.db.backends.postgresql':
+        continue
+    database.setdefault('OPTIONS', {})['connect_timeout'] = 10
+    database['CONN_HEALTH_CHECKS'] = True
+    if DATABASE_POOL:
+        min_size, max_size = DATABASE_POOL_SIZES[DATABASE_PROCESS_TYPE]
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS']['pool'] = {
+            'min_size': min_size,
+            'max_size': max_size,
+            'timeout': DATABASE_POOL_TIMEOUT,
+            'max_idle': DATABASE_POOL_MAX_IDLE,
+            'max_lifetime': DATABASE_POOL_MAX_LIFETIME,
+            'name': f'{DATABASE_PROCESS_TYPE}-{database["NAME"]}',
+        }
+    elif not DEBUG:
+        database['CONN_MAX_AGE'] = 600
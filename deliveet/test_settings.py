@@ -13,8 +13,16 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': ':memory:',
-    }
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+        'TEST': {'MIRROR': 'default'},
+    },
 }
+DATABASE_ROUTERS = ['deliveet.utils.replicas.ReplicaRouter']
+REPLICA_DATABASE_ALIAS = 'replica'
+REPLICA_STICKY_SECONDS = 10
 
 # Installed apps - minimal set for testing
 INSTALLED_APPS = [
@@ -51,11 +59,13 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'deliveet.utils.metrics.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'deliveet.utils.replicas.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -65,8 +75,13 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'deliveet.utils.remove_dark_classes.FilesystemLoader',
+                    'deliveet.utils.remove_dark_classes.AppDirectoriesLoader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -108,6 +123,19 @@ CHANNEL_LAYERS = {
         'BACKEND': 'channels.layers.InMemoryChannelLayer'
     }
 }
+WEBSOCKET_AUTH_CACHE_SECONDS = 60
+WEBSOCKET_RATE_LIMITS = {
+    'delivery_location': '2/second',
+    'tracker': '5/second',
+    'notifications': '10/second',
+}
+RATE_LIMIT_REDIS_RETRY_SECONDS = 5
+NOTIFICATION_BATCH_SIZE = 500
+NOTIFICATION_UNREAD_CACHE_SECONDS = 3600
+PROMOTION_CACHE_SECONDS = 300
+SUPPORT_AGENT_CAPACITY = 5
+SUPPORT_REQUEUE_SECONDS = 60
+SUPPORT_CONNECTION_TTL_SECONDS = 90
 
 # CORS
 CORS_ALLOWED_ORIGINS = ['*']
@@ -157,16 +185,30 @@ SIMPLE_JWT = {
 # Cache
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'deliveet.utils.metrics.InstrumentedLocMemCache',
     }
 }
 
+# Metrics
+METRICS_TOKEN = 'test-metrics-token'
+METRICS_FLUSH_SECONDS = 10
+METRICS_DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+METRICS_QUERY_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500]
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Email outbox
+EMAIL_OUTBOX_BATCH_SIZE = 100
+EMAIL_OUTBOX_RATE_LIMIT = 0
+EMAIL_OUTBOX_MAX_ATTEMPTS = 3
+EMAIL_OUTBOX_RETRY_SECONDS = 60
+EMAIL_OUTBOX_STALL_SECONDS = 300
+EMAIL_OUTBOX_KEEP_DAYS = 7
+
 # Celery (disabled for tests)
-CELERY_ALWAYS_EAGER = True
-CELERY_EAGER_PROPAGATES_EXCEPTIONS = True
+CELERY_TASK_ALWAYS_EAGER = True
+CELERY_TASK_EAGER_PROPAGATES = True
 
 # Monnify Payment Gateway
 MONNIFY_BASE_URL = 'https://sandbox.monnify.com'
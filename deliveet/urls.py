@@ -5,13 +5,21 @@ from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path, re_path
 from django.views.generic import TemplateView
-from django.views.static import serve
 
 from deliveet import consumers
+from deliveet.utils.health import health_check
+from deliveet.utils.media import serve_media
+from deliveet.utils.metrics import metrics_view
 
 urlpatterns = [
     # Admin
     path('admin/', admin.site.urls),
+
+    # Health check with database pool stats
+    path('health/', health_check, name='health_check'),
+
+    # Prometheus metrics
+    path('metrics/', metrics_view, name='metrics'),
     
     # REST API v1
     path('api/v1/', include('api.urls', namespace='api')),
@@ -35,13 +43,18 @@ urlpatterns = [
     path('firebase-messaging-sw.js',
          (TemplateView.as_view(template_name="snippets/firebase-messaging-sw.js",
                                content_type="application/javascript", ))),
-    re_path(r'^media/(?P<path>.*)$', serve, {'document_root': settings.MEDIA_ROOT}),
+    re_path(r'^media/(?P<path>.*)$', serve_media),
 ]
 
-# WebSocket URL patterns
+# WebSocket URL patterns. Send the access token in the Authorization header
+# or the access_token subprotocol; the URLs ending in the token are kept
+# for older clients.
 websocket_urlpatterns = [
     path('ws/delivery/<delivery_task_id>/', consumers.DeliveryTaskConsumer.as_asgi()),
+    path('ws/tracker/<shipment_id>/', consumers.DeliveryTrackerConsumer.as_asgi()),
     path('ws/tracker/<shipment_id>/<user_token>/', consumers.DeliveryTrackerConsumer.as_asgi()),
+    path('ws/notifications/<user_id>/', consumers.NotificationConsumer.as_asgi()),
     path('ws/notifications/<user_id>/<user_token>/', consumers.NotificationConsumer.as_asgi()),
+    path('ws/support/', consumers.SupportAgentConsumer.as_asgi()),
 ]
 
@@ -0,0 +1,336 @@
+"""
+This module runs admin CSV imports and bulk actions in Celery.
+
+Starting an import or a bulk action from the admin only records a BulkJob
+and queues it, so the request returns at once however many rows are
+involved. The worker handles BULK_JOB_CHUNK_SIZE rows at a time:
+
+- an import reads the uploaded CSV as a stream, validates each row with
+  the admin's import_form, looks up the rows that already exist by
+  import_key with one query, and writes the chunk with bulk_create and
+  bulk_update;
+- a bulk action walks the selected rows in primary key order and calls
+  the admin's action method with one chunk at a time.
+
+Each chunk is written in the same transaction as the job's progress and
+checkpoint, so memory stays bounded by the chunk size and a job picked up
+again after a worker restart carries on from the last committed chunk.
+Jobs whose worker stopped sending heartbeats are re-queued by the
+resume_bulk_jobs task.
+"""
+import csv
+import io
+import logging
+import pickle
+from datetime import timedelta
+from functools import partial
+
+from django import forms
+from django.apps import apps
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.forms.models import model_to_dict
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
+
+from app.models import BulkJob
+
+logger = logging.getLogger(__name__)
+
+Status = BulkJob.StatusChoices
+
+
+class ImportForm(forms.ModelForm):
+    """
+    This is the base of the forms import rows are validated with. Rows are
+    matched to existing records on the import key, so the per-row
+    uniqueness queries of model forms are skipped.
+    """
+
+    def validate_unique(self):
+        pass
+
+
+class ImportUploadForm(forms.Form):
+    """
+    This renders the upload form of an admin import
+    """
+    file = forms.FileField(help_text='A CSV file with a header row')
+
+
+def bulk_action(description):
+    """
+    Decorator for ModelAdmin methods that take a chunk of the selected rows
+    and return the number of rows they changed
+    """
+    def decorator(func):
+        func.short_description = description
+        return func
+    return decorator
+
+
+def enqueue(job):
+    """
+    This queues the job once the transaction that created it commits
+    """
+    from app.tasks import run_bulk_job
+
+    transaction.on_commit(partial(run_bulk_job.delay, str(job.pk)))
+
+
+def stalled_jobs():
+    """
+    This returns the jobs waiting for a worker or whose worker stopped
+    """
+    stalled = timezone.now() - timedelta(seconds=settings.BULK_JOB_STALL_SECONDS)
+    return BulkJob.objects.filter(
+        Q(status=Status.PENDING, created_at__lt=stalled)
+        | Q(status=Status.RUNNING, heartbeat_at__lt=stalled)
+    )
+
+
+def claim(job_id):
+    """
+    This marks the job as running in this worker. It returns False while
+    another worker is running the job.
+    """
+    now = timezone.now()
+    stalled = now - timedelta(seconds=settings.BULK_JOB_STALL_SECONDS)
+    return bool(BulkJob.objects.filter(
+        Q(status=Status.PENDING) | Q(status=Status.RUNNING, heartbeat_at__lt=stalled),
+        pk=job_id,
+    ).update(status=Status.RUNNING, heartbeat_at=now))
+
+
+def _save_progress(job, checkpoint, processed, succeeded, failed=0, errors=()):
+    job.checkpoint = str(checkpoint)
+    job.processed += processed
+    job.succeeded += succeeded
+    job.failed += failed
+    room = settings.BULK_JOB_MAX_ERRORS - len(job.errors)
+    if room > 0:
+        job.errors = job.errors + list(errors)[:room]
+    job.heartbeat_at = timezone.now()
+    job.save(update_fields=['checkpoint', 'processed', 'succeeded', 'failed', 'errors', 'heartbeat_at'])
+
+
+def run_job(job_id):
+    """
+    This runs or resumes a job unless another worker is running it
+    """
+    if not claim(job_id):
+        return
+    job = BulkJob.objects.get(pk=job_id)
+    model = apps.get_model(job.model)
+    model_admin = admin.site.get_model_admin(model)
+
+    try:
+        if job.kind == BulkJob.KindChoices.IMPORT:
+            _run_import(job, model, model_admin)
+        else:
+            _run_action(job, model, model_admin)
+    except Exception as error:
+        logger.exception('Bulk job %s failed at checkpoint %r', job.pk, job.checkpoint)
+        BulkJob.objects.filter(pk=job.pk).update(
+            status=Status.FAILED,
+            errors=job.errors + [{'row': None, 'errors': {'__all__': [str(error)]}}],
+            finished_at=timezone.now(),
+        )
+        return
+
+    BulkJob.objects.filter(pk=job.pk).update(status=Status.COMPLETED, finished_at=timezone.now())
+    logger.info('Bulk job %s finished: %s succeeded, %s failed', job.pk, job.succeeded, job.failed)
+
+
+def _read_rows(job):
+    # A new handle every time; reopening the FieldFile would reuse a closed one.
+    source = job.source.storage.open(job.source.name, 'rb')
+    return source, csv.DictReader(io.TextIOWrapper(source, encoding='utf-8-sig', newline=''))
+
+
+def _run_import(job, model, model_admin):
+    if job.total is None:
+        source, reader = _read_rows(job)
+        with source:
+            job.total = sum(1 for _row in reader)
+        job.save(update_fields=['total'])
+
+    start = int(job.checkpoint or 0)
+    source, reader = _read_rows(job)
+    with source:
+        chunk = []
+        for number, row in enumerate(reader, start=1):
+            if number <= start:
+                continue
+            chunk.append((number, row))
+            if len(chunk) == settings.BULK_JOB_CHUNK_SIZE:
+                _import_chunk(job, model, model_admin, chunk)
+                chunk = []
+        if chunk:
+            _import_chunk(job, model, model_admin, chunk)
+
+
+def _import_chunk(job, model, model_admin, chunk):
+    form_class = model_admin.import_form
+    key = model_admin.import_key
+    fields = [field for field in form_class._meta.fields if field != model._meta.pk.name]
+    # Empty cells leave the field to its default, or unchanged for updates.
+    rows = [
+        (number, {name: value for name, value in row.items() if name and value not in ('', None)})
+        for number, row in chunk
+    ]
+    existing = {
+        str(getattr(instance, key)): instance
+        for instance in model.objects.filter(**{f'{key}__in': {row[key] for _number, row in rows if key in row}})
+    }
+
+    created, updated, errors = {}, {}, []
+    for number, row in rows:
+        row_key = row.get(key)
+        instance = created.get(row_key) or updated.get(row_key) or existing.get(row_key)
+        data = {**model_to_dict(instance if instance is not None else model(), fields), **row}
+        form = form_class(data=data, instance=instance)
+        if not form.is_valid():
+            errors.append({
+                'row': number,
+                'errors': {name: list(field_errors) for name, field_errors in form.errors.items()},
+            })
+            continue
+        record = form.save(commit=False)
+        if row_key is not None and row_key in existing:
+            updated[row_key] = record
+        else:
+            created[row_key if row_key is not None else f'row-{number}'] = record
+
+    with transaction.atomic():
+        model_admin.prepare_import(list(created.values()))
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(list(created.values()))
+                model.objects.bulk_update(list(updated.values()), fields)
+        except IntegrityError:
+            # A row clashes with another record; save the rows one by one
+            # so only the clashing rows fail.
+            for record in [*created.values(), *updated.values()]:
+                try:
+                    with transaction.atomic():
+                        record.save()
+                except IntegrityError as error:
+                    errors.append({'row': None, 'errors': {'__all__': [f'{getattr(record, key, "")}: {error}']}})
+        failed = len(errors)
+        _save_progress(job, chunk[-1][0], len(chunk), len(chunk) - failed, failed, errors)
+
+
+def _run_action(job, model, model_admin):
+    queryset = model.objects.all()
+    queryset.query = pickle.loads(job.query)
+    if job.total is None:
+        job.total = queryset.count()
+        job.save(update_fields=['total'])
+
+    action = getattr(model_admin, job.action)
+    checkpoint = job.checkpoint
+    while True:
+        pending = queryset.filter(pk__gt=checkpoint) if checkpoint else queryset
+        pks = list(pending.order_by('pk').values_list('pk', flat=True)[:settings.BULK_JOB_CHUNK_SIZE])
+        if not pks:
+            return
+        with transaction.atomic():
+            changed = action(model.objects.filter(pk__in=pks))
+            checkpoint = pks[-1]
+            # Rows the action had nothing to change in are not failures.
+            _save_progress(job, checkpoint, len(pks), changed)
+
+
+class BulkJobAdminMixin:
+    """
+    This runs a ModelAdmin's imports and bulk actions as background jobs.
+    Subclasses set import_form (an ImportForm) and import_key (a field
+    naming each record, used to update rows that already exist), and list
+    in bulk_actions methods decorated with bulk_action.
+    """
+    import_form = None
+    import_key = None
+    bulk_actions = ()
+    change_list_template = 'admin/bulk_jobs/change_list.html'
+
+    def prepare_import(self, records):
+        """
+        This is called with the new records of a chunk before they are
+        inserted with bulk_create, which skips save()
+        """
+
+    def get_urls(self):
+        opts = self.model._meta
+        return [
+            path(
+                'import/',
+                self.admin_site.admin_view(self.import_view),
+                name=f'{opts.app_label}_{opts.model_name}_import',
+            ),
+        ] + super().get_urls()
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {
+            **(extra_context or {}),
+            'has_import': self.import_form is not None and self.has_import_permission(request),
+        }
+        return super().changelist_view(request, extra_context)
+
+    def has_import_permission(self, request):
+        return self.has_add_permission(request) and self.has_change_permission(request)
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        if not self.has_change_permission(request):
+            return actions
+        for name in self.bulk_actions:
+            description = f'{getattr(self, name).short_description} (in the background)'
+            actions[name] = (partial(BulkJobAdminMixin.start_bulk_action, action=name), name, description)
+        return actions
+
+    def start_bulk_action(self, request, queryset, action):
+        opts = self.model._meta
+        job = BulkJob.objects.create(
+            kind=BulkJob.KindChoices.ACTION,
+            model=opts.label_lower,
+            action=action,
+            query=pickle.dumps(queryset.query),
+            created_by=request.user,
+        )
+        enqueue(job)
+        self.message_user(request, self._job_started_message(job), messages.INFO)
+
+    def import_view(self, request):
+        if self.import_form is None or not self.has_import_permission(request):
+            raise PermissionDenied
+
+        form = ImportUploadForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            job = BulkJob.objects.create(
+                kind=BulkJob.KindChoices.IMPORT,
+                model=self.model._meta.label_lower,
+                source=form.cleaned_data['file'],
+                created_by=request.user,
+            )
+            enqueue(job)
+            self.message_user(request, self._job_started_message(job), messages.INFO)
+            return redirect(reverse('admin:app_bulkjob_change', args=[job.pk]))
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': f'Import {self.model._meta.verbose_name_plural}',
+            'form': form,
+            'columns': list(self.import_form._meta.fields),
+            'import_key': self.import_key,
+        }
+        return TemplateResponse(request, 'admin/bulk_jobs/import.html', context)
+
+    def _job_started_message(self, job):
+        return f'{job} started in the background. Follow its progress under Bulk jobs.'
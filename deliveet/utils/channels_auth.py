@@ -0,0 +1,123 @@
+"""
+This module authenticates WebSocket connections with SimpleJWT access
+tokens.
+
+Browsers cannot set headers on a WebSocket, so JWTAuthMiddleware takes the
+token from either of:
+
+    Authorization: Bearer <access token>
+    Sec-WebSocket-Protocol: access_token, <access token>
+
+The token is validated with the SIMPLE_JWT settings, like the REST API
+does. The user it names is cached for WEBSOCKET_AUTH_CACHE_SECONDS, so the
+reconnect storm after a deploy costs one query per user rather than one
+per connection; saving or deleting the user drops the cached copy.
+
+Connections without a token go through Channels' session authentication,
+which the dashboard pages use. A connection with a token that does not
+validate gets an AnonymousUser and does not fall back to the session.
+"""
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+TOKEN_SUBPROTOCOL = 'access_token'
+
+
+def _user_key(user_id):
+    return f'websocket:user:{user_id}'
+
+
+def forget_user(user_id):
+    """
+    This drops the cached user, so the next connection loads it again
+    """
+    cache.delete(_user_key(user_id))
+
+
+def get_token(scope):
+    """
+    This returns the access token of a connection and the subprotocol to
+    accept it with, or (None, None)
+    """
+    subprotocols = scope.get('subprotocols') or []
+    if TOKEN_SUBPROTOCOL in subprotocols[:-1]:
+        return subprotocols[subprotocols.index(TOKEN_SUBPROTOCOL) + 1], TOKEN_SUBPROTOCOL
+
+    for name, value in scope.get('headers') or []:
+        if name == b'authorization':
+            parts = value.decode('latin1').split()
+            if len(parts) == 2 and parts[0] in api_settings.AUTH_HEADER_TYPES:
+                return parts[1], None
+    return None, None
+
+
+@database_sync_to_async
+def _load_user(user_id):
+    user = get_user_model().objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+    return user if user is not None and api_settings.USER_AUTHENTICATION_RULE(user) else None
+
+
+async def authenticate(raw_token):
+    """
+    This returns the active user an access token was issued to, or an
+    AnonymousUser
+    """
+    try:
+        user_id = AccessToken(raw_token)[api_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return AnonymousUser()
+
+    key = _user_key(user_id)
+    user = await cache.aget(key)
+    if user is None:
+        user = await _load_user(user_id)
+        # A missing or inactive user is cached too, as False.
+        await cache.aset(key, user or False, timeout=settings.WEBSOCKET_AUTH_CACHE_SECONDS)
+    return user or AnonymousUser()
+
+
+async def scope_user(scope, path_token=None):
+    """
+    This returns the connection's user, authenticating the token of the
+    older URLs that carry it in the path when the middleware found none
+    """
+    user = scope.get('user')
+    if (user is None or not user.is_authenticated) and path_token:
+        return await authenticate(path_token)
+    return user or AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    This sets scope['user'] from the connection's access token, and
+    scope['auth_subprotocol'] to the subprotocol the consumer should
+    accept. Connections without a token are passed to fallback.
+    """
+
+    def __init__(self, inner, fallback=None):
+        super().__init__(inner)
+        self.fallback = fallback
+
+    async def __call__(self, scope, receive, send):
+        raw_token, subprotocol = get_token(scope)
+        if raw_token is None and self.fallback is not None:
+            return await self.fallback(scope, receive, send)
+
+        user = await authenticate(raw_token) if raw_token else AnonymousUser()
+        return await super().__call__(dict(scope, user=user, auth_subprotocol=subprotocol), receive, send)
+
+
+def JWTAuthMiddlewareStack(inner):
+    """
+    This authenticates with an access token when the connection has one
+    and with the session otherwise
+    """
+    return JWTAuthMiddleware(inner, fallback=AuthMiddlewareStack(inner))
@@ -0,0 +1,69 @@
+"""
+This module reports on the pooled database connections of this process.
+
+With DATABASE_POOL on, each PostgreSQL alias gets a psycopg connection
+pool sized for the process type (see DATABASE_POOL_SIZES in settings).
+Threads borrow a connection for a request, a consumer call or a task and
+hand it back when Django closes it, so the number of server connections
+no longer follows the number of threads. pool_stats() exposes the pool
+counters, including how long requests waited for a connection.
+"""
+import logging
+import os
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_last_logged = 0.0
+
+
+def pool_stats():
+    """
+    This returns the pool counters of each pooled database alias. Counters
+    are totals since the pool opened; sizes are current values.
+    """
+    stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is None:
+            continue
+        counters = pool.get_stats()
+        requests = counters.get('requests_num', 0)
+        counters['requests_wait_ms_avg'] = round(counters.get('requests_wait_ms', 0) / requests, 3) if requests else 0.0
+        stats[alias] = counters
+    return stats
+
+
+def log_pool_stats(interval):
+    """
+    This logs the pool counters at most once every interval seconds
+    """
+    global _last_logged
+    if time.monotonic() - _last_logged < interval:
+        return
+    _last_logged = time.monotonic()
+    for alias, counters in pool_stats().items():
+        logger.info(
+            'Database pool %s (pid %s): %s/%s connections, %s requests, %s waited, '
+            '%.1fms average wait, %s timeouts',
+            alias, os.getpid(),
+            counters.get('pool_size', 0), counters.get('pool_max', 0),
+            counters.get('requests_num', 0), counters.get('requests_queued', 0),
+            counters['requests_wait_ms_avg'], counters.get('requests_errors', 0),
+        )
+
+
+def forget_inherited_pools():
+    """
+    This drops pools copied from the parent into a forked process, so the
+    child opens its own connections instead of sharing the parent's sockets
+    """
+    try:
+        from django.db.backends.postgresql.base import DatabaseWrapper
+    except ImproperlyConfigured:
+        # psycopg is not installed, so nothing can be pooled.
+        return
+    DatabaseWrapper._connection_pools.clear()
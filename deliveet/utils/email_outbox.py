@@ -0,0 +1,164 @@
+"""
+This module sends the site's email through an outbox.
+
+queue_email() stores the email as an OutgoingEmail in the caller's
+transaction and asks a Celery worker to send the outbox once the
+transaction commits. A request therefore never waits on SMTP or SES, an
+email is only sent if the data it talks about was saved, and nothing is
+lost while the mail server or the broker is down.
+
+The worker claims EMAIL_OUTBOX_BATCH_SIZE emails at a time and sends them
+over one connection, at most EMAIL_OUTBOX_RATE_LIMIT a second. An email
+that fails is retried with exponential backoff, up to
+EMAIL_OUTBOX_MAX_ATTEMPTS times. The send_queued_emails task also runs
+every minute, which sends the retries and anything queued while the
+broker was unreachable. Sent emails, and the ones given up on, are
+deleted after EMAIL_OUTBOX_KEEP_DAYS by the purge_sent_emails task.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from app.models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+Status = OutgoingEmail.StatusChoices
+
+
+def queue_email(subject, body, to, html_body='', from_email=None):
+    """
+    This adds an email to the outbox and has it sent once the current
+    transaction commits
+    """
+    email = OutgoingEmail.objects.create(
+        subject=subject,
+        body=body,
+        html_body=html_body or '',
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(to),
+    )
+    transaction.on_commit(dispatch)
+    return email
+
+
+def queue_template_email(subject, template_name, context, to, from_email=None):
+    """
+    This renders an HTML template and queues it, with its text as the
+    plain body
+    """
+    html_body = render_to_string(template_name, context)
+    return queue_email(subject, strip_tags(html_body), to, html_body=html_body, from_email=from_email)
+
+
+def dispatch():
+    """
+    This asks a worker to send the outbox. When the broker is unreachable
+    the emails wait for the periodic run instead.
+    """
+    from app.tasks import send_queued_emails
+
+    try:
+        send_queued_emails.apply_async(retry=False)
+    except Exception:
+        logger.warning('Could not queue the outbox task, leaving the emails for the next run', exc_info=True)
+
+
+def claim_batch(size):
+    """
+    This marks up to size due emails as being sent by this worker and
+    returns them. Rows another worker is claiming are skipped.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status__in=[Status.PENDING, Status.SENDING], send_after__lte=now)
+            .order_by('send_after')
+            .values_list('pk', flat=True)[:size]
+        )
+        OutgoingEmail.objects.filter(pk__in=ids).update(
+            status=Status.SENDING,
+            send_after=now + timedelta(seconds=settings.EMAIL_OUTBOX_STALL_SECONDS),
+        )
+    return list(OutgoingEmail.objects.filter(pk__in=ids).order_by('pk'))
+
+
+def _message(email, connection):
+    message = EmailMultiAlternatives(
+        email.subject, email.body, email.from_email, email.to, connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def _failed(email, error):
+    email.attempts += 1
+    email.last_error = f'{type(error).__name__}: {error}'
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = Status.FAILED
+        logger.error('Giving up on email %s after %s attempts: %s', email.pk, email.attempts, email.last_error)
+    else:
+        email.status = Status.PENDING
+        email.send_after = timezone.now() + timedelta(
+            seconds=settings.EMAIL_OUTBOX_RETRY_SECONDS * 2 ** (email.attempts - 1)
+        )
+    email.save(update_fields=['attempts', 'last_error', 'status', 'send_after'])
+
+
+def send_batch(size=None):
+    """
+    This sends one batch of due emails over a single connection and
+    returns how many were claimed
+    """
+    emails = claim_batch(size or settings.EMAIL_OUTBOX_BATCH_SIZE)
+    if not emails:
+        return 0
+
+    interval = 1 / settings.EMAIL_OUTBOX_RATE_LIMIT if settings.EMAIL_OUTBOX_RATE_LIMIT else 0
+    next_send = time.monotonic()
+    sent = []
+    connection = get_connection()
+    try:
+        for email in emails:
+            pause = next_send - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+            next_send = time.monotonic() + interval
+            try:
+                connection.open()
+                _message(email, connection).send()
+            except Exception as error:
+                _failed(email, error)
+                # The connection may be broken; the next email opens a new one.
+                connection.close()
+            else:
+                sent.append(email.pk)
+    finally:
+        connection.close()
+        OutgoingEmail.objects.filter(pk__in=sent).update(status=Status.SENT, sent_at=timezone.now())
+    return len(emails)
+
+
+def purge_sent():
+    """
+    This deletes the sent and failed emails older than
+    EMAIL_OUTBOX_KEEP_DAYS, as they hold links such as password resets
+    """
+    cutoff = timezone.now() - timedelta(days=settings.EMAIL_OUTBOX_KEEP_DAYS)
+    deleted, _ = OutgoingEmail.objects.filter(
+        Q(status=Status.SENT, sent_at__lt=cutoff)
+        # A failed email never gets a sent_at; it gave up within hours of
+        # being queued.
+        | Q(status=Status.FAILED, created_at__lt=cutoff)
+    ).delete()
+    return deleted
@@ -0,0 +1,67 @@
+"""
+This module gives each process one Firebase Admin app, created the first
+time something needs it.
+
+Initializing Firebase parses the service account credentials and imports
+the Google client libraries, which takes a noticeable share of process
+start-up. Doing it when accounts.views was imported meant every web,
+ASGI and Celery process and every test run paid for it, and none of them
+could start without credentials. Push notifications and phone number
+verification call firebase_messaging() and verify_id_token() instead, and
+only those fail, with ImproperlyConfigured, when the credentials are
+missing.
+"""
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+_lock = threading.Lock()
+_app = None
+
+
+def firebase_app():
+    """
+    This returns the process's Firebase Admin app, initializing it on the
+    first call
+    """
+    global _app
+    if _app is not None:
+        return _app
+
+    with _lock:
+        if _app is None:
+            import firebase_admin
+            from firebase_admin import credentials
+
+            try:
+                certificate = credentials.Certificate(settings.FIREBASE_SECRETS)
+            except ValueError as error:
+                raise ImproperlyConfigured(f'Failed to initialize Firebase credentials: {error}') from error
+            try:
+                _app = firebase_admin.initialize_app(certificate)
+            except ValueError:
+                # Something else in the process initialized it already.
+                _app = firebase_admin.get_app()
+    return _app
+
+
+def firebase_messaging():
+    """
+    This returns the firebase_admin.messaging module with the app
+    initialized, to build and send push notifications with
+    """
+    firebase_app()
+    from firebase_admin import messaging
+
+    return messaging
+
+
+def verify_id_token(id_token):
+    """
+    This verifies a Firebase ID token and returns its claims
+    """
+    firebase_app()
+    from firebase_admin import auth
+
+    return auth.verify_id_token(id_token)
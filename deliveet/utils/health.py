@@ -0,0 +1,44 @@
+"""
+This module answers health checks from load balancers and docker-compose.
+
+Anyone gets the overall status. The state of each database and the
+connection pools are only shown to the metrics scraper and staff, as
+metrics_view is.
+"""
+import logging
+
+from django.db import DatabaseError, connections
+from django.http import JsonResponse
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_safe
+
+from deliveet.utils.db_pool import pool_stats
+from deliveet.utils.metrics import is_scraper
+
+logger = logging.getLogger(__name__)
+
+
+@never_cache
+@require_safe
+def health_check(request):
+    """
+    This checks that every database answers and, for the scraper and
+    staff, reports the connection pools of the process that served the
+    request
+    """
+    databases = {}
+    healthy = True
+    for alias in connections:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+            databases[alias] = 'ok'
+        except DatabaseError as error:
+            logger.warning('Health check of database %s failed: %s', alias, error)
+            databases[alias] = 'unavailable'
+            healthy = False
+
+    body = {'status': 'ok' if healthy else 'unavailable'}
+    if is_scraper(request):
+        body.update(databases=databases, pools=pool_stats())
+    return JsonResponse(body, status=200 if healthy else 503)
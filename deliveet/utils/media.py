@@ -0,0 +1,104 @@
+"""
+This module serves uploaded media files.
+
+Django only resolves the file and answers conditional requests. The bytes
+are sent by the front web server (nginx X-Accel-Redirect or X-Sendfile), or
+by S3 through a signed URL when USE_S3 is on, so no worker is held for the
+length of a download. The 'django' mode streams the file from the worker
+and is meant for local development.
+"""
+import mimetypes
+import os
+import posixpath
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, HttpResponseRedirect
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags
+from django.views.decorators.http import require_safe
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def media_etag(stat):
+    """
+    This builds a strong ETag from the file's mtime and size.
+    It uses the same format as nginx so both agree on a file's validator.
+    """
+    return '"%x-%x"' % (int(stat.st_mtime), stat.st_size)
+
+
+def media_cache_control(path):
+    """
+    This returns the Cache-Control header for a media path.
+    Renditions under an immutable prefix never change once written.
+    """
+    if any(path.startswith(prefix) for prefix in settings.MEDIA_IMMUTABLE_PREFIXES):
+        return IMMUTABLE_CACHE_CONTROL
+    return f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+
+
+def _not_modified(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag in etags
+
+
+def _signed_url_response(path):
+    """
+    This redirects to a short-lived signed URL for the file on S3
+    """
+    response = HttpResponseRedirect(default_storage.url(path))
+    response['Cache-Control'] = f'private, max-age={settings.MEDIA_SIGNED_URL_CACHE_SECONDS}'
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    This serves a file from MEDIA_ROOT using the configured MEDIA_SERVE_MODE
+    """
+    path = posixpath.normpath(path).lstrip('/')
+
+    if settings.USE_S3:
+        return _signed_url_response(path)
+
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (OSError, SuspiciousFileOperation):
+        raise Http404('File not found')
+    if not os.path.isfile(full_path):
+        raise Http404('File not found')
+
+    etag = media_etag(stat)
+    cache_control = media_cache_control(path)
+
+    if _not_modified(request, etag):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        return response
+
+    if settings.MEDIA_SERVE_MODE == 'x-accel':
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = quote(settings.MEDIA_ACCEL_REDIRECT_PREFIX + path)
+    elif settings.MEDIA_SERVE_MODE == 'x-sendfile':
+        response = HttpResponse()
+        response['X-Sendfile'] = full_path
+    else:
+        response = FileResponse(open(full_path, 'rb'))
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    response['Content-Type'] = content_type or 'application/octet-stream'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = cache_control
+    return response
@@ -0,0 +1,430 @@
+"""
+This module measures where the time of each request, consumer message and
+Celery task goes, and exposes the results in the Prometheus text format.
+
+For every unit of work it records, under the resolved URL name (or the
+consumer and message type, or the task name):
+
+- the wall time,
+- the number of database queries and the time spent in them, timed by an
+  execute wrapper every database connection gets,
+- cache hits and misses of the instrumented cache backends below, and
+- the time spent in outgoing HTTP calls made with requests.
+
+MetricsMiddleware covers views, InstrumentedConsumerMixin covers Channels
+consumers and the Celery signals in deliveet/celery.py cover tasks.
+
+Observations are added up in the process and every METRICS_FLUSH_SECONDS
+added to a Redis hash, so the /metrics/ endpoint reports the web, ASGI and
+worker processes together. Without Redis as the default cache each process
+reports only its own numbers.
+"""
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager, suppress
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_safe
+from django_redis.cache import RedisCache
+
+from deliveet.utils.db_pool import pool_stats
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY = 'metrics:v1'
+
+FAMILIES = {
+    'deliveet_duration_seconds': ('histogram', 'Wall time of requests, consumer messages and tasks.'),
+    'deliveet_db_queries': ('histogram', 'Database queries per request, consumer message or task.'),
+    'deliveet_db_duration_seconds': ('histogram', 'Time spent in database queries.'),
+    'deliveet_external_http_duration_seconds': ('histogram', 'Time spent in outgoing HTTP calls.'),
+    'deliveet_handled_total': ('counter', 'Requests, consumer messages and tasks handled, by outcome.'),
+    'deliveet_cache_requests_total': ('counter', 'Cache lookups, by result.'),
+}
+
+# The measurements of the unit of work being run
+_sample = ContextVar('metrics_sample', default=None)
+# Celery tasks being run in this process, by task id
+_tasks = {}
+
+_lock = threading.Lock()
+_buckets = defaultdict(lambda: defaultdict(float))
+_counters = defaultdict(float)
+_last_flush = time.monotonic()
+_installed = False
+
+_MISSING = object()
+
+
+class Sample:
+    """
+    This holds the measurements of one request, message or task
+    """
+    __slots__ = ('queries', 'db_time', 'http_time', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.http_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+def _time_query(execute, sql, params, many, context):
+    sample = _sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.queries += 1
+        sample.db_time += time.perf_counter() - start
+
+
+def _add_query_timer(sender, connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+def _time_http_calls():
+    from requests.adapters import HTTPAdapter
+
+    send = HTTPAdapter.send
+
+    @wraps(send)
+    def timed_send(adapter, request, *args, **kwargs):
+        sample = _sample.get()
+        if sample is None:
+            return send(adapter, request, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return send(adapter, request, *args, **kwargs)
+        finally:
+            sample.http_time += time.perf_counter() - start
+
+    HTTPAdapter.send = timed_send
+
+
+def install():
+    """
+    This hooks the query and HTTP timers in, once per process
+    """
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    connection_created.connect(_add_query_timer, dispatch_uid='deliveet.metrics')
+    _time_http_calls()
+
+
+def _start():
+    install()
+    # In case this thread connected before the hook was in.
+    for connection in connections.all():
+        _add_query_timer(None, connection)
+
+
+@contextmanager
+def collect():
+    """
+    This measures the block and yields its Sample
+    """
+    _start()
+    sample = Sample()
+    token = _sample.set(sample)
+    try:
+        yield sample
+    finally:
+        _sample.reset(token)
+
+
+def _observe(family, labels, value, buckets):
+    index = bisect_left(buckets, value)
+    histogram = _buckets[(family, labels)]
+    histogram[index] += 1
+    histogram['sum'] += value
+    histogram['count'] += 1
+
+
+def record(kind, name, outcome, duration, sample):
+    """
+    This adds the measurements of a finished request, message or task
+    """
+    labels = (('kind', kind), ('name', name))
+    with _lock:
+        _observe('deliveet_duration_seconds', labels, duration, settings.METRICS_DURATION_BUCKETS)
+        _observe('deliveet_db_queries', labels, sample.queries, settings.METRICS_QUERY_BUCKETS)
+        _observe('deliveet_db_duration_seconds', labels, sample.db_time, settings.METRICS_DURATION_BUCKETS)
+        _observe('deliveet_external_http_duration_seconds', labels, sample.http_time,
+                 settings.METRICS_DURATION_BUCKETS)
+        _counters[('deliveet_handled_total', labels + (('outcome', outcome),))] += 1
+        if sample.cache_hits:
+            _counters[('deliveet_cache_requests_total', labels + (('result', 'hit'),))] += sample.cache_hits
+        if sample.cache_misses:
+            _counters[('deliveet_cache_requests_total', labels + (('result', 'miss'),))] += sample.cache_misses
+
+    if time.monotonic() - _last_flush >= settings.METRICS_FLUSH_SECONDS:
+        flush()
+
+
+def _bucket_bounds(family):
+    if family == 'deliveet_db_queries':
+        return settings.METRICS_QUERY_BUCKETS
+    return settings.METRICS_DURATION_BUCKETS
+
+
+def _local_values():
+    """
+    This returns the numbers added up in this process as sample name and
+    labels to value, with cumulative histogram buckets
+    """
+    values = {}
+    for (family, labels), histogram in _buckets.items():
+        bounds = [*_bucket_bounds(family), float('inf')]
+        cumulative = 0
+        for index, bound in enumerate(bounds):
+            cumulative += histogram.get(index, 0)
+            le = '+Inf' if bound == float('inf') else repr(float(bound))
+            values[json.dumps([f'{family}_bucket', [*labels, ('le', le)]])] = cumulative
+        values[json.dumps([f'{family}_sum', list(labels)])] = histogram['sum']
+        values[json.dumps([f'{family}_count', list(labels)])] = histogram['count']
+    for (family, labels), value in _counters.items():
+        values[json.dumps([family, list(labels)])] = value
+    return values
+
+
+def _redis():
+    from django_redis import get_redis_connection
+
+    try:
+        return get_redis_connection('default')
+    except NotImplementedError:
+        # The default cache is not Redis.
+        return None
+
+
+def flush():
+    """
+    This adds the numbers of this process to the shared totals in Redis
+    """
+    global _last_flush
+    connection = _redis()
+    with _lock:
+        _last_flush = time.monotonic()
+        if connection is None or not (_buckets or _counters):
+            return
+        values = _local_values()
+        try:
+            pipeline = connection.pipeline(transaction=False)
+            for field, value in values.items():
+                pipeline.hincrbyfloat(REDIS_KEY, field, value)
+            pipeline.execute()
+        except Exception as error:
+            # Kept for the next flush.
+            logger.warning('Could not flush metrics to Redis: %s', error)
+            return
+        _buckets.clear()
+        _counters.clear()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + pairs + '}'
+
+
+def _family(name):
+    for family in FAMILIES:
+        if name == family or name in (f'{family}_bucket', f'{family}_sum', f'{family}_count'):
+            return family
+    return name
+
+
+def _sort_key(item):
+    (name, labels), _value = item
+    le = dict(labels).get('le')
+    return (_family(name), [pair for pair in labels if pair[0] != 'le'], name, float(le) if le else 0.0)
+
+
+def render():
+    """
+    This returns every metric in the Prometheus text format
+    """
+    connection = _redis()
+    if connection is None:
+        with _lock:
+            values = _local_values()
+    else:
+        flush()
+        values = {
+            field.decode(): float(value)
+            for field, value in connection.hgetall(REDIS_KEY).items()
+        }
+
+    samples = []
+    for field, value in values.items():
+        name, labels = json.loads(field)
+        samples.append(((name, [tuple(pair) for pair in labels]), value))
+    samples.sort(key=_sort_key)
+
+    lines = []
+    described = set()
+    for (name, labels), value in samples:
+        family = _family(name)
+        if family not in described:
+            described.add(family)
+            kind, description = FAMILIES[family]
+            lines += [f'# HELP {family} {description}', f'# TYPE {family} {kind}']
+        lines.append(f'{name}{_format_labels(labels)} {value:g}')
+
+    # Pools belong to each process, so these describe the one answering.
+    for alias, counters in pool_stats().items():
+        for counter, value in sorted(counters.items()):
+            labels = _format_labels([('alias', alias), ('pid', os.getpid())])
+            lines.append(f'deliveet_db_pool_{counter}{labels} {value:g}')
+    return '\n'.join(lines) + '\n'
+
+
+def is_scraper(request):
+    """
+    This tells whether the request carries the METRICS_TOKEN bearer token
+    or comes from a staff user
+    """
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    if token and hmac.compare_digest(authorization, f'Bearer {token}'):
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_authenticated and user.is_staff)
+
+
+@never_cache
+@require_safe
+def metrics_view(request):
+    """
+    This serves the metrics to a scraper with the METRICS_TOKEN bearer
+    token, or to staff users
+    """
+    if not is_scraper(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class MetricsMiddleware:
+    """
+    This measures each request under its URL name
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install()
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with collect() as sample:
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        # Unresolved paths share one name to keep the label set bounded.
+        name = match.view_name if match is not None else '<unresolved>'
+        record('http', name, f'{response.status_code // 100}xx', time.perf_counter() - start, sample)
+        return response
+
+
+class InstrumentedConsumerMixin:
+    """
+    This measures each message a Channels consumer handles, under the
+    consumer and message type
+    """
+
+    async def dispatch(self, message):
+        start = time.perf_counter()
+        outcome = 'error'
+        with collect() as sample:
+            try:
+                await super().dispatch(message)
+                outcome = 'ok'
+            finally:
+                name = f'{type(self).__name__}.{message["type"]}'
+                record('consumer', name, outcome, time.perf_counter() - start, sample)
+
+
+def start_task(task_id):
+    """
+    This starts measuring a Celery task
+    """
+    _start()
+    sample = Sample()
+    _tasks[task_id] = (_sample.set(sample), sample, time.perf_counter())
+
+
+def finish_task(task_id, name, state):
+    """
+    This records a Celery task started with start_task
+    """
+    started = _tasks.pop(task_id, None)
+    if started is None:
+        return
+    token, sample, start = started
+    with suppress(ValueError):
+        _sample.reset(token)
+    record('task', name, (state or 'unknown').lower(), time.perf_counter() - start, sample)
+
+
+class InstrumentedCacheMixin:
+    """
+    This counts the hits and misses of a cache backend
+    """
+
+    def get(self, key, default=None, version=None, **kwargs):
+        value = super().get(key, _MISSING, version=version, **kwargs)
+        sample = _sample.get()
+        if sample is not None:
+            if value is _MISSING:
+                sample.cache_misses += 1
+            else:
+                sample.cache_hits += 1
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None, **kwargs):
+        keys = list(keys)
+        sample = _sample.get()
+        # Some backends look the keys up one by one with get().
+        token = _sample.set(None)
+        try:
+            values = super().get_many(keys, version=version, **kwargs)
+        finally:
+            _sample.reset(token)
+        if sample is not None:
+            sample.cache_hits += len(values)
+            sample.cache_misses += len(keys) - len(values)
+        return values
+
+
+class InstrumentedRedisCache(InstrumentedCacheMixin, RedisCache):
+    """
+    This is django_redis's cache with hits and misses counted
+    """
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    """
+    This is the local memory cache with hits and misses counted
+    """
@@ -0,0 +1,265 @@
+"""
+This module limits how often a user or client may do something.
+
+Rates are written like DRF's, with an optional number of units:
+'100/hour', '5/second', '20/10s'. The limiter uses GCRA, the generic cell
+rate algorithm: each key stores a single timestamp, the theoretical
+arrival time of the next request, and a request is allowed while that
+time is less than one period ahead. A client may burst up to the whole
+budget and then gets one request every period/limit, with no fixed
+window boundaries to game.
+
+The check is one Lua script in Redis, so it is atomic across processes
+and takes a single round trip; the script uses Redis' clock so that the
+web servers' clocks do not matter. When the default cache is not Redis,
+or Redis cannot be reached, the same algorithm runs in process memory
+instead, and Redis is tried again after RATE_LIMIT_REDIS_RETRY_SECONDS.
+
+AnonRateThrottle, UserRateThrottle and ScopedRateThrottle replace DRF's
+throttles of the same names, which keep every request's timestamp in the
+cache and rewrite the list on each request. rate_limit() limits the
+messages a Channels consumer handles, with the budgets in
+WEBSOCKET_RATE_LIMITS.
+"""
+import asyncio
+import json
+import logging
+import math
+import re
+import threading
+import time
+from collections import namedtuple
+from functools import lru_cache, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+Decision = namedtuple('Decision', ['allowed', 'retry_after'])
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+RATE = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*([smhd])[a-z]*\s*$')
+
+# KEYS[1]: the key; ARGV: emission interval, period and cost, the times in
+# microseconds. Returns 0 when allowed, or the microseconds to wait.
+GCRA_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000000 + tonumber(clock[2])
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval * cost
+local wait = new_tat - now - period
+if wait > 0 then
+    return math.ceil(wait)
+end
+redis.call('SET', KEYS[1], string.format('%.0f', new_tat), 'PX', math.ceil((new_tat - now) / 1000))
+return 0
+"""
+
+
+@lru_cache(maxsize=128)
+def parse_rate(rate):
+    """
+    This returns the number of requests and the period in seconds of a
+    rate such as '5/second' or '20/10s'
+    """
+    match = RATE.match(rate)
+    if match is None:
+        raise ValueError(f'Invalid rate {rate!r}, expected something like "100/hour" or "20/10s"')
+    requests, count, unit = match.groups()
+    if int(requests) < 1:
+        raise ValueError(f'Invalid rate {rate!r}, the limit must be at least 1')
+    return int(requests), int(count or 1) * PERIODS[unit]
+
+
+class LocalLimiter:
+    """
+    This is the in-process GCRA used without Redis. Each process keeps its
+    own budgets, so with several processes a client gets up to one budget
+    per process.
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._tats = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, interval, period, cost=1):
+        """
+        This returns 0 and counts the request when it is allowed, or the
+        microseconds to wait otherwise. Like the Redis script, it counts in
+        whole microseconds.
+        """
+        now = round(time.monotonic() * 1000000)
+        with self._lock:
+            new_tat = max(self._tats.get(key, now), now) + interval * cost
+            wait = new_tat - now - period
+            if wait > 0:
+                return wait
+            if len(self._tats) >= self.max_keys:
+                self._tats = {k: tat for k, tat in self._tats.items() if tat > now}
+            self._tats[key] = new_tat
+            return 0
+
+    def clear(self):
+        with self._lock:
+            self._tats.clear()
+
+
+local_limiter = LocalLimiter()
+_script = None
+_redis_down_until = 0.0
+
+
+def _redis_script():
+    """
+    This returns the GCRA script bound to the default cache's Redis, or
+    None when the cache is not Redis
+    """
+    global _script
+    if _script is None:
+        from django_redis import get_redis_connection
+
+        try:
+            _script = get_redis_connection('default').register_script(GCRA_SCRIPT)
+        except NotImplementedError:
+            _script = False
+    return _script or None
+
+
+def limit(scope, ident, rate, cost=1):
+    """
+    This counts a request of ident against its budget for scope and
+    returns whether it is allowed and, if not, the seconds until it would
+    be
+    """
+    global _redis_down_until
+    count, period = parse_rate(rate)
+    interval, period = round(period * 1000000 / count), period * 1000000
+    key = f'ratelimit:{scope}:{ident}'
+
+    script = _redis_script() if time.monotonic() >= _redis_down_until else None
+    wait = None
+    if script is not None:
+        try:
+            wait = script(keys=[key], args=[interval, period, cost])
+        except Exception as error:
+            _redis_down_until = time.monotonic() + settings.RATE_LIMIT_REDIS_RETRY_SECONDS
+            logger.warning('Rate limiting in process memory, Redis failed: %s', error)
+    if wait is None:
+        wait = local_limiter.hit(key, interval, period, cost)
+    return Decision(wait == 0, wait / 1000000)
+
+
+class RateThrottle(BaseThrottle):
+    """
+    This is the base of the DRF throttles. Subclasses set scope and
+    return the client's identity from get_ident_for, or None to not
+    throttle the request.
+    """
+    scope = None
+    decision = None
+
+    def get_scope(self, view):
+        return self.scope
+
+    def get_ident_for(self, request, view):
+        raise NotImplementedError('.get_ident_for() must be overridden')
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+        ident = self.get_ident_for(request, view) if rate else None
+        if ident is None:
+            return True
+        self.decision = limit(scope, ident, rate)
+        return self.decision.allowed
+
+    def wait(self):
+        return self.decision.retry_after if self.decision else None
+
+
+class AnonRateThrottle(RateThrottle):
+    """
+    This limits anonymous clients by IP address, with the 'anon' rate
+    """
+    scope = 'anon'
+
+    def get_ident_for(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.get_ident(request)
+
+
+class UserRateThrottle(RateThrottle):
+    """
+    This limits users, or anonymous clients by IP address, with the
+    'user' rate
+    """
+    scope = 'user'
+
+    def get_ident_for(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return self.get_ident(request)
+
+
+class ScopedRateThrottle(UserRateThrottle):
+    """
+    This limits the views that set throttle_scope with that scope's rate,
+    so a route can have its own budget
+    """
+
+    def get_scope(self, view):
+        return getattr(view, 'throttle_scope', None)
+
+
+def _consumer_ident(consumer):
+    user = consumer.scope.get('user')
+    return user.pk if user is not None and user.is_authenticated else consumer.channel_name
+
+
+def _refusal(scope, decision):
+    return json.dumps({
+        'type': 'error',
+        'error': 'rate_limited',
+        'scope': scope,
+        'retry_after': math.ceil(decision.retry_after * 1000) / 1000,
+    })
+
+
+def rate_limit(scope, rate=None):
+    """
+    Decorator for the receive method of a consumer. Messages beyond the
+    user's budget for scope, WEBSOCKET_RATE_LIMITS[scope] unless rate is
+    given, are answered with a rate_limited error instead of handled.
+    """
+    def decorator(func):
+        def check(consumer):
+            return limit(f'ws:{scope}', _consumer_ident(consumer), rate or settings.WEBSOCKET_RATE_LIMITS[scope])
+
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(consumer, *args, **kwargs):
+                decision = await sync_to_async(check, thread_sensitive=False)(consumer)
+                if not decision.allowed:
+                    return await consumer.send(text_data=_refusal(scope, decision))
+                return await func(consumer, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(consumer, *args, **kwargs):
+            decision = check(consumer)
+            if not decision.allowed:
+                return consumer.send(text_data=_refusal(scope, decision))
+            return func(consumer, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,17 +1,68 @@
+"""
+This module removes Tailwind's dark: classes from the templates.
+
+The site has no dark mode, but the Flowbite markup the templates started
+from is full of dark: variants. FilesystemLoader and AppDirectoriesLoader,
+which replace Django's loaders of the same name in TEMPLATES, strip them
+from the template source when a template is loaded. Behind Django's
+cached loader each template is cleaned once per process, so rendering
+costs nothing extra.
+
+Classes are removed from class attributes and from quoted strings in
+template tags, such as the classes given to the add_class filter:
+
+    <p class="text-gray-900 dark:text-white">      ->  <p class="text-gray-900">
+    {{ field|add_class:'p-2.5 dark:bg-gray-700' }}  ->  {{ field|add_class:'p-2.5' }}
+"""
 import re
 
+from django.template.loaders import app_directories, filesystem
+
+CLASS_ATTRIBUTE = re.compile(r'class="([^"]*)"')
+TEMPLATE_TAG = re.compile(r'{{.*?}}|{%.*?%}', re.DOTALL)
+QUOTED_STRING = re.compile(r'\'[^\']*\'|"[^"]*"')
+# A dark: class, possibly right after or before a template tag
+DARK_CLASS = re.compile(r'''(?<![^\s'"}])dark:[^\s'"{]+\s*''')
+
 
 def remove_dark_classes(value):
-    classes = value.split()
-    filtered_classes = [cls for cls in classes if not cls.startswith('dark:')]
-    return ' '.join(filtered_classes)
+    """
+    This removes the dark: classes from a list of classes
+    """
+    return DARK_CLASS.sub('', value)
+
+
+def _clean_tag(match):
+    return QUOTED_STRING.sub(lambda string: remove_dark_classes(string.group(0)), match.group(0))
+
+
+def strip_dark_classes(source):
+    """
+    This removes the dark: classes from a template's source
+    """
+    if 'dark:' not in source:
+        return source
+    source = TEMPLATE_TAG.sub(_clean_tag, source)
+    return CLASS_ATTRIBUTE.sub(lambda match: f'class="{remove_dark_classes(match.group(1))}"', source)
+
+
+class DarkClassStrippingMixin:
+    """
+    This strips the dark: classes of the templates a loader reads
+    """
+
+    def get_contents(self, origin):
+        return strip_dark_classes(super().get_contents(origin))
+
 
+class FilesystemLoader(DarkClassStrippingMixin, filesystem.Loader):
+    """
+    This loads templates from TEMPLATES' DIRS without dark: classes
+    """
 
-def dark_mode_processor(request):
-    def process_classes(content):
-        pattern = r'class="([^"]*)"'
-        return re.sub(pattern, lambda m: f'class="{remove_dark_classes(m.group(1))}"', content)
 
-    return {
-        'process_classes': process_classes,
-    }
+class AppDirectoriesLoader(DarkClassStrippingMixin, app_directories.Loader):
+    """
+    This loads templates from the apps' templates directories without
+    dark: classes
+    """
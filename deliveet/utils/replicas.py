@@ -0,0 +1,156 @@
+"""
+This module sends the reads of heavy read-only views to a replica database.
+
+Views opt in with the read_from_replica decorator (or ReplicaAdminMixin for
+admin change lists). While such a view runs, ReplicaRouter sends reads to
+the REPLICA_DATABASE_ALIAS connection if DATABASES has one, and everything
+else to the default database. Reads stay on the default database:
+
+- inside a transaction on the default database,
+- after the request has written anything, and
+- for REPLICA_STICKY_SECONDS after the user's last write, so a user who
+  just placed an order sees it on their dashboard even if the replica
+  lags behind. ReplicaMiddleware notices the write and pins the user.
+
+Without a replica configured every query goes to the default database.
+To try it locally, point REPLICA_DATABASE_URL at a copy of the database.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# The alias reads go to, set while a replica view runs
+_replica = ContextVar('replica', default=None)
+# The request being served, set by ReplicaMiddleware
+_request_state = ContextVar('replica_request_state', default=None)
+
+
+class _RequestState:
+    __slots__ = ('wrote',)
+
+    def __init__(self):
+        self.wrote = False
+
+
+def replica_alias():
+    """
+    This returns the replica alias, or None without a replica
+    """
+    alias = settings.REPLICA_DATABASE_ALIAS
+    return alias if alias in settings.DATABASES else None
+
+
+def _pin_key(user_id):
+    return f'replica:pinned:{user_id}'
+
+
+def pin_to_primary(user_id):
+    """
+    This sends the user's replica reads to the default database for
+    REPLICA_STICKY_SECONDS
+    """
+    cache.set(_pin_key(user_id), True, timeout=settings.REPLICA_STICKY_SECONDS)
+
+
+@contextmanager
+def use_replica(user_id=None):
+    """
+    This sends reads inside the block to the replica, unless the user
+    wrote in the last REPLICA_STICKY_SECONDS
+    """
+    alias = replica_alias()
+    if alias is None or (user_id is not None and cache.get(_pin_key(user_id))):
+        yield
+        return
+
+    token = _replica.set(alias)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def read_from_replica(view):
+    """
+    Decorator for read-only views whose queries may go to the replica
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        user = getattr(request, 'user', None)
+        user_id = user.pk if user is not None and user.is_authenticated else None
+        with use_replica(user_id):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaAdminMixin:
+    """
+    This serves an admin change list from the replica
+    """
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context)
+        return read_from_replica(super().changelist_view)(request, extra_context)
+
+
+class ReplicaRouter:
+    """
+    This routes the reads of replica views to the replica and everything
+    else to the default database
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _replica.get()
+        if alias is None:
+            return None
+        state = _request_state.get()
+        if state is not None and state.wrote:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica copies the schema from the default database.
+        if db == replica_alias():
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    This pins users who wrote during the request to the default database
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if replica_alias() is None:
+            return self.get_response(request)
+
+        state = _RequestState()
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+
+        user = getattr(request, 'user', None)
+        if state.wrote and user is not None and user.is_authenticated:
+            pin_to_primary(user.pk)
+        return response
@@ -0,0 +1,107 @@
+"""
+Delivery analytics served from rollups.
+
+Django adds completed deliveries, cancellations, distance, revenue, courier
+earnings and ratings to hourly and daily rows per courier, per customer and
+for the platform (shipments/rollups.py), and pushes the rows it changes
+here. A period query adds up at most one row per day of the period, however
+many deliveries it covers.
+
+The store lives in memory. After a restart it asks Django for the whole
+recent window in its reply to the next push.
+"""
+from datetime import datetime, timedelta, timezone
+
+HOUR = 'hour'
+DAY = 'day'
+
+COURIER = 'courier'
+CUSTOMER = 'customer'
+PLATFORM = 'platform'
+
+# period name: (row granularity, number of rows ending with the current one)
+PERIODS = {
+    'hour': (HOUR, 1),
+    'day': (DAY, 1),
+    'week': (DAY, 7),
+    'month': (DAY, 30),
+}
+
+RETENTION = {
+    HOUR: timedelta(days=2),
+    DAY: timedelta(days=31),
+}
+
+STEPS = {
+    HOUR: timedelta(hours=1),
+    DAY: timedelta(days=1),
+}
+
+FIELDS = ('deliveries', 'cancellations', 'distance_km', 'revenue', 'earnings', 'rating_sum', 'rating_count')
+
+
+def period_start(moment, granularity):
+    """
+    This returns the start of the UTC hour or day a moment falls in
+    """
+    start = moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return start.replace(hour=0) if granularity == DAY else start
+
+
+class RollupStore:
+    """
+    Rollup rows keyed by (granularity, scope, subject id, period start)
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.synced = False
+
+    def load(self, rollups, full=False, now=None):
+        """
+        This stores rows pushed by Django. A full load replaces everything.
+        """
+        if full:
+            self.rows = {}
+        for rollup in rollups:
+            key = (
+                rollup['granularity'],
+                rollup['scope'],
+                rollup['subject_id'],
+                datetime.fromisoformat(rollup['period_start']),
+            )
+            self.rows[key] = tuple(rollup[field] for field in FIELDS)
+        if full:
+            self.synced = True
+        self.prune(now)
+
+    def prune(self, now=None):
+        """
+        This drops rows older than any period can reach
+        """
+        now = now or datetime.now(timezone.utc)
+        cutoffs = {granularity: now - age for granularity, age in RETENTION.items()}
+        for key in [key for key in self.rows if key[3] < cutoffs[key[0]]]:
+            del self.rows[key]
+
+    def totals(self, scope, subject_id, period, now=None):
+        """
+        This adds up the rows for the period ending now
+        """
+        granularity, count = PERIODS[period]
+        start = period_start(now or datetime.now(timezone.utc), granularity)
+        sums = [0] * len(FIELDS)
+        for offset in range(count):
+            row = self.rows.get((granularity, scope, subject_id, start - offset * STEPS[granularity]))
+            if row:
+                sums = [total + value for total, value in zip(sums, row)]
+
+        totals = dict(zip(FIELDS, sums))
+        rating_sum, rating_count = totals.pop('rating_sum'), totals.pop('rating_count')
+        totals['average_rating'] = round(rating_sum / rating_count, 2) if rating_count else 0.0
+        totals['ratings'] = rating_count
+        totals['distance_km'] = round(float(totals['distance_km']), 3)
+        totals['revenue'] = round(float(totals['revenue']), 2)
+        totals['earnings'] = round(float(totals['earnings']), 2)
+        totals['period_start'] = (start - (count - 1) * STEPS[granularity]).isoformat()
+        return totals
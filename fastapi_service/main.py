@@ -6,11 +6,14 @@ FastAPI Service for High-Performance Features
 """
 from fastapi import FastAPI, Depends, HTTPException, status, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZIPMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel, EmailStr
+from datetime import datetime
 from typing import Optional, List
 import os
 
+from fastapi_service import analytics, matching, routing
+
 # Create FastAPI app
 app = FastAPI(
     title="Deliveet FastAPI Service",
@@ -21,7 +24,7 @@ app = FastAPI(
 )
 
 # Middleware
-app.add_middleware(GZIPMiddleware, minimum_size=1000)
+app.add_middleware(GZipMiddleware, minimum_size=1000)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=os.environ.get('CORS_ALLOWED_ORIGINS', 'http://localhost:3000').split(','),
@@ -36,27 +39,69 @@ app.add_middleware(
 # ==========================================
 
 class LocationUpdate(BaseModel):
-    courier_id: int
+    courier_id: str
     latitude: float
     longitude: float
     timestamp: Optional[str] = None
+    is_available: bool = True
 
 
 class DeliveryMatch(BaseModel):
-    shipment_id: int
-    courier_id: int
+    delivery_id: str
+    courier_id: str
     distance: float
     estimated_time: int
     match_score: float
 
 
+class MatchRequest(BaseModel):
+    delivery_id: str
+    pickup_latitude: float
+    pickup_longitude: float
+    limit: int = 5
+    radius_km: float = matching.MATCH_RADIUS_KM
+
+
+class CourierStats(BaseModel):
+    courier_id: str
+    active_deliveries: Optional[int] = None
+    average_rating: Optional[float] = None
+    idle_since: Optional[str] = None
+
+
+class RouteDelivery(BaseModel):
+    delivery_id: str
+    pickup_latitude: float
+    pickup_longitude: float
+    drop_latitude: float
+    drop_longitude: float
+    picked_up: bool = False
+
+
+class RouteRequest(BaseModel):
+    courier_id: str
+    start_latitude: Optional[float] = None
+    start_longitude: Optional[float] = None
+    deliveries: List[RouteDelivery]
+    time_budget: float = routing.DEFAULT_TIME_BUDGET
+
+
 class CourierLocation(BaseModel):
-    courier_id: int
+    courier_id: str
     latitude: float
     longitude: float
     is_available: bool
 
 
+class DeliveryEvent(BaseModel):
+    event_id: int
+    delivery_id: str
+    previous_status: str
+    status: str
+    occurred_at: str
+    payload: dict = {}
+
+
 class DeliveryAnalytics(BaseModel):
     total_deliveries: int
     completed: int
@@ -65,6 +110,25 @@ class DeliveryAnalytics(BaseModel):
     total_earnings: float
 
 
+class Rollup(BaseModel):
+    granularity: str
+    scope: str
+    subject_id: str = ""
+    period_start: str
+    deliveries: int = 0
+    cancellations: int = 0
+    distance_km: float = 0.0
+    revenue: float = 0.0
+    earnings: float = 0.0
+    rating_sum: int = 0
+    rating_count: int = 0
+
+
+class RollupSync(BaseModel):
+    full: bool = False
+    rollups: List[Rollup]
+
+
 # ==========================================
 # HEALTH CHECK
 # ==========================================
@@ -82,14 +146,18 @@ async def health_check():
 # LOCATION TRACKING ENDPOINTS
 # ==========================================
 
+# Courier positions, workload and ratings used for matching
+courier_index = matching.CourierIndex()
+
+
 @app.post("/api/v1/locations/update")
 async def update_courier_location(location: LocationUpdate):
     """
     Real-time courier location update
     """
-    # TODO: Implement location tracking with Redis caching
-    # Store location in Redis with TTL
-    # Broadcast to nearby customers via WebSocket
+    courier_index.update_location(
+        location.courier_id, location.latitude, location.longitude, location.is_available
+    )
     return {
         "status": "success",
         "courier_id": location.courier_id,
@@ -98,16 +166,18 @@ async def update_courier_location(location: LocationUpdate):
 
 
 @app.get("/api/v1/locations/courier/{courier_id}")
-async def get_courier_location(courier_id: int):
+async def get_courier_location(courier_id: str):
     """
     Get current courier location
     """
-    # TODO: Retrieve from Redis cache
+    row = courier_index.rows.get(courier_id)
+    if row is None or not courier_index.located[row]:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Courier location unknown")
     return {
         "courier_id": courier_id,
-        "latitude": 0.0,
-        "longitude": 0.0,
-        "timestamp": ""
+        "latitude": float(courier_index.latitude[row]),
+        "longitude": float(courier_index.longitude[row]),
+        "is_available": bool(courier_index.available[row])
     }
 
 
@@ -115,11 +185,74 @@ async def get_courier_location(courier_id: int):
 async def get_nearby_couriers(latitude: float, longitude: float, radius: float = 5.0):
     """
     Get nearby available couriers
-    Uses geospatial queries for efficient matching
+    Uses the grid index of the courier locations
+    """
+    rows, distances = courier_index.candidates(latitude, longitude, radius)
+    order = distances.argsort()
+    return {
+        "nearby_couriers": [
+            CourierLocation(
+                courier_id=courier_index.ids[rows[i]],
+                latitude=float(courier_index.latitude[rows[i]]),
+                longitude=float(courier_index.longitude[rows[i]]),
+                is_available=True,
+            )
+            for i in order
+        ]
+    }
+
+
+@app.post("/api/v1/couriers/stats")
+async def update_courier_stats(stats: List[CourierStats]):
+    """
+    Replace the workload, rating or idle time of couriers.
+    Django pushes a snapshot here every COURIER_STATS_INTERVAL
+    (shipments/courier_stats.py); delivery events keep it current.
+    """
+    for courier in stats:
+        courier_index.update_stats(
+            courier.courier_id,
+            active_deliveries=courier.active_deliveries,
+            average_rating=courier.average_rating,
+            idle_since=datetime.fromisoformat(courier.idle_since).timestamp() if courier.idle_since else None,
+        )
+    return {
+        "status": "success",
+        "updated": len(stats)
+    }
+
+
+# ==========================================
+# DELIVERY EVENTS (relayed from the Django outbox)
+# ==========================================
+
+# Latest event per delivery, used by the tracker
+delivery_status_cache: dict = {}
+
+
+@app.post("/api/v1/events/deliveries")
+async def receive_delivery_events(events: List[DeliveryEvent]):
     """
-    # TODO: Use Redis geospatial commands for fast proximity search
+    Receive a batch of delivery events from the outbox relay.
+    Events may be delivered more than once; older or repeated ids are ignored.
+    """
+    accepted = 0
+    for event in events:
+        latest = delivery_status_cache.get(event.delivery_id)
+        if latest and latest.event_id >= event.event_id:
+            continue
+        delivery_status_cache[event.delivery_id] = event
+        courier_index.apply_delivery_event(
+            event.payload.get('courier_id'),
+            event.previous_status,
+            event.status,
+            datetime.fromisoformat(event.occurred_at).timestamp(),
+        )
+        accepted += 1
     return {
-        "nearby_couriers": []
+        "status": "success",
+        "received": len(events),
+        "accepted": accepted
     }
 
 
@@ -127,50 +260,165 @@ async def get_nearby_couriers(latitude: float, longitude: float, radius: float =
 # DELIVERY MATCHING & OPTIMIZATION
 # ==========================================
 
+def _delivery_match(delivery_id, match):
+    courier_id, distance, estimated_time, score = match
+    return DeliveryMatch(
+        delivery_id=delivery_id,
+        courier_id=courier_id,
+        distance=round(distance, 3),
+        estimated_time=estimated_time,
+        match_score=round(score, 4),
+    )
+
+
 @app.post("/api/v1/deliveries/match")
-async def match_delivery(shipment_id: int):
+async def match_delivery(request: MatchRequest):
     """
-    Intelligent delivery matching algorithm
+    Rank the available couriers for a delivery
     Uses:
-    - Courier availability
-    - Location proximity
-    - Ratings & reliability
+    - Distance to the pickup
     - Current workload
+    - Ratings
+    - Idle time
     """
-    # TODO: Implement ML-based matching algorithm
+    matches = [
+        _delivery_match(request.delivery_id, match)
+        for match in matching.rank_couriers(
+            courier_index,
+            request.pickup_latitude,
+            request.pickup_longitude,
+            limit=request.limit,
+            radius_km=request.radius_km,
+        )
+    ]
     return {
-        "shipment_id": shipment_id,
-        "matched_couriers": [],
-        "best_match": None
+        "delivery_id": request.delivery_id,
+        "matched_couriers": matches,
+        "best_match": matches[0] if matches else None
+    }
+
+
+@app.post("/api/v1/deliveries/match/batch")
+def match_deliveries(requests: List[MatchRequest]):
+    """
+    Assign many pending deliveries at once, at most one per courier,
+    minimizing the total cost of the assignment.
+    A plain def: the solver takes a noticeable time on large batches,
+    so FastAPI runs it in its threadpool instead of the event loop.
+    """
+    radius_km = max((request.radius_km for request in requests), default=matching.MATCH_RADIUS_KM)
+    assignments = matching.assign_batch(
+        courier_index,
+        [(request.pickup_latitude, request.pickup_longitude) for request in requests],
+        radius_km=radius_km,
+    )
+    return {
+        "assignments": [
+            {
+                "delivery_id": request.delivery_id,
+                "match": _delivery_match(request.delivery_id, match) if match else None
+            }
+            for request, match in zip(requests, assignments)
+        ],
+        "assigned": sum(1 for match in assignments if match)
     }
 
 
 @app.post("/api/v1/route/optimize")
-async def optimize_route(courier_id: int, delivery_ids: List[int]):
+def optimize_route(request: RouteRequest):
     """
     Optimize delivery route for courier
-    Uses TSP (Traveling Salesman Problem) solver
+    Orders the pickups and drop-offs, each pickup before its drop-off,
+    starting from the given point or the courier's last known location.
+    A plain def: the solver runs for up to ROUTE_MAX_TIME_BUDGET_SECONDS,
+    so FastAPI runs it in its threadpool instead of the event loop.
     """
-    # TODO: Implement route optimization using OSRM or similar service
+    start = (request.start_latitude, request.start_longitude)
+    if None in start:
+        row = courier_index.rows.get(request.courier_id)
+        if row is None or not courier_index.located[row]:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Courier location unknown")
+        start = (float(courier_index.latitude[row]), float(courier_index.longitude[row]))
+
+    stops = routing.build_stops(
+        {
+            "delivery_id": delivery.delivery_id,
+            "pickup": (delivery.pickup_latitude, delivery.pickup_longitude),
+            "drop": (delivery.drop_latitude, delivery.drop_longitude),
+            "picked_up": delivery.picked_up,
+        }
+        for delivery in request.deliveries
+    )
+    route = routing.solve(start, stops, time_budget=min(request.time_budget, routing.MAX_TIME_BUDGET))
     return {
-        "courier_id": courier_id,
-        "optimized_route": [],
-        "estimated_time": 0
+        "courier_id": request.courier_id,
+        "optimized_route": [
+            {
+                "delivery_id": stop.delivery_id,
+                "kind": stop.kind,
+                "latitude": stop.latitude,
+                "longitude": stop.longitude
+            }
+            for stop in route.stops
+        ],
+        "distance": round(route.distance_km, 3),
+        "estimated_time": int(matching.estimated_minutes(route.distance_km))
+    }
+
+
+# ==========================================
+# ANALYTICS (rollups pushed by Django)
+# ==========================================
+
+rollup_store = analytics.RollupStore()
+
+
+def _period_totals(scope, subject_id, period):
+    if period not in analytics.PERIODS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"period must be one of {', '.join(analytics.PERIODS)}"
+        )
+    return rollup_store.totals(scope, subject_id, period)
+
+
+@app.post("/api/v1/analytics/rollups")
+async def receive_rollups(sync: RollupSync):
+    """
+    Store rollup rows changed by the Django rollup job.
+    Until a full sync arrives the reply asks for one.
+    """
+    rollup_store.load([rollup.model_dump() for rollup in sync.rollups], full=sync.full)
+    return {
+        "status": "success",
+        "received": len(sync.rollups),
+        "needs_full_sync": not rollup_store.synced
     }
 
 
 @app.get("/api/v1/analytics/courier/{courier_id}")
-async def get_courier_analytics(courier_id: int):
+async def get_courier_analytics(courier_id: str, period: str = "week"):
     """
-    Get courier analytics and statistics
+    Get courier analytics and statistics for period (hour, day, week or month)
     """
-    # TODO: Calculate from database
     return {
         "courier_id": courier_id,
-        "total_deliveries": 0,
-        "completed": 0,
-        "average_rating": 0.0,
-        "earnings_today": 0.0
+        "period": period,
+        **_period_totals(analytics.COURIER, courier_id, period)
+    }
+
+
+@app.get("/api/v1/analytics/customer/{customer_id}")
+async def get_customer_analytics(customer_id: str, period: str = "month"):
+    """
+    Get customer delivery statistics for period
+    """
+    totals = _period_totals(analytics.CUSTOMER, customer_id, period)
+    del totals["earnings"]
+    return {
+        "customer_id": customer_id,
+        "period": period,
+        **totals
     }
 
 
@@ -227,17 +475,18 @@ async def verify_payment(transaction_id: str):
 
 
 @app.get("/api/v1/earnings/{courier_id}")
-async def get_courier_earnings(courier_id: int, period: str = "week"):
+async def get_courier_earnings(courier_id: str, period: str = "week"):
     """
     Get courier earnings for period
     """
-    # TODO: Calculate earnings from deliveries
+    totals = _period_totals(analytics.COURIER, courier_id, period)
     return {
         "courier_id": courier_id,
         "period": period,
-        "total_earnings": 0.0,
-        "pending": 0.0,
-        "completed": 0.0
+        "period_start": totals["period_start"],
+        "total_earnings": totals["earnings"],
+        "deliveries": totals["deliveries"],
+        "distance_km": totals["distance_km"]
     }
 
 
@@ -267,16 +516,15 @@ async def search_couriers(
 # ==========================================
 
 @app.get("/api/v1/admin/dashboard")
-async def admin_dashboard():
+async def admin_dashboard(period: str = "day"):
     """
     Admin dashboard statistics
     """
+    totals = _period_totals(analytics.PLATFORM, "", period)
     return {
-        "total_users": 0,
-        "active_deliveries": 0,
-        "completed_today": 0,
-        "revenue_today": 0.0,
-        "avg_rating": 0.0
+        "period": period,
+        "active_deliveries": int(courier_index.active_deliveries[:len(courier_index)].sum()),
+        **totals
     }
 
 
@@ -0,0 +1,286 @@
+"""
+Courier matching for the FastAPI service.
+
+Courier state is kept column-wise in numpy arrays (position, availability,
+active deliveries, average rating, idle time) with a grid index over the
+positions, so candidates near a pickup are found without scanning every
+courier and are scored in one vectorized pass.
+
+Scores are costs: lower is better. A courier's cost is the distance to the
+pickup plus penalties for current workload, a low rating and having just
+finished a job. Many pending deliveries can be assigned at once as a
+min-cost assignment (scipy's linear_sum_assignment, a Hungarian-style
+solver), so each courier gets at most one delivery per batch.
+"""
+import math
+import os
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Size of a grid cell of the location index, about 5.5 km at the equator.
+CELL_SIZE_DEGREES = 0.05
+
+# Cost given to pairs the solver must not choose.
+UNREACHABLE = 1e9
+
+ACTIVE_STATUSES = {'pickup_in_progress', 'in-progress'}
+
+DEFAULT_RATING = float(os.environ.get('MATCH_DEFAULT_RATING', 4.0))
+MATCH_RADIUS_KM = float(os.environ.get('MATCH_RADIUS_KM', 10.0))
+AVERAGE_SPEED_KMH = float(os.environ.get('COURIER_AVERAGE_SPEED_KMH', 25.0))
+
+
+@dataclass(frozen=True)
+class MatchWeights:
+    """
+    Cost of each factor, in kilometres of extra distance
+    """
+    distance: float = 1.0
+    workload: float = 2.0
+    rating: float = 1.5
+    recent_activity: float = 1.0
+    idle_cap_minutes: float = 30.0
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """
+    Great-circle distance in km between one point, or an array of points,
+    and an array of points. Arrays broadcast like any numpy expression.
+    """
+    lat1 = np.radians(latitude)
+    lat2 = np.radians(latitudes)
+    dlat = lat2 - lat1
+    dlon = np.radians(longitudes) - np.radians(longitude)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _cell(latitude, longitude):
+    return math.floor(latitude / CELL_SIZE_DEGREES), math.floor(longitude / CELL_SIZE_DEGREES)
+
+
+class CourierIndex:
+    """
+    Courier state stored as arrays, one row per courier, with a grid index
+    """
+
+    def __init__(self, capacity=1024):
+        self.ids = []
+        self.rows = {}
+        self.cells = defaultdict(set)
+        self.row_cells = {}
+        self.latitude = np.zeros(capacity)
+        self.longitude = np.zeros(capacity)
+        self.located = np.zeros(capacity, dtype=bool)
+        self.available = np.zeros(capacity, dtype=bool)
+        self.active_deliveries = np.zeros(capacity, dtype=np.int32)
+        self.rating = np.full(capacity, DEFAULT_RATING)
+        self.idle_since = np.zeros(capacity)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _grow(self):
+        capacity = len(self.latitude) * 2
+        for name in ('latitude', 'longitude', 'located', 'available', 'active_deliveries', 'idle_since'):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+        rating = np.full(capacity, DEFAULT_RATING)
+        rating[:len(self.rating)] = self.rating
+        self.rating = rating
+
+    def _row(self, courier_id):
+        row = self.rows.get(courier_id)
+        if row is None:
+            row = len(self.ids)
+            if row == len(self.latitude):
+                self._grow()
+            self.ids.append(courier_id)
+            self.rows[courier_id] = row
+        return row
+
+    def update_location(self, courier_id, latitude, longitude, available=True):
+        """
+        This moves the courier to a new position in the index
+        """
+        row = self._row(courier_id)
+        cell = _cell(latitude, longitude)
+        previous_cell = self.row_cells.get(row)
+        if previous_cell != cell:
+            if previous_cell is not None:
+                self.cells[previous_cell].discard(row)
+            self.cells[cell].add(row)
+            self.row_cells[row] = cell
+        self.latitude[row] = latitude
+        self.longitude[row] = longitude
+        self.located[row] = True
+        self.available[row] = available
+
+    def update_stats(self, courier_id, active_deliveries=None, average_rating=None, idle_since=None):
+        """
+        This replaces the courier's workload, rating or idle time
+        """
+        row = self._row(courier_id)
+        if active_deliveries is not None:
+            self.active_deliveries[row] = active_deliveries
+        if average_rating is not None:
+            self.rating[row] = average_rating
+        if idle_since is not None:
+            self.idle_since[row] = idle_since
+
+    def apply_delivery_event(self, courier_id, previous_status, status, occurred_at):
+        """
+        This keeps the courier's workload and idle time in step with the
+        delivery events relayed from Django
+        """
+        if not courier_id:
+            return
+        was_active = previous_status in ACTIVE_STATUSES
+        is_active = status in ACTIVE_STATUSES
+        if was_active == is_active:
+            return
+        row = self._row(courier_id)
+        if is_active:
+            self.active_deliveries[row] += 1
+        else:
+            self.active_deliveries[row] = max(self.active_deliveries[row] - 1, 0)
+            if not self.active_deliveries[row]:
+                self.idle_since[row] = occurred_at
+
+    def candidates(self, latitude, longitude, radius_km=MATCH_RADIUS_KM):
+        """
+        This returns the rows of available couriers within the radius and
+        their distances, using the grid to skip couriers far away
+        """
+        lat_cells = math.ceil(radius_km / 111.0 / CELL_SIZE_DEGREES)
+        cos_lat = max(math.cos(math.radians(latitude)), 0.01)
+        lon_cells = math.ceil(radius_km / (111.0 * cos_lat) / CELL_SIZE_DEGREES)
+        center_lat, center_lon = _cell(latitude, longitude)
+
+        rows = [
+            row
+            for lat_cell in range(center_lat - lat_cells, center_lat + lat_cells + 1)
+            for lon_cell in range(center_lon - lon_cells, center_lon + lon_cells + 1)
+            for row in self.cells.get((lat_cell, lon_cell), ())
+        ]
+        rows = np.fromiter(rows, dtype=np.int64, count=len(rows))
+        rows = rows[self.available[rows] & self.located[rows]]
+        distances = haversine_km(latitude, longitude, self.latitude[rows], self.longitude[rows])
+        within = distances <= radius_km
+        return rows[within], distances[within]
+
+    def rows_in_box(self, south, north, west, east, radius_km=MATCH_RADIUS_KM):
+        """
+        This returns the rows of available couriers inside a box widened
+        by the radius. A batch covering a whole city reads the position
+        arrays once instead of searching the grid for every pickup.
+        """
+        count = len(self.ids)
+        lat_margin = radius_km / 111.0
+        cos_lat = max(math.cos(math.radians(max(abs(south), abs(north)))), 0.01)
+        lon_margin = radius_km / (111.0 * cos_lat)
+        latitude = self.latitude[:count]
+        longitude = self.longitude[:count]
+        inside = (
+            self.available[:count] & self.located[:count]
+            & (latitude >= south - lat_margin) & (latitude <= north + lat_margin)
+            & (longitude >= west - lon_margin) & (longitude <= east + lon_margin)
+        )
+        return np.flatnonzero(inside)
+
+
+def courier_costs(index, rows, distances, now=None, weights=MatchWeights()):
+    """
+    This scores candidate couriers. distances may be one row per delivery
+    (deliveries x candidates); the courier terms broadcast across them.
+    """
+    now = time.time() if now is None else now
+    idle_minutes = np.where(
+        index.idle_since[rows] > 0, (now - index.idle_since[rows]) / 60.0, weights.idle_cap_minutes
+    )
+    recently_busy = np.clip(weights.idle_cap_minutes - idle_minutes, 0, None) / weights.idle_cap_minutes
+    courier_cost = (
+        weights.workload * index.active_deliveries[rows]
+        + weights.rating * (5.0 - index.rating[rows])
+        + weights.recent_activity * recently_busy
+    )
+    return weights.distance * distances + courier_cost
+
+
+def match_score(costs):
+    """
+    This turns costs into scores between 0 and 1, higher is better
+    """
+    return 1.0 / (1.0 + np.maximum(costs, 0.0))
+
+
+def estimated_minutes(distances):
+    return np.ceil(distances / AVERAGE_SPEED_KMH * 60.0).astype(int)
+
+
+def rank_couriers(index, latitude, longitude, limit=5, radius_km=MATCH_RADIUS_KM, now=None):
+    """
+    This returns the best couriers for one pickup as
+    (courier_id, distance_km, estimated_minutes, score) tuples
+    """
+    rows, distances = index.candidates(latitude, longitude, radius_km)
+    if not len(rows):
+        return []
+    costs = courier_costs(index, rows, distances, now)
+    if len(costs) > limit:
+        best = np.argpartition(costs, limit)[:limit]
+    else:
+        best = np.arange(len(costs))
+    best = best[np.argsort(costs[best])]
+    minutes = estimated_minutes(distances[best])
+    scores = match_score(costs[best])
+    return [
+        (index.ids[rows[i]], float(distances[i]), int(minute), float(score))
+        for i, minute, score in zip(best, minutes, scores)
+    ]
+
+
+def assign_batch(index, pickups, radius_km=MATCH_RADIUS_KM, now=None):
+    """
+    This assigns many pickups at once, given as (latitude, longitude)
+    pairs, minimizing the total cost. Returns one
+    (courier_id, distance_km, estimated_minutes, score) tuple, or None,
+    per pickup.
+    """
+    if not pickups:
+        return []
+    pickups = np.asarray(pickups, dtype=float)
+    rows = index.rows_in_box(
+        pickups[:, 0].min(), pickups[:, 0].max(), pickups[:, 1].min(), pickups[:, 1].max(), radius_km
+    )
+    if not len(rows):
+        return [None] * len(pickups)
+
+    distances = haversine_km(
+        pickups[:, :1], pickups[:, 1:], index.latitude[rows][None, :], index.longitude[rows][None, :]
+    )
+    costs = courier_costs(index, rows, distances, now)
+    costs[distances > radius_km] = UNREACHABLE
+
+    delivery_indexes, courier_indexes = linear_sum_assignment(costs)
+    assignments = [None] * len(pickups)
+    for delivery, courier in zip(delivery_indexes, courier_indexes):
+        cost = costs[delivery, courier]
+        if cost >= UNREACHABLE:
+            continue
+        distance = distances[delivery, courier]
+        assignments[delivery] = (
+            index.ids[rows[courier]],
+            float(distance),
+            int(estimated_minutes(distance)),
+            float(match_score(cost)),
+        )
+    return assignments
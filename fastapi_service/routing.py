@@ -0,0 +1,239 @@
+"""
+Route optimization for couriers carrying several deliveries.
+
+A route starts at the courier and visits every pickup and drop-off, with
+each pickup before its drop-off. Items already picked up only need their
+drop-off. The solver works fully offline on a precomputed distance matrix:
+haversine distances scaled by a detour factor, or road distances the
+caller has cached.
+
+It builds a route by nearest neighbour, then improves it with 2-opt
+(reversing a stretch of the route) and Or-opt (moving a run of one to
+three stops elsewhere) until no move helps or the time budget runs out.
+Moves that would put a drop-off before its pickup are skipped. 2-opt
+assumes the matrix is symmetric.
+"""
+import os
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from fastapi_service.matching import haversine_km
+
+# Roads are longer than the straight line between two points.
+DETOUR_FACTOR = float(os.environ.get('ROUTE_DETOUR_FACTOR', 1.3))
+DEFAULT_TIME_BUDGET = float(os.environ.get('ROUTE_TIME_BUDGET_SECONDS', 1.0))
+MAX_TIME_BUDGET = float(os.environ.get('ROUTE_MAX_TIME_BUDGET_SECONDS', 5.0))
+
+PICKUP = 'pickup'
+DROP = 'drop'
+
+
+@dataclass(frozen=True)
+class Stop:
+    delivery_id: str
+    kind: str
+    latitude: float
+    longitude: float
+
+
+@dataclass
+class Route:
+    stops: list
+    distance_km: float
+    initial_distance_km: float
+    improvements: int
+    solve_seconds: float
+
+
+def build_stops(deliveries):
+    """
+    This turns deliveries into stops. Each delivery is a dict with
+    delivery_id, pickup and drop (latitude, longitude) pairs and an
+    optional picked_up flag.
+    """
+    stops = []
+    for delivery in deliveries:
+        if not delivery.get('picked_up'):
+            stops.append(Stop(delivery['delivery_id'], PICKUP, *delivery['pickup']))
+        stops.append(Stop(delivery['delivery_id'], DROP, *delivery['drop']))
+    return stops
+
+
+def distance_matrix(start, stops, detour_factor=DETOUR_FACTOR):
+    """
+    This returns the matrix of road distance estimates in km between the
+    start (row 0) and the stops (rows 1..n)
+    """
+    latitudes = np.array([start[0]] + [stop.latitude for stop in stops])
+    longitudes = np.array([start[1]] + [stop.longitude for stop in stops])
+    return haversine_km(latitudes[:, None], longitudes[:, None], latitudes[None, :], longitudes[None, :]) * detour_factor
+
+
+def route_distance(matrix, order):
+    """
+    This returns the length of a route of node numbers starting at node 0
+    """
+    previous = 0
+    total = 0.0
+    for node in order:
+        total += matrix[previous][node]
+        previous = node
+    return total
+
+
+def _precedence(stops):
+    """
+    This returns, for each node, the node that must come before it
+    (its pickup) and the node that must come after it (its drop-off)
+    """
+    count = len(stops) + 1
+    pickup_of = [0] * count
+    drop_of = [0] * count
+    pickups = {}
+    for node, stop in enumerate(stops, start=1):
+        if stop.kind == PICKUP:
+            pickups[stop.delivery_id] = node
+    for node, stop in enumerate(stops, start=1):
+        if stop.kind == DROP and stop.delivery_id in pickups:
+            pickup_of[node] = pickups[stop.delivery_id]
+            drop_of[pickups[stop.delivery_id]] = node
+    return pickup_of, drop_of
+
+
+def nearest_neighbour(matrix, pickup_of):
+    """
+    This builds a route by always driving to the nearest stop that is
+    allowed next: any pickup, or a drop-off whose item is on board
+    """
+    remaining = set(range(1, len(matrix)))
+    visited = {0}
+    order = []
+    current = 0
+    while remaining:
+        row = matrix[current]
+        current = min(
+            (node for node in remaining if pickup_of[node] in visited),
+            key=row.__getitem__,
+        )
+        order.append(current)
+        visited.add(current)
+        remaining.remove(current)
+    return order
+
+
+def _positions(route):
+    position = [0] * len(route)
+    for index, node in enumerate(route):
+        position[node] = index
+    return position
+
+
+def _two_opt(matrix, route, pickup_of, deadline):
+    """
+    This sweeps the route once, reversing every segment that shortens it,
+    and returns the number of reversals
+    """
+    position = _positions(route)
+    count = len(route)
+    moves = 0
+    for i in range(1, count - 1):
+        if time.perf_counter() > deadline:
+            break
+        j = i + 1
+        while j < count:
+            last = route[j]
+            # A reversed segment holding both ends of a delivery would put
+            # the drop-off first, and so would every longer segment.
+            if pickup_of[last] and position[pickup_of[last]] >= i:
+                break
+            before, first = route[i - 1], route[i]
+            delta = matrix[before][last] - matrix[before][first]
+            if j + 1 < count:
+                after = route[j + 1]
+                delta += matrix[first][after] - matrix[last][after]
+            if delta < -1e-9:
+                route[i:j + 1] = route[i:j + 1][::-1]
+                for index in range(i, j + 1):
+                    position[route[index]] = index
+                moves += 1
+                j = i + 1
+                continue
+            j += 1
+    return moves
+
+
+def _or_opt(matrix, route, pickup_of, drop_of, deadline):
+    """
+    This sweeps the route once, moving runs of 1 to 3 stops to a cheaper
+    place, and returns the number of moves
+    """
+    moves = 0
+    for length in (1, 2, 3):
+        position = _positions(route)
+        count = len(route)
+        for i in range(1, count - length + 1):
+            if time.perf_counter() > deadline:
+                return moves
+            segment = route[i:i + length]
+            before = route[i - 1]
+            removed = matrix[before][segment[0]]
+            if i + length < count:
+                after = route[i + length]
+                removed += matrix[segment[-1]][after] - matrix[before][after]
+
+            for j in range(count):
+                if i - 1 <= j < i + length:
+                    continue
+                # The segment goes between route[j] and route[j + 1].
+                if j < i:
+                    if any(pickup_of[node] and j < position[pickup_of[node]] < i for node in segment):
+                        continue
+                elif any(drop_of[node] and i + length <= position[drop_of[node]] <= j for node in segment):
+                    continue
+                left = route[j]
+                added = matrix[left][segment[0]]
+                if j + 1 < count:
+                    right = route[j + 1]
+                    added += matrix[segment[-1]][right] - matrix[left][right]
+                if added - removed < -1e-9:
+                    del route[i:i + length]
+                    insert_at = j + 1 if j < i else j + 1 - length
+                    route[insert_at:insert_at] = segment
+                    position = _positions(route)
+                    moves += 1
+                    break
+    return moves
+
+
+def solve(start, stops, matrix=None, time_budget=DEFAULT_TIME_BUDGET):
+    """
+    This orders the stops for a courier at start, a (latitude, longitude)
+    pair. matrix may hold cached road distances with the start as row 0.
+    """
+    started = time.perf_counter()
+    deadline = started + time_budget
+    if matrix is None:
+        matrix = distance_matrix(start, stops)
+    matrix = np.asarray(matrix, dtype=float).tolist()
+    pickup_of, drop_of = _precedence(stops)
+
+    route = [0] + nearest_neighbour(matrix, pickup_of)
+    initial_distance = route_distance(matrix, route[1:])
+
+    improvements = 0
+    while time.perf_counter() < deadline:
+        moves = _two_opt(matrix, route, pickup_of, deadline) + _or_opt(matrix, route, pickup_of, drop_of, deadline)
+        if not moves:
+            break
+        improvements += moves
+    order = route[1:]
+
+    return Route(
+        stops=[stops[node - 1] for node in order],
+        distance_km=route_distance(matrix, order),
+        initial_distance_km=initial_distance,
+        improvements=improvements,
+        solve_seconds=time.perf_counter() - started,
+    )
@@ -1,8 +1,57 @@
+import secrets
+
 from django.contrib import admin
 
+from deliveet.utils.bulk_jobs import BulkJobAdminMixin, ImportForm, bulk_action
+from deliveet.utils.exports import StreamingExportAdminMixin
 from finance.models import Wallet, WalletTransaction
 
+
+class WalletTransactionImportForm(ImportForm):
+    """
+    This validates one row of a wallet transaction import. Imports record
+    transactions and leave wallet balances as they are.
+    """
+
+    class Meta:
+        model = WalletTransaction
+        fields = ['transaction_reference', 'wallet', 'transaction_type', 'amount', 'transaction_verified']
+
 # Register your models here.
 
 admin.site.register(Wallet)
-admin.site.register(WalletTransaction)
+
+
+@admin.register(WalletTransaction)
+class WalletTransactionAdmin(StreamingExportAdminMixin, BulkJobAdminMixin, admin.ModelAdmin):
+    list_display = ['transaction_reference', 'wallet', 'transaction_type', 'amount', 'transaction_verified', 'created_at']
+    list_filter = ['transaction_type', 'transaction_verified']
+    export_fields = [
+        'id', 'transaction_reference', 'wallet__user__email', 'transaction_type', 'amount',
+        'transaction_verified', 'created_at',
+    ]
+    # The status filter of exports selects deposits or withdrawals.
+    export_status_field = 'transaction_type'
+    import_form = WalletTransactionImportForm
+    import_key = 'transaction_reference'
+    bulk_actions = ['verify_deposits']
+
+    def prepare_import(self, records):
+        for record in records:
+            if not record.transaction_reference:
+                record.transaction_reference = secrets.token_urlsafe(16)
+
+    @bulk_action('Verify selected deposits with Paystack')
+    def verify_deposits(self, queryset):
+        """
+        This checks each unverified deposit with Paystack, as the wallet
+        page does, and credits the wallets of the ones that went through
+        """
+        deposits = queryset.filter(
+            transaction_type='Deposit', transaction_verified=False, wallet__isnull=False,
+        ).select_related('wallet')
+        verified = 0
+        for deposit in deposits:
+            if deposit.verify_transaction() and deposit.credit_wallet(deposit.wallet):
+                verified += 1
+        return verified
@@ -3,7 +3,7 @@ This contains all the models for the finance app.
 """
 import secrets
 
-from django.db import models
+from django.db import models, transaction
 
 from accounts.models import UserAccount
 from app.models import BaseModel
@@ -103,6 +103,7 @@ class WalletTransaction(BaseModel):
     def verify_transaction(self):
         paystack = Paystack()
         status, result = paystack.verify_transaction(self.transaction_reference, self.amount)
+        self.verified = False
         if status:
             if result['amount'] / 100 == self.amount:
                 self.verified = True
@@ -111,4 +112,24 @@ class WalletTransaction(BaseModel):
             return True
         return False
 
+    def credit_wallet(self, wallet):
+        """
+        This adds a deposit Paystack verified to the wallet and marks it
+        verified, unless that was already done. The deposit and the wallet
+        are locked, so a deposit is never credited twice.
+        """
+        with transaction.atomic():
+            unverified = WalletTransaction.objects.select_for_update().filter(
+                pk=self.pk, transaction_verified=False
+            )
+            if not unverified.exists():
+                return False
+            wallet = Wallet.objects.select_for_update().get(pk=wallet.pk)
+            wallet.balance += self.amount
+            wallet.save()
+
+            self.transaction_verified = True
+            self.save()
+        return True
+
     pass
@@ -16,6 +16,7 @@ from django.views.generic import TemplateView
 
 from finance.forms import TransactionForm
 from finance.models import WalletTransaction, Wallet
+from shipments.archive import delivery_history
 from shipments.models import Delivery
 
 # Paystack Variables
@@ -63,13 +64,12 @@ class WalletView(TemplateView):
         last_update_time = last_update.created_at if last_update else timezone.make_aware(timezone.datetime.min)
 
         # Calculate courier's earnings
-        new_delivery_tasks = Delivery.objects.filter(
+        new_delivery_tasks = delivery_history(
             courier=self.request.user.courier_account,
             status=Delivery.StatusChoices.COMPLETED,
             delivered_at__gt=last_update_time,
-
         )
-        total_price = new_delivery_tasks.aggregate(Sum('price'))['price__sum'] or Decimal('0')
+        total_price = new_delivery_tasks.aggregate(price__sum=Sum('price'))['price__sum'] or Decimal('0')
         courier_earnings = (total_price * Decimal('0.9')).quantize(Decimal('0.01'))
 
         if courier_earnings > Decimal('0'):
@@ -130,15 +130,7 @@ def verify_transaction(request, transaction_reference):
         verified = transaction_obj.verify_transaction()
 
         if verified:
-            with transaction.atomic():
-                user_wallet = Wallet.objects.select_for_update().get(user=request.user)
-                user_wallet.balance += transaction_obj.amount
-                user_wallet.save()
-
-                # Mark the transaction as verified
-                transaction_obj.transaction_verified = True
-                transaction_obj.save()
-
+            transaction_obj.credit_wallet(Wallet.objects.get(user=request.user))
             messages.success(request, 'Wallet funding successful')
         else:
             messages.error(request, 'Transaction verification failed')
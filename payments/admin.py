@@ -0,0 +1,21 @@
+"""
+Payment Admin
+"""
+from django.contrib import admin
+
+from deliveet.utils.exports import StreamingExportAdminMixin
+from payments.models import Payment, PaymentRefund
+
+
+@admin.register(Payment)
+class PaymentAdmin(StreamingExportAdminMixin, admin.ModelAdmin):
+    list_display = ['transaction_ref', 'user', 'amount', 'currency', 'status', 'payment_method', 'created_at']
+    list_filter = ['status', 'payment_method']
+    search_fields = ['transaction_ref', 'monnify_reference']
+    export_fields = [
+        'id', 'transaction_ref', 'monnify_reference', 'user__email', 'amount', 'currency', 'status',
+        'payment_method', 'payment_for', 'created_at', 'completed_at',
+    ]
+
+
+admin.site.register(PaymentRefund)
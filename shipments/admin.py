@@ -1,7 +1,76 @@
 from django.contrib import admin
 
-from shipments.models import Delivery, DeliveryTransaction
+from deliveet.utils.bulk_jobs import BulkJobAdminMixin, ImportForm, bulk_action
+from deliveet.utils.exports import StreamingExportAdminMixin
+from deliveet.utils.replicas import ReplicaAdminMixin
+from shipments import transitions
+from shipments.models import (
+    Delivery, DeliveryArchive, DeliveryBundle, DeliveryRollup, DeliveryTransaction, ProofUpload,
+)
+
+DELIVERY_EXPORT_FIELDS = [
+    'id', 'tracking_number', 'status', 'customer__user__email', 'courier__user__email',
+    'item_name', 'item_type', 'size', 'quantity', 'pickup_address', 'delivery_address',
+    'distance', 'duration', 'price', 'payment_method', 'created_at', 'pickedup_at', 'delivered_at',
+]
+
+
+class DeliveryImportForm(ImportForm):
+    """
+    This validates one row of a delivery import. Imported rows are written
+    as they are, without going through the state machine.
+    """
+
+    class Meta:
+        model = Delivery
+        fields = [
+            'tracking_number', 'customer', 'courier', 'status', 'item_name', 'item_type', 'size', 'quantity',
+            'pickup_address', 'pickup_latitude', 'pickup_longitude', 'sender_name', 'sender_phone',
+            'delivery_address', 'delivery_latitude', 'delivery_longitude', 'recipient_name', 'recipient_phone',
+            'distance', 'duration', 'price', 'payment_method', 'pickedup_at', 'delivered_at',
+        ]
+
 
 # Register your models here.
-admin.site.register(Delivery)
+@admin.register(Delivery)
+class DeliveryAdmin(StreamingExportAdminMixin, BulkJobAdminMixin, ReplicaAdminMixin, admin.ModelAdmin):
+    list_display = ['item_name', 'customer', 'courier', 'status', 'price', 'created_at']
+    list_filter = ['status']
+    export_fields = DELIVERY_EXPORT_FIELDS
+    import_form = DeliveryImportForm
+    import_key = 'tracking_number'
+    bulk_actions = ['cancel_deliveries']
+
+    def prepare_import(self, records):
+        Delivery.assign_tracking_numbers(records)
+
+    @bulk_action('Cancel selected deliveries waiting for a courier')
+    def cancel_deliveries(self, queryset):
+        canceled = 0
+        for delivery in queryset.filter(status=Delivery.StatusChoices.PROCESSING):
+            try:
+                transitions.cancel(delivery)
+            except transitions.TransitionError:
+                # Accepted by a courier since the chunk was read.
+                continue
+            canceled += 1
+        return canceled
+
+
+@admin.register(DeliveryArchive)
+class DeliveryArchiveAdmin(StreamingExportAdminMixin, ReplicaAdminMixin, admin.ModelAdmin):
+    list_display = ['item_name', 'customer', 'courier', 'status', 'price', 'created_at', 'archived_at']
+    list_filter = ['status']
+    search_fields = ['tracking_number']
+    export_fields = DELIVERY_EXPORT_FIELDS
+
+
+@admin.register(DeliveryRollup)
+class DeliveryRollupAdmin(ReplicaAdminMixin, admin.ModelAdmin):
+    list_display = ['scope', 'subject_id', 'granularity', 'period_start', 'deliveries', 'revenue']
+    list_filter = ['scope', 'granularity']
+
+
 admin.site.register(DeliveryTransaction)
+admin.site.register(ProofUpload)
+admin.site.register(DeliveryBundle)
@@ -0,0 +1,190 @@
+"""
+This module moves old delivered and canceled deliveries to the archive.
+
+Deliveries that reached a terminal status more than
+DELIVERY_ARCHIVE_AFTER_DAYS ago are copied to DeliveryArchive and deleted
+from the delivery table, so the queries couriers and customers run all day
+only scan deliveries that can still change. A delivery is archived with its
+payment transactions; its outbox events go with it, so deliveries with
+events the relay has not published yet are left for a later run. Ratings
+and payment records keep their rows and lose the link to the delivery.
+
+History pages read both tables through delivery_history(), which behaves
+like a queryset ordered newest first.
+"""
+import logging
+from datetime import timedelta
+from heapq import merge
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from shipments.models import AbstractDelivery, Delivery, DeliveryArchive
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = [Delivery.StatusChoices.COMPLETED, Delivery.StatusChoices.CANCELED]
+
+ARCHIVED_FIELDS = [field.attname for field in AbstractDelivery._meta.fields] + [
+    'id', 'uuid', 'customer_id', 'courier_id', 'created_at', 'updated_at',
+]
+
+
+def _snapshot_transactions(delivery):
+    return [
+        {
+            'transaction_reference': delivery_transaction.transaction_reference,
+            'amount': str(delivery_transaction.amount),
+            'transaction_status': delivery_transaction.transaction_status,
+            'transaction_verified': delivery_transaction.transaction_verified,
+            'created_at': delivery_transaction.created_at.isoformat(),
+        }
+        for delivery_transaction in delivery.delivery_transactions.all()
+    ]
+
+
+def archivable_deliveries(cutoff):
+    """
+    This returns the deliveries last changed before cutoff that can be
+    archived
+    """
+    return Delivery.objects.filter(
+        status__in=TERMINAL_STATUSES,
+        updated_at__lt=cutoff,
+    ).exclude(events__published_at__isnull=True)
+
+
+def archive_cutoff(older_than_days=None, now=None):
+    """
+    This returns the time deliveries must have last changed before to be
+    archived
+    """
+    if older_than_days is None:
+        older_than_days = settings.DELIVERY_ARCHIVE_AFTER_DAYS
+    return (now or timezone.now()) - timedelta(days=older_than_days)
+
+
+def archive_batch(cutoff, batch_size):
+    """
+    This archives up to batch_size deliveries last changed before cutoff and
+    returns the number archived. Rows locked by other transactions are
+    skipped and picked up by a later run.
+    """
+    with transaction.atomic():
+        deliveries = list(
+            archivable_deliveries(cutoff)
+            .select_for_update(skip_locked=True, of=('self',))
+            .order_by('updated_at')
+            .prefetch_related('delivery_transactions')[:batch_size]
+        )
+        if not deliveries:
+            return 0
+
+        DeliveryArchive.objects.bulk_create(
+            [
+                DeliveryArchive(
+                    transactions=_snapshot_transactions(delivery),
+                    **{field: getattr(delivery, field) for field in ARCHIVED_FIELDS},
+                )
+                for delivery in deliveries
+            ]
+        )
+        Delivery.objects.filter(id__in=[delivery.id for delivery in deliveries]).delete()
+    return len(deliveries)
+
+
+def archive_deliveries(older_than_days=None, batch_size=None, now=None):
+    """
+    This archives every delivery that reached a terminal status more than
+    older_than_days ago and returns the number archived
+    """
+    batch_size = batch_size or settings.DELIVERY_ARCHIVE_BATCH_SIZE
+    cutoff = archive_cutoff(older_than_days, now)
+
+    archived = 0
+    while True:
+        count = archive_batch(cutoff, batch_size)
+        archived += count
+        if count < batch_size:
+            break
+
+    if archived:
+        logger.info('Archived %s deliveries last changed before %s', archived, cutoff)
+    return archived
+
+
+class DeliveryHistory:
+    """
+    This reads live and archived deliveries as one list, newest first. It
+    supports what list views and templates use: len(), count(), iteration,
+    slicing and aggregate() with Sum and Count.
+    """
+
+    def __init__(self, live, archived):
+        self.live = live.order_by('-created_at')
+        self.archived = archived.order_by('-created_at')
+        self._result_cache = None
+
+    def select_related(self, *fields):
+        return DeliveryHistory(self.live.select_related(*fields), self.archived.select_related(*fields))
+
+    def count(self):
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        return self.live.count() + self.archived.count()
+
+    def aggregate(self, **aggregates):
+        """
+        This adds up the aggregates of both tables. Only additive aggregates
+        such as Sum and Count make sense here.
+        """
+        live = self.live.order_by().aggregate(**aggregates)
+        archived = self.archived.order_by().aggregate(**aggregates)
+        return {
+            name: None if live[name] is None and archived[name] is None else (live[name] or 0) + (archived[name] or 0)
+            for name in aggregates
+        }
+
+    def _merged(self, live, archived):
+        return merge(live, archived, key=attrgetter('created_at'), reverse=True)
+
+    def __iter__(self):
+        if self._result_cache is None:
+            self._result_cache = list(self._merged(self.live, self.archived))
+        return iter(self._result_cache)
+
+    def __len__(self):
+        if self._result_cache is None:
+            list(iter(self))
+        return len(self._result_cache)
+
+    def __bool__(self):
+        return self.count() > 0
+
+    def __getitem__(self, key):
+        if self._result_cache is not None:
+            return self._result_cache[key]
+        if isinstance(key, int):
+            if key < 0:
+                raise ValueError('Negative indexing is not supported.')
+            return self[key:key + 1][0]
+        if key.step is not None or (key.start or 0) < 0 or (key.stop is not None and key.stop < 0):
+            return list(self)[key]
+        if key.stop is None:
+            return list(self)[key]
+        # Both tables are ordered the same way, so the first stop rows of
+        # the merged list are among the first stop rows of each table.
+        rows = self._merged(self.live[:key.stop], self.archived[:key.stop])
+        return list(rows)[key.start or 0:key.stop]
+
+
+def delivery_history(**filters):
+    """
+    This returns the live and archived deliveries matching filters
+    """
+    return DeliveryHistory(
+        Delivery.objects.filter(**filters),
+        DeliveryArchive.objects.filter(**filters),
+    )
@@ -0,0 +1,235 @@
+"""
+This module creates many deliveries from one merchant request.
+
+A request carries up to BULK_DELIVERY_MAX_ROWS orders as JSON or CSV. Each
+order is validated on its own, so one bad row does not reject the batch.
+The distances of the valid orders are looked up concurrently (see
+shipments/pricing.py), orders paid from the wallet are charged together,
+and all orders are inserted ready for couriers with a single INSERT plus
+one for their outbox events. Couriers get one push notification for the
+whole batch once it is committed.
+
+The result lists every row in request order with either the created
+delivery or the reasons it was rejected.
+"""
+import csv
+import io
+import json
+import logging
+import secrets
+from decimal import Decimal
+from functools import partial
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.urls import reverse
+
+from accounts.models import Courier
+from deliveet.utils.firebase import firebase_messaging
+from finance.models import Wallet, WalletTransaction
+from shipments import bundling, pricing, transitions
+from shipments.forms import BulkDeliveryForm
+from shipments.models import Delivery, DeliveryTransaction
+
+logger = logging.getLogger(__name__)
+
+# Tokens FCM accepts in one multicast message
+FCM_MULTICAST_LIMIT = 500
+
+
+class BulkRequestError(Exception):
+    """
+    This is raised when a bulk request as a whole cannot be read
+    """
+
+
+def _decode_csv(text):
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+def parse_rows(request):
+    """
+    This returns the orders of a bulk request: a JSON list, a JSON object
+    with a "deliveries" list, a CSV body or an uploaded CSV file
+    """
+    if 'file' in request.FILES:
+        rows = _decode_csv(request.FILES['file'].read().decode('utf-8-sig'))
+    elif request.content_type == 'text/csv':
+        rows = _decode_csv(request.body.decode('utf-8-sig'))
+    elif request.content_type == 'application/json':
+        try:
+            rows = json.loads(request.body)
+        except ValueError:
+            raise BulkRequestError('The request body is not valid JSON.')
+        if isinstance(rows, dict):
+            rows = rows.get('deliveries')
+    else:
+        raise BulkRequestError('Send the deliveries as JSON or CSV.')
+
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise BulkRequestError('Send a list of deliveries.')
+    if not rows:
+        raise BulkRequestError('The request has no deliveries.')
+    if len(rows) > settings.BULK_DELIVERY_MAX_ROWS:
+        raise BulkRequestError(f'Send at most {settings.BULK_DELIVERY_MAX_ROWS} deliveries per request.')
+    # Empty CSV cells leave the field to its default.
+    return [{field: value for field, value in row.items() if value not in ('', None)} for row in rows]
+
+
+def validate_rows(customer, rows):
+    """
+    This returns an unsaved delivery or the form errors for each row
+    """
+    validated = []
+    for row in rows:
+        form = BulkDeliveryForm(data=row)
+        if not form.is_valid():
+            validated.append({field: [str(error) for error in errors] for field, errors in form.errors.items()})
+            continue
+        delivery = form.save(commit=False)
+        delivery.customer = customer
+        validated.append(delivery)
+    return validated
+
+
+def price_deliveries(deliveries):
+    """
+    This sets the distance, duration and price of deliveries and returns
+    the lookup error of each delivery that could not be priced
+    """
+    quotes = pricing.quote_routes(
+        (delivery.pickup_address, delivery.delivery_address) for delivery in deliveries
+    )
+    errors = {}
+    for delivery in deliveries:
+        quote = quotes[(delivery.pickup_address, delivery.delivery_address)]
+        if isinstance(quote, Exception):
+            errors[delivery.id] = str(quote)
+            continue
+        delivery.distance, delivery.duration = quote
+        delivery.price = pricing.price_for_distance(delivery.distance)
+    return errors
+
+
+def _charge_wallet(user, deliveries):
+    """
+    This charges the wallet for as many deliveries as the balance covers,
+    in order, and returns the error of each delivery it could not charge.
+    Must run inside the transaction that creates the deliveries.
+    """
+    wallet = Wallet.objects.select_for_update().filter(user=user).first()
+    if wallet is None:
+        return {delivery.id: 'You do not have a wallet.' for delivery in deliveries}
+
+    errors, charged, total = {}, [], Decimal('0.00')
+    for delivery in deliveries:
+        if total + delivery.price > wallet.balance:
+            errors[delivery.id] = 'Insufficient wallet balance. Please fund your account.'
+            continue
+        total += delivery.price
+        charged.append(delivery)
+    if not charged:
+        return errors
+
+    wallet.balance -= total
+    wallet.save(update_fields=['balance', 'updated_at'])
+    WalletTransaction.objects.create(
+        wallet=wallet,
+        transaction_type='Withdraw',
+        amount=total,
+        transaction_verified=True
+    )
+    return errors
+
+
+def create_deliveries(user, rows):
+    """
+    This creates the deliveries of a bulk request for the customer and
+    returns one result per row
+    """
+    validated = validate_rows(user.customer_account, rows)
+    deliveries = [delivery for delivery in validated if isinstance(delivery, Delivery)]
+    errors = price_deliveries(deliveries)
+
+    with transaction.atomic():
+        wallet_deliveries = [
+            delivery for delivery in deliveries
+            if delivery.id not in errors and delivery.payment_method == Delivery.PaymentMethodChoices.WALLET
+        ]
+        if wallet_deliveries:
+            errors.update(_charge_wallet(user, wallet_deliveries))
+
+        created = transitions.submit_new([delivery for delivery in deliveries if delivery.id not in errors])
+        DeliveryTransaction.objects.bulk_create([
+            DeliveryTransaction(
+                delivery=delivery,
+                amount=delivery.price,
+                transaction_reference=secrets.token_urlsafe(16),
+                transaction_status=DeliveryTransaction.PaymentStatus.PAID,
+            )
+            for delivery in created
+            if delivery.payment_method == Delivery.PaymentMethodChoices.WALLET
+        ])
+        if created:
+            transaction.on_commit(partial(notify_couriers, created))
+
+    results = []
+    for row, delivery in enumerate(validated, start=1):
+        if not isinstance(delivery, Delivery):
+            results.append({'row': row, 'success': False, 'errors': delivery})
+        elif delivery.id in errors:
+            results.append({'row': row, 'success': False, 'errors': {'__all__': [errors[delivery.id]]}})
+        else:
+            results.append({
+                'row': row,
+                'success': True,
+                'id': str(delivery.id),
+                'tracking_number': delivery.tracking_number,
+                'distance': delivery.distance,
+                'duration': delivery.duration,
+                'price': str(delivery.price),
+            })
+    return results
+
+
+def notify_couriers(deliveries):
+    """
+    This tells couriers about a batch of new deliveries with one push
+    notification each, however many deliveries the batch holds. Deliveries
+    already broadcast are left out.
+    """
+    deliveries = bundling.not_yet_broadcast(deliveries)
+    if not deliveries:
+        return
+    tokens = list(
+        Courier.objects.exclude(fcm_token__isnull=True).exclude(fcm_token='').values_list('fcm_token', flat=True)
+    )
+    if not tokens:
+        return
+
+    try:
+        messaging = firebase_messaging()
+    except ImproperlyConfigured as error:
+        logger.warning('Not notifying couriers of %s deliveries: %s', len(deliveries), error)
+        return
+
+    pickups = {delivery.pickup_address for delivery in deliveries}
+    body = f'Pickup at {next(iter(pickups))}' if len(pickups) == 1 else f'From {len(pickups)} pickup addresses'
+    for start in range(0, len(tokens), FCM_MULTICAST_LIMIT):
+        message = messaging.MulticastMessage(
+            notification=messaging.Notification(
+                title=f'{len(deliveries)} new deliveries',
+                body=body,
+            ),
+            webpush=messaging.WebpushConfig(
+                fcm_options=messaging.WebpushFCMOptions(
+                    link=settings.NOTIFICATION_URL + reverse('couriers:available_delivery_tasks'),
+                ),
+            ),
+            tokens=tokens[start:start + FCM_MULTICAST_LIMIT],
+        )
+        try:
+            messaging.send_multicast(message)
+        except Exception as error:
+            logger.warning('Notifying couriers of %s deliveries failed: %s', len(deliveries), error)
@@ -0,0 +1,293 @@
+"""
+This module bundles open deliveries that can be carried together.
+
+Deliveries waiting for a courier are grouped by the grid cell of their
+pickup and the compass sector of the trip from pickup to drop-off, so a
+bundle starts from the same few streets and heads the same way. Each
+bundle is offered to one idle courier near the pickups with a single push
+notification instead of a broadcast to every courier. If the courier does
+not accept before the offer expires, the deliveries can be bundled and
+offered again, to someone else.
+
+Bundle membership is recorded in DeliveryBundle.deliveries. Accepting a
+bundle assigns its deliveries through the state machine, so a delivery
+another courier took in the meantime is simply left out.
+
+A bundling round reads the open deliveries without locking them and only
+locks a group's rows, skipping any another round holds, once a courier
+has been picked for it. A delivery submitted while another open delivery
+shares its pickup cell and heading is not broadcast to every courier, as
+the next round offers it in a bundle; deliveries a round leaves unoffered
+are broadcast then, once each.
+"""
+import logging
+import math
+from collections import defaultdict
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Courier
+from deliveet.utils.firebase import firebase_messaging
+from shipments import transitions
+from shipments.models import Delivery, DeliveryBundle
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+
+ACTIVE_STATUSES = [
+    Delivery.StatusChoices.PICKUP_IN_PROGRESS,
+    Delivery.StatusChoices.DELIVERY_IN_PROGRESS,
+]
+
+BUNDLED_STATUSES = [DeliveryBundle.StatusChoices.OFFERED, DeliveryBundle.StatusChoices.ACCEPTED]
+
+BROADCAST_CACHE_KEY = 'bundling:broadcast:{}'
+BROADCAST_MARK_SECONDS = 24 * 3600
+
+
+def distance_km(latitude, longitude, other_latitude, other_longitude):
+    """
+    This returns the great-circle distance between two points
+    """
+    lat1, lat2 = math.radians(latitude), math.radians(other_latitude)
+    dlat = lat2 - lat1
+    dlon = math.radians(other_longitude - longitude)
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def pickup_cell(delivery):
+    """
+    This returns the grid cell of the delivery's pickup
+    """
+    size = settings.BUNDLE_CELL_SIZE_DEGREES
+    return f'{math.floor(delivery.pickup_latitude / size)}:{math.floor(delivery.pickup_longitude / size)}'
+
+
+def heading_sector(delivery):
+    """
+    This returns the compass sector of the trip from pickup to drop-off
+    """
+    lat1, lat2 = math.radians(delivery.pickup_latitude), math.radians(delivery.delivery_latitude)
+    dlon = math.radians(delivery.delivery_longitude - delivery.pickup_longitude)
+    bearing = math.degrees(math.atan2(
+        math.sin(dlon) * math.cos(lat2),
+        math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(dlon),
+    )) % 360
+    return int(bearing // (360 / settings.BUNDLE_HEADING_SECTORS))
+
+
+def _open_deliveries():
+    return Delivery.objects.filter(
+        status=Delivery.StatusChoices.PROCESSING,
+        courier__isnull=True,
+    ).exclude(bundles__status__in=BUNDLED_STATUSES)
+
+
+def will_be_bundled(delivery):
+    """
+    This tells whether another open delivery shares the delivery's pickup
+    cell and heading, so the next bundling round can bundle them
+    """
+    size = settings.BUNDLE_CELL_SIZE_DEGREES
+    south = math.floor(delivery.pickup_latitude / size) * size
+    west = math.floor(delivery.pickup_longitude / size) * size
+    others = _open_deliveries().filter(
+        pickup_latitude__range=(south, south + size),
+        pickup_longitude__range=(west, west + size),
+    ).exclude(pk=delivery.pk).only('pickup_latitude', 'pickup_longitude', 'delivery_latitude', 'delivery_longitude')
+    key = (pickup_cell(delivery), heading_sector(delivery))
+    return any((pickup_cell(other), heading_sector(other)) == key for other in others)
+
+
+def not_yet_broadcast(deliveries):
+    """
+    This returns the deliveries no broadcast has gone out for and marks
+    them as broadcast
+    """
+    return [
+        delivery for delivery in deliveries
+        if cache.add(BROADCAST_CACHE_KEY.format(delivery.pk), True, timeout=BROADCAST_MARK_SECONDS)
+    ]
+
+
+def group_deliveries(deliveries):
+    """
+    This groups deliveries by pickup cell and heading and splits the
+    groups into bundles of at most BUNDLE_MAX_SIZE. Deliveries with
+    nothing to share a trip with are left out.
+    """
+    groups = defaultdict(list)
+    for delivery in deliveries:
+        groups[(pickup_cell(delivery), heading_sector(delivery))].append(delivery)
+
+    bundles = []
+    for key, group in groups.items():
+        group.sort(key=lambda delivery: delivery.created_at)
+        for start in range(0, len(group), settings.BUNDLE_MAX_SIZE):
+            members = group[start:start + settings.BUNDLE_MAX_SIZE]
+            if len(members) > 1:
+                bundles.append((key, members))
+    return bundles
+
+
+def expire_bundles(now=None):
+    """
+    This expires offers the courier did not accept in time
+    """
+    return DeliveryBundle.objects.filter(
+        status=DeliveryBundle.StatusChoices.OFFERED,
+        expires_at__lte=now or timezone.now(),
+    ).update(status=DeliveryBundle.StatusChoices.EXPIRED, updated_at=timezone.now())
+
+
+def nearest_idle_courier(latitude, longitude, exclude=()):
+    """
+    This returns the closest courier within BUNDLE_OFFER_RADIUS_KM who is
+    not on a delivery and has no bundle on offer, or None
+    """
+    radius = settings.BUNDLE_OFFER_RADIUS_KM
+    lat_margin = radius / 111.0
+    lon_margin = radius / (111.0 * max(math.cos(math.radians(latitude)), 0.01))
+    couriers = Courier.objects.filter(
+        courier_latitude__range=(latitude - lat_margin, latitude + lat_margin),
+        courier_longitude__range=(longitude - lon_margin, longitude + lon_margin),
+    ).exclude(
+        Q(pk__in=exclude)
+        | Q(courier_deliveries__status__in=ACTIVE_STATUSES)
+        | Q(delivery_bundles__status=DeliveryBundle.StatusChoices.OFFERED)
+    ).only('pk', 'courier_latitude', 'courier_longitude', 'fcm_token')
+
+    best, best_distance = None, radius
+    for courier in couriers:
+        distance = distance_km(latitude, longitude, courier.courier_latitude, courier.courier_longitude)
+        if distance <= best_distance:
+            best, best_distance = courier, distance
+    return best
+
+
+def _previously_offered(deliveries):
+    """
+    This returns the couriers who let an offer for any of these deliveries expire
+    """
+    return set(DeliveryBundle.objects.filter(
+        deliveries__in=deliveries,
+        status=DeliveryBundle.StatusChoices.EXPIRED,
+    ).values_list('courier_id', flat=True))
+
+
+def build_bundles():
+    """
+    This bundles the open deliveries and offers each bundle to a courier,
+    then broadcasts the deliveries left unoffered. Returns the bundles
+    created.
+    """
+    from shipments.bulk import notify_couriers
+
+    now = timezone.now()
+    expire_bundles(now)
+
+    deliveries = list(_open_deliveries())
+    offered = []
+    taken = set()
+    handled = set()
+    for (cell, heading), members in group_deliveries(deliveries):
+        latitude = sum(delivery.pickup_latitude for delivery in members) / len(members)
+        longitude = sum(delivery.pickup_longitude for delivery in members) / len(members)
+        courier = nearest_idle_courier(latitude, longitude, exclude=taken | _previously_offered(members))
+        if courier is None:
+            continue
+
+        handled.update(delivery.pk for delivery in members)
+        with transaction.atomic():
+            # Leaves out deliveries accepted, canceled or bundled by another
+            # round since they were read
+            members = list(
+                _open_deliveries().select_for_update(skip_locked=True)
+                .filter(pk__in=[delivery.pk for delivery in members])
+            )
+            if len(members) < 2:
+                continue
+            bundle = DeliveryBundle.objects.create(
+                courier=courier,
+                pickup_cell=cell,
+                heading=heading,
+                expires_at=now + timedelta(seconds=settings.BUNDLE_OFFER_SECONDS),
+            )
+            bundle.deliveries.set(members)
+            transaction.on_commit(partial(offer_bundle, bundle))
+        taken.add(courier.pk)
+        offered.append(bundle)
+
+    unoffered = [delivery for delivery in deliveries if delivery.pk not in handled]
+    if unoffered:
+        notify_couriers(unoffered)
+    return offered
+
+
+def offer_bundle(bundle):
+    """
+    This sends the bundle offer to its courier as one push notification
+    """
+    token = bundle.courier.fcm_token
+    if not token:
+        return
+    try:
+        messaging = firebase_messaging()
+    except ImproperlyConfigured as error:
+        logger.warning('Not offering bundle %s: %s', bundle.id, error)
+        return
+
+    count = bundle.deliveries.count()
+    message = messaging.Message(
+        notification=messaging.Notification(
+            title=f'{count} deliveries from one pickup area',
+            body=f'Accept within {settings.BUNDLE_OFFER_SECONDS} seconds.',
+        ),
+        data={'bundle_id': str(bundle.id)},
+        webpush=messaging.WebpushConfig(
+            fcm_options=messaging.WebpushFCMOptions(
+                link=settings.NOTIFICATION_URL + reverse('couriers:available_delivery_tasks'),
+            ),
+        ),
+        token=token,
+    )
+    try:
+        messaging.send(message)
+    except Exception as error:
+        logger.warning('Offering bundle %s failed: %s', bundle.id, error)
+
+
+def accept_bundle(bundle_id, courier):
+    """
+    This accepts a bundle on offer to the courier and assigns its
+    deliveries. Returns the deliveries the courier now has.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        accepted = DeliveryBundle.objects.filter(
+            id=bundle_id,
+            courier=courier,
+            status=DeliveryBundle.StatusChoices.OFFERED,
+            expires_at__gt=now,
+        ).update(status=DeliveryBundle.StatusChoices.ACCEPTED, accepted_at=now, updated_at=now)
+        if not accepted:
+            raise transitions.TransitionError('This bundle is no longer on offer.')
+
+        deliveries = []
+        for delivery in Delivery.objects.filter(bundles__id=bundle_id):
+            try:
+                deliveries.append(transitions.accept(delivery, courier))
+            except transitions.TransitionError:
+                # Canceled or taken by another courier since it was bundled.
+                continue
+    return deliveries
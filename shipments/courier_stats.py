@@ -0,0 +1,84 @@
+"""
+This module pushes courier stats to the FastAPI matching service.
+
+The service scores couriers by their rating and their number of active
+deliveries. The delivery events relayed from the outbox keep the active
+counts current between pushes, but the service starts from nothing after
+a restart and never sees ratings, so push_courier_stats() sends a
+snapshot of every courier every COURIER_STATS_INTERVAL seconds. The
+snapshot replaces what the service has, which also repairs counts thrown
+off by events it missed.
+"""
+import logging
+
+import requests
+from django.conf import settings
+from django.db.models import Count
+
+from accounts.models import Courier
+from shipments.models import Delivery
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = [
+    Delivery.StatusChoices.PICKUP_IN_PROGRESS,
+    Delivery.StatusChoices.DELIVERY_IN_PROGRESS,
+]
+
+
+def courier_stats(couriers):
+    """
+    This returns the stats of the given couriers, rows of user_id and
+    user__rating, in the shape the service expects
+    """
+    active = dict(
+        Delivery.objects.filter(status__in=ACTIVE_STATUSES, courier__in=[courier['user_id'] for courier in couriers])
+        .order_by().values('courier').annotate(count=Count('pk')).values_list('courier', 'count')
+    )
+    return [
+        {
+            'courier_id': str(courier['user_id']),
+            'active_deliveries': active.get(courier['user_id'], 0),
+            # Unrated couriers keep the service's default rating
+            'average_rating': courier['user__rating'],
+        }
+        for courier in couriers
+    ]
+
+
+def push_courier_stats(batch_size=None):
+    """
+    This sends the rating and active deliveries of every courier to the
+    FastAPI service, batch_size couriers per request, and returns the
+    number of couriers sent
+    """
+    if not settings.FASTAPI_SERVICE_URL:
+        return 0
+    batch_size = batch_size or settings.COURIER_STATS_BATCH_SIZE
+
+    couriers = Courier.objects.order_by('pk').values('user_id', 'user__rating')
+    sent = 0
+    last_pk = None
+    while True:
+        batch = couriers.filter(pk__gt=last_pk) if last_pk is not None else couriers
+        batch = list(batch[:batch_size])
+        if not batch:
+            break
+        try:
+            _post_stats(courier_stats(batch))
+        except Exception as error:
+            # The next run sends the whole snapshot again.
+            logger.warning('Pushing stats of %s couriers failed: %s', len(batch), error)
+            break
+        sent += len(batch)
+        last_pk = batch[-1]['user_id']
+    return sent
+
+
+def _post_stats(stats):
+    response = requests.post(
+        f'{settings.FASTAPI_SERVICE_URL}/api/v1/couriers/stats',
+        json=stats,
+        timeout=settings.COURIER_STATS_SINK_TIMEOUT,
+    )
+    response.raise_for_status()
@@ -0,0 +1,275 @@
+"""
+This module records delivery events in the outbox and relays them.
+
+record_delivery_event() must be called inside the transaction that changes
+the delivery, so an event exists if and only if the change was committed.
+The relay (manage.py relay_delivery_events) publishes pending events in
+batches to the channel groups, the FastAPI tracker and the customer's
+notification group, and marks them published only after every sink has
+accepted them. Delivery is at least once: clients receive an event_id and
+should ignore ids they have already seen.
+
+A batch that fails is retried after DELIVERY_EVENTS_RETRY_SECONDS,
+doubling each attempt, and later events are published in the meantime.
+When the tracker rejects a batch with a client error, its events are sent
+one by one so only the events it rejects wait. An event that has failed
+DELIVERY_EVENTS_MAX_ATTEMPTS times is marked failed and skipped from then on.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+import requests
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Min, Q
+from django.utils import timezone
+
+from shipments.models import Delivery, DeliveryEvent
+
+logger = logging.getLogger(__name__)
+
+RELAY_STATS_CACHE_KEY = 'delivery_events:relay_stats'
+
+
+def record_delivery_event(delivery, previous_status, event_type=DeliveryEvent.EventTypeChoices.STATUS_CHANGED):
+    """
+    This adds an event for the delivery to the outbox
+    """
+    if not transaction.get_connection().in_atomic_block:
+        raise RuntimeError('Delivery events must be recorded inside the transaction that changes the delivery.')
+
+    return DeliveryEvent.objects.create(
+        delivery=delivery,
+        event_type=event_type,
+        previous_status=previous_status or '',
+        status=delivery.status,
+        payload=delivery_event_payload(delivery),
+    )
+
+
+def record_delivery_events(deliveries, previous_status, event_type=DeliveryEvent.EventTypeChoices.STATUS_CHANGED):
+    """
+    This adds one event per delivery to the outbox with a single INSERT
+    """
+    if not transaction.get_connection().in_atomic_block:
+        raise RuntimeError('Delivery events must be recorded inside the transaction that changes the delivery.')
+
+    return DeliveryEvent.objects.bulk_create([
+        DeliveryEvent(
+            delivery=delivery,
+            event_type=event_type,
+            previous_status=previous_status or '',
+            status=delivery.status,
+            payload=delivery_event_payload(delivery),
+        )
+        for delivery in deliveries
+    ])
+
+
+def delivery_event_payload(delivery):
+    """
+    This is the snapshot of the delivery sent to subscribers
+    """
+    return {
+        'delivery_id': str(delivery.id),
+        'customer_id': str(delivery.customer_id),
+        'courier_id': str(delivery.courier_id) if delivery.courier_id else None,
+        'item_name': delivery.item_name,
+        'status_display': delivery.get_status_display(),
+        'pickup_photo': delivery.pickup_photo.url if delivery.pickup_photo else None,
+        'delivery_photo': delivery.delivery_photo.url if delivery.delivery_photo else None,
+    }
+
+
+def _channel_messages(event):
+    """
+    This returns the (group, message) pairs an event is published as
+    """
+    payload = event.payload
+    delivery_task = {
+        'event_id': event.id,
+        'status': payload['status_display'],
+    }
+    for photo in ('pickup_photo', 'delivery_photo'):
+        if payload.get(photo):
+            delivery_task[photo] = payload[photo]
+
+    return [
+        (f'delivery_task_{event.delivery_id}', {
+            'type': 'delivery_task_update',
+            'delivery_task': delivery_task,
+        }),
+        (f'tracker_{event.delivery_id}', {
+            'type': 'status_update',
+            'status': {'event_id': event.id, 'status': event.status, 'display': payload['status_display']},
+        }),
+        (f'notifications_{payload["customer_id"]}', {
+            'type': 'send_notification',
+            'title': payload['item_name'],
+            'message': f'Your delivery is now {payload["status_display"].lower()}.',
+            'data': {'event_id': event.id, 'delivery_id': payload['delivery_id'], 'status': event.status},
+        }),
+    ]
+
+
+async def _send_to_channels(events):
+    layer = get_channel_layer()
+    sends = [
+        layer.group_send(group, message)
+        for event in events
+        for group, message in _channel_messages(event)
+    ]
+    await asyncio.gather(*sends)
+
+
+def _send_to_tracker(events):
+    """
+    This posts the whole batch to the FastAPI tracker in one request
+    """
+    if not settings.FASTAPI_SERVICE_URL:
+        return
+    response = requests.post(
+        f'{settings.FASTAPI_SERVICE_URL}/api/v1/events/deliveries',
+        json=[
+            {
+                'event_id': event.id,
+                'delivery_id': str(event.delivery_id),
+                'previous_status': event.previous_status,
+                'status': event.status,
+                'occurred_at': event.created_at.isoformat(),
+                'payload': event.payload,
+            }
+            for event in events
+        ],
+        timeout=settings.DELIVERY_EVENTS_SINK_TIMEOUT,
+    )
+    response.raise_for_status()
+
+
+def _rejected(error):
+    """
+    This tells whether the tracker refused the request itself, which
+    sending it again cannot fix
+    """
+    status_code = getattr(error.response, 'status_code', None) or 0
+    return 400 <= status_code < 500 and status_code not in (408, 429)
+
+
+def _send_to_tracker_or_isolate(events):
+    """
+    This posts the batch to the tracker. When the tracker rejects it, each
+    event is posted alone and the events it rejects are returned with
+    their errors.
+    """
+    try:
+        _send_to_tracker(events)
+        return {}
+    except requests.HTTPError as error:
+        if len(events) == 1 and _rejected(error):
+            return {events[0]: error}
+        if not _rejected(error):
+            raise
+
+    rejected = {}
+    for event in events:
+        try:
+            _send_to_tracker([event])
+        except requests.HTTPError as error:
+            if not _rejected(error):
+                raise
+            rejected[event] = error
+    return rejected
+
+
+def _failed(events, error):
+    """
+    This schedules the next attempt of failed events, or gives up on those
+    that have had DELIVERY_EVENTS_MAX_ATTEMPTS
+    """
+    now = timezone.now()
+    last_error = str(error)[:1000]
+    by_attempts = defaultdict(list)
+    for event in events:
+        by_attempts[event.attempts + 1].append(event.id)
+    for attempts, ids in by_attempts.items():
+        if attempts >= settings.DELIVERY_EVENTS_MAX_ATTEMPTS:
+            logger.error('Giving up on delivery events %s after %s attempts: %s', ids, attempts, last_error)
+            changes = {'failed_at': now}
+        else:
+            changes = {'next_attempt_at': now + timedelta(
+                seconds=settings.DELIVERY_EVENTS_RETRY_SECONDS * 2 ** (attempts - 1)
+            )}
+        DeliveryEvent.objects.filter(id__in=ids).update(attempts=attempts, last_error=last_error, **changes)
+
+
+def _pending_events():
+    return DeliveryEvent.objects.filter(published_at__isnull=True, failed_at__isnull=True)
+
+
+def publish_pending_events(batch_size=None):
+    """
+    This publishes one batch of due events and returns the relay stats
+    """
+    batch_size = batch_size or settings.DELIVERY_EVENTS_BATCH_SIZE
+    with transaction.atomic():
+        events = list(
+            _pending_events().select_for_update(skip_locked=True)
+            .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=timezone.now()))
+            .order_by('id')[:batch_size]
+        )
+        if not events:
+            return _record_stats(0, [])
+
+        try:
+            async_to_sync(_send_to_channels)(events)
+            rejected = _send_to_tracker_or_isolate(events)
+        except Exception as error:
+            logger.warning('Publishing %s delivery events failed: %s', len(events), error)
+            _failed(events, error)
+            return _record_stats(0, [], failed=len(events))
+
+        for event, error in rejected.items():
+            logger.warning('The tracker rejected delivery event %s: %s', event.id, error)
+            _failed([event], error)
+        published = [event for event in events if event not in rejected]
+        published_at = timezone.now()
+        DeliveryEvent.objects.filter(id__in=[event.id for event in published]).update(
+            published_at=published_at,
+            attempts=F('attempts') + 1,
+        )
+    lags = [(published_at - event.created_at).total_seconds() for event in published]
+    return _record_stats(len(published), lags, failed=len(rejected))
+
+
+def _record_stats(published, lags, failed=0):
+    oldest_pending = _pending_events().aggregate(
+        oldest=Min('created_at')
+    )['oldest']
+    stats = {
+        'published': published,
+        'failed': failed,
+        'max_lag_seconds': max(lags) if lags else 0.0,
+        'avg_lag_seconds': sum(lags) / len(lags) if lags else 0.0,
+        'backlog_age_seconds': (timezone.now() - oldest_pending).total_seconds() if oldest_pending else 0.0,
+    }
+    cache.set(RELAY_STATS_CACHE_KEY, stats, timeout=None)
+    return stats
+
+
+def purge_published_events(older_than):
+    """
+    This deletes events that were published, or given up on, before the
+    given time, keeping those the rollups have yet to add
+    """
+    deleted, _ = DeliveryEvent.objects.filter(
+        Q(published_at__lt=older_than) | Q(failed_at__lt=older_than)
+    ).exclude(
+        rolled_up=False,
+        status__in=[Delivery.StatusChoices.COMPLETED, Delivery.StatusChoices.CANCELED],
+    ).delete()
+    return deleted
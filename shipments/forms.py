@@ -3,6 +3,7 @@ This contains all the forms for the shipments app.
 """
 from django import forms
 
+from api import promotions
 from shipments.models import Delivery
 
 
@@ -40,7 +41,60 @@ class PaymentMethodForm(forms.ModelForm):
     """
     This renders forms for the transaction model
     """
+    promo_code = forms.CharField(
+        max_length=20,
+        required=False,
+    )
+    promotion = None
 
     class Meta:
         model = Delivery
         fields = ['payment_method', ]
+
+    def clean_promo_code(self):
+        """
+        This checks the promotion code against the delivery's price and
+        keeps the promotion in self.promotion
+        """
+        code = self.cleaned_data['promo_code'].strip()
+        if code:
+            try:
+                self.promotion = promotions.check(code, self.instance.price)
+            except promotions.PromotionError as error:
+                raise forms.ValidationError(str(error))
+        return code
+
+
+class BulkDeliveryForm(forms.ModelForm):
+    """
+    This validates one order of a bulk delivery request
+    """
+    payment_method = forms.ChoiceField(
+        choices=[
+            (Delivery.PaymentMethodChoices.COD.value, Delivery.PaymentMethodChoices.COD.label),
+            (Delivery.PaymentMethodChoices.WALLET.value, Delivery.PaymentMethodChoices.WALLET.label),
+        ],
+        required=False,
+    )
+
+    class Meta:
+        model = Delivery
+        fields = [
+            'item_name', 'item_type', 'size', 'quantity',
+            'pickup_address', 'pickup_latitude', 'pickup_longitude', 'sender_name', 'sender_phone',
+            'delivery_address', 'delivery_latitude', 'delivery_longitude', 'recipient_name', 'recipient_phone',
+            'payment_method',
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in ('pickup_address', 'sender_name', 'sender_phone',
+                     'delivery_address', 'recipient_name', 'recipient_phone'):
+            self.fields[name].required = True
+        # Fields left out of a row keep the model defaults.
+        for name in ('item_type', 'size', 'quantity', 'pickup_latitude', 'pickup_longitude',
+                     'delivery_latitude', 'delivery_longitude'):
+            self.fields[name].required = False
+
+    def clean_payment_method(self):
+        return self.cleaned_data['payment_method'] or Delivery.PaymentMethodChoices.COD
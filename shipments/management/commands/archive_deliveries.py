@@ -0,0 +1,28 @@
+"""
+Moves old delivered and canceled deliveries to the archive.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from shipments.archive import archivable_deliveries, archive_cutoff, archive_deliveries
+
+
+class Command(BaseCommand):
+    help = 'Move delivered and canceled deliveries older than a number of days to the archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.DELIVERY_ARCHIVE_AFTER_DAYS,
+                            help='Archive deliveries last changed more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=settings.DELIVERY_ARCHIVE_BATCH_SIZE,
+                            help='Deliveries moved per transaction')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Count the deliveries that would be archived without moving them')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = archivable_deliveries(archive_cutoff(options['days'])).count()
+            self.stdout.write(f'{count} deliveries would be archived')
+            return
+
+        archived = archive_deliveries(options['days'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} deliveries'))
@@ -0,0 +1,34 @@
+"""
+Bundles open deliveries and offers the bundles to couriers.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from shipments.bundling import build_bundles
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Bundle open deliveries that share a pickup area and heading and offer them to couriers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=settings.BUNDLE_INTERVAL,
+                            help='Seconds between bundling rounds')
+        parser.add_argument('--once', action='store_true', help='Run one bundling round and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            bundles = build_bundles()
+            if bundles:
+                logger.info(
+                    'Offered %s bundles holding %s deliveries',
+                    len(bundles), sum(bundle.deliveries.count() for bundle in bundles)
+                )
+            if options['once']:
+                self.stdout.write(self.style.SUCCESS(f'Offered {len(bundles)} bundles'))
+                return
+            time.sleep(options['interval'])
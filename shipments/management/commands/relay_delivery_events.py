@@ -0,0 +1,48 @@
+"""
+Publishes delivery events from the outbox to their subscribers.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shipments.events import publish_pending_events, purge_published_events
+
+logger = logging.getLogger(__name__)
+
+PURGE_EVERY_SECONDS = 3600
+
+
+class Command(BaseCommand):
+    help = 'Relay pending delivery events to channel groups, the FastAPI tracker and notifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.DELIVERY_EVENTS_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=settings.DELIVERY_EVENTS_RELAY_INTERVAL,
+                            help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit')
+
+    def handle(self, *args, **options):
+        last_purge = 0.0
+        while True:
+            stats = publish_pending_events(options['batch_size'])
+            if stats['published'] or stats['failed']:
+                logger.info(
+                    'Relayed %(published)s delivery events (%(failed)s failed), '
+                    'max lag %(max_lag_seconds).3fs, backlog age %(backlog_age_seconds).3fs', stats
+                )
+
+            if time.monotonic() - last_purge > PURGE_EVERY_SECONDS:
+                retention = timedelta(days=settings.DELIVERY_EVENTS_RETENTION_DAYS)
+                purge_published_events(timezone.now() - retention)
+                last_purge = time.monotonic()
+
+            if stats['published'] == options['batch_size']:
+                continue
+            if options['once']:
+                self.stdout.write(self.style.SUCCESS('Outbox drained'))
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:36
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_alter_useraccount_phone_number'),
+        ('shipments', '0005_alter_delivery_item_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProofUpload',
+            fields=[
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('pickup_photo', 'Pickup Photo'), ('delivery_photo', 'Delivery Photo')], max_length=20)),
+                ('status', models.CharField(choices=[('uploading', 'Uploading'), ('completed', 'Completed'), ('aborted', 'Aborted')], default='uploading', max_length=20)),
+                ('content_type', models.CharField(blank=True, default='', max_length=50)),
+                ('total_size', models.PositiveIntegerField()),
+                ('received_bytes', models.PositiveIntegerField(default=0)),
+                ('storage_name', models.CharField(help_text='Final name of the photo in the default storage', max_length=255)),
+                ('storage_upload_id', models.CharField(blank=True, default='', help_text='Multipart upload id when writing to S3', max_length=255)),
+                ('parts', models.JSONField(blank=True, default=list)),
+                ('courier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='proof_uploads', to='accounts.courier')),
+                ('delivery', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='proof_uploads', to='shipments.delivery')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
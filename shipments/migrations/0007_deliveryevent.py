@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0006_proofupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('status_changed', 'Status Changed')], default='status_changed', max_length=50)),
+                ('previous_status', models.CharField(blank=True, default='', max_length=50)),
+                ('status', models.CharField(choices=[('creating', 'Creating'), ('processing', 'Processing'), ('pickup_in_progress', 'Pickup in progress'), ('in-progress', 'Delivery In Progress'), ('delivered', 'Delivered'), ('canceled', 'Canceled')], max_length=50)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('published_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('delivery', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='shipments.delivery')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('published_at__isnull', True)), fields=['id'], name='shipments_event_unpublished')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:54
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_alter_useraccount_phone_number'),
+        ('shipments', '0007_deliveryevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryBundle',
+            fields=[
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('offered', 'Offered'), ('accepted', 'Accepted'), ('expired', 'Expired')], default='offered', max_length=20)),
+                ('pickup_cell', models.CharField(help_text='Grid cell shared by the pickups', max_length=50)),
+                ('heading', models.PositiveSmallIntegerField(help_text='Compass sector shared by the trips')),
+                ('expires_at', models.DateTimeField()),
+                ('accepted_at', models.DateTimeField(blank=True, null=True)),
+                ('courier', models.ForeignKey(help_text='The courier the bundle is offered to', on_delete=django.db.models.deletion.CASCADE, related_name='delivery_bundles', to='accounts.courier')),
+                ('deliveries', models.ManyToManyField(related_name='bundles', to='shipments.delivery')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'expires_at'], name='shipments_d_status_83e744_idx')],
+            },
+        ),
+    ]
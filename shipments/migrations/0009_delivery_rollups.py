@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:59
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0008_deliverybundle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=10)),
+                ('scope', models.CharField(choices=[('courier', 'Courier'), ('customer', 'Customer'), ('platform', 'Platform')], max_length=20)),
+                ('subject_id', models.CharField(blank=True, default='', help_text='The courier or customer id, empty for the platform', max_length=36)),
+                ('period_start', models.DateTimeField()),
+                ('deliveries', models.PositiveIntegerField(default=0)),
+                ('cancellations', models.PositiveIntegerField(default=0)),
+                ('distance_km', models.FloatField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('earnings', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-period_start'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('source', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('processed_until', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='deliveryevent',
+            index=models.Index(fields=['created_at'], name='shipments_d_created_572fc3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryrollup',
+            index=models.Index(fields=['granularity', 'period_start'], name='shipments_d_granula_b0b454_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='deliveryrollup',
+            constraint=models.UniqueConstraint(fields=('granularity', 'scope', 'subject_id', 'period_start'), name='shipments_rollup_unique_period'),
+        ),
+    ]
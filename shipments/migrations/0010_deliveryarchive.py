@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:14
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_alter_useraccount_phone_number'),
+        ('shipments', '0009_delivery_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryArchive',
+            fields=[
+                ('item_name', models.CharField(help_text='Name of item to be delivered', max_length=255, verbose_name='Item Name')),
+                ('item_type', models.CharField(choices=[('Food', 'Food'), ('documents', 'Documents'), ('gadgets', 'Gadgets'), ('appliances', 'Appliances'), ('furniture', 'Furniture'), ('clothing_&_apparel', 'Clothing & Apparel'), ('health_&_beauty', 'Health & Beauty'), ('sports_&_outdoor', 'Sports & Outdoor'), ('beverages', 'Beverages'), ('office_supplies', 'Office Supplies'), ('electrical_&_industrial_equipments', 'Electrical & Industrial Equipments'), ('medical_supplies', 'Medical Supplies'), ('packaging_material', 'Packaging Material'), ('goods', 'Goods'), ('others', 'Others')], default='goods', help_text='Select the type of item to be delivered', max_length=50)),
+                ('size', models.CharField(choices=[('small', 'Small'), ('medium', 'Medium'), ('large', 'Large'), ('extra_large', 'Extra Large')], default='small', help_text='Select the size of type to be delivered', max_length=20)),
+                ('photo', models.ImageField(blank=True, null=True, upload_to='')),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('status', models.CharField(choices=[('creating', 'Creating'), ('processing', 'Processing'), ('pickup_in_progress', 'Pickup in progress'), ('in-progress', 'Delivery In Progress'), ('delivered', 'Delivered'), ('canceled', 'Canceled')], default='creating', max_length=50)),
+                ('pickup_address', models.CharField(max_length=255, null=True)),
+                ('pickup_latitude', models.FloatField(default=0)),
+                ('pickup_longitude', models.FloatField(default=0)),
+                ('pickup_photo', models.ImageField(blank=True, null=True, upload_to='')),
+                ('sender_name', models.CharField(help_text='Name of the sender or the person to be picked up from', max_length=255, null=True)),
+                ('sender_phone', models.CharField(help_text='Phone number of the sender or the person to be picked up from', max_length=14, null=True)),
+                ('delivery_address', models.CharField(max_length=255, null=True)),
+                ('delivery_latitude', models.FloatField(default=0)),
+                ('delivery_longitude', models.FloatField(default=0)),
+                ('recipient_name', models.CharField(help_text='Name of the receiver or the person to be delivered to', max_length=255, null=True)),
+                ('recipient_phone', models.CharField(help_text='Name of the receiver or the person to be delivered to', max_length=14, null=True)),
+                ('delivery_photo', models.ImageField(blank=True, null=True, upload_to='')),
+                ('duration', models.IntegerField(default=0)),
+                ('distance', models.FloatField(default=0)),
+                ('price', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('pickedup_at', models.DateTimeField(blank=True, null=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('tracking_number', models.CharField(blank=True, default='', max_length=255, null=True)),
+                ('payment_method', models.CharField(choices=[('wallet', 'Wallet Balance'), ('card', 'Card Payment'), ('cod', 'Cash on Delivery')], default='card', max_length=50)),
+                ('id', models.UUIDField(editable=False, help_text='The id the delivery had before it was archived', primary_key=True, serialize=False)),
+                ('uuid', models.UUIDField(editable=False)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('transactions', models.JSONField(blank=True, default=list, help_text='The payment transactions of the delivery when it was archived')),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('courier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_courier_deliveries', to='accounts.courier')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_deliveries', to='accounts.customer')),
+            ],
+            options={
+                'verbose_name_plural': 'Archived deliveries',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['customer', '-created_at'], name='shipments_d_custome_be6d37_idx'), models.Index(fields=['courier', '-created_at'], name='shipments_d_courier_c97036_idx')],
+            },
+        ),
+    ]
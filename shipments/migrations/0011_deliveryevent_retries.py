@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0010_deliveryarchive'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='deliveryevent',
+            name='shipments_event_unpublished',
+        ),
+        migrations.AddField(
+            model_name='deliveryevent',
+            name='failed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='deliveryevent',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryevent',
+            index=models.Index(condition=models.Q(('failed_at__isnull', True), ('published_at__isnull', True)), fields=['id'], name='shipments_event_pending'),
+        ),
+    ]
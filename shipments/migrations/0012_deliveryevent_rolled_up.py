@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:58
+
+from django.db import migrations, models
+
+
+def mark_rolled_up_events(apps, schema_editor):
+    # Events up to the old created_at watermark are already in the rollups.
+    DeliveryEvent = apps.get_model('shipments', 'DeliveryEvent')
+    RollupWatermark = apps.get_model('shipments', 'RollupWatermark')
+    watermark = RollupWatermark.objects.filter(source='delivery_events').first()
+    if watermark and watermark.processed_until:
+        DeliveryEvent.objects.filter(created_at__lte=watermark.processed_until).update(rolled_up=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0011_deliveryevent_retries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliveryevent',
+            name='rolled_up',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryevent',
+            index=models.Index(condition=models.Q(('rolled_up', False), ('status__in', ['delivered', 'canceled'])), fields=['id'], name='shipments_event_rollup'),
+        ),
+        migrations.RunPython(mark_rolled_up_events, migrations.RunPython.noop),
+    ]
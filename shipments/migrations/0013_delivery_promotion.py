@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:24
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_ratingchange'),
+        ('shipments', '0012_deliveryevent_rolled_up'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery',
+            name='discount',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='promotion',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.promotion'),
+        ),
+    ]
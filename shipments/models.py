@@ -3,6 +3,7 @@ This contains all models for the shipments app.
 """
 import secrets
 import uuid
+from collections import Counter
 from decimal import Decimal
 
 from django.db import models
@@ -13,9 +14,9 @@ from deliveet.utils.finance import Paystack
 
 
 # Create your models here.
-class Delivery(BaseModel):
+class AbstractDelivery(models.Model):
     """
-    This contains fields for requesting delivery of items
+    This contains the fields deliveries share with archived deliveries
     """
 
     class StatusChoices(models.TextChoices):
@@ -66,23 +67,6 @@ class Delivery(BaseModel):
         CARD = 'card', 'Card Payment'
         COD = 'cod', 'Cash on Delivery'
 
-    id = models.UUIDField(
-        primary_key=True,
-        default=uuid.uuid4,
-        editable=False
-    )
-    customer = models.ForeignKey(
-        Customer,
-        on_delete=models.CASCADE,
-        related_name='user_deliveries',
-    )
-    courier = models.ForeignKey(
-        Courier,
-        on_delete=models.CASCADE,
-        related_name='courier_deliveries',
-        null=True,
-        blank=True
-    )
     item_name = models.CharField(
         help_text='Name of item to be delivered',
         verbose_name='Item Name',
@@ -195,6 +179,47 @@ class Delivery(BaseModel):
         default=PaymentMethodChoices.CARD
     )
 
+    class Meta:
+        abstract = True
+
+
+class Delivery(BaseModel, AbstractDelivery):
+    """
+    This contains fields for requesting delivery of items
+    """
+
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.CASCADE,
+        related_name='user_deliveries',
+    )
+    courier = models.ForeignKey(
+        Courier,
+        on_delete=models.CASCADE,
+        related_name='courier_deliveries',
+        null=True,
+        blank=True
+    )
+    # A card payment's promotion is redeemed, and its discount taken off
+    # the price, once the payment is verified.
+    promotion = models.ForeignKey(
+        'api.Promotion',
+        on_delete=models.SET_NULL,
+        related_name='+',
+        null=True,
+        blank=True
+    )
+    discount = models.DecimalField(
+        default=Decimal('0.00'),
+        decimal_places=2,
+        max_digits=10
+    )
+
     class Meta:
         """"
         This is the metaclass for the model
@@ -209,12 +234,35 @@ class Delivery(BaseModel):
         """
         return self.item_name
 
+    @property
+    def amount_due(self):
+        """
+        This is the price the customer pays, less the discount of a
+        promotion that is not redeemed yet
+        """
+        return self.price - self.discount
+
     # def __str__(self):
     #     """
     #     This returns a string representation of the model
     #     """
     #     return f"{self.get_payment_method_display()}"
 
+    @staticmethod
+    def assign_tracking_numbers(deliveries):
+        """
+        This gives deliveries about to be inserted with bulk_create, which
+        skips save(), unique tracking numbers
+        """
+        pending = [delivery for delivery in deliveries if not delivery.tracking_number]
+        while pending:
+            for delivery in pending:
+                delivery.tracking_number = secrets.token_urlsafe(8)
+            numbers = Counter(delivery.tracking_number for delivery in pending)
+            taken = set(Delivery.objects.filter(tracking_number__in=numbers).values_list('tracking_number', flat=True))
+            taken.update(number for number, count in numbers.items() if count > 1)
+            pending = [delivery for delivery in pending if delivery.tracking_number in taken]
+
     def save(self, *args, **kwargs):
         """
         This is the save method for the delivery model
@@ -229,6 +277,222 @@ class Delivery(BaseModel):
         super().save(*args, **kwargs)
 
 
+class ProofUpload(BaseModel):
+    """
+    This tracks a resumable, chunked upload of a pickup or delivery photo
+    """
+
+    class KindChoices(models.TextChoices):
+        """
+        This defines which proof photo of the delivery is being uploaded
+        """
+        PICKUP_PHOTO = 'pickup_photo', 'Pickup Photo'
+        DELIVERY_PHOTO = 'delivery_photo', 'Delivery Photo'
+
+    class StatusChoices(models.TextChoices):
+        """
+        This defines the different statuses of an upload
+        """
+        UPLOADING = 'uploading', 'Uploading'
+        COMPLETED = 'completed', 'Completed'
+        ABORTED = 'aborted', 'Aborted'
+
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    delivery = models.ForeignKey(
+        Delivery,
+        on_delete=models.CASCADE,
+        related_name='proof_uploads',
+    )
+    courier = models.ForeignKey(
+        Courier,
+        on_delete=models.CASCADE,
+        related_name='proof_uploads',
+    )
+    kind = models.CharField(
+        max_length=20,
+        choices=KindChoices.choices,
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=StatusChoices.choices,
+        default=StatusChoices.UPLOADING
+    )
+    content_type = models.CharField(
+        max_length=50,
+        default='',
+        blank=True
+    )
+    total_size = models.PositiveIntegerField()
+    received_bytes = models.PositiveIntegerField(
+        default=0
+    )
+    storage_name = models.CharField(
+        max_length=255,
+        help_text='Final name of the photo in the default storage'
+    )
+    storage_upload_id = models.CharField(
+        max_length=255,
+        default='',
+        blank=True,
+        help_text='Multipart upload id when writing to S3'
+    )
+    parts = models.JSONField(
+        default=list,
+        blank=True
+    )
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.get_kind_display()} for {self.delivery_id}'
+
+
+class DeliveryEvent(models.Model):
+    """
+    This is the outbox of delivery events. Each row is written in the same
+    transaction as the change it describes and later published by the relay.
+    """
+
+    class EventTypeChoices(models.TextChoices):
+        """
+        This defines the kinds of delivery events
+        """
+        STATUS_CHANGED = 'status_changed', 'Status Changed'
+
+    delivery = models.ForeignKey(
+        Delivery,
+        on_delete=models.CASCADE,
+        related_name='events',
+    )
+    event_type = models.CharField(
+        max_length=50,
+        choices=EventTypeChoices.choices,
+        default=EventTypeChoices.STATUS_CHANGED
+    )
+    previous_status = models.CharField(
+        max_length=50,
+        default='',
+        blank=True
+    )
+    status = models.CharField(
+        max_length=50,
+        choices=Delivery.StatusChoices.choices,
+    )
+    payload = models.JSONField(
+        default=dict,
+        blank=True
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True
+    )
+    published_at = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+    attempts = models.PositiveIntegerField(
+        default=0
+    )
+    last_error = models.TextField(
+        default='',
+        blank=True
+    )
+    # A failed event waits until next_attempt_at; failed_at marks an event
+    # the relay gave up on after DELIVERY_EVENTS_MAX_ATTEMPTS.
+    next_attempt_at = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+    failed_at = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+    # Set once a completed or canceled event is added to the rollups
+    rolled_up = models.BooleanField(
+        default=False
+    )
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(
+                fields=['id'],
+                condition=models.Q(published_at__isnull=True, failed_at__isnull=True),
+                name='shipments_event_pending',
+            ),
+            models.Index(
+                fields=['id'],
+                condition=models.Q(rolled_up=False, status__in=['delivered', 'canceled']),
+                name='shipments_event_rollup',
+            ),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.delivery_id}: {self.previous_status} -> {self.status}'
+
+
+class DeliveryBundle(BaseModel):
+    """
+    This groups open deliveries that share a pickup area and direction
+    so they are offered to one courier together
+    """
+
+    class StatusChoices(models.TextChoices):
+        """
+        This defines the statuses of a bundle offer
+        """
+        OFFERED = 'offered', 'Offered'
+        ACCEPTED = 'accepted', 'Accepted'
+        EXPIRED = 'expired', 'Expired'
+
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    deliveries = models.ManyToManyField(
+        Delivery,
+        related_name='bundles',
+    )
+    courier = models.ForeignKey(
+        Courier,
+        on_delete=models.CASCADE,
+        related_name='delivery_bundles',
+        help_text='The courier the bundle is offered to'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=StatusChoices.choices,
+        default=StatusChoices.OFFERED
+    )
+    pickup_cell = models.CharField(
+        max_length=50,
+        help_text='Grid cell shared by the pickups'
+    )
+    heading = models.PositiveSmallIntegerField(
+        help_text='Compass sector shared by the trips'
+    )
+    expires_at = models.DateTimeField()
+    accepted_at = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.pickup_cell}/{self.heading} ({self.get_status_display()})'
+
+
 class DeliveryTransaction(BaseModel):
     """
     This contains fields for delivery transactions
@@ -301,3 +565,153 @@ class DeliveryTransaction(BaseModel):
         return False
 
     pass
+
+
+class DeliveryRollup(models.Model):
+    """
+    This holds delivery totals for one courier, one customer or the whole
+    platform over one hour or one day
+    """
+
+    class GranularityChoices(models.TextChoices):
+        """
+        This defines the length of a rollup period
+        """
+        HOUR = 'hour', 'Hour'
+        DAY = 'day', 'Day'
+
+    class ScopeChoices(models.TextChoices):
+        """
+        This defines what a rollup is kept for
+        """
+        COURIER = 'courier', 'Courier'
+        CUSTOMER = 'customer', 'Customer'
+        PLATFORM = 'platform', 'Platform'
+
+    granularity = models.CharField(
+        max_length=10,
+        choices=GranularityChoices.choices
+    )
+    scope = models.CharField(
+        max_length=20,
+        choices=ScopeChoices.choices
+    )
+    subject_id = models.CharField(
+        max_length=36,
+        default='',
+        blank=True,
+        help_text='The courier or customer id, empty for the platform'
+    )
+    period_start = models.DateTimeField()
+    deliveries = models.PositiveIntegerField(
+        default=0
+    )
+    cancellations = models.PositiveIntegerField(
+        default=0
+    )
+    distance_km = models.FloatField(
+        default=0
+    )
+    revenue = models.DecimalField(
+        default=Decimal('0.00'),
+        decimal_places=2,
+        max_digits=14
+    )
+    earnings = models.DecimalField(
+        default=Decimal('0.00'),
+        decimal_places=2,
+        max_digits=14
+    )
+    rating_sum = models.PositiveIntegerField(
+        default=0
+    )
+    rating_count = models.PositiveIntegerField(
+        default=0
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True
+    )
+
+    class Meta:
+        ordering = ['-period_start']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['granularity', 'scope', 'subject_id', 'period_start'],
+                name='shipments_rollup_unique_period',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['granularity', 'period_start']),
+        ]
+
+    def __str__(self):
+        return f'{self.scope} {self.subject_id} {self.granularity} {self.period_start:%Y-%m-%d %H:00}'
+
+
+class RollupWatermark(models.Model):
+    """
+    This records when each source was last added to the rollups. A run
+    locks the rows, so runs add the sources one after another.
+    """
+    source = models.CharField(
+        max_length=50,
+        primary_key=True
+    )
+    processed_until = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True
+    )
+
+    def __str__(self):
+        return f'{self.source} until {self.processed_until}'
+
+
+class DeliveryArchive(AbstractDelivery):
+    """
+    This holds a delivered or canceled delivery moved out of the delivery
+    table once it is old enough to only show up in history
+    """
+    id = models.UUIDField(
+        primary_key=True,
+        editable=False,
+        help_text='The id the delivery had before it was archived'
+    )
+    uuid = models.UUIDField(
+        editable=False
+    )
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.CASCADE,
+        related_name='archived_deliveries',
+    )
+    courier = models.ForeignKey(
+        Courier,
+        on_delete=models.CASCADE,
+        related_name='archived_courier_deliveries',
+        null=True,
+        blank=True
+    )
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    transactions = models.JSONField(
+        default=list,
+        blank=True,
+        help_text='The payment transactions of the delivery when it was archived'
+    )
+    archived_at = models.DateTimeField(
+        auto_now_add=True
+    )
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = 'Archived deliveries'
+        indexes = [
+            models.Index(fields=['customer', '-created_at']),
+            models.Index(fields=['courier', '-created_at']),
+        ]
+
+    def __str__(self):
+        return self.item_name
@@ -0,0 +1,82 @@
+"""
+This module prices deliveries from the road distance between their
+pickup and drop-off addresses.
+
+Distances come from the Google Distance Matrix API. quote_routes() looks
+up many routes at once for bulk orders: identical routes are looked up
+once, and lookups run on at most BULK_DELIVERY_LOOKUP_WORKERS threads that
+each keep their connection open, so a batch of hundreds of orders takes a
+few round trips of wall time instead of one per order.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import requests
+from django.conf import settings
+
+DISTANCE_MATRIX_URL = 'https://maps.googleapis.com/maps/api/distancematrix/json'
+
+PRICE_PER_KM = Decimal('450')
+
+
+class DistanceLookupError(Exception):
+    """
+    This is raised when the distance between two addresses is unknown
+    """
+
+
+def lookup_distance(origin, destination, session=None):
+    """
+    This returns the road distance in km and the duration in minutes
+    between two addresses
+    """
+    response = (session or requests).get(
+        DISTANCE_MATRIX_URL,
+        params={'origins': origin, 'destinations': destination, 'key': settings.GOOGLE_MAP_API_KEY},
+        timeout=settings.DISTANCE_LOOKUP_TIMEOUT,
+    )
+    data = response.json()
+    if data.get('status') != 'OK':
+        raise DistanceLookupError('Unable to calculate distance. Please check the addresses.')
+
+    element = data['rows'][0]['elements'][0]
+    if element.get('status', 'OK') != 'OK':
+        raise DistanceLookupError('Unable to calculate distance. Please check the addresses.')
+    distance = element['distance']['value']  # Distance in meters
+    duration = element['duration']['value']  # Duration in seconds
+    return round(distance / 1000, 2), int(duration / 60)
+
+
+def price_for_distance(distance):
+    """
+    This returns the price of a delivery over distance km
+    """
+    return (Decimal(str(distance)) * PRICE_PER_KM).quantize(Decimal('0.01'))
+
+
+def quote_routes(routes, max_workers=None):
+    """
+    This looks up the distance of each (origin, destination) route and
+    returns a dict mapping every route to (distance, duration) or to the
+    DistanceLookupError raised for it
+    """
+    routes = list(dict.fromkeys(routes))
+    if not routes:
+        return {}
+    max_workers = max_workers or settings.BULK_DELIVERY_LOOKUP_WORKERS
+    local = threading.local()
+
+    def quote(route):
+        # requests sessions are not thread safe, so each worker keeps its own.
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        try:
+            return lookup_distance(*route, session=local.session)
+        except DistanceLookupError as error:
+            return error
+        except Exception as error:
+            return DistanceLookupError(f'Unable to calculate distance: {error}')
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(routes))) as executor:
+        return dict(zip(routes, executor.map(quote, routes)))
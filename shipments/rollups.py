@@ -0,0 +1,268 @@
+"""
+This module keeps the delivery analytics rollups up to date.
+
+Completed and canceled deliveries and rating changes are added to hourly
+and daily DeliveryRollup rows per courier, per customer and for the whole
+platform. Each run of update_rollups() reads only what has not been added
+yet: delivery events are flagged rolled_up, and RatingChange rows, which
+api.ratings queues for every new, edited and deleted rating, are deleted
+once added. The rollups and the flags are saved in the same transaction,
+so each event is counted exactly once even when a run fails, and a row
+whose transaction commits late is simply picked up by the next run. Runs
+lock their RollupWatermark rows, so they add the sources one at a time.
+
+Periods are UTC hours and days. The rows a run changes are pushed to the
+FastAPI analytics store, which answers period queries from them.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from api.models import RatingChange
+from shipments.models import Delivery, DeliveryEvent, DeliveryRollup, RollupWatermark
+
+logger = logging.getLogger(__name__)
+
+COURIER_SHARE = Decimal('0.9')
+
+DELIVERY_EVENTS_SOURCE = 'delivery_events'
+RATINGS_SOURCE = 'ratings'
+SOURCES = [DELIVERY_EVENTS_SOURCE, RATINGS_SOURCE]
+
+ROLLUP_FIELDS = ['deliveries', 'cancellations', 'distance_km', 'revenue', 'earnings', 'rating_sum', 'rating_count']
+
+FULL_SYNC_CACHE_KEY = 'delivery_rollups:full_sync_needed'
+
+Granularity = DeliveryRollup.GranularityChoices
+Scope = DeliveryRollup.ScopeChoices
+
+
+def period_starts(moment):
+    """
+    This returns the (granularity, period start) pairs a moment falls in
+    """
+    hour = moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return [(Granularity.HOUR, hour), (Granularity.DAY, hour.replace(hour=0))]
+
+
+def _empty_totals():
+    return {
+        'deliveries': 0,
+        'cancellations': 0,
+        'distance_km': 0.0,
+        'revenue': Decimal('0.00'),
+        'earnings': Decimal('0.00'),
+        'rating_sum': 0,
+        'rating_count': 0,
+    }
+
+
+def _add(totals, moment, subjects, **increments):
+    for granularity, period_start in period_starts(moment):
+        for scope, subject_id in subjects:
+            row = totals[(granularity, scope, subject_id, period_start)]
+            for field, value in increments.items():
+                row[field] += value
+
+
+def _chunks(ids, size=1000):
+    for index in range(0, len(ids), size):
+        yield ids[index:index + size]
+
+
+def add_delivery_events(totals):
+    """
+    This adds the completed or canceled deliveries not rolled up yet to
+    totals, flags their events and returns the number of events read
+    """
+    events = DeliveryEvent.objects.filter(
+        rolled_up=False,
+        status__in=[Delivery.StatusChoices.COMPLETED, Delivery.StatusChoices.CANCELED],
+    )
+
+    ids = []
+    for event_id, created_at, status, price, distance, customer_id, courier_id in events.values_list(
+        'id', 'created_at', 'status', 'delivery__price', 'delivery__distance',
+        'delivery__customer_id', 'delivery__courier_id',
+    ).iterator():
+        subjects = [(Scope.PLATFORM, ''), (Scope.CUSTOMER, str(customer_id))]
+        if courier_id:
+            subjects.append((Scope.COURIER, str(courier_id)))
+
+        if status == Delivery.StatusChoices.COMPLETED:
+            _add(
+                totals, created_at, subjects,
+                deliveries=1,
+                distance_km=distance,
+                revenue=price,
+                earnings=(price * COURIER_SHARE).quantize(Decimal('0.01')),
+            )
+        else:
+            _add(totals, created_at, subjects, cancellations=1)
+        ids.append(event_id)
+
+    for chunk in _chunks(ids):
+        DeliveryEvent.objects.filter(id__in=chunk).update(rolled_up=True)
+    return len(ids)
+
+
+def add_ratings(totals):
+    """
+    This adds the queued rating changes to totals, in the period each
+    rating was given, deletes them and returns the number read. Ratings of
+    couriers also count towards the platform.
+    """
+    ids = []
+    for change_id, rated_at, rating_delta, count_delta, rated_user_id, courier_id in (
+        RatingChange.objects.values_list(
+            'id', 'rated_at', 'rating_delta', 'count_delta', 'rated_user_id', 'rated_user__courier_account__user_id',
+        ).order_by().iterator()
+    ):
+        if courier_id:
+            subjects = [(Scope.PLATFORM, ''), (Scope.COURIER, str(rated_user_id))]
+        else:
+            subjects = [(Scope.CUSTOMER, str(rated_user_id))]
+        _add(totals, rated_at, subjects, rating_sum=rating_delta, rating_count=count_delta)
+        ids.append(change_id)
+
+    for chunk in _chunks(ids):
+        RatingChange.objects.filter(id__in=chunk).delete()
+    return len(ids)
+
+
+def apply_totals(totals):
+    """
+    This adds totals to the rollup rows, creating missing rows, and
+    returns the rows changed. Callers must hold the watermark locks.
+    """
+    if not totals:
+        return []
+
+    existing = {
+        (row.granularity, row.scope, row.subject_id, row.period_start): row
+        for row in DeliveryRollup.objects.filter(
+            period_start__in={key[3] for key in totals},
+            subject_id__in={key[2] for key in totals},
+        )
+    }
+    created, changed = [], []
+    for key, increments in totals.items():
+        row = existing.get(key)
+        if row is None:
+            granularity, scope, subject_id, period_start = key
+            created.append(DeliveryRollup(
+                granularity=granularity,
+                scope=scope,
+                subject_id=subject_id,
+                period_start=period_start,
+                **increments,
+            ))
+            continue
+        for field, value in increments.items():
+            setattr(row, field, getattr(row, field) + value)
+        row.updated_at = timezone.now()
+        changed.append(row)
+
+    DeliveryRollup.objects.bulk_create(created)
+    DeliveryRollup.objects.bulk_update(changed, ROLLUP_FIELDS + ['updated_at'])
+    return created + changed
+
+
+def update_rollups(now=None):
+    """
+    This adds everything recorded since the last run to the rollups and
+    returns the rows changed
+    """
+    now = now or timezone.now()
+    for source in SOURCES:
+        RollupWatermark.objects.get_or_create(source=source)
+
+    with transaction.atomic():
+        watermarks = {
+            watermark.source: watermark
+            for watermark in RollupWatermark.objects.select_for_update().filter(source__in=SOURCES)
+        }
+        totals = defaultdict(_empty_totals)
+        read = {}
+        for source, add in ((DELIVERY_EVENTS_SOURCE, add_delivery_events), (RATINGS_SOURCE, add_ratings)):
+            read[source] = add(totals)
+            watermarks[source].processed_until = now
+            watermarks[source].save(update_fields=['processed_until', 'updated_at'])
+
+        rows = apply_totals(totals)
+
+    if any(read.values()):
+        logger.info('Rolled up %s, %s rollup rows changed', read, len(rows))
+    return rows
+
+
+def recent_rollups(now=None):
+    """
+    This returns the rows the analytics store keeps: daily rows for the
+    last DELIVERY_ROLLUP_SYNC_DAYS and hourly rows for the last two days
+    """
+    now = now or timezone.now()
+    return list(DeliveryRollup.objects.filter(
+        Q(granularity=Granularity.DAY, period_start__gte=now - timedelta(days=settings.DELIVERY_ROLLUP_SYNC_DAYS))
+        | Q(granularity=Granularity.HOUR, period_start__gte=now - timedelta(days=2))
+    ))
+
+
+def _serialize(row):
+    return {
+        'granularity': row.granularity,
+        'scope': row.scope,
+        'subject_id': row.subject_id,
+        'period_start': row.period_start.isoformat(),
+        'deliveries': row.deliveries,
+        'cancellations': row.cancellations,
+        'distance_km': row.distance_km,
+        'revenue': float(row.revenue),
+        'earnings': float(row.earnings),
+        'rating_sum': row.rating_sum,
+        'rating_count': row.rating_count,
+    }
+
+
+def push_rollups(rows):
+    """
+    This sends changed rows to the FastAPI analytics store. The whole recent
+    window is sent instead when the store asks for it (after a restart) or
+    when an earlier push failed. Returns the number of rows sent.
+    """
+    if not settings.FASTAPI_SERVICE_URL:
+        return 0
+
+    full = bool(cache.get(FULL_SYNC_CACHE_KEY))
+    try:
+        if not full:
+            response = _post_rollups(rows, full=False)
+            full = response.get('needs_full_sync', False)
+        if full:
+            rows = recent_rollups()
+            _post_rollups(rows, full=True)
+    except Exception as error:
+        logger.warning('Pushing %s rollup rows failed: %s', len(rows), error)
+        cache.set(FULL_SYNC_CACHE_KEY, True, timeout=None)
+        return 0
+
+    cache.delete(FULL_SYNC_CACHE_KEY)
+    return len(rows)
+
+
+def _post_rollups(rows, full):
+    response = requests.post(
+        f'{settings.FASTAPI_SERVICE_URL}/api/v1/analytics/rollups',
+        json={'full': full, 'rollups': [_serialize(row) for row in rows]},
+        timeout=settings.DELIVERY_ROLLUP_SINK_TIMEOUT,
+    )
+    response.raise_for_status()
+    return response.json()
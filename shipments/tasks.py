@@ -0,0 +1,34 @@
+"""
+This module contains the Celery tasks of the shipments app.
+"""
+from celery import shared_task
+
+from shipments import archive, courier_stats, rollups
+
+
+@shared_task(ignore_result=True)
+def update_delivery_rollups():
+    """
+    This adds new deliveries, cancellations and ratings to the analytics
+    rollups and pushes the changed rows to the FastAPI service
+    """
+    rows = rollups.update_rollups()
+    rollups.push_rollups(rows)
+    return len(rows)
+
+
+@shared_task(ignore_result=True)
+def archive_deliveries():
+    """
+    This moves old delivered and canceled deliveries to the archive
+    """
+    return archive.archive_deliveries()
+
+
+@shared_task(ignore_result=True)
+def push_courier_stats():
+    """
+    This sends the rating and active deliveries of every courier to the
+    FastAPI matching service
+    """
+    return courier_stats.push_courier_stats()
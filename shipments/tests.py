@@ -1,3 +1,831 @@
-from django.test import TestCase
+"""
+Tests for the shipments app
+"""
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import requests
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.middleware.csrf import CsrfViewMiddleware
+from django.db.models import Sum
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.utils import timezone
+
+from accounts.models import UserAccount, Customer, Courier
+from finance.models import Wallet, WalletTransaction
+from api.models import Promotion, Rating
+from shipments import archive, bundling, courier_stats, events, pricing, rollups, transitions, uploads
+from shipments.forms import PaymentMethodForm
+from shipments.views import (
+    bulk_create_deliveries_api, create_delivery_task_view, handle_payment_form, submit_payment, verify_delivery_payment,
+)
+from shipments.models import (
+    Delivery, DeliveryArchive, DeliveryBundle, DeliveryEvent, DeliveryRollup, DeliveryTransaction, ProofUpload,
+)
+
+try:
+    from botocore.exceptions import ClientError
+    from botocore.stub import Stubber
+except ImportError:
+    ClientError = Stubber = None
+
+JPEG_BYTES = b'\xff\xd8\xff\xe0' + b'\x00' * 2044
+
+S3_STORAGES = {
+    'default': {
+        'BACKEND': 'storages.backends.s3boto3.S3Boto3Storage',
+        'OPTIONS': {
+            'bucket_name': 'deliveet-test',
+            'access_key': 'test',
+            'secret_key': 'test',
+            'region_name': 'us-east-1',
+            'location': 'media',
+        },
+    },
+}
+
+
+def create_courier(email='courier@test.com'):
+    user = UserAccount.objects.create_user(
+        email=email,
+        password='CourierPass123!',
+        first_name='Jane',
+        last_name='Smith',
+        account_type=UserAccount.UserAccountType.COURIER,
+        is_courier=True,
+    )
+    return Courier.objects.create(user=user)
+
+
+def create_customer(email='customer@test.com'):
+    user = UserAccount.objects.create_user(
+        email=email,
+        password='CustomerPass123!',
+        first_name='John',
+        last_name='Doe',
+        is_customer=True,
+    )
+    return Customer.objects.create(user=user)
+
+
+def create_delivery(customer, **kwargs):
+    kwargs.setdefault('item_name', 'Parcel')
+    kwargs.setdefault('status', Delivery.StatusChoices.PROCESSING)
+    return Delivery.objects.create(customer=customer, **kwargs)
+
+
+class ProofUploadTests(TestCase):
+    """Test resumable proof of delivery uploads"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            USE_S3=False,
+            PROOF_UPLOAD_CHUNK_SIZE=1024,
+            PROOF_UPLOAD_MAX_SIZE=4096,
+        )
+        self.settings_override.enable()
+        self.courier = create_courier()
+        self.delivery = create_delivery(
+            create_customer(),
+            courier=self.courier,
+            status=Delivery.StatusChoices.PICKUP_IN_PROGRESS,
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def send(self, upload, data, start):
+        end = start + len(data) - 1
+        return uploads.write_chunk(
+            upload.id, self.courier, io.BytesIO(data), f'bytes {start}-{end}/{upload.total_size}'
+        )
+
+    def test_chunks_finalize_upload_and_status(self):
+        upload = uploads.start_upload(self.delivery, self.courier, len(JPEG_BYTES))
+        self.assertEqual(upload.kind, ProofUpload.KindChoices.PICKUP_PHOTO)
+
+        upload = self.send(upload, JPEG_BYTES[:1024], 0)
+        self.assertEqual(upload.received_bytes, 1024)
+        self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.status, Delivery.StatusChoices.PICKUP_IN_PROGRESS)
+
+        upload = self.send(upload, JPEG_BYTES[1024:], 1024)
+        self.assertEqual(upload.status, ProofUpload.StatusChoices.COMPLETED)
+        self.assertEqual(upload.content_type, 'image/jpeg')
+
+        self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.status, Delivery.StatusChoices.DELIVERY_IN_PROGRESS)
+        self.assertIsNotNone(self.delivery.pickedup_at)
+        self.assertEqual(self.delivery.events.get().status, Delivery.StatusChoices.DELIVERY_IN_PROGRESS)
+        with open(os.path.join(self.media_root, self.delivery.pickup_photo.name), 'rb') as photo:
+            self.assertEqual(photo.read(), JPEG_BYTES)
+
+    def test_out_of_order_chunk_reports_resume_offset(self):
+        upload = uploads.start_upload(self.delivery, self.courier, len(JPEG_BYTES))
+        self.send(upload, JPEG_BYTES[:1024], 0)
+
+        with self.assertRaises(uploads.UploadError) as error:
+            self.send(upload, JPEG_BYTES[1024:], 1000)
+        self.assertEqual(error.exception.status_code, 409)
+        self.assertEqual(error.exception.offset, 1024)
+
+    def test_chunk_overtaken_while_written_is_not_counted(self):
+        upload = uploads.start_upload(self.delivery, self.courier, len(JPEG_BYTES))
+        write_chunk = uploads.LocalChunkWriter.write_chunk
+
+        def overtaken(writer, stream, length):
+            written = write_chunk(writer, stream, length)
+            ProofUpload.objects.filter(id=upload.id).update(received_bytes=1024)
+            return written
+
+        with mock.patch.object(uploads.LocalChunkWriter, 'write_chunk', overtaken):
+            with self.assertRaises(uploads.UploadError) as error:
+                self.send(upload, JPEG_BYTES[:1024], 0)
+        self.assertEqual((error.exception.status_code, error.exception.offset), (409, 1024))
+
+    @skipUnless(Stubber, 'boto3 is not installed')
+    @override_settings(USE_S3=True, STORAGES=S3_STORAGES, PROOF_UPLOAD_CHUNK_SIZE=4096)
+    def test_retried_first_chunk_reuses_the_s3_upload(self):
+        upload = uploads.start_upload(self.delivery, self.courier, len(JPEG_BYTES))
+        key = f'media/proofs/{self.delivery.id}/{upload.kind}-{upload.id}.jpg'
+        part = {'Bucket': 'deliveet-test', 'Key': key, 'UploadId': 'multipart-1', 'PartNumber': 1, 'Body': JPEG_BYTES}
+
+        with Stubber(default_storage.connection.meta.client) as stubber:
+            stubber.add_response(
+                'create_multipart_upload',
+                {'Bucket': 'deliveet-test', 'Key': key, 'UploadId': 'multipart-1'},
+                {'Bucket': 'deliveet-test', 'Key': key, 'ContentType': 'image/jpeg'},
+            )
+            stubber.add_client_error('upload_part', 'InternalError', http_status_code=500, expected_params=part)
+            stubber.add_response('upload_part', {'ETag': '"etag-1"'}, part)
+            stubber.add_response('complete_multipart_upload', {}, {
+                'Bucket': 'deliveet-test',
+                'Key': key,
+                'UploadId': 'multipart-1',
+                'MultipartUpload': {'Parts': [{'PartNumber': 1, 'ETag': '"etag-1"'}]},
+            })
+
+            with self.assertRaises(ClientError):
+                self.send(upload, JPEG_BYTES, 0)
+            upload = self.send(upload, JPEG_BYTES, 0)
+            stubber.assert_no_pending_responses()
+
+        self.assertEqual(upload.status, ProofUpload.StatusChoices.COMPLETED)
+        self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.status, Delivery.StatusChoices.DELIVERY_IN_PROGRESS)
+
+    @override_settings(USE_S3=True)
+    def test_small_chunk_before_the_last_is_rejected_on_s3(self):
+        upload = uploads.start_upload(self.delivery, self.courier, len(JPEG_BYTES))
+
+        with self.assertRaises(uploads.UploadError) as error:
+            self.send(upload, JPEG_BYTES[:1024], 0)
+        self.assertEqual(error.exception.status_code, 400)
+        upload.refresh_from_db()
+        self.assertEqual(upload.received_bytes, 0)
+
+    def test_first_chunk_rejects_non_photo(self):
+        upload = uploads.start_upload(self.delivery, self.courier, 100)
+
+        with self.assertRaises(uploads.UploadError) as error:
+            self.send(upload, b'%PDF-1.4' + b'\x00' * 92, 0)
+        self.assertEqual(error.exception.status_code, 415)
+
+    def test_oversized_upload_is_rejected_before_any_bytes(self):
+        with self.assertRaises(uploads.UploadError) as error:
+            uploads.start_upload(self.delivery, self.courier, 4097)
+        self.assertEqual(error.exception.status_code, 413)
+        self.assertFalse(ProofUpload.objects.exists())
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    FASTAPI_SERVICE_URL='',
+)
+class DeliveryEventOutboxTests(TransactionTestCase):
+    """Test the delivery events outbox and relay"""
+
+    def setUp(self):
+        self.customer = create_customer()
+        self.delivery = create_delivery(self.customer)
+
+    def cancel_delivery(self):
+        with transaction.atomic():
+            self.delivery.status = Delivery.StatusChoices.CANCELED
+            self.delivery.save()
+            return events.record_delivery_event(self.delivery, Delivery.StatusChoices.PROCESSING)
+
+    def test_event_must_be_recorded_in_a_transaction(self):
+        with self.assertRaises(RuntimeError):
+            events.record_delivery_event(self.delivery, Delivery.StatusChoices.PROCESSING)
+
+    def test_rolled_back_change_leaves_no_event(self):
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                self.cancel_delivery()
+                raise ValueError('checkout failed')
+
+        self.assertFalse(DeliveryEvent.objects.exists())
+
+    def test_relay_publishes_to_channel_groups(self):
+        event = self.cancel_delivery()
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(f'delivery_task_{self.delivery.id}', channel)
+
+        stats = events.publish_pending_events()
+
+        self.assertEqual(stats['published'], 1)
+        message = async_to_sync(layer.receive)(channel)
+        self.assertEqual(message['type'], 'delivery_task_update')
+        self.assertEqual(message['delivery_task'], {'event_id': event.id, 'status': 'Canceled'})
+        event.refresh_from_db()
+        self.assertIsNotNone(event.published_at)
+
+    def test_failed_publish_is_retried(self):
+        event = self.cancel_delivery()
+
+        with mock.patch.object(events, '_send_to_tracker', side_effect=ConnectionError('tracker down')):
+            stats = events.publish_pending_events()
+        self.assertEqual(stats['failed'], 1)
+        event.refresh_from_db()
+        self.assertIsNone(event.published_at)
+        self.assertEqual(event.attempts, 1)
+
+        self.assertIsNotNone(event.next_attempt_at)
+
+        # Not due yet
+        self.assertEqual(events.publish_pending_events()['published'], 0)
+        DeliveryEvent.objects.update(next_attempt_at=timezone.now())
+        stats = events.publish_pending_events()
+        self.assertEqual(stats['published'], 1)
+
+    @override_settings(FASTAPI_SERVICE_URL='http://fastapi.test', DELIVERY_EVENTS_MAX_ATTEMPTS=2)
+    def test_rejected_event_is_given_up_on_without_blocking_the_others(self):
+        rejected = self.cancel_delivery()
+        with transaction.atomic():
+            accepted = events.record_delivery_event(create_delivery(self.customer), Delivery.StatusChoices.CREATING)
+
+        def post(url, json, timeout):
+            response = mock.Mock(status_code=422 if rejected.id in [event['event_id'] for event in json] else 200)
+            if response.status_code == 422:
+                response.raise_for_status.side_effect = requests.HTTPError('422 Unprocessable', response=response)
+            return response
+
+        with mock.patch('shipments.events.requests.post', side_effect=post):
+            stats = events.publish_pending_events()
+            self.assertEqual((stats['published'], stats['failed']), (1, 1))
+            DeliveryEvent.objects.update(next_attempt_at=timezone.now())
+            stats = events.publish_pending_events()
+
+        self.assertEqual((stats['published'], stats['failed'], stats['backlog_age_seconds']), (0, 1, 0.0))
+        accepted.refresh_from_db()
+        rejected.refresh_from_db()
+        self.assertIsNotNone(accepted.published_at)
+        self.assertEqual((rejected.attempts, rejected.published_at), (2, None))
+        self.assertIsNotNone(rejected.failed_at)
+        self.assertEqual(events.publish_pending_events()['published'], 0)
+
+
+class DeliveryTransitionTests(TransactionTestCase):
+    """Test the delivery state machine"""
+
+    def setUp(self):
+        self.delivery = create_delivery(create_customer())
+
+    def test_transition_records_event(self):
+        courier = create_courier()
+        transitions.accept(self.delivery, courier)
+
+        self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.status, Delivery.StatusChoices.PICKUP_IN_PROGRESS)
+        self.assertEqual(self.delivery.courier, courier)
+        event = self.delivery.events.get()
+        self.assertEqual(event.previous_status, Delivery.StatusChoices.PROCESSING)
+        self.assertEqual(event.status, Delivery.StatusChoices.PICKUP_IN_PROGRESS)
+
+    def test_stale_instance_cannot_transition(self):
+        stale = Delivery.objects.get(id=self.delivery.id)
+        transitions.cancel(self.delivery)
+
+        with self.assertRaises(transitions.TransitionError):
+            transitions.accept(stale, create_courier())
+        self.assertEqual(Delivery.objects.get(id=self.delivery.id).status, Delivery.StatusChoices.CANCELED)
+        self.assertEqual(DeliveryEvent.objects.count(), 1)
+
+    def test_invalid_transition_is_rejected(self):
+        with self.assertRaises(transitions.TransitionError):
+            transitions.transition_to(self.delivery, Delivery.StatusChoices.COMPLETED)
+
+    @skipUnlessDBFeature('test_db_allows_multiple_connections')
+    def test_only_one_of_many_simultaneous_accepts_wins(self):
+        couriers = [create_courier(f'courier{number}@test.com') for number in range(50)]
+        barrier = threading.Barrier(len(couriers))
+
+        def accept(courier):
+            delivery = Delivery.objects.get(id=self.delivery.id)
+            barrier.wait()
+            try:
+                transitions.accept(delivery, courier)
+                return courier
+            except transitions.TransitionError:
+                return None
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(couriers)) as executor:
+            winners = [courier for courier in executor.map(accept, couriers) if courier]
+
+        self.assertEqual(len(winners), 1)
+        self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.courier, winners[0])
+        self.assertEqual(self.delivery.events.count(), 1)
+
+
+class CheckoutSubmissionTests(TestCase):
+    """Test submitting a delivery at checkout"""
+
+    def setUp(self):
+        self.customer = create_customer()
+        self.delivery = create_delivery(self.customer, status=Delivery.StatusChoices.CREATING, price=Decimal('1500.00'))
+        self.request = RequestFactory().post('/shipments/create/')
+        self.request.user = self.customer.user
+
+    def test_repeated_wallet_checkout_is_charged_once(self):
+        Wallet.objects.create(user=self.customer.user, balance=Decimal('4000.00'))
+        stale = Delivery.objects.get(id=self.delivery.id)
+        wallet = Delivery.PaymentMethodChoices.WALLET
+
+        self.assertTrue(submit_payment(self.request, self.delivery, wallet))
+        courier = create_courier()
+        transitions.accept(self.delivery, courier)
+        with self.assertRaises(transitions.TransitionError):
+            submit_payment(self.request, stale, wallet)
+
+        self.delivery.refresh_from_db()
+        self.assertEqual((self.delivery.status, self.delivery.courier), (Delivery.StatusChoices.PICKUP_IN_PROGRESS, courier))
+        self.assertEqual(self.delivery.payment_method, wallet)
+        self.assertEqual(Wallet.objects.get(user=self.customer.user).balance, Decimal('2500.00'))
+        self.assertEqual(WalletTransaction.objects.count(), 1)
+
+    def test_short_wallet_changes_nothing(self):
+        Wallet.objects.create(user=self.customer.user, balance=Decimal('1000.00'))
+
+        self.assertFalse(submit_payment(self.request, self.delivery, Delivery.PaymentMethodChoices.WALLET))
+        self.assertEqual(Delivery.objects.get(id=self.delivery.id).status, Delivery.StatusChoices.CREATING)
+        self.assertFalse(DeliveryTransaction.objects.exists())
+
+    def create_promotion(self):
+        cache.clear()
+        return Promotion.objects.create(
+            code='SAVE10',
+            name='Launch offer',
+            promotion_type='percentage',
+            discount_value=Decimal('10.00'),
+            usage_limit=5,
+            start_date=timezone.now() - timedelta(days=1),
+            end_date=timezone.now() + timedelta(days=1),
+        )
+
+    @mock.patch('shipments.views.redirect')
+    @mock.patch('shipments.views.messages')
+    def test_card_promotion_is_redeemed_when_the_payment_is_verified(self, messages, redirect):
+        promotion = self.create_promotion()
+        form = PaymentMethodForm(
+            {'payment_method': Delivery.PaymentMethodChoices.CARD, 'promo_code': 'SAVE10'}, instance=self.delivery,
+        )
+
+        self.assertIsNone(handle_payment_form(self.request, self.delivery, form))
+        self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.status, Delivery.StatusChoices.CREATING)
+        self.assertEqual((self.delivery.promotion_id, self.delivery.amount_due), (promotion.pk, Decimal('1350.00')))
+
+        payment = DeliveryTransaction.objects.create(delivery=self.delivery, amount=self.delivery.amount_due)
+        with mock.patch.object(DeliveryTransaction, 'verify_transaction', return_value=True):
+            verify_delivery_payment(self.request, payment.id)
+            verify_delivery_payment(self.request, payment.id)
+
+        self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.status, Delivery.StatusChoices.PROCESSING)
+        self.assertEqual((self.delivery.price, self.delivery.discount), (Decimal('1350.00'), Decimal('0.00')))
+        promotion.refresh_from_db()
+        self.assertEqual(promotion.used_count, 1)
+
+    @mock.patch('shipments.views.render')
+    @mock.patch('shipments.views.messages')
+    def test_rejected_promotion_code_is_shown_on_the_form(self, messages, render):
+        request = RequestFactory().post('/shipments/create/', {
+            'step': 4, 'payment_method': Delivery.PaymentMethodChoices.CARD, 'promo_code': 'NOPE',
+        })
+        request.user = self.customer.user
+
+        create_delivery_task_view(request)
+
+        payment_form = render.call_args.args[2]['payment_form']
+        self.assertEqual(payment_form.errors['promo_code'], ['This promotion code is not valid.'])
+        self.assertIsNone(Delivery.objects.get(id=self.delivery.id).promotion)
+
+
+class DeliveryBundlingTests(TestCase):
+    """Test bundling of open deliveries"""
+
+    def setUp(self):
+        cache.clear()
+        self.customer = create_customer()
+        self.near = self.located_courier('near@test.com', 6.5205, 3.3705)
+        self.farther = self.located_courier('farther@test.com', 6.5300, 3.3800)
+
+    def located_courier(self, email, latitude, longitude):
+        courier = create_courier(email)
+        courier.courier_latitude = latitude
+        courier.courier_longitude = longitude
+        courier.save()
+        return courier
+
+    def open_delivery(self, pickup=(6.5201, 3.3701), drop=(6.60, 3.37)):
+        return create_delivery(
+            self.customer,
+            pickup_latitude=pickup[0],
+            pickup_longitude=pickup[1],
+            delivery_latitude=drop[0],
+            delivery_longitude=drop[1],
+        )
+
+    def test_deliveries_sharing_pickup_and_heading_are_offered_to_nearest_idle_courier(self):
+        northbound = [self.open_delivery() for _ in range(3)]
+        self.open_delivery(drop=(6.40, 3.37))
+        self.open_delivery(pickup=(6.45, 3.30))
+
+        bundles = bundling.build_bundles()
+
+        self.assertEqual(len(bundles), 1)
+        self.assertEqual(bundles[0].courier, self.near)
+        self.assertEqual(set(bundles[0].deliveries.all()), set(northbound))
+
+    def test_busy_courier_is_not_offered_a_bundle(self):
+        transitions.accept(self.open_delivery(pickup=(6.0, 3.0)), self.near)
+        self.open_delivery()
+        self.open_delivery()
+
+        bundle, = bundling.build_bundles()
+        self.assertEqual(bundle.courier, self.farther)
+
+    def test_expired_offer_goes_to_another_courier(self):
+        self.open_delivery()
+        self.open_delivery()
+        first, = bundling.build_bundles()
+        DeliveryBundle.objects.filter(id=first.id).update(expires_at=timezone.now())
+
+        second, = bundling.build_bundles()
+        first.refresh_from_db()
+        self.assertEqual(first.status, DeliveryBundle.StatusChoices.EXPIRED)
+        self.assertEqual(second.courier, self.farther)
+
+    def test_only_deliveries_without_a_bundle_partner_are_broadcast_at_checkout(self):
+        first = self.open_delivery()
+        self.open_delivery(drop=(6.40, 3.37))
+        self.assertFalse(bundling.will_be_bundled(first))
+
+        self.assertTrue(bundling.will_be_bundled(self.open_delivery()))
+
+    def test_deliveries_left_unoffered_are_broadcast_once(self):
+        Courier.objects.update(courier_latitude=0.0, courier_longitude=0.0, fcm_token='token')
+        self.open_delivery()
+        self.open_delivery()
+
+        with mock.patch('shipments.bulk.firebase_messaging') as firebase_messaging, \
+                mock.patch('shipments.bulk.reverse', return_value='/couriers/delivery-tasks/'):
+            self.assertEqual(bundling.build_bundles(), [])
+            self.assertEqual(bundling.build_bundles(), [])
+
+        messaging = firebase_messaging.return_value
+        messaging.send_multicast.assert_called_once()
+        self.assertEqual(messaging.Notification.call_args.kwargs['title'], '2 new deliveries')
+
+    def test_accepting_bundle_assigns_deliveries_still_open(self):
+        kept = self.open_delivery()
+        canceled = self.open_delivery()
+        bundle, = bundling.build_bundles()
+        transitions.cancel(canceled)
+
+        accepted = bundling.accept_bundle(bundle.id, self.near)
+
+        self.assertEqual(accepted, [kept])
+        kept.refresh_from_db()
+        self.assertEqual(kept.courier, self.near)
+        self.assertEqual(kept.status, Delivery.StatusChoices.PICKUP_IN_PROGRESS)
+        with self.assertRaises(transitions.TransitionError):
+            bundling.accept_bundle(bundle.id, self.near)
+
+
+class DeliveryRollupTests(TestCase):
+    """Test the incremental analytics rollups"""
+
+    def setUp(self):
+        self.customer = create_customer()
+        self.courier = create_courier()
+
+    def complete_delivery(self, price, distance):
+        delivery = create_delivery(
+            self.customer,
+            courier=self.courier,
+            status=Delivery.StatusChoices.DELIVERY_IN_PROGRESS,
+            price=Decimal(price),
+            distance=distance,
+        )
+        return transitions.deliver(delivery)
+
+    def run_rollups(self):
+        return rollups.update_rollups(now=timezone.now() + timedelta(hours=1))
+
+    def rollup(self, scope, subject_id='', granularity=DeliveryRollup.GranularityChoices.DAY):
+        return DeliveryRollup.objects.get(scope=scope, subject_id=subject_id, granularity=granularity)
+
+    def test_completed_and_canceled_deliveries_are_rolled_up_per_scope(self):
+        self.complete_delivery('1000.00', 4.5)
+        self.complete_delivery('500.00', 2.0)
+        transitions.cancel(create_delivery(self.customer))
+
+        self.run_rollups()
+
+        courier = self.rollup(DeliveryRollup.ScopeChoices.COURIER, str(self.courier.pk))
+        self.assertEqual(courier.deliveries, 2)
+        self.assertEqual(courier.distance_km, 6.5)
+        self.assertEqual(courier.revenue, Decimal('1500.00'))
+        self.assertEqual(courier.earnings, Decimal('1350.00'))
+        self.assertEqual(courier.cancellations, 0)
+
+        customer = self.rollup(DeliveryRollup.ScopeChoices.CUSTOMER, str(self.customer.pk))
+        self.assertEqual((customer.deliveries, customer.cancellations), (2, 1))
+        platform = self.rollup(DeliveryRollup.ScopeChoices.PLATFORM, granularity=DeliveryRollup.GranularityChoices.HOUR)
+        self.assertEqual((platform.deliveries, platform.cancellations), (2, 1))
+
+    def test_each_event_is_counted_once_across_runs(self):
+        self.complete_delivery('1000.00', 4.5)
+        self.run_rollups()
+        self.assertEqual(self.run_rollups(), [])
+
+        later = self.complete_delivery('200.00', 1.0)
+        DeliveryEvent.objects.filter(delivery=later).update(created_at=timezone.now() + timedelta(hours=2))
+        rollups.update_rollups(now=timezone.now() + timedelta(hours=3))
+        platform = DeliveryRollup.objects.filter(
+            scope=DeliveryRollup.ScopeChoices.PLATFORM,
+            granularity=DeliveryRollup.GranularityChoices.HOUR,
+        )
+        self.assertEqual(sorted(platform.values_list('deliveries', flat=True)), [1, 1])
+
+    def test_event_committed_after_a_run_is_counted_by_the_next(self):
+        self.complete_delivery('1000.00', 4.5)
+        self.run_rollups()
+        # Stamped before the run, as a transaction that commits late
+        late = self.complete_delivery('500.00', 2.0)
+        DeliveryEvent.objects.filter(delivery=late).update(created_at=timezone.now() - timedelta(minutes=10))
+
+        self.run_rollups()
+
+        self.assertEqual(self.rollup(DeliveryRollup.ScopeChoices.PLATFORM).deliveries, 2)
+
+    def test_courier_ratings_are_rolled_up(self):
+        delivery = self.complete_delivery('1000.00', 4.5)
+        Rating.objects.create(rater=self.customer.user, rated_user=self.courier.user, delivery=delivery, rating=4)
+
+        self.run_rollups()
+
+        courier = self.rollup(DeliveryRollup.ScopeChoices.COURIER, str(self.courier.pk))
+        self.assertEqual((courier.rating_sum, courier.rating_count), (4, 1))
+        self.assertEqual(self.rollup(DeliveryRollup.ScopeChoices.PLATFORM).rating_count, 1)
+
+    def test_edited_and_deleted_ratings_change_the_rollups(self):
+        delivery = self.complete_delivery('1000.00', 4.5)
+        rating = Rating.objects.create(rater=self.customer.user, rated_user=self.courier.user, delivery=delivery, rating=4)
+        self.run_rollups()
+
+        rating.rating = 2
+        rating.save()
+        self.run_rollups()
+        courier = self.rollup(DeliveryRollup.ScopeChoices.COURIER, str(self.courier.pk))
+        self.assertEqual((courier.rating_sum, courier.rating_count), (2, 1))
+
+        rating.delete()
+        self.run_rollups()
+        courier.refresh_from_db()
+        self.assertEqual((courier.rating_sum, courier.rating_count), (0, 0))
+
+    @override_settings(FASTAPI_SERVICE_URL='http://fastapi.test')
+    def test_store_that_lost_its_rows_gets_a_full_sync(self):
+        self.complete_delivery('1000.00', 4.5)
+        rows = self.run_rollups()
+        response = mock.Mock()
+        response.json.side_effect = [{'needs_full_sync': True}, {'needs_full_sync': False}]
+
+        with mock.patch('shipments.rollups.requests.post', return_value=response) as post:
+            rollups.push_rollups(rows[:1])
+
+        incremental, full = [call.kwargs['json'] for call in post.call_args_list]
+        self.assertEqual((incremental['full'], len(incremental['rollups'])), (False, 1))
+        self.assertEqual((full['full'], len(full['rollups'])), (True, 6))
+
+
+@override_settings(FASTAPI_SERVICE_URL='http://fastapi.test')
+class CourierStatsTests(TestCase):
+    """Test pushing courier stats to the matching service"""
+
+    def setUp(self):
+        self.customer = create_customer()
+        self.couriers = [create_courier(f'courier{i}@test.com') for i in range(3)]
+
+    def test_ratings_and_active_deliveries_are_pushed_in_batches(self):
+        rated, busy, idle = self.couriers
+        create_delivery(self.customer, courier=busy, status=Delivery.StatusChoices.PICKUP_IN_PROGRESS)
+        create_delivery(self.customer, courier=busy, status=Delivery.StatusChoices.DELIVERY_IN_PROGRESS)
+        create_delivery(self.customer, courier=idle, status=Delivery.StatusChoices.COMPLETED)
+        Rating.objects.create(rater=self.customer.user, rated_user=rated.user, rating=4)
+
+        with mock.patch('shipments.courier_stats.requests.post') as post:
+            self.assertEqual(courier_stats.push_courier_stats(batch_size=2), 3)
+
+        self.assertEqual(post.call_count, 2)
+        stats = {
+            courier['courier_id']: (courier['active_deliveries'], courier['average_rating'])
+            for call in post.call_args_list
+            for courier in call.kwargs['json']
+        }
+        self.assertEqual(stats, {
+            str(rated.pk): (0, 4.0),
+            str(busy.pk): (2, None),
+            str(idle.pk): (0, None),
+        })
+
+    def test_failed_push_stops_the_run(self):
+        with mock.patch('shipments.courier_stats.requests.post', side_effect=requests.ConnectionError):
+            self.assertEqual(courier_stats.push_courier_stats(batch_size=2), 0)
+
+
+class DeliveryArchiveTests(TestCase):
+    """Test moving old deliveries to the archive"""
+
+    def setUp(self):
+        self.customer = create_customer()
+        self.courier = create_courier()
+
+    def finished_delivery(self, days_ago, price='1000.00', cancel=False):
+        if cancel:
+            delivery = transitions.cancel(create_delivery(self.customer, courier=self.courier, price=Decimal(price)))
+        else:
+            delivery = transitions.deliver(create_delivery(
+                self.customer,
+                courier=self.courier,
+                status=Delivery.StatusChoices.DELIVERY_IN_PROGRESS,
+                price=Decimal(price),
+            ))
+        DeliveryEvent.objects.filter(delivery=delivery).update(published_at=timezone.now())
+        moment = timezone.now() - timedelta(days=days_ago)
+        Delivery.objects.filter(pk=delivery.pk).update(created_at=moment, updated_at=moment)
+        return delivery
+
+    def test_old_finished_deliveries_are_moved_to_the_archive(self):
+        old = self.finished_delivery(days_ago=100)
+        canceled = self.finished_delivery(days_ago=120, cancel=True)
+        recent = self.finished_delivery(days_ago=10)
+        active = create_delivery(self.customer)
+        DeliveryTransaction.objects.create(delivery=old, amount=Decimal('1000.00'))
+        rating = Rating.objects.create(rater=self.customer.user, rated_user=self.courier.user, delivery=old, rating=5)
+        old.refresh_from_db()
+
+        self.assertEqual(archive.archive_deliveries(older_than_days=90, batch_size=1), 2)
+
+        self.assertEqual(set(Delivery.objects.values_list('pk', flat=True)), {recent.pk, active.pk})
+        archived = DeliveryArchive.objects.get(pk=old.pk)
+        self.assertEqual((archived.tracking_number, archived.price), (old.tracking_number, old.price))
+        self.assertEqual((archived.created_at, archived.delivered_at), (old.created_at, old.delivered_at))
+        self.assertEqual(archived.transactions[0]['amount'], '1000.00')
+        self.assertTrue(DeliveryArchive.objects.filter(pk=canceled.pk).exists())
+        rating.refresh_from_db()
+        self.assertIsNone(rating.delivery_id)
+
+    def test_deliveries_with_unpublished_events_wait(self):
+        delivery = self.finished_delivery(days_ago=100)
+        DeliveryEvent.objects.filter(delivery=delivery).update(published_at=None)
+
+        self.assertEqual(archive.archive_deliveries(older_than_days=90), 0)
+        self.assertTrue(Delivery.objects.filter(pk=delivery.pk).exists())
+
+    def test_history_reads_live_and_archived_deliveries(self):
+        archived = [self.finished_delivery(days_ago=days, price='100.00') for days in (95, 200)]
+        live = [self.finished_delivery(days_ago=days, price='10.00') for days in (1, 150)]
+        archive.archive_deliveries(older_than_days=90)
+
+        history = archive.delivery_history(courier=self.courier, status=Delivery.StatusChoices.COMPLETED)
+
+        self.assertEqual(history.count(), 4)
+        self.assertEqual(
+            [delivery.pk for delivery in history[1:3]],
+            [archived[0].pk, live[1].pk],
+        )
+        self.assertEqual([delivery.pk for delivery in history], [live[0].pk, archived[0].pk, live[1].pk, archived[1].pk])
+        self.assertEqual(history.aggregate(total=Sum('price'))['total'], Decimal('220.00'))
+
+
+class BulkDeliveryCreationTests(TestCase):
+    """Test creating many deliveries in one request"""
+
+    def setUp(self):
+        self.customer = create_customer()
+        self.factory = RequestFactory()
+        patcher = mock.patch('shipments.pricing.lookup_distance', side_effect=self.lookup_distance)
+        self.lookup = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def lookup_distance(origin, destination, session=None):
+        if destination == 'Nowhere':
+            raise pricing.DistanceLookupError('Unable to calculate distance. Please check the addresses.')
+        return 5.0, 20
+
+    def row(self, **kwargs):
+        row = {
+            'item_name': 'Shoes',
+            'pickup_address': '1 Marina, Lagos',
+            'sender_name': 'Shop',
+            'sender_phone': '08012345678',
+            'delivery_address': '2 Allen Avenue, Ikeja',
+            'recipient_name': 'Ada',
+            'recipient_phone': '08087654321',
+        }
+        row.update(kwargs)
+        return row
+
+    def post(self, body, content_type='application/json'):
+        request = self.factory.post('/shipments/apis/deliveries/bulk', body, content_type=content_type)
+        request.user = self.customer.user
+        return bulk_create_deliveries_api(request)
+
+    def test_requests_without_a_csrf_token_are_rejected(self):
+        request = self.factory.post('/shipments/apis/deliveries/bulk', {'deliveries': [self.row()]},
+                                    content_type='application/json')
+        request.user = self.customer.user
+        middleware = CsrfViewMiddleware(bulk_create_deliveries_api)
+
+        response = middleware.process_view(request, bulk_create_deliveries_api, (), {})
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Delivery.objects.exists())
+
+    def test_valid_rows_are_created_and_invalid_rows_reported(self):
+        rows = [self.row(), self.row(recipient_phone=''), self.row(delivery_address='Nowhere'), self.row(size='small')]
+
+        with self.captureOnCommitCallbacks(execute=True), \
+                mock.patch('shipments.bulk.notify_couriers') as notify_couriers:
+            response = self.post({'deliveries': rows})
+
+        self.assertEqual(response.status_code, 201)
+        body = json.loads(response.content)
+        self.assertEqual((body['created'], body['failed']), (2, 2))
+        self.assertEqual([result['success'] for result in body['results']], [True, False, False, True])
+        self.assertIn('recipient_phone', body['results'][1]['errors'])
+        self.assertEqual(body['results'][0]['price'], '2250.00')
+
+        deliveries = Delivery.objects.filter(customer=self.customer)
+        self.assertEqual(deliveries.count(), 2)
+        self.assertTrue(all(delivery.status == Delivery.StatusChoices.PROCESSING for delivery in deliveries))
+        self.assertEqual(len({delivery.tracking_number for delivery in deliveries}), 2)
+        self.assertEqual(DeliveryEvent.objects.filter(delivery__customer=self.customer).count(), 2)
+        # Identical routes are looked up once, and couriers are notified once.
+        self.assertEqual(self.lookup.call_count, 2)
+        notify_couriers.assert_called_once()
+        self.assertEqual(len(notify_couriers.call_args.args[0]), 2)
+
+    def test_csv_rows_paid_from_the_wallet_are_charged_together(self):
+        Wallet.objects.create(user=self.customer.user, balance=Decimal('5000.00'))
+        header = ','.join(self.row()) + ',payment_method\n'
+        lines = ''.join(','.join(f'"{value}"' for value in self.row().values()) + ',wallet\n' for _ in range(3))
+
+        response = self.post(header + lines, content_type='text/csv')
+
+        body = json.loads(response.content)
+        self.assertEqual([result['success'] for result in body['results']], [True, True, False])
+        self.assertIn('Insufficient wallet balance', body['results'][2]['errors']['__all__'][0])
+        self.assertEqual(Wallet.objects.get(user=self.customer.user).balance, Decimal('500.00'))
+        self.assertEqual(WalletTransaction.objects.get().amount, Decimal('4500.00'))
+        self.assertEqual(DeliveryTransaction.objects.filter(delivery__customer=self.customer).count(), 2)
+
+    @override_settings(BULK_DELIVERY_MAX_ROWS=2)
+    def test_oversized_or_unreadable_requests_are_rejected(self):
+        self.assertEqual(self.post([self.row()] * 3).status_code, 400)
+        self.assertEqual(self.post('not json').status_code, 400)
+        self.assertFalse(Delivery.objects.exists())
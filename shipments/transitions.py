@@ -0,0 +1,188 @@
+"""
+This module is the state machine for deliveries.
+
+Every transition is a single conditional UPDATE
+(WHERE id = ? AND status = <expected status>), so two requests racing on
+the same delivery cannot both win and nothing waits on a row lock: the
+loser updates no rows and gets a TransitionError. The status change and
+its outbox event are written in the same transaction. Views and APIs must
+move deliveries through these functions instead of saving the status.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from shipments.events import record_delivery_event, record_delivery_events
+from shipments.models import Delivery
+
+Status = Delivery.StatusChoices
+
+# The statuses a delivery may move to from each status.
+TRANSITIONS = {
+    Status.CREATING: {Status.PROCESSING},
+    Status.PROCESSING: {Status.PICKUP_IN_PROGRESS, Status.CANCELED},
+    Status.PICKUP_IN_PROGRESS: {Status.DELIVERY_IN_PROGRESS},
+    Status.DELIVERY_IN_PROGRESS: {Status.COMPLETED},
+    Status.COMPLETED: set(),
+    Status.CANCELED: set(),
+}
+
+
+class TransitionError(Exception):
+    """
+    This is raised when a delivery is not in the status a transition expects
+    """
+
+
+def _label(status):
+    return dict(Status.choices).get(status, status)
+
+
+def can_transition(from_status, to_status):
+    """
+    This checks whether a delivery may move between two statuses
+    """
+    return to_status in TRANSITIONS.get(from_status, ())
+
+
+def transition(delivery, from_status, to_status, conditions=None, **changes):
+    """
+    This moves the delivery from one status to another with a conditional
+    UPDATE and records the event. The instance is updated to match the row.
+    """
+    if not can_transition(from_status, to_status):
+        raise TransitionError(
+            f'A delivery cannot move from {_label(from_status)} to {_label(to_status)}.'
+        )
+
+    changes['updated_at'] = timezone.now()
+    with transaction.atomic():
+        updated = Delivery.objects.filter(
+            id=delivery.id,
+            status=from_status,
+            **(conditions or {})
+        ).update(status=to_status, **changes)
+        if not updated:
+            raise TransitionError('This delivery has already been updated.')
+
+        for field, value in changes.items():
+            setattr(delivery, field, value)
+        delivery.status = to_status
+        record_delivery_event(delivery, from_status)
+    return delivery
+
+
+def _store_photo(delivery, field_name, photo):
+    """
+    This saves an uploaded photo to storage and returns its name.
+    Names of photos already in storage are returned as they are.
+    """
+    if isinstance(photo, str):
+        return photo
+    field_file = getattr(delivery, field_name)
+    field_file.save(photo.name, photo, save=False)
+    return field_file.name
+
+
+def _transition_with_photo(delivery, from_status, to_status, field_name, photo, **changes):
+    if photo is None:
+        return transition(delivery, from_status, to_status, **changes)
+
+    name = _store_photo(delivery, field_name, photo)
+    try:
+        return transition(delivery, from_status, to_status, **{field_name: name}, **changes)
+    except TransitionError:
+        if name != photo:
+            getattr(delivery, field_name).storage.delete(name)
+        raise
+
+
+def submit(delivery, **changes):
+    """
+    This sends a delivery the customer has paid for, or chosen to pay on
+    delivery, to the couriers. changes, such as the payment method, are
+    saved in the same UPDATE.
+    """
+    return transition(delivery, Status.CREATING, Status.PROCESSING, **changes)
+
+
+def submit_new(deliveries):
+    """
+    This inserts new deliveries that are ready for couriers, as if each
+    had been created and submitted, with one INSERT for the deliveries and
+    one for their events
+    """
+    for delivery in deliveries:
+        delivery.status = Status.PROCESSING
+    Delivery.assign_tracking_numbers(deliveries)
+    with transaction.atomic():
+        deliveries = Delivery.objects.bulk_create(deliveries)
+        record_delivery_events(deliveries, Status.CREATING)
+    return deliveries
+
+
+def accept(delivery, courier):
+    """
+    This assigns the delivery to the courier. Only one courier can win.
+    """
+    return transition(
+        delivery,
+        Status.PROCESSING,
+        Status.PICKUP_IN_PROGRESS,
+        conditions={'courier__isnull': True},
+        courier=courier,
+    )
+
+
+def pick_up(delivery, photo=None):
+    """
+    This marks the item as picked up, with the photo taken at pickup
+    """
+    return _transition_with_photo(
+        delivery,
+        Status.PICKUP_IN_PROGRESS,
+        Status.DELIVERY_IN_PROGRESS,
+        'pickup_photo',
+        photo,
+        pickedup_at=timezone.now(),
+    )
+
+
+def deliver(delivery, photo=None):
+    """
+    This marks the item as delivered, with the photo taken at drop-off
+    """
+    return _transition_with_photo(
+        delivery,
+        Status.DELIVERY_IN_PROGRESS,
+        Status.COMPLETED,
+        'delivery_photo',
+        photo,
+        delivered_at=timezone.now(),
+    )
+
+
+def cancel(delivery):
+    """
+    This cancels a delivery no courier has accepted yet
+    """
+    return transition(delivery, Status.PROCESSING, Status.CANCELED)
+
+
+def transition_to(delivery, to_status, courier=None, photo=None):
+    """
+    This moves the delivery to the requested status through the matching
+    transition. It is used by APIs that receive the target status.
+    """
+    if not can_transition(delivery.status, to_status):
+        raise TransitionError(
+            f'A delivery cannot move from {_label(delivery.status)} to {_label(to_status)}.'
+        )
+    if to_status == Status.PROCESSING:
+        return submit(delivery)
+    if to_status == Status.PICKUP_IN_PROGRESS:
+        return accept(delivery, courier)
+    if to_status == Status.DELIVERY_IN_PROGRESS:
+        return pick_up(delivery, photo)
+    if to_status == Status.COMPLETED:
+        return deliver(delivery, photo)
+    return cancel(delivery)
@@ -0,0 +1,353 @@
+"""
+This module handles resumable, chunked uploads of proof of delivery photos.
+
+Chunks are streamed from the request straight into the default storage
+(the local media folder or an S3 multipart upload when USE_S3 is on), so a
+slow courier connection never holds a whole photo in memory and an
+interrupted upload can continue from the last byte the server received.
+
+A chunk is written outside any transaction and no row is locked while its
+bytes arrive. Only then does a conditional UPDATE (WHERE received_bytes =
+the chunk's start) move the offset, so of two requests racing for the same
+offset exactly one is counted. The delivery status only moves once the
+last chunk has been written.
+"""
+import os
+import re
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from shipments import transitions
+from shipments.models import Delivery, ProofUpload
+
+READ_BLOCK_SIZE = 64 * 1024
+
+# S3 refuses to complete a multipart upload with a part under 5MB that is
+# not the last one.
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+
+CONTENT_RANGE_PATTERN = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+# Photo types we accept, identified by the first bytes of the file.
+PHOTO_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png', 'png'),
+    (b'RIFF', 'image/webp', 'webp'),
+)
+
+# The proof photo expected for each in-progress status, and where it leads.
+PROOF_STEPS = {
+    Delivery.StatusChoices.PICKUP_IN_PROGRESS: ProofUpload.KindChoices.PICKUP_PHOTO,
+    Delivery.StatusChoices.DELIVERY_IN_PROGRESS: ProofUpload.KindChoices.DELIVERY_PHOTO,
+}
+
+
+class UploadError(Exception):
+    """
+    This is raised when an upload or one of its chunks is rejected
+    """
+    status_code = 400
+
+    def __init__(self, message, status_code=None, offset=None):
+        super().__init__(message)
+        if status_code:
+            self.status_code = status_code
+        self.offset = offset
+
+
+def detect_photo_type(head):
+    """
+    This returns the content type and extension of a photo
+    from its first bytes, or None if it is not a supported photo
+    """
+    for signature, content_type, extension in PHOTO_SIGNATURES:
+        if head.startswith(signature):
+            if content_type == 'image/webp' and head[8:12] != b'WEBP':
+                continue
+            return content_type, extension
+    return None
+
+
+def parse_content_range(header):
+    """
+    This parses a 'bytes start-end/total' Content-Range header
+    """
+    match = CONTENT_RANGE_PATTERN.match(header or '')
+    if not match:
+        raise UploadError('A valid Content-Range header is required.')
+    start, end, total = (int(value) for value in match.groups())
+    if end < start:
+        raise UploadError('Invalid Content-Range header.')
+    return start, end, total
+
+
+class LocalChunkWriter:
+    """
+    This writes chunks into a partial file next to the final
+    photo in the media folder and renames it into place at the end
+    """
+
+    def __init__(self, upload):
+        self.upload = upload
+        self.path = default_storage.path(upload.storage_name)
+        self.partial_path = self.path + '.part'
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        open(self.partial_path, 'wb').close()
+
+    def write_chunk(self, stream, length):
+        written = 0
+        with open(self.partial_path, 'r+b') as partial:
+            # Bytes left behind by an interrupted chunk are overwritten by
+            # its retry; nothing is truncated, as a concurrent request may
+            # be writing the same range.
+            partial.seek(self.upload.received_bytes)
+            for block in stream:
+                partial.write(block)
+                written += len(block)
+        return written
+
+    def finish(self):
+        os.replace(self.partial_path, self.path)
+
+    def abort(self):
+        if os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+
+
+class S3ChunkWriter:
+    """
+    This writes every chunk as one part of an S3 multipart upload, which
+    is why write_chunk() refuses small chunks before the last one
+    """
+
+    def __init__(self, upload):
+        self.upload = upload
+        self.client = default_storage.connection.meta.client
+        self.bucket = default_storage.bucket_name
+        self.key = default_storage._normalize_name(upload.storage_name)
+
+    def start(self):
+        if self.upload.storage_upload_id:
+            # A retried first chunk writes part 1 of the same upload again.
+            return
+        response = self.client.create_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            ContentType=self.upload.content_type,
+        )
+        self.upload.storage_upload_id = response['UploadId']
+
+    def write_chunk(self, stream, length):
+        body = b''.join(stream)
+        part_number = len(self.upload.parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload.storage_upload_id,
+            PartNumber=part_number,
+            Body=body,
+        )
+        self.upload.parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+        return len(body)
+
+    def finish(self):
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload.storage_upload_id,
+            MultipartUpload={'Parts': self.upload.parts},
+        )
+
+    def abort(self):
+        if self.upload.storage_upload_id:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload.storage_upload_id,
+            )
+
+
+def get_chunk_writer(upload):
+    """
+    This returns the chunk writer for the configured media storage
+    """
+    if settings.USE_S3:
+        return S3ChunkWriter(upload)
+    return LocalChunkWriter(upload)
+
+
+def start_upload(delivery, courier, total_size):
+    """
+    This opens a new upload for the proof photo the delivery is waiting for
+    """
+    kind = PROOF_STEPS.get(delivery.status)
+    if kind is None:
+        raise UploadError('This delivery is not waiting for a photo.', status_code=409)
+    if total_size <= 0:
+        raise UploadError('The photo size is required.')
+    if total_size > settings.PROOF_UPLOAD_MAX_SIZE:
+        raise UploadError('The photo is too large.', status_code=413)
+
+    upload = ProofUpload(
+        delivery=delivery,
+        courier=courier,
+        kind=kind,
+        total_size=total_size,
+    )
+    upload.storage_name = _storage_name(upload)
+    upload.save()
+    return upload
+
+
+def _storage_name(upload, extension=None):
+    name = f'proofs/{upload.delivery_id}/{upload.kind}-{upload.id}'
+    if extension:
+        name = f'{name}.{extension}'
+    return name
+
+
+def _iter_stream(stream, length):
+    """
+    This reads exactly length bytes from the stream in small blocks
+    """
+    remaining = length
+    while remaining:
+        block = stream.read(min(READ_BLOCK_SIZE, remaining))
+        if not block:
+            raise UploadError('The chunk ended before Content-Range said it would.')
+        remaining -= len(block)
+        yield block
+
+
+def write_chunk(upload_id, courier, stream, content_range):
+    """
+    This appends one chunk to an upload and finalizes it on the last chunk.
+    New uploads are validated for size and photo type on their first chunk.
+    """
+    start, end, total = parse_content_range(content_range)
+    length = end - start + 1
+    if length > settings.PROOF_UPLOAD_CHUNK_SIZE:
+        raise UploadError('The chunk is too large.', status_code=413)
+    if settings.USE_S3 and end + 1 < total and length < S3_MIN_PART_SIZE:
+        raise UploadError('Every chunk but the last must be at least 5MB.')
+
+    upload = ProofUpload.objects.filter(id=upload_id, courier=courier).first()
+    if not upload:
+        raise UploadError('Upload not found.', status_code=404)
+    _check_chunk(upload, start, end, total)
+
+    blocks = _iter_stream(stream, length)
+    writer = get_chunk_writer(upload)
+    if start == 0:
+        head = next(blocks)
+        writer = _start_writer(upload, head)
+        blocks = _prepend(head, blocks)
+
+    received = start + writer.write_chunk(blocks, length)
+    finished = received == upload.total_size
+    with transaction.atomic():
+        updated = ProofUpload.objects.filter(
+            id=upload.id,
+            status=ProofUpload.StatusChoices.UPLOADING,
+            received_bytes=start,
+        ).update(
+            received_bytes=received,
+            parts=upload.parts,
+            status=ProofUpload.StatusChoices.COMPLETED if finished else ProofUpload.StatusChoices.UPLOADING,
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            # Another request moved the upload on while this chunk was written.
+            upload.refresh_from_db()
+            _check_chunk(upload, start, end, total)
+        upload.received_bytes = received
+
+        if finished:
+            _complete_upload(upload, writer)
+    return upload
+
+
+def _check_chunk(upload, start, end, total):
+    if upload.status != ProofUpload.StatusChoices.UPLOADING:
+        raise UploadError('This upload is no longer open.', status_code=409)
+    if total != upload.total_size or end >= total:
+        raise UploadError('Content-Range does not match the upload size.')
+    if start != upload.received_bytes:
+        raise UploadError('Chunk does not start at the current offset.',
+                          status_code=409, offset=upload.received_bytes)
+
+
+def _start_writer(upload, head):
+    """
+    This checks the photo type from the first bytes and starts writing the
+    photo under its final name. The name and the S3 upload id are saved
+    at once, so a retried first chunk reuses the S3 upload instead of
+    leaving it behind.
+    """
+    photo_type = detect_photo_type(head)
+    if photo_type is None:
+        raise UploadError('Only JPEG, PNG and WebP photos are allowed.', status_code=415)
+    content_type, extension = photo_type
+    storage_name = _storage_name(upload, extension)
+    if storage_name != upload.storage_name:
+        # Drop what an earlier first chunk of another photo type started.
+        get_chunk_writer(upload).abort()
+        upload.storage_upload_id = ''
+
+    upload.content_type = content_type
+    upload.storage_name = storage_name
+    upload.parts = []
+    writer = get_chunk_writer(upload)
+    writer.start()
+    ProofUpload.objects.filter(
+        id=upload.id,
+        status=ProofUpload.StatusChoices.UPLOADING,
+        received_bytes=0,
+    ).update(
+        content_type=upload.content_type,
+        storage_name=upload.storage_name,
+        storage_upload_id=upload.storage_upload_id,
+        parts=[],
+        updated_at=timezone.now(),
+    )
+    return writer
+
+
+def _prepend(head, blocks):
+    yield head
+    yield from blocks
+
+
+def _complete_upload(upload, writer):
+    """
+    This attaches the finished photo to the delivery and moves it to the
+    next status. It runs in the transaction that counts the last chunk, so
+    the chunk and the transition are rolled back together if the storage
+    cannot finish the upload, and the chunk can be sent again.
+    """
+    delivery = Delivery.objects.get(id=upload.delivery_id)
+    try:
+        if upload.kind == ProofUpload.KindChoices.PICKUP_PHOTO:
+            transitions.pick_up(delivery, upload.storage_name)
+        else:
+            transitions.deliver(delivery, upload.storage_name)
+    except transitions.TransitionError:
+        raise UploadError('This delivery is no longer waiting for this photo.', status_code=409)
+    writer.finish()
+
+    upload.status = ProofUpload.StatusChoices.COMPLETED
+    upload.delivery = delivery
+
+
+def abort_upload(upload):
+    """
+    This cancels an upload and removes whatever was written so far
+    """
+    get_chunk_writer(upload).abort()
+    upload.status = ProofUpload.StatusChoices.ABORTED
+    upload.save(update_fields=['status', 'updated_at'])
@@ -6,4 +6,5 @@ app_name = 'shipments'
 urlpatterns = [
     # path('', views.ShipmentView.as_view(), name='shipment_index'),
     path('create/', views.create_delivery_task_view, name='create_delivery'),
+    path('apis/deliveries/bulk', views.bulk_create_deliveries_api, name='bulk_create_deliveries_api'),
 ]
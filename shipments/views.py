@@ -1,21 +1,30 @@
-import requests
+import logging
+from decimal import Decimal
+
 from django.conf import settings
 from django.contrib import messages
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponseRedirect
+from django.db import transaction
+from django.http import HttpResponseRedirect, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
 from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_http_methods
 from django.views.generic import TemplateView, FormView, ListView
-from firebase_admin import messaging
 
 from accounts.models import Courier
+from api import promotions
 from deliveet.utils.decorators import customer_required
+from deliveet.utils.firebase import firebase_messaging
 from finance.forms import TransactionForm
 from finance.models import Wallet, WalletTransaction
+from shipments import bulk, bundling, pricing, transitions
 from shipments.forms import DeliveryItemForm, DeliveryPickupForm, DeliveryRecipientForm, PaymentMethodForm
 from shipments.models import Delivery, DeliveryTransaction
 
+logger = logging.getLogger(__name__)
+
 
 def check_existing_delivery_tasks(request):
     task_owner = request.user.customer_account
@@ -86,7 +95,8 @@ def create_delivery_task_view(request):
                 calculate_distance_and_price(request, creating_delivery_task)
                 return redirect(reverse('shipments:create_delivery') + f'?step=4')
         elif step == 4:
-            payment = handle_payment_form(request, creating_delivery_task)
+            payment_form = PaymentMethodForm(request.POST, instance=creating_delivery_task)
+            payment = handle_payment_form(request, creating_delivery_task, payment_form)
             if payment:
                 return payment
 
@@ -118,74 +128,114 @@ def create_delivery_task_view(request):
 def calculate_distance_and_price(request, creating_delivery_task):
     origin = creating_delivery_task.pickup_address
     destination = creating_delivery_task.delivery_address
-    api_key = settings.GOOGLE_MAP_API_KEY
-    url = f"https://maps.googleapis.com/maps/api/distancematrix/json?origins={origin}&destinations={destination}&key={api_key}"
 
     try:
-        response = requests.get(url)
-        data = response.json()
-
-        if data['status'] == 'OK':
-            distance = data['rows'][0]['elements'][0]['distance']['value']  # Distance in meters
-            duration = data['rows'][0]['elements'][0]['duration']['value']  # Duration in seconds
-
-            creating_delivery_task.distance = round(distance / 1000, 2)  # Convert to km
-            creating_delivery_task.duration = int(duration / 60)  # Convert to minutes
-            creating_delivery_task.price = creating_delivery_task.distance * 450  # Adjust pricing as needed
-            creating_delivery_task.save()
-        else:
-            messages.error(request, "Unable to calculate distance. Please check the addresses.")
-
+        distance, duration = pricing.lookup_distance(origin, destination)
     except Exception as e:
         messages.error(request, str(e))
+    else:
+        creating_delivery_task.distance = distance
+        creating_delivery_task.duration = duration
+        creating_delivery_task.price = pricing.price_for_distance(distance)
+        creating_delivery_task.save()
+
+
+def submit_payment(request, delivery, payment_method, promotion=None):
+    """
+    This submits the delivery with its payment method in one transaction
+    that also redeems the promotion and, for wallet payments, charges the
+    locked wallet. It returns False, changing nothing, when the wallet
+    does not cover the price.
+    """
+    price = delivery.price
+    if promotion is not None:
+        price -= promotions.discount_for(promotion, price)
+
+    with transaction.atomic():
+        wallet = None
+        if payment_method == Delivery.PaymentMethodChoices.WALLET:
+            wallet = Wallet.objects.select_for_update().filter(user=request.user).first()
+            if wallet is None or wallet.balance < price:
+                return False
+
+        # Only a delivery still being created is submitted, so a repeated
+        # checkout changes nothing and is never charged twice.
+        transitions.submit(
+            delivery, payment_method=payment_method, price=price, promotion=promotion, discount=Decimal('0.00'),
+        )
+        if promotion is not None:
+            promotions.redeem(promotion)
+
+        if wallet is not None:
+            wallet.balance -= price
+            wallet.save(update_fields=['balance', 'updated_at'])
+
+            WalletTransaction.objects.create(
+                wallet=wallet,
+                transaction_type='Withdraw',
+                amount=price,
+                transaction_verified=True
+            )
+
+            DeliveryTransaction.objects.create(
+                delivery=delivery,
+                amount=price,
+                transaction_status=DeliveryTransaction.PaymentStatus.PAID
+            )
+    return True
+
+
+def handle_payment_form(request, creating_delivery_task, payment_form):
+    if not payment_form.is_valid():
+        # The bound form is rendered again with its errors.
+        messages.error(request, payment_form.errors)
+        return None
+
+    payment_method = payment_form.cleaned_data['payment_method']
+    if payment_method not in (Delivery.PaymentMethodChoices.COD, Delivery.PaymentMethodChoices.WALLET):
+        # Card payments are submitted, and their promotion redeemed, once the
+        # payment is verified. The card is charged the amount due.
+        promotion = payment_form.promotion
+        discount = Decimal('0.00')
+        if promotion is not None:
+            discount = promotions.discount_for(promotion, creating_delivery_task.price)
+        Delivery.objects.filter(
+            id=creating_delivery_task.id,
+            status=Delivery.StatusChoices.CREATING,
+        ).update(payment_method=payment_method, promotion=promotion, discount=discount)
+        creating_delivery_task.promotion = promotion
+        creating_delivery_task.discount = discount
+        return None
 
+    try:
+        submitted = submit_payment(request, creating_delivery_task, payment_method, payment_form.promotion)
+    except transitions.TransitionError:
+        # The delivery was already submitted; nothing is charged twice.
+        messages.info(request, 'This delivery task has already been created.')
+        return redirect(reverse('customers:customer_shipments'))
+    except promotions.PromotionError as error:
+        # The last use went to another order; nothing was submitted or charged.
+        messages.error(request, str(error))
+        return redirect(reverse('shipments:create_delivery') + '?step=4')
 
-def handle_payment_form(request, creating_delivery_task):
-    payment_form = PaymentMethodForm(request.POST, instance=creating_delivery_task)
-    if payment_form.is_valid():
-        creating_delivery_task = payment_form.save()
-        if creating_delivery_task.payment_method == Delivery.PaymentMethodChoices.COD:
-            creating_delivery_task.status = Delivery.StatusChoices.PROCESSING
-            creating_delivery_task.save()
-            messages.success(request, 'Delivery task created successfully.')
-            send_courier_notifications(creating_delivery_task)
-
-            return redirect(reverse('customers:customer_shipments'))
-
-        elif creating_delivery_task.payment_method == Delivery.PaymentMethodChoices.WALLET:
-            wallet = Wallet.objects.get(user=request.user)
-            if wallet.balance >= creating_delivery_task.price:
-                wallet.balance -= creating_delivery_task.price
-                wallet.save()
-
-                WalletTransaction.objects.create(
-                    wallet=wallet,
-                    transaction_type='Withdraw',
-                    amount=creating_delivery_task.price,
-                    transaction_verified=True
-                )
-
-                DeliveryTransaction.objects.create(
-                    delivery=creating_delivery_task,
-                    amount=creating_delivery_task.price,
-                    transaction_status=DeliveryTransaction.PaymentStatus.PAID
-                )
-
-                creating_delivery_task.status = Delivery.StatusChoices.PROCESSING
-                creating_delivery_task.save()
+    if not submitted:
+        messages.error(request, 'Insufficient wallet balance. Please fund your account.')
+        return redirect(reverse('finance:initiate_transaction'))
 
-                messages.success(request, 'Payment successful. Delivery task created successfully.')
-                send_courier_notifications(creating_delivery_task)
-                return redirect(reverse('customers:customer_shipments'))
-            else:
-                messages.error(request, 'Insufficient wallet balance. Please fund your account.')
-                return redirect(reverse('finance:initiate_transaction'))
-    return None
+    if payment_method == Delivery.PaymentMethodChoices.WALLET:
+        messages.success(request, 'Payment successful. Delivery task created successfully.')
+    else:
+        messages.success(request, 'Delivery task created successfully.')
+    # A delivery that can be bundled is offered with its bundle instead.
+    if not bundling.will_be_bundled(creating_delivery_task) and bundling.not_yet_broadcast([creating_delivery_task]):
+        send_courier_notifications(creating_delivery_task)
+    return redirect(reverse('customers:customer_shipments'))
 
 
 def send_courier_notifications(creating_delivery_task):
     couriers = Courier.objects.all()
     registration_tokens = [i.fcm_token for i in couriers if i.fcm_token]
+    messaging = firebase_messaging()
     message = messaging.MulticastMessage(
         notification=messaging.Notification(
             title=creating_delivery_task.item_name,
@@ -206,25 +256,66 @@ def send_courier_notifications(creating_delivery_task):
 
 
 def verify_delivery_payment(request, transaction_reference):
-    transaction = get_object_or_404(DeliveryTransaction, id=transaction_reference)
+    delivery_transaction = get_object_or_404(DeliveryTransaction, id=transaction_reference)
 
-    if transaction.transaction_verified:
+    if delivery_transaction.transaction_verified:
         messages.info(request, 'This transaction has already been processed.')
         return redirect('customers:customer_shipments')
 
-    verified = transaction.verify_transaction()
+    verified = delivery_transaction.verify_transaction()
 
     if verified:
         with transaction.atomic():
-            delivery = transaction.delivery
-            delivery.status = Delivery.StatusChoices.PROCESSING
-            delivery.save()
-
-            transaction.transaction_verified = True
-            transaction.save()
+            delivery_transaction.transaction_verified = True
+            delivery_transaction.save()
+
+            delivery = delivery_transaction.delivery
+            try:
+                transitions.submit(delivery, price=delivery.amount_due, discount=Decimal('0.00'))
+            except transitions.TransitionError:
+                # The payment is kept; the delivery left CREATING through another request.
+                pass
+            else:
+                if delivery.promotion is not None:
+                    _redeem_paid_promotion(delivery)
 
         messages.success(request, 'Payment successful. Delivery task created.')
     else:
         messages.error(request, 'Transaction verification failed')
 
     return redirect('customers:customer_shipments')
+
+
+def _redeem_paid_promotion(delivery):
+    try:
+        promotions.redeem(delivery.promotion)
+    except promotions.PromotionError:
+        # The card was already charged the discounted price, so the
+        # delivery keeps it.
+        logger.warning('Promotion %s ran out before delivery %s was paid', delivery.promotion.code, delivery.id)
+
+
+@login_required
+@require_http_methods(["POST"])
+def bulk_create_deliveries_api(request):
+    """
+    Creates up to BULK_DELIVERY_MAX_ROWS deliveries from a JSON list or a
+    CSV file and reports the result of every row. It pays from the wallet
+    with the session cookie, so requests must carry the CSRF token.
+    """
+    if not request.user.is_customer or not hasattr(request.user, 'customer_account'):
+        return JsonResponse({"success": False, "message": "Only customers can create deliveries."}, status=403)
+
+    try:
+        rows = bulk.parse_rows(request)
+    except bulk.BulkRequestError as error:
+        return JsonResponse({"success": False, "message": str(error)}, status=400)
+
+    results = bulk.create_deliveries(request.user, rows)
+    created = sum(1 for result in results if result['success'])
+    return JsonResponse({
+        "success": created > 0,
+        "created": created,
+        "failed": len(results) - created,
+        "results": results,
+    }, status=201 if created else 400)
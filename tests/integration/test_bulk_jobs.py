@@ -0,0 +1,158 @@
+"""
+Bulk Job Tests
+Tests the admin imports and bulk actions run in the background
+"""
+import pickle
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import UserAccount
+from app.models import BulkJob
+from deliveet.utils.bulk_jobs import run_job
+from finance.models import Wallet, WalletTransaction
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+USERS_CSV = (
+    'email,first_name,last_name,account_type,is_customer\n'
+    'existing@test.com,Renamed,,courier,\n'
+    'ada@test.com,Ada,Lovelace,,True\n'
+    'not-an-email,Broken,,,\n'
+    'grace@test.com,Grace,Hopper,,\n'
+    'alan@test.com,Alan,Turing,,True\n'
+)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, BULK_JOB_CHUNK_SIZE=2)
+class BulkJobTests(TestCase):
+    """Test chunked imports and bulk actions"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.existing = UserAccount.objects.create_user(
+            email='existing@test.com',
+            password='ExistingPass123!',
+            first_name='Old',
+            last_name='Name',
+        )
+
+    def import_job(self, **fields):
+        job = BulkJob(kind=BulkJob.KindChoices.IMPORT, model='accounts.useraccount', **fields)
+        job.source.save('users.csv', ContentFile(USERS_CSV.encode()), save=False)
+        job.save()
+        return job
+
+    def test_import_creates_and_updates_in_chunks(self):
+        job = self.import_job()
+
+        run_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, BulkJob.StatusChoices.COMPLETED)
+        self.assertEqual((job.total, job.processed, job.succeeded, job.failed), (5, 5, 4, 1))
+        self.assertEqual(job.checkpoint, '5')
+        self.assertEqual(job.errors[0]['row'], 3)
+        self.assertIn('email', job.errors[0]['errors'])
+
+        self.existing.refresh_from_db()
+        # Empty cells leave the existing values alone.
+        self.assertEqual((self.existing.first_name, self.existing.last_name), ('Renamed', 'Name'))
+        self.assertEqual(self.existing.account_type, 'courier')
+        self.assertTrue(self.existing.check_password('ExistingPass123!'))
+
+        ada = UserAccount.objects.get(email='ada@test.com')
+        self.assertTrue(ada.is_customer)
+        self.assertFalse(ada.has_usable_password())
+        self.assertEqual(UserAccount.objects.count(), 4)
+
+    def test_interrupted_import_resumes_from_checkpoint(self):
+        # A worker stopped after committing the first two chunks.
+        job = self.import_job(
+            status=BulkJob.StatusChoices.RUNNING,
+            total=5,
+            processed=4,
+            succeeded=3,
+            failed=1,
+            checkpoint='4',
+            heartbeat_at=timezone.now() - timedelta(hours=1),
+        )
+
+        run_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, BulkJob.StatusChoices.COMPLETED)
+        self.assertEqual((job.processed, job.succeeded), (5, 4))
+        self.assertEqual(list(UserAccount.objects.values_list('email', flat=True).order_by('email')), [
+            'alan@test.com', 'existing@test.com',
+        ])
+
+    def test_bulk_action_runs_in_chunks_and_is_claimed_once(self):
+        for number in range(5):
+            UserAccount.objects.create_user(email=f'user{number}@test.com', password='UserPass123!')
+        UserAccount.objects.update(is_active=False)
+        queryset = UserAccount.objects.filter(email__startswith='user')
+        job = BulkJob.objects.create(
+            kind=BulkJob.KindChoices.ACTION,
+            model='accounts.useraccount',
+            action='activate_users',
+            query=pickle.dumps(queryset.query),
+        )
+
+        run_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, BulkJob.StatusChoices.COMPLETED)
+        self.assertEqual((job.total, job.processed, job.succeeded), (5, 5, 5))
+        self.assertEqual(queryset.filter(is_active=True).count(), 5)
+        self.assertFalse(UserAccount.objects.get(email='existing@test.com').is_active)
+
+        # A job another worker is running is left to it.
+        BulkJob.objects.filter(pk=job.pk).update(status=BulkJob.StatusChoices.RUNNING, heartbeat_at=timezone.now())
+        UserAccount.objects.update(is_active=False)
+        run_job(job.pk)
+        self.assertEqual(queryset.filter(is_active=True).count(), 0)
+
+    def test_verify_deposits_credits_only_what_paystack_confirms(self):
+        wallet = Wallet.objects.create(user=self.existing, balance=Decimal('100.00'))
+        paid = WalletTransaction.objects.create(wallet=wallet, amount=Decimal('500.00'))
+        unpaid = WalletTransaction.objects.create(wallet=wallet, amount=Decimal('700.00'))
+        credited = WalletTransaction.objects.create(wallet=wallet, amount=Decimal('900.00'), transaction_verified=True)
+        queryset = WalletTransaction.objects.all()
+        job = BulkJob.objects.create(
+            kind=BulkJob.KindChoices.ACTION,
+            model='finance.wallettransaction',
+            action='verify_deposits',
+            query=pickle.dumps(queryset.query),
+        )
+
+        def verify(reference, amount):
+            if reference == paid.transaction_reference:
+                return True, {'amount': 50000}
+            return False, 'Transaction reference not found'
+
+        with mock.patch('finance.models.Paystack.verify_transaction', side_effect=verify) as paystack:
+            run_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, BulkJob.StatusChoices.COMPLETED)
+        self.assertEqual((job.processed, job.succeeded), (3, 1))
+        self.assertEqual(paystack.call_count, 2)
+        wallet.refresh_from_db()
+        self.assertEqual(wallet.balance, Decimal('600.00'))
+        self.assertEqual(
+            list(queryset.filter(transaction_verified=True).order_by('pk').values_list('pk', flat=True)),
+            [paid.pk, credited.pk],
+        )
+        unpaid.refresh_from_db()
+        self.assertFalse(unpaid.transaction_verified)
@@ -0,0 +1,73 @@
+"""
+Channels Auth Tests
+Tests authenticating WebSocket connections with JWT access tokens
+"""
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.test import TransactionTestCase
+from django.urls import path
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import UserAccount
+from deliveet.consumers import NotificationConsumer
+from deliveet.utils.channels_auth import JWTAuthMiddlewareStack
+
+application = JWTAuthMiddlewareStack(URLRouter([
+    path('ws/notifications/<user_id>/', NotificationConsumer.as_asgi()),
+    path('ws/notifications/<user_id>/<user_token>/', NotificationConsumer.as_asgi()),
+]))
+
+
+class JWTAuthMiddlewareTests(TransactionTestCase):
+    """Test the WebSocket JWT middleware and its user cache"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create_user(
+            email='courier@test.com',
+            password='CourierPass123!',
+            first_name='Ada',
+            last_name='Obi',
+        )
+        self.token = str(AccessToken.for_user(self.user))
+
+    async def connect(self, url, **kwargs):
+        communicator = WebsocketCommunicator(application, url, **kwargs)
+        connected, subprotocol = await communicator.connect()
+        await communicator.disconnect()
+        return connected, subprotocol
+
+    async def test_token_from_subprotocol_or_header(self):
+        url = f'/ws/notifications/{self.user.pk}/'
+
+        self.assertEqual(
+            await self.connect(url, subprotocols=['access_token', self.token]),
+            (True, 'access_token'),
+        )
+        self.assertEqual(
+            await self.connect(url, headers=[(b'authorization', f'Bearer {self.token}'.encode())]),
+            (True, None),
+        )
+        self.assertEqual(await self.connect(url, subprotocols=['access_token', 'not-a-token']), (False, 1000))
+        self.assertEqual(await self.connect(f'{url}{self.token}/'), (True, None))
+
+    async def test_notifications_of_another_user_are_refused(self):
+        other = await UserAccount.objects.acreate(email='other@test.com', first_name='Other')
+
+        connected, _ = await self.connect(f'/ws/notifications/{other.pk}/', subprotocols=['access_token', self.token])
+
+        self.assertFalse(connected)
+
+    async def test_user_is_cached_until_saved(self):
+        url = f'/ws/notifications/{self.user.pk}/'
+        subprotocols = ['access_token', self.token]
+        self.assertTrue((await self.connect(url, subprotocols=subprotocols))[0])
+
+        # An update without signals leaves the cached user in place
+        await UserAccount.objects.filter(pk=self.user.pk).aupdate(is_active=False)
+        self.assertTrue((await self.connect(url, subprotocols=subprotocols))[0])
+
+        self.user.is_active = False
+        await self.user.asave(update_fields=['is_active'])
+        self.assertFalse((await self.connect(url, subprotocols=subprotocols))[0])
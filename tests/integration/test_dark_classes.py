@@ -0,0 +1,47 @@
+"""
+Dark Class Tests
+Tests that templates are loaded without Tailwind's dark: classes
+"""
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.template import Context, Engine
+from django.test import SimpleTestCase
+
+from deliveet.utils.remove_dark_classes import strip_dark_classes
+
+
+class DarkClassStrippingTests(SimpleTestCase):
+    """Test stripping dark: classes when templates load"""
+
+    def test_classes_are_stripped_from_attributes_and_tag_arguments(self):
+        source = (
+            '<p class="text-gray-900 dark:text-white">'
+            '<a class="{% if step == 1 %}font-semibold dark:text-white{% else %}dark:text-gray-400 '
+            'text-gray-300{% endif %}">'
+            "{{ field|add_class:'p-2.5 dark:bg-gray-700 block' }}"
+            '<script>el.classList.add("dark")</script>'
+        )
+
+        self.assertEqual(strip_dark_classes(source), (
+            '<p class="text-gray-900 ">'
+            '<a class="{% if step == 1 %}font-semibold {% else %}text-gray-300{% endif %}">'
+            "{{ field|add_class:'p-2.5 block' }}"
+            '<script>el.classList.add("dark")</script>'
+        ))
+
+    def test_cached_loader_strips_each_template_once(self):
+        directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, directory)
+        (directory / 'page.html').write_text('<b class="font-bold dark:text-white">{{ name }}</b>')
+        engine = Engine(loaders=[
+            ('django.template.loaders.cached.Loader', [
+                ('deliveet.utils.remove_dark_classes.FilesystemLoader', [str(directory)]),
+            ]),
+        ])
+
+        template = engine.get_template('page.html')
+
+        self.assertEqual(template.render(Context({'name': 'Ada'})), '<b class="font-bold ">Ada</b>')
+        self.assertIs(engine.get_template('page.html'), template)
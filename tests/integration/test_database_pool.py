@@ -0,0 +1,50 @@
+"""
+Database Pool Tests
+Tests the health check and the pool statistics
+"""
+import json
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from deliveet.utils import db_pool
+from deliveet.utils.health import health_check
+
+
+class FakePool:
+    def get_stats(self):
+        return {'pool_size': 4, 'pool_max': 8, 'requests_num': 200, 'requests_queued': 5, 'requests_wait_ms': 150}
+
+
+class PoolStatsTests(SimpleTestCase):
+    """Test the pool statistics"""
+
+    def test_stats_include_average_wait(self):
+        connections = {'default': SimpleNamespace(pool=FakePool()), 'sqlite': SimpleNamespace()}
+        with mock.patch.object(db_pool, 'connections', connections):
+            stats = db_pool.pool_stats()
+
+        self.assertEqual(list(stats), ['default'])
+        self.assertEqual(stats['default']['requests_wait_ms_avg'], 0.75)
+        self.assertEqual(stats['default']['requests_queued'], 5)
+
+
+class HealthCheckTests(TestCase):
+    """Test the health check endpoint"""
+
+    @override_settings(METRICS_TOKEN='scrape-token')
+    def test_health_check_queries_the_database(self):
+        response = health_check(RequestFactory().get('/health/', HTTP_AUTHORIZATION='Bearer scrape-token'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['databases']['default'], 'ok')
+
+    def test_anonymous_health_check_only_gets_the_status(self):
+        request = RequestFactory().get('/health/')
+        request.user = AnonymousUser()
+
+        response = health_check(request)
+
+        self.assertEqual(json.loads(response.content), {'status': 'ok'})
@@ -0,0 +1,61 @@
+"""
+Delivery Analytics Tests
+Tests period queries on the FastAPI rollup store
+"""
+from datetime import datetime, timedelta, timezone
+
+from django.test import SimpleTestCase
+
+from fastapi_service import analytics
+
+
+def rollup(period_start, granularity=analytics.DAY, subject_id='courier-1', **values):
+    row = {
+        'granularity': granularity,
+        'scope': analytics.COURIER,
+        'subject_id': subject_id,
+        'period_start': period_start.isoformat(),
+    }
+    row.update(dict.fromkeys(analytics.FIELDS, 0))
+    row.update(values)
+    return row
+
+
+class RollupStoreTests(SimpleTestCase):
+    """Test the analytics rollup store"""
+
+    def setUp(self):
+        self.now = datetime(2026, 3, 10, 14, 30, tzinfo=timezone.utc)
+        self.today = datetime(2026, 3, 10, tzinfo=timezone.utc)
+        self.store = analytics.RollupStore()
+        self.store.load([
+            rollup(self.today, deliveries=3, earnings=2700.0, rating_sum=9, rating_count=2),
+            rollup(self.today - timedelta(days=6), deliveries=2, earnings=900.0, rating_sum=5, rating_count=1),
+            rollup(self.today - timedelta(days=20), deliveries=10, earnings=9000.0),
+            rollup(self.today + timedelta(hours=14), analytics.HOUR, deliveries=1, earnings=450.0),
+            rollup(self.today, subject_id='courier-2', deliveries=7),
+        ], full=True, now=self.now)
+
+    def test_periods_add_up_their_rows(self):
+        day = self.store.totals(analytics.COURIER, 'courier-1', 'day', now=self.now)
+        week = self.store.totals(analytics.COURIER, 'courier-1', 'week', now=self.now)
+        month = self.store.totals(analytics.COURIER, 'courier-1', 'month', now=self.now)
+        hour = self.store.totals(analytics.COURIER, 'courier-1', 'hour', now=self.now)
+
+        self.assertEqual((day['deliveries'], week['deliveries'], month['deliveries']), (3, 5, 15))
+        self.assertEqual(week['earnings'], 3600.0)
+        self.assertEqual(week['average_rating'], 4.67)
+        self.assertEqual(week['period_start'], '2026-03-04T00:00:00+00:00')
+        self.assertEqual(hour['deliveries'], 1)
+
+    def test_unknown_subject_has_zero_totals(self):
+        totals = self.store.totals(analytics.COURIER, 'nobody', 'week', now=self.now)
+        self.assertEqual(totals['deliveries'], 0)
+        self.assertEqual(totals['average_rating'], 0.0)
+
+    def test_incremental_load_replaces_rows_and_prunes_old_ones(self):
+        self.store.load([rollup(self.today, deliveries=4)], now=self.now + timedelta(days=15))
+
+        self.assertEqual(self.store.totals(analytics.COURIER, 'courier-1', 'day', now=self.now)['deliveries'], 4)
+        self.assertEqual(self.store.totals(analytics.COURIER, 'courier-1', 'month', now=self.now)['deliveries'], 6)
+        self.assertTrue(self.store.synced)
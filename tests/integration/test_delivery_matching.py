@@ -0,0 +1,53 @@
+"""
+Delivery Matching Tests
+Tests courier ranking and batch assignment in the FastAPI matching engine
+"""
+import time
+
+from django.test import SimpleTestCase
+
+from fastapi_service import matching
+
+
+class DeliveryMatchingTests(SimpleTestCase):
+    """Test the courier index and matching"""
+
+    def setUp(self):
+        self.now = time.time()
+        self.index = matching.CourierIndex(capacity=2)
+        self.index.update_location('near', 6.5200, 3.3700)
+        self.index.update_location('close', 6.5300, 3.3800)
+        self.index.update_location('far', 6.6000, 3.3500)
+        self.index.update_location('other-city', 7.3800, 3.9000)
+        for courier_id in ('near', 'close', 'far', 'other-city'):
+            self.index.update_stats(courier_id, average_rating=5.0, idle_since=self.now - 3600)
+
+    def test_candidates_are_limited_to_the_radius(self):
+        rows, _ = self.index.candidates(6.52, 3.37, radius_km=5)
+        self.assertEqual({self.index.ids[row] for row in rows}, {'near', 'close'})
+
+    def test_nearest_idle_courier_ranks_first(self):
+        ranked = matching.rank_couriers(self.index, 6.5201, 3.3701, now=self.now)
+        self.assertEqual([match[0] for match in ranked], ['near', 'close', 'far'])
+
+    def test_workload_and_rating_outweigh_small_distances(self):
+        self.index.update_stats('near', active_deliveries=2, average_rating=3.5)
+        ranked = matching.rank_couriers(self.index, 6.5201, 3.3701, now=self.now)
+        self.assertEqual(ranked[0][0], 'close')
+
+    def test_delivery_events_track_workload(self):
+        self.index.apply_delivery_event('near', 'processing', 'pickup_in_progress', self.now)
+        self.assertEqual(self.index.active_deliveries[self.index.rows['near']], 1)
+        self.index.apply_delivery_event('near', 'in-progress', 'delivered', self.now)
+        self.assertEqual(self.index.active_deliveries[self.index.rows['near']], 0)
+        self.assertEqual(self.index.idle_since[self.index.rows['near']], self.now)
+
+    def test_batch_assigns_each_courier_once_at_minimum_cost(self):
+        # The first pickup is as close to 'near' as to 'close'; the second
+        # sits on 'near', so the cheapest plan gives the first one 'close'.
+        pickups = [(6.5250, 3.3750), (6.5200, 3.3700), (9.0000, 3.0000)]
+        assignments = matching.assign_batch(self.index, pickups, now=self.now)
+
+        self.assertEqual(assignments[0][0], 'close')
+        self.assertEqual(assignments[1][0], 'near')
+        self.assertIsNone(assignments[2])
@@ -0,0 +1,81 @@
+"""
+Document Expiry Tests
+Tests expiring documents, unverifying their couriers and notifying them
+"""
+from datetime import date, timedelta
+
+from django.test import TestCase, override_settings
+
+from accounts.models import Courier, UserAccount
+from api.documents import expire_documents
+from api.models import Document, Notification
+
+TODAY = date(2026, 10, 19)
+
+
+def create_courier(email):
+    user = UserAccount.objects.create_user(email=email, is_courier=True)
+    return Courier.objects.create(user=user, is_verified=True)
+
+
+def create_document(courier, document_type='license', expires_in=None, is_verified=True):
+    return Document.objects.create(
+        user=courier.user,
+        document_type=document_type,
+        file=f'documents/{document_type}.pdf',
+        original_filename=f'{document_type}.pdf',
+        file_size=1024,
+        is_verified=is_verified,
+        expiry_date=TODAY + timedelta(days=expires_in) if expires_in is not None else None,
+    )
+
+
+@override_settings(NOTIFICATION_BATCH_SIZE=2)
+class DocumentExpiryTests(TestCase):
+    """Test the document expiry sweep"""
+
+    def test_expired_documents_unverify_their_couriers_in_bulk(self):
+        lapsed = create_courier('lapsed@test.com')
+        renewed = create_courier('renewed@test.com')
+        other = create_courier('other@test.com')
+        expired = [
+            create_document(lapsed, 'license', expires_in=-1),
+            create_document(lapsed, 'insurance', expires_in=-30),
+            create_document(renewed, 'license', expires_in=-1),
+            # Not a verification document
+            create_document(other, 'proof_of_delivery', expires_in=-1),
+        ]
+        create_document(renewed, 'license', expires_in=365)
+        create_document(other, 'license', expires_in=0)
+        create_document(other, 'id_card')
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            # A savepoint, the document and courier UPDATEs, one SELECT and
+            # an INSERT per two notifications
+            with self.assertNumQueries(7):
+                self.assertEqual(expire_documents(TODAY), (4, 1))
+
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(
+            set(Document.objects.filter(is_expired=True).values_list('pk', flat=True)),
+            {document.pk for document in expired},
+        )
+        self.assertEqual(
+            {courier.user.email: courier.is_verified for courier in Courier.objects.select_related('user')},
+            {'lapsed@test.com': False, 'renewed@test.com': True, 'other@test.com': True},
+        )
+        self.assertEqual(Notification.objects.filter(user=lapsed.user).count(), 2)
+        self.assertEqual(
+            Notification.objects.get(user=renewed.user).title,
+            'Your Driver License has expired',
+        )
+
+    def test_documents_are_expired_once(self):
+        courier = create_courier('courier@test.com')
+        create_document(courier, expires_in=-1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(expire_documents(TODAY), (1, 1))
+        with self.assertNumQueries(3):
+            self.assertEqual(expire_documents(TODAY), (0, 0))
+        self.assertEqual(Notification.objects.count(), 1)
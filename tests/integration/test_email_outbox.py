@@ -0,0 +1,99 @@
+"""
+Email Outbox Tests
+Tests that emails are queued on commit and sent in batches by workers
+"""
+from datetime import timedelta
+from smtplib import SMTPServerDisconnected
+from unittest import mock
+
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from accounts.forms import ResetPasswordForm
+from accounts.models import UserAccount
+from app.models import OutgoingEmail
+from deliveet.utils import email_outbox
+
+Status = OutgoingEmail.StatusChoices
+
+
+@override_settings(EMAIL_OUTBOX_RATE_LIMIT=0, EMAIL_OUTBOX_MAX_ATTEMPTS=3, EMAIL_OUTBOX_RETRY_SECONDS=60)
+class EmailOutboxTests(TestCase):
+    """Test queueing and sending emails through the outbox"""
+
+    def create_user(self):
+        return UserAccount.objects.create_user(
+            email='ada@test.com',
+            password='AdaPass123!',
+            first_name='Ada',
+            last_name='Lovelace',
+        )
+
+    def test_welcome_email_is_queued_and_sent_after_commit(self):
+        with mock.patch.object(email_outbox, 'dispatch') as dispatch:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.create_user()
+                self.assertEqual(mail.outbox, [])
+                dispatch.assert_not_called()
+            dispatch.assert_called_once()
+
+        self.assertEqual(email_outbox.send_batch(), 1)
+
+        email = OutgoingEmail.objects.get()
+        self.assertEqual((email.status, email.to), (Status.SENT, ['ada@test.com']))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'Welcome to DELIVEET')
+        self.assertEqual(mail.outbox[0].alternatives[0].mimetype, 'text/html')
+        self.assertEqual(email_outbox.send_batch(), 0)
+
+    def test_password_reset_email_goes_through_the_outbox(self):
+        self.create_user()
+        form = ResetPasswordForm({'email': 'ada@test.com'})
+        self.assertTrue(form.is_valid())
+
+        form.save(
+            domain_override='deliveet.app',
+            subject_template_name='registration/password_reset_subject.txt',
+            email_template_name='registration/password_reset_email.html',
+        )
+
+        email = OutgoingEmail.objects.get(to=['ada@test.com'], subject__icontains='password')
+        self.assertEqual(email.status, Status.PENDING)
+        self.assertIn('deliveet.app', email.body)
+
+    def test_failed_email_is_retried_with_backoff_then_given_up(self):
+        email = email_outbox.queue_email('Receipt', 'Thanks', ['ada@test.com'])
+        error = SMTPServerDisconnected('Connection unexpectedly closed')
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=error):
+            for attempt in range(1, 4):
+                OutgoingEmail.objects.filter(pk=email.pk).update(send_after=timezone.now())
+                before = timezone.now()
+                email_outbox.send_batch()
+
+                email.refresh_from_db()
+                self.assertEqual(email.attempts, attempt)
+                if attempt < 3:
+                    self.assertEqual(email.status, Status.PENDING)
+                    self.assertGreaterEqual((email.send_after - before).total_seconds(), 60 * 2 ** (attempt - 1))
+
+        self.assertEqual(email.status, Status.FAILED)
+        self.assertIn('SMTPServerDisconnected', email.last_error)
+        self.assertEqual(email_outbox.send_batch(), 0)
+
+    def test_old_sent_and_failed_emails_are_purged(self):
+        old = timezone.now() - timedelta(days=8)
+        sent = email_outbox.queue_email('Receipt', 'Thanks', ['ada@test.com'])
+        failed = email_outbox.queue_email('Reset', 'https://deliveet.app/reset/abc', ['ada@test.com'])
+        pending = email_outbox.queue_email('Later', 'Soon', ['ada@test.com'])
+        recent = email_outbox.queue_email('Reset', 'https://deliveet.app/reset/def', ['ada@test.com'])
+        OutgoingEmail.objects.filter(pk=sent.pk).update(status=Status.SENT, sent_at=old, created_at=old)
+        OutgoingEmail.objects.filter(pk=failed.pk).update(status=Status.FAILED, created_at=old)
+        OutgoingEmail.objects.filter(pk=pending.pk).update(created_at=old)
+        OutgoingEmail.objects.filter(pk=recent.pk).update(status=Status.FAILED)
+
+        self.assertEqual(email_outbox.purge_sent(), 2)
+        self.assertQuerySetEqual(
+            OutgoingEmail.objects.order_by('pk').values_list('pk', flat=True), [pending.pk, recent.pk]
+        )
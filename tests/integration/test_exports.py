@@ -0,0 +1,132 @@
+"""
+Export Tests
+Tests the streaming CSV and NDJSON exports
+"""
+import asyncio
+import csv
+import io
+import json
+import warnings
+from decimal import Decimal
+
+from django.contrib.admin.sites import site
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import path
+
+from accounts.models import Customer, UserAccount
+from deliveet.utils.exports import export_response, filter_export, stream_rows
+from payments.models import Payment
+from shipments.models import Delivery
+
+
+def export_deliveries(request):
+    return export_response(
+        Delivery.objects.order_by('item_name'), ['item_name', 'status'], 'csv', 'deliveries', request
+    )
+
+
+urlpatterns = [
+    path('export/', export_deliveries),
+]
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class StreamingExportTests(TestCase):
+    """Test streaming exports of deliveries and payments"""
+
+    def setUp(self):
+        self.user = UserAccount.objects.create_user(
+            email='merchant@test.com',
+            password='MerchantPass123!',
+            is_customer=True,
+        )
+        customer = Customer.objects.create(user=self.user)
+        for number, status in enumerate(['delivered', 'delivered', 'canceled', 'processing', 'delivered']):
+            Delivery.objects.create(customer=customer, item_name=f'Parcel {number}', status=status, price=Decimal('100.50'))
+
+    def params(self, query):
+        return RequestFactory().get('/export/', query).GET
+
+    def test_csv_is_written_in_chunks(self):
+        queryset = filter_export(Delivery.objects.all(), self.params({'status': ['delivered', 'canceled']}))
+
+        chunks = list(stream_rows(queryset.order_by('item_name'), ['item_name', 'status', 'price']))
+
+        # The header, then two rows per chunk.
+        self.assertEqual(len(chunks), 3)
+        rows = list(csv.reader(io.StringIO(''.join(chunks))))
+        self.assertEqual(rows[0], ['item_name', 'status', 'price'])
+        self.assertEqual(rows[1:], [
+            ['Parcel 0', 'delivered', '100.50'],
+            ['Parcel 1', 'delivered', '100.50'],
+            ['Parcel 2', 'canceled', '100.50'],
+            ['Parcel 4', 'delivered', '100.50'],
+        ])
+
+    def test_ndjson_has_one_object_per_line(self):
+        queryset = filter_export(Delivery.objects.all(), self.params({'from': '2000-01-01', 'to': '2999-12-31'}))
+
+        lines = ''.join(stream_rows(queryset, ['item_name', 'price', 'created_at'], 'ndjson')).splitlines()
+
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[0])['price'], '100.50')
+
+    def test_admin_export_view_streams_filtered_payments(self):
+        Payment.objects.create(user=self.user, amount=Decimal('500.00'), transaction_ref='ref-1',
+                               status='completed', payment_method='card', payment_for='wallet')
+        Payment.objects.create(user=self.user, amount=Decimal('700.00'), transaction_ref='ref-2',
+                               status='failed', payment_method='card', payment_for='wallet')
+        admin = site._registry[Payment]
+        request = RequestFactory().get('/admin/payments/payment/export/', {'status': 'completed'})
+        request.user = UserAccount.objects.create_superuser(email='admin@test.com', password='AdminPass123!')
+
+        response = admin.export_view(request)
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['transaction_ref'] for row in rows], ['ref-1'])
+
+        request = RequestFactory().get('/admin/payments/payment/export/', {'from': 'yesterday'})
+        request.user = UserAccount.objects.get(email='admin@test.com')
+        self.assertEqual(admin.export_view(request).status_code, 400)
+
+    @override_settings(ROOT_URLCONF=__name__, MIDDLEWARE=[])
+    async def test_asgi_export_is_sent_a_chunk_at_a_time(self):
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': '/export/', 'query_string': b'', 'headers': [],
+            'asgi': {'version': '3.0'},
+        }
+        requests = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+        messages = []
+
+        async def receive():
+            if requests:
+                return requests.pop()
+            # The client stays connected.
+            await asyncio.Event().wait()
+
+        async def send(message):
+            messages.append(message)
+
+        # As the test client does, keep the test's database connection open.
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        try:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                await ASGIHandler()(scope, receive, send)
+        finally:
+            request_started.connect(close_old_connections)
+            request_finished.connect(close_old_connections)
+
+        self.assertFalse([warning for warning in caught if 'synchronous iterators' in str(warning.message)])
+        self.assertEqual(messages[0]['status'], 200)
+        bodies = [message['body'] for message in messages[1:] if message.get('body')]
+        # The header, then two rows per chunk.
+        self.assertEqual(len(bodies), 4)
+        rows = list(csv.reader(io.StringIO(b''.join(bodies).decode())))
+        self.assertEqual(rows[0], ['item_name', 'status'])
+        self.assertEqual(len(rows), 6)
@@ -0,0 +1,44 @@
+"""
+Firebase Tests
+Tests that Firebase is initialized on first use rather than at import
+"""
+import sys
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from deliveet.utils import firebase
+
+
+class FirebaseInitializationTests(SimpleTestCase):
+    """Test the lazily initialized Firebase app"""
+
+    def setUp(self):
+        patcher = mock.patch.object(firebase, '_app', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_views_import_without_initializing_firebase(self):
+        import accounts.views  # noqa: F401
+        import shipments.views  # noqa: F401
+
+        self.assertIsNone(firebase._app)
+
+    @override_settings(FIREBASE_SECRETS={'type': 'service_account', 'private_key': None})
+    def test_missing_credentials_raise_improperly_configured(self):
+        with self.assertRaises(ImproperlyConfigured):
+            firebase.firebase_messaging()
+
+        self.assertIsNone(firebase._app)
+
+    def test_app_is_initialized_once(self):
+        firebase_admin = mock.MagicMock()
+        modules = {'firebase_admin': firebase_admin, 'firebase_admin.credentials': firebase_admin.credentials}
+
+        with mock.patch.dict(sys.modules, modules):
+            first = firebase.firebase_app()
+            second = firebase.firebase_app()
+
+        self.assertIs(first, second)
+        firebase_admin.initialize_app.assert_called_once()
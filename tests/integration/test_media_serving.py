@@ -0,0 +1,101 @@
+"""
+Media Serving Integration Tests
+Tests X-Accel-Redirect/X-Sendfile hand-off and cache validators for media files
+"""
+import os
+import shutil
+import tempfile
+from unittest import skipUnless
+
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from deliveet.utils.media import IMMUTABLE_CACHE_CONTROL, serve_media
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+# The media storage USE_S3 sets up in deliveet/settings.py
+S3_STORAGES = {
+    'default': {
+        'BACKEND': 'storages.backends.s3boto3.S3Boto3Storage',
+        'OPTIONS': {
+            'bucket_name': 'deliveet-test',
+            'access_key': 'test',
+            'secret_key': 'test',
+            'region_name': 'us-east-1',
+            'location': 'media',
+            'custom_domain': None,
+            'querystring_auth': True,
+            'querystring_expire': 600,
+        },
+    },
+}
+
+
+class MediaServingTests(SimpleTestCase):
+    """Test the media serving view"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.media_root, 'proofs'))
+        with open(os.path.join(self.media_root, 'proofs', 'photo.jpg'), 'wb') as photo:
+            photo.write(b'\xff\xd8\xff' + b'\x00' * 100)
+        with open(os.path.join(self.media_root, 'avatar.png'), 'wb') as avatar:
+            avatar.write(b'\x89PNG\r\n\x1a\n')
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root)
+
+    def serve(self, path, **headers):
+        return serve_media(self.factory.get(f'/media/{path}', **headers), path)
+
+    def test_x_accel_redirect_hands_off_to_nginx(self):
+        with override_settings(MEDIA_ROOT=self.media_root, MEDIA_SERVE_MODE='x-accel', USE_S3=False):
+            response = self.serve('proofs/photo.jpg')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/proofs/photo.jpg')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(response.content, b'')
+        self.assertFalse(response['ETag'].startswith('W/'))
+
+    def test_x_sendfile_uses_absolute_path(self):
+        with override_settings(MEDIA_ROOT=self.media_root, MEDIA_SERVE_MODE='x-sendfile', USE_S3=False):
+            response = self.serve('avatar.png')
+
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.media_root, 'avatar.png'))
+        self.assertEqual(response['Cache-Control'], 'public, max-age=86400')
+
+    def test_matching_etag_returns_not_modified(self):
+        with override_settings(MEDIA_ROOT=self.media_root, MEDIA_SERVE_MODE='django', USE_S3=False):
+            etag = self.serve('proofs/photo.jpg')['ETag']
+            response = self.serve('proofs/photo.jpg', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_path_traversal_is_not_found(self):
+        from django.http import Http404
+
+        with override_settings(MEDIA_ROOT=self.media_root, MEDIA_SERVE_MODE='x-accel', USE_S3=False):
+            with self.assertRaises(Http404):
+                self.serve('../etc/passwd')
+
+    @skipUnless(boto3, 'boto3 is not installed')
+    @override_settings(
+        USE_S3=True,
+        STORAGES=S3_STORAGES,
+        AWS_S3_CUSTOM_DOMAIN='deliveet-test.s3.amazonaws.com',
+        AWS_S3_SIGNATURE_VERSION='s3v4',
+    )
+    def test_s3_redirects_to_a_signed_url(self):
+        response = self.serve('proofs/photo.jpg')
+
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/media/proofs/photo.jpg?', response['Location'])
+        self.assertIn('X-Amz-Signature=', response['Location'])
+        self.assertIn('X-Amz-Expires=600', response['Location'])
+        self.assertTrue(response['Cache-Control'].startswith('private'))
@@ -0,0 +1,83 @@
+"""
+Metrics Tests
+Tests the latency, query and cache instrumentation and the metrics endpoint
+"""
+from types import SimpleNamespace
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from accounts.models import UserAccount
+from deliveet.utils import metrics
+
+
+class MetricsTests(TestCase):
+    """Test the instrumentation of views, consumers and tasks"""
+
+    def setUp(self):
+        metrics._buckets.clear()
+        metrics._counters.clear()
+        self.cache = metrics.InstrumentedLocMemCache('metrics-tests', {})
+        self.cache.set('known', 'value')
+
+    def test_middleware_records_queries_and_cache_use_per_url_name(self):
+        def view(request):
+            list(UserAccount.objects.all())
+            list(UserAccount.objects.filter(is_active=True))
+            self.cache.get('known')
+            self.cache.get_many(['known', 'unknown'])
+            request.resolver_match = SimpleNamespace(view_name='shipments:track')
+            return HttpResponse()
+
+        metrics.MetricsMiddleware(view)(RequestFactory().get('/shipments/track/'))
+
+        output = metrics.render()
+        labels = 'kind="http",name="shipments:track"'
+        self.assertIn(f'deliveet_db_queries_sum{{{labels}}} 2', output)
+        self.assertIn(f'deliveet_db_queries_bucket{{{labels},le="1.0"}} 0', output)
+        self.assertIn(f'deliveet_db_queries_bucket{{{labels},le="2.0"}} 1', output)
+        self.assertIn(f'deliveet_duration_seconds_count{{{labels}}} 1', output)
+        self.assertIn(f'deliveet_handled_total{{{labels},outcome="2xx"}} 1', output)
+        self.assertIn(f'deliveet_cache_requests_total{{{labels},result="hit"}} 2', output)
+        self.assertIn(f'deliveet_cache_requests_total{{{labels},result="miss"}} 1', output)
+        self.assertIn('# TYPE deliveet_duration_seconds histogram', output)
+
+    def test_consumers_and_tasks_are_recorded_under_their_names(self):
+        class Consumer:
+            async def dispatch(self, message):
+                raise ValueError('No handler')
+
+        class TrackerConsumer(metrics.InstrumentedConsumerMixin, Consumer):
+            pass
+
+        with self.assertRaises(ValueError):
+            async_to_sync(TrackerConsumer().dispatch)({'type': 'websocket.receive'})
+
+        metrics.start_task('task-id')
+        UserAccount.objects.count()
+        metrics.finish_task('task-id', 'shipments.tasks.archive_deliveries', 'SUCCESS')
+
+        output = metrics.render()
+        self.assertIn(
+            'deliveet_handled_total{kind="consumer",name="TrackerConsumer.websocket.receive",outcome="error"} 1',
+            output,
+        )
+        self.assertIn('deliveet_db_queries_sum{kind="task",name="shipments.tasks.archive_deliveries"} 1', output)
+        self.assertIn(
+            'deliveet_handled_total{kind="task",name="shipments.tasks.archive_deliveries",outcome="success"} 1',
+            output,
+        )
+
+    @override_settings(METRICS_TOKEN='scrape-token')
+    def test_endpoint_requires_token_or_staff(self):
+        request = RequestFactory().get('/metrics/')
+        request.user = AnonymousUser()
+        self.assertEqual(metrics.metrics_view(request).status_code, 403)
+
+        request = RequestFactory().get('/metrics/', HTTP_AUTHORIZATION='Bearer scrape-token')
+        request.user = AnonymousUser()
+        response = metrics.metrics_view(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
@@ -0,0 +1,61 @@
+"""
+Notification Tests
+Tests creating notifications in bulk, pushing them and counting unread ones
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from accounts.models import UserAccount
+from api import notifications
+from api.models import Notification
+
+
+@override_settings(NOTIFICATION_BATCH_SIZE=2)
+class NotificationServiceTests(TestCase):
+    """Test the notification service"""
+
+    def setUp(self):
+        cache.clear()
+        self.users = [
+            UserAccount.objects.create_user(email=f'user{number}@test.com')
+            for number in range(3)
+        ]
+
+    def test_notifications_are_inserted_in_batches_and_pushed(self):
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(f'notifications_{self.users[0].pk}', channel)
+        self.assertEqual(notifications.unread_count(self.users[0].pk), 0)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertNumQueries(2):
+                notifications.notify_users(self.users, 'message', 'Hello', 'Welcome aboard', {'step': 1})
+
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(Notification.objects.count(), 3)
+        message = async_to_sync(layer.receive)(channel)
+        self.assertEqual(
+            (message['type'], message['title'], message['data']),
+            ('send_notification', 'Hello', {'step': 1}),
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(notifications.unread_count(self.users[0].pk), 1)
+
+    def test_mark_read_is_one_update_and_adjusts_the_count(self):
+        user = self.users[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            created = notifications.notify_users([user] * 3, 'message', 'Hello', 'Hi')
+        self.assertEqual(notifications.unread_count(user.pk), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(1):
+                self.assertEqual(notifications.mark_read(user.pk, [created[0].pk, created[1].pk]), 2)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(notifications.unread_count(user.pk), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(notifications.mark_read(user.pk), 1)
+        self.assertEqual(notifications.unread_count(user.pk), 0)
+        self.assertFalse(Notification.objects.filter(user=user, is_read=False).exists())
@@ -0,0 +1,114 @@
+"""
+Promotion Tests
+Tests checking promotion codes from the cache and redeeming them
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.utils import timezone
+
+from accounts.models import Customer, UserAccount
+from api import promotions
+from api.models import Promotion
+from shipments.forms import PaymentMethodForm
+from shipments.models import Delivery
+
+
+def create_promotion(code='SAVE10', **kwargs):
+    now = timezone.now()
+    kwargs.setdefault('promotion_type', 'percentage')
+    kwargs.setdefault('discount_value', Decimal('10.00'))
+    return Promotion.objects.create(
+        code=code,
+        name='Launch offer',
+        start_date=now - timedelta(days=1),
+        end_date=now + timedelta(days=1),
+        **kwargs,
+    )
+
+
+class PromotionTests(TestCase):
+    """Test checking and redeeming promotion codes"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_codes_are_checked_from_the_cache_until_saved(self):
+        promotion = create_promotion(max_discount=Decimal('150.00'))
+        self.assertEqual(promotions.check('SAVE10', Decimal('1000.00')).pk, promotion.pk)
+        self.assertIsNone(promotions.get_promotion('NOPE'))
+        with self.assertNumQueries(0):
+            checked = promotions.check(' SAVE10 ', Decimal('2500.00'))
+            self.assertEqual(promotions.discount_for(checked, Decimal('2500.00')), Decimal('150.00'))
+            self.assertIsNone(promotions.get_promotion('NOPE'))
+
+        promotion.is_active = False
+        promotion.save()
+        with self.assertRaisesMessage(promotions.PromotionError, 'not valid'):
+            promotions.check('SAVE10', Decimal('1000.00'))
+
+    def test_redeeming_stops_at_the_usage_limit(self):
+        promotion = create_promotion(usage_limit=2, promotion_type='free_delivery', discount_value=0)
+        # All three checkouts see the cached copy before either redeems.
+        checked = [promotions.check('SAVE10', Decimal('800.00')) for _ in range(3)]
+        self.assertEqual(promotions.discount_for(checked[0], Decimal('800.00')), Decimal('800.00'))
+
+        promotions.redeem(checked[0])
+        promotions.redeem(checked[1])
+        with self.assertRaisesMessage(promotions.PromotionError, 'no longer available'):
+            promotions.redeem(checked[2])
+
+        promotion.refresh_from_db()
+        self.assertEqual(promotion.used_count, 2)
+        with self.assertRaises(promotions.PromotionError):
+            promotions.check('SAVE10', Decimal('800.00'))
+
+    def test_payment_form_checks_the_code_against_the_price(self):
+        user = UserAccount.objects.create_user(email='customer@test.com', is_customer=True)
+        delivery = Delivery.objects.create(customer=Customer.objects.create(user=user), price=Decimal('400.00'))
+        create_promotion(min_order_amount=Decimal('500.00'))
+
+        form = PaymentMethodForm({'payment_method': Delivery.PaymentMethodChoices.COD, 'promo_code': 'SAVE10'},
+                                 instance=delivery)
+        self.assertFalse(form.is_valid())
+        self.assertIn('at least 500.00', form.errors['promo_code'][0])
+
+        form = PaymentMethodForm({'payment_method': Delivery.PaymentMethodChoices.COD}, instance=delivery)
+        self.assertTrue(form.is_valid())
+        self.assertIsNone(form.promotion)
+
+
+class PromotionConcurrencyTests(TransactionTestCase):
+    """Test redeeming one promotion from many checkouts at once"""
+
+    def setUp(self):
+        cache.clear()
+
+    @skipUnlessDBFeature('test_db_allows_multiple_connections')
+    def test_simultaneous_redemptions_never_exceed_the_usage_limit(self):
+        promotion = create_promotion(usage_limit=5)
+        checkouts = 30
+        barrier = threading.Barrier(checkouts)
+
+        def checkout(number):
+            checked = promotions.check('SAVE10', Decimal('1000.00'))
+            barrier.wait()
+            try:
+                promotions.redeem(checked)
+                return True
+            except promotions.PromotionError:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=checkouts) as executor:
+            redeemed = [number for number, won in enumerate(executor.map(checkout, range(checkouts))) if won]
+
+        self.assertEqual(len(redeemed), 5)
+        promotion.refresh_from_db()
+        self.assertEqual(promotion.used_count, 5)
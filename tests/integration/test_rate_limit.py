@@ -0,0 +1,109 @@
+"""
+Rate Limit Tests
+Tests the GCRA limiter, its DRF throttles and its consumer decorator
+"""
+from unittest import mock
+
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, override_settings
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+
+from deliveet.utils import rate_limit
+from deliveet.utils.rate_limit import ScopedRateThrottle, limit, parse_rate
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class RouteView(APIView):
+    permission_classes = []
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'route'
+
+    def get(self, request):
+        return Response({'ok': True})
+
+
+class EchoConsumer(AsyncWebsocketConsumer):
+    @rate_limit.rate_limit('echo', rate='2/minute')
+    async def receive(self, text_data=None, bytes_data=None):
+        await self.send(text_data=text_data)
+
+
+class RateLimitTests(SimpleTestCase):
+    """Test limiting with the in-process fallback"""
+
+    def setUp(self):
+        rate_limit.local_limiter.clear()
+        self.clock = Clock()
+        patcher = mock.patch.object(rate_limit, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('100/hour'), (100, 3600))
+        self.assertEqual(parse_rate('5/second'), (5, 1))
+        self.assertEqual(parse_rate('20/10s'), (20, 10))
+        with self.assertRaises(ValueError):
+            parse_rate('often')
+
+    def test_burst_then_one_request_per_interval(self):
+        allowed = [limit('test', 'courier-1', '3/second').allowed for _ in range(4)]
+        self.assertEqual(allowed, [True, True, True, False])
+        self.assertTrue(limit('test', 'courier-2', '3/second').allowed)
+
+        self.clock.now += 0.2
+        decision = limit('test', 'courier-1', '3/second')
+        self.assertFalse(decision.allowed)
+        self.assertAlmostEqual(decision.retry_after, 1 / 3 - 0.2, places=5)
+
+        self.clock.now += 0.14
+        self.assertTrue(limit('test', 'courier-1', '3/second').allowed)
+        self.assertFalse(limit('test', 'courier-1', '3/second').allowed)
+
+    def test_redis_failure_falls_back_to_process_memory(self):
+        script = mock.Mock(side_effect=ConnectionError('Connection refused'))
+        with mock.patch.object(rate_limit, '_redis_script', return_value=script), \
+                mock.patch.object(rate_limit, '_redis_down_until', 0.0):
+            self.assertTrue(limit('test', 'courier-1', '1/second').allowed)
+            self.assertFalse(limit('test', 'courier-1', '1/second').allowed)
+
+        script.assert_called_once()
+
+    @override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {'route': '2/minute'}})
+    def test_scoped_throttle_gives_a_route_its_own_budget(self):
+        factory = APIRequestFactory()
+        statuses = [RouteView.as_view()(factory.get('/route/')).status_code for _ in range(3)]
+
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(RouteView.as_view()(factory.get('/route/'))['Retry-After'], '30')
+
+
+class RateLimitedConsumerTests(SimpleTestCase):
+    """Test limiting the messages of a consumer"""
+    # Consumers close old database connections on each message
+    databases = {'default'}
+
+    def setUp(self):
+        rate_limit.local_limiter.clear()
+
+    async def test_messages_beyond_the_budget_are_refused(self):
+        communicator = WebsocketCommunicator(EchoConsumer.as_asgi(), '/ws/echo/')
+        await communicator.connect()
+
+        replies = []
+        for message in ['one', 'two', 'three']:
+            await communicator.send_to(text_data=message)
+            replies.append(await communicator.receive_from())
+        await communicator.disconnect()
+
+        self.assertEqual(replies[:2], ['one', 'two'])
+        self.assertIn('"error": "rate_limited"', replies[2])
@@ -0,0 +1,86 @@
+"""
+Rating Tests
+Tests keeping users' rating totals up to date and rebuilding them
+"""
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from accounts.models import UserAccount
+from api.models import Rating
+
+
+class RatingTotalsTests(TestCase):
+    """Test the rating totals of rated users"""
+
+    def setUp(self):
+        self.customer = UserAccount.objects.create_user(email='customer@test.com')
+        self.couriers = [
+            UserAccount.objects.create_user(email=f'courier{number}@test.com', is_courier=True)
+            for number in range(2)
+        ]
+
+    def totals(self, user):
+        user.refresh_from_db()
+        return user.rating_sum, user.rating_count, user.rating
+
+    def test_saving_and_deleting_ratings_changes_the_totals(self):
+        first, second = self.couriers
+        self.assertEqual(self.totals(first), (0, 0, None))
+
+        rating = Rating.objects.create(rater=self.customer, rated_user=first, rating=5)
+        Rating.objects.create(rater=self.customer, rated_user=first, rating=2)
+        self.assertEqual(self.totals(first), (7, 2, 3.5))
+
+        rating.rating = 3
+        rating.save()
+        rating.save()
+        self.assertEqual(self.totals(first), (5, 2, 2.5))
+
+        rating.rated_user = second
+        rating.save()
+        self.assertEqual(self.totals(first), (2, 1, 2.0))
+        self.assertEqual(self.totals(second), (3, 1, 3.0))
+
+        rating.delete()
+        self.assertEqual(self.totals(second), (0, 0, None))
+
+    def test_rating_orders_and_filters_in_sql(self):
+        first, second = self.couriers
+        Rating.objects.create(rater=self.customer, rated_user=first, rating=3)
+        Rating.objects.create(rater=self.customer, rated_user=second, rating=5)
+
+        rated = UserAccount.objects.filter(rating__gte=3).order_by('-rating')
+        self.assertEqual(list(rated), [second, first])
+        self.assertFalse(UserAccount.objects.filter(pk=self.customer.pk, rating__isnull=False).exists())
+
+    def test_recompute_rebuilds_the_totals(self):
+        first, second = self.couriers
+        Rating.objects.create(rater=self.customer, rated_user=first, rating=4)
+        Rating.objects.create(rater=self.customer, rated_user=first, rating=1)
+        # Bulk updates skip the signals
+        Rating.objects.filter(rated_user=first).update(rating=5)
+        UserAccount.objects.filter(pk=second.pk).update(rating_sum=9, rating_count=3)
+
+        out = StringIO()
+        call_command('recompute_ratings', batch_size=2, stdout=out)
+
+        self.assertIn('Recomputed the ratings of 3 users', out.getvalue())
+        self.assertEqual(self.totals(first), (10, 2, 5.0))
+        self.assertEqual(self.totals(second), (0, 0, None))
+
+    def test_concurrent_edits_lock_the_rating(self):
+        rating = Rating.objects.create(rater=self.customer, rated_user=self.couriers[0], rating=5)
+        stale = Rating.objects.get(pk=rating.pk)
+        rating.rating = 3
+        rating.save()
+
+        # A copy loaded before the edit changes the totals from the row, not from 5
+        stale.rating = 4
+        with self.assertNumQueries(6):
+            stale.save()
+        self.assertEqual(self.totals(self.couriers[0]), (4, 1, 4.0))
+
+        stale.delete()
+        self.assertEqual(self.totals(self.couriers[0]), (0, 0, None))
@@ -0,0 +1,64 @@
+"""
+Read Replica Tests
+Tests routing of replica views and read-your-writes stickiness
+"""
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase
+
+from accounts.models import UserAccount
+from deliveet.utils import replicas
+from shipments.models import Delivery
+
+
+@skipUnless(replicas.replica_alias(), 'No replica database configured')
+class ReadReplicaRoutingTests(TransactionTestCase):
+    """Test the replica router (TestCase transactions would keep every read on default)"""
+
+    def setUp(self):
+        cache.clear()
+        self.alias = replicas.replica_alias()
+        self.user = UserAccount.objects.create_user(
+            email='customer@test.com',
+            password='CustomerPass123!',
+            first_name='John',
+            last_name='Doe',
+        )
+
+    def request(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        return request
+
+    def test_reads_use_default_database_outside_replica_views(self):
+        self.assertEqual(Delivery.objects.all().db, 'default')
+
+    def test_replica_view_reads_from_replica(self):
+        @replicas.read_from_replica
+        def view(request):
+            return HttpResponse(Delivery.objects.all().db)
+
+        self.assertEqual(view(self.request()).content.decode(), self.alias)
+        self.assertEqual(Delivery.objects.all().db, 'default')
+
+    def test_reads_inside_a_transaction_stay_on_default(self):
+        with replicas.use_replica(), transaction.atomic():
+            self.assertEqual(Delivery.objects.all().db, 'default')
+
+    def test_user_who_wrote_reads_from_default_for_a_while(self):
+        def write(request):
+            UserAccount.objects.filter(pk=self.user.pk).update(first_name='Johnny')
+            with replicas.use_replica(self.user.pk):
+                # Reads after a write in the same request stay on default.
+                return HttpResponse(Delivery.objects.all().db)
+
+        response = replicas.ReplicaMiddleware(write)(self.request())
+
+        self.assertEqual(response.content.decode(), 'default')
+        with replicas.use_replica(self.user.pk):
+            self.assertEqual(Delivery.objects.all().db, 'default')
+        with replicas.use_replica(user_id=None):
+            self.assertEqual(Delivery.objects.all().db, self.alias)
@@ -0,0 +1,62 @@
+"""
+Route Optimization Tests
+Tests pickup and drop-off ordering in the FastAPI route optimizer
+"""
+import random
+
+from django.test import SimpleTestCase
+
+from fastapi_service import routing
+
+
+class RouteOptimizationTests(SimpleTestCase):
+    """Test the route optimizer"""
+
+    def assertPickupsBeforeDrops(self, stops):
+        picked_up = set()
+        for stop in stops:
+            if stop.kind == routing.PICKUP:
+                picked_up.add(stop.delivery_id)
+            else:
+                self.assertIn(stop.delivery_id, picked_up)
+
+    def test_pickups_come_before_their_drops(self):
+        rng = random.Random(3)
+        deliveries = [
+            {
+                'delivery_id': f'delivery-{number}',
+                'pickup': (rng.uniform(6.4, 6.7), rng.uniform(3.25, 3.55)),
+                'drop': (rng.uniform(6.4, 6.7), rng.uniform(3.25, 3.55)),
+            }
+            for number in range(40)
+        ]
+        route = routing.solve((6.5, 3.4), routing.build_stops(deliveries))
+
+        self.assertEqual(len(route.stops), 80)
+        self.assertPickupsBeforeDrops(route.stops)
+        self.assertLessEqual(route.distance_km, route.initial_distance_km)
+
+    def test_items_on_board_only_need_a_drop(self):
+        deliveries = [
+            {'delivery_id': 'on-board', 'pickup': (6.60, 3.30), 'drop': (6.51, 3.40), 'picked_up': True},
+            {'delivery_id': 'waiting', 'pickup': (6.52, 3.41), 'drop': (6.45, 3.45)},
+        ]
+        route = routing.solve((6.50, 3.40), routing.build_stops(deliveries))
+
+        self.assertEqual(
+            [(stop.delivery_id, stop.kind) for stop in route.stops],
+            [('on-board', 'drop'), ('waiting', 'pickup'), ('waiting', 'drop')],
+        )
+
+    def test_improvement_fixes_a_nearest_neighbour_detour(self):
+        # Stops on a road through the courier at 0. Nearest neighbour drives
+        # to 1, 3 and 4.5, then all the way back to -1.5; it is shorter to
+        # start with -1.5 and drive through.
+        positions = [0, 1, -1.5, 3, 4.5]
+        matrix = [[abs(a - b) for b in positions] for a in positions]
+        stops = [routing.Stop(name, routing.DROP, 0, 0) for name in ('a', 'b', 'c', 'd')]
+        route = routing.solve((0, 0), stops, matrix=matrix)
+
+        self.assertEqual(route.initial_distance_km, 10.5)
+        self.assertEqual(route.distance_km, 7.5)
+        self.assertEqual([stop.delivery_id for stop in route.stops], ['b', 'a', 'c', 'd'])
@@ -0,0 +1,130 @@
+"""
+Support Queue Tests
+Tests routing support tickets to the least loaded agents on duty
+"""
+import time
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from accounts.models import UserAccount
+from api import support
+from api.models import Support
+from deliveet.consumers import SupportAgentConsumer
+
+
+def create_ticket(user, priority='medium', **kwargs):
+    return Support.objects.create(user=user, subject=f'{priority} problem', description='Help', priority=priority, **kwargs)
+
+
+@override_settings(SUPPORT_AGENT_CAPACITY=2)
+class SupportQueueTests(TestCase):
+    """Test the support ticket queue and assignment"""
+
+    def setUp(self):
+        support.local_queue.clear()
+        self.customer = UserAccount.objects.create_user(email='customer@test.com')
+        self.first = UserAccount.objects.create_user(email='first@test.com', is_staff=True)
+        self.second = UserAccount.objects.create_user(email='second@test.com', is_staff=True)
+
+    def assigned(self, agent):
+        return list(Support.objects.filter(assigned_to=agent, status='in_progress').order_by('created_at')
+                    .values_list('priority', flat=True))
+
+    def test_tickets_go_by_priority_to_the_least_loaded_agent(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_ticket(self.customer, 'high', status='in_progress', assigned_to=self.first)
+            for priority in ['low', 'urgent', 'medium', 'high']:
+                create_ticket(self.customer, priority)
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(f'support_agent_{self.second.pk}', channel)
+
+        self.assertEqual(support.agent_connected(self.second.pk, 'second-1'), 2)
+        self.assertEqual(support.agent_connected(self.first.pk, 'first-1'), 1)
+
+        self.assertEqual(self.assigned(self.second), ['urgent', 'high'])
+        self.assertEqual(self.assigned(self.first), ['high', 'medium'])
+        message = async_to_sync(layer.receive)(channel)
+        self.assertEqual((message['type'], message['ticket']['priority']), ('ticket_assigned', 'urgent'))
+
+        # Resolving a ticket makes room for the last one
+        ticket = Support.objects.get(assigned_to=self.second, priority='urgent')
+        ticket.status = 'resolved'
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket.save()
+        self.assertEqual(self.assigned(self.second), ['low', 'high'])
+
+    def test_requeue_rebuilds_a_lost_queue_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tickets = [create_ticket(self.customer, priority) for priority in ['low', 'urgent', 'medium']]
+        # As after a Redis restart
+        support.local_queue.clear()
+        self.assertEqual(support.agent_connected(self.first.pk, 'first-1'), 0)
+
+        self.assertEqual(support.requeue(batch_size=2), 3)
+        self.assertEqual(self.assigned(self.first), ['urgent', 'medium'])
+        # The queued copy of an assigned ticket is skipped
+        support.queue_tickets(tickets)
+        self.assertEqual(support.requeue(), 1)
+        self.assertEqual(self.assigned(self.first), ['urgent', 'medium'])
+
+        support.agent_disconnected(self.first.pk, 'first-1')
+        self.assertEqual(support.agent_connected(self.second.pk, 'second-1'), 1)
+        self.assertEqual(self.assigned(self.second), ['low'])
+
+
+    def test_agents_whose_connections_lapse_lose_their_unseen_tickets(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            seen, unseen = create_ticket(self.customer, 'urgent'), create_ticket(self.customer, 'high')
+        self.assertEqual(support.agent_connected(self.first.pk, 'first-1'), 2)
+        support.ticket_seen(seen.pk, self.first.pk)
+        support.agent_connected(self.second.pk, 'second-1')
+
+        # The first agent's process died; the second keeps sending heartbeats.
+        later = time.time() + 60
+        with mock.patch('api.support.time.time', return_value=later):
+            support.agent_heartbeat(self.second.pk, 'second-1')
+        with mock.patch('api.support.time.time', return_value=later + 60):
+            self.assertEqual(support.requeue(), 1)
+
+        self.assertEqual(support.local_queue.agents(), [str(self.second.pk)])
+        self.assertEqual(self.assigned(self.first), ['urgent'])
+        self.assertEqual(self.assigned(self.second), ['high'])
+
+
+class SupportAgentConsumerTests(TransactionTestCase):
+    """Test pushing tickets to agents over WebSockets"""
+
+    def setUp(self):
+        support.local_queue.clear()
+        self.customer = UserAccount.objects.create_user(email='customer@test.com')
+        self.agent = UserAccount.objects.create_user(email='agent@test.com', is_staff=True)
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(SupportAgentConsumer.as_asgi(), '/ws/support/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    async def test_agents_on_duty_are_pushed_their_tickets(self):
+        ticket = await Support.objects.acreate(user=self.customer, subject='Late parcel', description='Where is it?')
+
+        communicator, connected = await self.connect(self.agent)
+        self.assertTrue(connected)
+        message = await communicator.receive_json_from()
+        await communicator.disconnect()
+
+        self.assertEqual(message['type'], 'ticket_assigned')
+        self.assertEqual(message['ticket']['id'], str(ticket.pk))
+        self.assertEqual(support.local_queue.agents(), [])
+        await ticket.arefresh_from_db()
+        self.assertIsNotNone(ticket.seen_at)
+
+    async def test_only_staff_are_agents(self):
+        communicator, connected = await self.connect(self.customer)
+
+        self.assertFalse(connected)